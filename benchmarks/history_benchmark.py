@@ -0,0 +1,247 @@
+"""Balance history benchmark suite.
+
+Generates synthetic histories that mix canonical ``YYYY/MM/DD-HH:MM`` entries
+with legacy ``DD/MM-HH:MM`` / ``"Balance: X"`` records, then times the
+history code paths the bot relies on:
+
+- ``load_legacy``: first load of a schema v1 file (migration included)
+- ``save``: ``save_balance_history`` (atomic JSON snapshot)
+- ``load``: ``load_balance_history`` of that snapshot
+- ``filter_last_24h`` / ``filter_since_midnight``
+- ``format_history_entry``: formatting every entry
+- ``calculate_uptime``: ``handlers.system._calculate_uptime``
+
+Results are compared with ``benchmarks/history_baseline.json``; any timing
+more than ``--threshold`` slower than its baseline is reported as a
+regression and the script exits with status 1.
+
+Usage, from the repository root::
+
+    python benchmarks/history_benchmark.py                  # compare with the baseline
+    python benchmarks/history_benchmark.py --update         # record a new baseline
+    python benchmarks/history_benchmark.py --sizes 10000 --threshold 0.5
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from services import history as history_store  # noqa: E402
+from services.history import (  # noqa: E402
+    load_balance_history, save_balance_history, filter_last_24h, filter_since_midnight,
+    format_history_entry, make_time_key,
+)
+from handlers.system import _calculate_uptime  # noqa: E402
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history_baseline.json')
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+# Allowed slowdown over the baseline before a timing is flagged (0.25 = 25%)
+DEFAULT_THRESHOLD = 0.25
+# Slowdowns smaller than this are timer noise, whatever the ratio
+NOISE_FLOOR_SECONDS = 0.001
+# Synthetic snapshots are 5 minutes apart: 1M entries span about 9.5 years
+SAMPLE_INTERVAL = timedelta(minutes=5)
+# Share of the entries from the last LEGACY_DAYS written in the legacy format
+LEGACY_RATIO = 0.1
+# Legacy keys carry no year, so they only make sense within the last year
+LEGACY_DAYS = 300
+BENCHMARKS = (
+    'load_legacy', 'save', 'load', 'filter_last_24h', 'filter_since_midnight',
+    'format_history_entry', 'calculate_uptime',
+)
+
+
+def generate_history(size: int, now: datetime = None, seed: int = 0) -> dict:
+    """Build a schema v1 history of *size* records ending at *now*.
+
+    Most records use canonical keys and entry dicts (with or without
+    temperature/RAM); about ``LEGACY_RATIO`` of the recent ones use the
+    legacy key and ``"Balance: X"`` value formats.
+
+    :param size: Number of records.
+    :param now: Time of the newest record; defaults to now.
+    :param seed: Random seed, so runs compare the same data.
+    :return: Raw history dict as stored in a schema v1 file.
+    """
+    if now is None:
+        now = datetime.now()
+    rng = random.Random(seed)
+    legacy_after = now - timedelta(days=LEGACY_DAYS)
+    balance = 1000.0
+    raw: dict = {}
+    for index in range(size):
+        dt = now - SAMPLE_INTERVAL * (size - 1 - index)
+        balance = round(balance + rng.uniform(-1.0, 1.5), 2)
+        if dt > legacy_after and rng.random() < LEGACY_RATIO:
+            legacy_key = f"{dt.day:02d}/{dt.month:02d}-{dt.hour:02d}:{dt.minute:02d}"
+            raw[legacy_key] = f"Balance: {balance}"
+            continue
+        entry: dict = {"balance": balance}
+        if rng.random() < 0.8:
+            entry["temperature_avg"] = round(rng.uniform(35.0, 65.0), 1)
+            entry["ram_percent"] = round(rng.uniform(40.0, 90.0), 1)
+        raw[make_time_key(dt)] = entry
+    return raw
+
+
+def _best_of(func, repeat: int) -> float:
+    """Return the fastest of *repeat* runs of *func*, in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmarks(size: int, repeat: int = 3) -> dict:
+    """Time every benchmark on a synthetic history of *size* records.
+
+    Files are written to a temporary directory; ``BALANCE_HISTORY_FILE`` is
+    pointed there for the duration of the run.
+
+    :return: Dict mapping each name in ``BENCHMARKS`` to seconds (best of *repeat*).
+    """
+    results: dict = {}
+    original_file = history_store.BALANCE_HISTORY_FILE
+    with tempfile.TemporaryDirectory() as directory:
+        history_store.BALANCE_HISTORY_FILE = os.path.join(directory, 'balance_history.json')
+        try:
+            raw = generate_history(size)
+
+            def load_legacy():
+                with open(history_store.BALANCE_HISTORY_FILE, 'w', encoding='utf-8') as f:
+                    json.dump(raw, f)
+                start = time.perf_counter()
+                loaded = load_balance_history()
+                return time.perf_counter() - start, loaded
+
+            # The migration rewrites the file, so each run starts from a fresh v1 file
+            runs = [load_legacy() for _ in range(repeat)]
+            results['load_legacy'] = min(elapsed for elapsed, _ in runs)
+            history = runs[-1][1]
+            del raw, runs
+
+            results['save'] = _best_of(lambda: save_balance_history(history), repeat)
+            results['load'] = _best_of(load_balance_history, repeat)
+            results['filter_last_24h'] = _best_of(lambda: filter_last_24h(history), repeat)
+            results['filter_since_midnight'] = _best_of(
+                lambda: filter_since_midnight(history), repeat)
+            results['format_history_entry'] = _best_of(
+                lambda: [format_history_entry(key, value) for key, value in history.items()],
+                repeat)
+            results['calculate_uptime'] = _best_of(lambda: _calculate_uptime(history), repeat)
+        finally:
+            history_store.BALANCE_HISTORY_FILE = original_file
+    return results
+
+
+def read_baseline(path: str = None) -> dict:
+    """Return the stored baseline, or an empty dict.
+
+    The baseline is ``{"results": {size: {benchmark: seconds}}}``.
+    """
+    try:
+        with open(path or BASELINE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_baseline(results: dict, path: str = None) -> None:
+    """Store *results* (``{size: {benchmark: seconds}}``) as the new baseline."""
+    baseline = {
+        "environment": {"python": platform.python_version(), "machine": platform.machine()},
+        "results": {
+            str(size): {name: round(seconds, 6) for name, seconds in timings.items()}
+            for size, timings in sorted(results.items())
+        },
+    }
+    with open(path or BASELINE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2)
+        f.write('\n')
+
+
+def find_regressions(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """Compare *results* with *baseline*.
+
+    Timings within ``NOISE_FLOOR_SECONDS`` of their baseline are never flagged.
+
+    :param results: ``{size: {benchmark: seconds}}`` of the current run.
+    :param baseline: Baseline as returned by :func:`read_baseline`.
+    :param threshold: Allowed slowdown ratio (0.25 = 25% slower).
+    :return: ``(size, benchmark, baseline_seconds, seconds)`` tuples, one per regression.
+    """
+    regressions = []
+    reference = baseline.get("results", {})
+    for size, timings in sorted(results.items()):
+        for name, seconds in timings.items():
+            expected = reference.get(str(size), {}).get(name)
+            if expected is None or seconds - expected < NOISE_FLOOR_SECONDS:
+                continue
+            if seconds > expected * (1 + threshold):
+                regressions.append((size, name, expected, seconds))
+    return regressions
+
+
+def format_report(results: dict, baseline: dict) -> str:
+    """Return a table of timings with the change against the baseline."""
+    reference = baseline.get("results", {})
+    lines = [f"{'size':>9}  {'benchmark':<22} {'seconds':>10} {'baseline':>10} {'change':>8}"]
+    for size, timings in sorted(results.items()):
+        for name in BENCHMARKS:
+            seconds = timings[name]
+            expected = reference.get(str(size), {}).get(name)
+            if expected:
+                lines.append(f"{size:>9}  {name:<22} {seconds:>10.4f} {expected:>10.4f} "
+                             f"{(seconds / expected - 1) * 100:>+7.1f}%")
+            else:
+                lines.append(f"{size:>9}  {name:<22} {seconds:>10.4f} {'-':>10} {'-':>8}")
+    return "\n".join(lines)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark services.history against a stored baseline.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="history sizes to benchmark (default: 10000 100000 1000000)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="runs per benchmark, best one kept (default: 3)")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown over the baseline, as a ratio (default: 0.25)")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline file")
+    parser.add_argument('--update', action='store_true',
+                        help="store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    # Migration and loader messages are not part of the report; force drops the
+    # bot_activity.log handler config installs, so runs do not write to it
+    logging.basicConfig(level=logging.ERROR, force=True)
+    results = {size: run_benchmarks(size, args.repeat) for size in args.sizes}
+    baseline = read_baseline(args.baseline)
+    print(format_report(results, baseline))
+
+    if args.update:
+        stored = {int(size): timings for size, timings in baseline.get("results", {}).items()}
+        write_baseline({**stored, **results}, args.baseline)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressions = find_regressions(results, baseline, args.threshold)
+    for size, name, expected, seconds in regressions:
+        print(f"REGRESSION {name} at {size} entries: {seconds:.4f}s vs {expected:.4f}s baseline "
+              f"(+{(seconds / expected - 1) * 100:.0f}%, threshold {args.threshold * 100:.0f}%)")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
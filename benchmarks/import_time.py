@@ -0,0 +1,101 @@
+"""Bot import-time report, from ``python -X importtime``.
+
+Imports ``main`` (what the bot loads before it starts polling) in a fresh
+interpreter with ``-X importtime`` and summarizes the trace:
+
+- total import time of the module
+- the slowest imports, by cumulative time
+- heavy libraries that should only load on first use (matplotlib, NumPy,
+  psutil, docker): the script exits with status 1 when one of them is
+  imported at startup
+
+Usage, from the repository root::
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --top 25
+"""
+import os
+import re
+import sys
+import argparse
+import tempfile
+import subprocess
+
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+# Libraries deferred to first use: imported at startup, they are a regression
+HEAVY_MODULES = ('matplotlib', 'numpy', 'psutil', 'docker')
+DEFAULT_TOP = 15
+_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$')
+
+
+def parse_importtime(trace: str) -> list:
+    """Parse ``-X importtime`` output.
+
+    :param trace: Text the interpreter wrote to stderr.
+    :return: ``(module, self_us, cumulative_us, depth)`` tuples, in trace order.
+    """
+    records = []
+    for line in trace.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            records.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return records
+
+
+def measure_imports(module: str = 'main') -> list:
+    """Import *module* from ``src/`` in a fresh interpreter and return its parsed import trace.
+
+    :raises RuntimeError: When the import fails.
+    """
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(SRC_DIR))
+    # Run elsewhere: importing main opens its log file in the working directory
+    with tempfile.TemporaryDirectory() as directory:
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=directory, env=env, capture_output=True, text=True,
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def heavy_imports(records: list) -> list:
+    """Return the names of ``HEAVY_MODULES`` (top-level packages) found in *records*."""
+    loaded = {module.split('.')[0] for module, _, _, _ in records}
+    return [name for name in HEAVY_MODULES if name in loaded]
+
+
+def format_report(records: list, module: str = 'main', top: int = DEFAULT_TOP) -> str:
+    """Return a summary of the import of *module*.
+
+    It lists the total import time, the *top* slowest imports and the heavy libraries loaded.
+    """
+    total = next((cumulative for name, _, cumulative, _ in records if name == module), 0)
+    lines = [f"import {module}: {total / 1000:.1f} ms, {len(records)} modules", "",
+             f"{'cumulative':>12} {'self':>10}  module"]
+    for name, self_us, cumulative_us, depth in sorted(records, key=lambda record: -record[2])[:top]:
+        indent = '  ' * depth
+        lines.append(f"{cumulative_us / 1000:>9.1f} ms {self_us / 1000:>7.1f} ms  {indent}{name}")
+    heavy = heavy_imports(records)
+    lines += ["", f"Heavy libraries imported at startup: {', '.join(heavy) if heavy else 'none'}"]
+    return "\n".join(lines)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Summarize python -X importtime for the bot startup.")
+    parser.add_argument('--module', default='main',
+                        help="module to import from src/ (default: main)")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP,
+                        help="slowest imports listed (default: 15)")
+    args = parser.parse_args(argv)
+
+    records = measure_imports(args.module)
+    print(format_report(records, args.module, args.top))
+    return 1 if heavy_imports(records) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
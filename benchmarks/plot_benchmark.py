@@ -0,0 +1,119 @@
+"""Chart render benchmark: fresh figure per chart vs persistent figure template.
+
+Times ``/hist`` charts (balance, resources) on synthetic hourly histories
+of one day, one month and one year by default, two ways:
+
+- ``fresh``: a new figure is built for every render (axes, twin axis,
+  titles, legend, layout), as charts were drawn before figure templates
+- ``template``: the long-lived template used by ``services.plotting`` is
+  re-drawn with the new data
+
+Both draw at most ``MAX_PLOT_POINTS`` points per series (LTTB
+downsampling), so template timings should stay flat across sizes.
+
+Usage, from the repository root::
+
+    python benchmarks/plot_benchmark.py
+    python benchmarks/plot_benchmark.py --sizes 24 8760 87600 --repeat 10
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from services.history import BalanceHistory, make_time_key  # noqa: E402
+from services.plotting import (  # noqa: E402
+    _BalanceChart, _ResourcesChart, _date_numbers, _history_series, load_matplotlib,
+)
+
+
+DEFAULT_SIZES = (24, 720, 8760)
+CHARTS = ('balance', 'resources')
+
+
+def generate_history(size: int, now: datetime = None, seed: int = 0) -> BalanceHistory:
+    """Build an hourly history of *size* entries with balance, temperature and RAM.
+
+    The last entry is at *now*.
+    """
+    if now is None:
+        now = datetime.now()
+    rng = random.Random(seed)
+    balance = 1000.0
+    entries = {}
+    for index in range(size):
+        balance = round(balance + rng.uniform(-1.0, 1.5), 2)
+        entries[make_time_key(now - timedelta(hours=size - 1 - index))] = {
+            "balance": balance,
+            "temperature_avg": round(rng.uniform(35.0, 65.0), 1),
+            "ram_percent": round(rng.uniform(40.0, 90.0), 1),
+        }
+    return BalanceHistory(entries)
+
+
+def _best_of(func, repeat: int) -> float:
+    """Return the fastest of *repeat* runs of *func*, in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmarks(size: int, repeat: int = 5) -> dict:
+    """Time each chart of a *size*-entry history rendered on a fresh figure and on a template.
+
+    :return: ``{chart: {"fresh": seconds, "template": seconds}}`` (best of *repeat*).
+    """
+    load_matplotlib()
+    epochs, balances, temperatures, rams = _history_series(generate_history(size))
+    times = _date_numbers(epochs)
+    renders = {
+        'balance': (_BalanceChart, (times, balances)),
+        'resources': (_ResourcesChart, (times, temperatures, rams)),
+    }
+    results = {}
+    for chart in CHARTS:
+        chart_type, args = renders[chart]
+        template = chart_type()
+        # The first render fits the layout; the bot pays it once per process
+        template.render(*args)
+        results[chart] = {
+            "fresh": _best_of(lambda: chart_type().render(*args), repeat),
+            "template": _best_of(lambda: template.render(*args), repeat),
+        }
+    return results
+
+
+def format_report(results: dict) -> str:
+    """Return a table of render times with the speedup of the template."""
+    lines = [f"{'size':>6}  {'chart':<10} {'fresh':>9} {'template':>9} {'speedup':>8}"]
+    for size, charts in sorted(results.items()):
+        for chart in CHARTS:
+            fresh, template = charts[chart]["fresh"], charts[chart]["template"]
+            speedup = fresh / template
+            lines.append(f"{size:>6}  {chart:<10} {fresh:>9.4f} {template:>9.4f} {speedup:>7.2f}x")
+    return "\n".join(lines)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark chart rendering with and without figure templates.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="history sizes to chart (default: 24 720 8760)")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="renders per timing, best one kept (default: 5)")
+    args = parser.parse_args(argv)
+
+    results = {size: run_benchmarks(size, args.repeat) for size in args.sizes}
+    print(format_report(results))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
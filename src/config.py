@@ -3,6 +3,34 @@ import logging
 
 # Scheduler
 JOB_SCHED_NAME = 'periodic_node_ping'
+HISTORY_COMPACT_JOB_NAME = 'balance_history_compaction'
+HISTORY_ARCHIVE_JOB_NAME = 'balance_history_archive'
+PROBE_LOG_FLUSH_JOB_NAME = 'probe_log_flush'
+# Seconds between writes of the buffered health probes to config/probe_log.bin
+PROBE_LOG_FLUSH_SECONDS = 60
+
+# Balance history retention (opt-in): raw entries, then hourly aggregates, then daily aggregates.
+# Values used for the keys missing from topology "history_retention"
+HISTORY_RETENTION_DEFAULT = {'raw_days': 7, 'hourly_days': 90}
+# Optional "runs" key of history_retention: unchanged consecutive snapshots stored as one run
+HISTORY_RUNS_DEFAULT = {'temperature_tolerance': 0.5, 'ram_tolerance': 1.0, 'min_length': 4}
+# Cold history archive (opt-in): closed months older than hot_days move to compressed segments
+# under config/history/ (gzip or lzma).
+# Values used for the keys missing from topology "history_archive"
+HISTORY_ARCHIVE_DEFAULT = {'hot_days': 90, 'compression': 'gzip'}
+# Window of balance history loaded before the bot starts polling
+# (older entries load in the background)
+HISTORY_RECENT_LOAD_HOURS = 48
+
+# Chart rendering process pool: worker processes (topology "plot_workers", 0 renders in the bot
+# process), renders queued or running before new requests are turned away, and seconds allowed
+# per render
+PLOT_WORKERS_DEFAULT = 2
+PLOT_QUEUE_SIZE = 8
+PLOT_TIMEOUT_SECONDS = 30
+# PNG bytes kept by the chart cache, keyed by a hash of the plotted data
+# (topology "plot_cache_mb", 0 disables it)
+PLOT_CACHE_MB_DEFAULT = 32
 
 # Logging
 LOG_FILE_NAME = 'bot_activity.log'
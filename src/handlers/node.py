@@ -1,20 +1,33 @@
 import os
+import time
+import contextlib
 import asyncio
 import logging
+from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext, ConversationHandler
 from services.massa_rpc import get_addresses
-from services.docker_manager import start_docker_node, stop_docker_node, restart_bot, exec_massa_client
-from handlers.common import auth_required, cb_auth_required, handle_api_error, safe_delete_file, notify_admins_unauthorized
+from services.docker_manager import (
+    start_docker_node, stop_docker_node, restart_bot, exec_massa_client,
+)
+from handlers.common import (
+    auth_required, cb_auth_required, handle_api_error, notify_admins_unauthorized,
+)
 from services.history import (
-    save_balance_history,
-    make_time_key, build_balance_entry, format_history_entry,
+    save_balance_history, append_balance_entry,
+    make_time_key, format_history_entry, HistoryRecord, copy_window,
+    parse_duration, query_history, QUERY_AGGREGATES,
 )
+from services.history_archive import clear_archive, history_with_archive, read_manifest
+from services.history_partitions import partition_archive_dir
 from services.plotting import create_png_plot, create_balance_history_plot, create_resources_plot
+from services.chart_cache import chart_name
+from services.plot_pool import PlotPoolBusy
 from services.system_monitor import get_system_stats
 from config import (
     LOG_FILE_NAME, FLUSH_CONFIRM_STATE, HIST_CONFIRM_STATE,
-    DOCKER_MENU_STATE, DOCKER_START_CONFIRM_STATE, DOCKER_STOP_CONFIRM_STATE, DOCKER_RESTART_CONFIRM_STATE,
+    DOCKER_MENU_STATE, DOCKER_START_CONFIRM_STATE, DOCKER_STOP_CONFIRM_STATE,
+    DOCKER_RESTART_CONFIRM_STATE,
     DOCKER_MASSA_MENU_STATE, DOCKER_BUYROLLS_INPUT_STATE, DOCKER_BUYROLLS_CONFIRM_STATE,
     DOCKER_SELLROLLS_INPUT_STATE, DOCKER_SELLROLLS_CONFIRM_STATE,
     PAT_FILE_NAME,
@@ -22,6 +35,11 @@ from config import (
 
 
 _DOCKER_MENU_TEXT = "🐳 Docker Node Management\nWhat do you want to do?"
+_HIST_USAGE = (
+    "Usage: /hist [address] [range] [step] [avg|min|max|last]\n"
+    "e.g. /hist 7d 1h (last 7 days, hourly averages). Units: m, h, d, w."
+)
+_PLOT_POOL_BUSY = "Too many charts being drawn, please try again in a moment."
 
 
 def _build_docker_main_menu_markup() -> InlineKeyboardMarkup:
@@ -41,15 +59,73 @@ def _build_docker_main_menu_markup() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(keyboard)
 
 
-def extract_address_data(json_data: dict):
+def _parse_hist_args(args: list):
+    """Parse ``/hist [range] [step] [agg]`` arguments.
+
+    :return: ``(range, step, agg)`` with None for omitted durations, or None when the
+        arguments are invalid.
+    """
+    if len(args) > 3:
+        return None
+    window = parse_duration(args[0]) if args else None
+    step = parse_duration(args[1]) if len(args) > 1 else None
+    agg = args[2].lower() if len(args) > 2 else 'avg'
+    if (args and window is None) or (len(args) > 1 and step is None) or agg not in QUERY_AGGREGATES:
+        return None
+    return window, step, agg
+
+
+def _select_address(context: CallbackContext, args: list):
+    """Pop an address selector off the front of *args* when one is given.
+
+    A selector is a monitored address, its 1-based position in
+    ``massa_node_address``, or an unambiguous prefix or suffix of it (see
+    ``HistoryPartitions.resolve``).  Durations (``7d``) are never selectors.
+
+    :return: ``(address, remaining args)``, or None when the first argument
+        is neither a selector nor a duration.
+    """
+    primary = context.bot_data.get('massa_node_address')
+    partitions = context.bot_data.get('history_partitions')
+    if not args or parse_duration(args[0]) is not None:
+        return primary, args
+    if partitions is None:
+        return (primary, args[1:]) if args[0] in (primary, '1') else None
+    address = partitions.resolve(args[0])
+    return (address, args[1:]) if address is not None else None
+
+
+async def _address_history(context: CallbackContext, address: str) -> tuple:
+    """Return the balance history of *address* and its lock, loading its partition on first use."""
+    partitions = context.bot_data.get('history_partitions')
+    if partitions is None or address == context.bot_data.get('massa_node_address'):
+        return context.bot_data['balance_history'], context.bot_data.get('balance_lock')
+    # Loading a partition parses its snapshot file: keep it off the event loop
+    partition = await asyncio.to_thread(partitions.get, address)
+    return partition.history, partition.lock
+
+
+def _addresses_text(context: CallbackContext) -> str:
+    partitions = context.bot_data.get('history_partitions')
+    if partitions is not None:
+        addresses = partitions.addresses
+    else:
+        addresses = [context.bot_data.get('massa_node_address')]
+    lines = (f"{index}. {address}" for index, address in enumerate(addresses, start=1))
+    return "Addresses:\n" + "\n".join(lines)
+
+
+def extract_address_data(json_data: dict, index: int = 0):
     """
     Extract useful JSON response data from get_address.
 
     :param json_data: Input JSON data to parse.
-    :return: Tuple composed of final_balance, final_roll_count, cycles, ok_counts, nok_counts and active_rolls.
+    :param index: Position of the address in a batched ``get_addresses`` request.
+    :return: Tuple composed of final_balance, final_roll_count, cycles, ok_counts, nok_counts
+        and active_rolls.
     """
-    if "result" in json_data and len(json_data["result"]) > 0:
-        result = json_data["result"][0]
+    if "result" in json_data and len(json_data["result"]) > index:
+        result = json_data["result"][index]
         final_balance = result["final_balance"]
         final_roll_count = result["final_roll_count"]
         cycles = [info["cycle"] for info in result["cycle_infos"]]
@@ -60,26 +136,131 @@ def extract_address_data(json_data: dict):
     return None
 
 
+async def _plot(context: CallbackContext, plot_function, *args) -> bytes:
+    """Run a ``services.plotting`` function in the plot pool when one is running, else inline.
+
+    Charts already drawn from the same data come from the plot cache, when one is configured.
+    """
+    plot_cache = context.bot_data.get('plot_cache')
+    key = plot_cache.key(plot_function, *args) if plot_cache is not None else None
+    if key is not None:
+        png = plot_cache.get(key)
+        if png is not None:
+            return png
+    plot_pool = context.bot_data.get('plot_pool')
+    if plot_pool is None:
+        png = plot_function(*args)
+    else:
+        png = await plot_pool.run(plot_function, *args)
+    if key is not None:
+        plot_cache.put(key, png)
+    return png
+
+
+def record_probe(bot_data: dict, up: bool, latency_ms: float = None) -> None:
+    """Record a health probe outcome in the probe log, when one is configured.
+
+    :param bot_data: Shared bot data holding ``probe_log``.
+    :param up: True when the node answered and is healthy (no NOK, rolls > 0).
+    :param latency_ms: RPC round trip, or None when the node did not answer.
+    """
+    probe_log = bot_data.get('probe_log')
+    if probe_log is None:
+        return
+    try:
+        probe_log.record(up, latency_ms)
+    except Exception as e:
+        logging.error(f"Error recording probe: {e}")
+
+
+def record_snapshot(bot_data: dict, time_key: str, entry) -> None:
+    """Store a balance snapshot of the first address in ``balance_history``.
+
+    ``balance_lock`` is only held for the in-memory insert and the rolling
+    window update; the journal append, or the database commit of a
+    write-through store, is left to the history persister thread when one is
+    running.
+
+    :param bot_data: Shared bot data holding the history, its lock, window and persister.
+    :param time_key: Key of the snapshot.
+    :param entry: Snapshot record.
+    """
+    balance_history = bot_data['balance_history']
+    persister = bot_data.get('history_persister')
+    window = bot_data.get('history_window')
+    deferred = persister is not None and getattr(balance_history, 'write_through', False)
+    with bot_data.get('balance_lock') or contextlib.nullcontext():
+        if not deferred:
+            balance_history[time_key] = entry
+        if window is not None:
+            window.add(time_key, entry)
+        if persister is None:
+            append_balance_entry(balance_history, time_key)
+    if deferred:
+        persister.enqueue_store(time_key, entry)
+    elif persister is not None:
+        # Written by the persister thread, off the event loop
+        persister.enqueue_append(time_key)
+
+
+async def _other_node(update: Update, context: CallbackContext, address: str) -> None:
+    """/node for an additional address: status text and a snapshot in its own history partition."""
+    try:
+        json_data = get_addresses(logging, address)
+        if await handle_api_error(update, json_data):
+            return
+        data = extract_address_data(json_data)
+        if data is None:
+            logging.error(f"Node {address} unreachable or no data available")
+            await update.message.reply_text("Node unreachable or no data available.")
+            return
+        await update.message.reply_text(
+            f"Node status ({address}): "
+            f"Final Balance: {data[0]}\n"
+            f"Final Roll Count: {data[1]}\n"
+            f"OK Counts: {data[3]}\n"
+            f"NOK Counts: {data[4]}\n"
+            f"Active Rolls: {data[5]}"
+        )
+        now = datetime.now().replace(second=0, microsecond=0)
+        entry = HistoryRecord.from_stats(now, float(data[0]), get_system_stats(logging))
+        context.bot_data['history_partitions'].record([(address, make_time_key(now), entry)])
+    except Exception as e:
+        logging.error(f"Error in /node {address} : {e}")
+        await update.message.reply_text("Arf !")
+
+
 @auth_required
 async def node(update: Update, context: CallbackContext) -> None:
-    """Handle /node command: fetch Massa node status, send stats and validation chart."""
+    """Handle /node [address] command: fetch Massa node status, send stats and validation chart."""
     logging.info(f'User {update.effective_user.id} used the /node command.')
-    balance_history = context.bot_data['balance_history']
     massa_node_address = context.bot_data['massa_node_address']
 
-    image_path = None
+    selected = _select_address(context, list(context.args or []))
+    if selected is None or selected[1]:
+        await update.message.reply_text("Usage: /node [address]\n" + _addresses_text(context))
+        return
+    if selected[0] != massa_node_address:
+        await _other_node(update, context, selected[0])
+        return
+
     try:
         # Fetch node data via JSON-RPC
+        started = time.perf_counter()
         json_data = get_addresses(logging, massa_node_address)
+        latency_ms = (time.perf_counter() - started) * 1000
         if await handle_api_error(update, json_data):
+            record_probe(context.bot_data, False)
             return
 
         # Parse the response into individual fields
         data = extract_address_data(json_data)
         if data is None:
             logging.error("Node unreachable or no data available")
+            record_probe(context.bot_data, False, latency_ms)
             await update.message.reply_text("Node unreachable or no data available.")
             return
+        record_probe(context.bot_data, not (any(data[4]) or data[1] == 0), latency_ms)
 
         # Send a text summary of the node status
         formatted_string = (
@@ -93,33 +274,30 @@ async def node(update: Update, context: CallbackContext) -> None:
 
         # Record current balance snapshot with timestamp, including system resources
         system_stats = get_system_stats(logging)
-        time_key = make_time_key()
-        entry = build_balance_entry(float(data[0]), system_stats)
+        now = datetime.now().replace(second=0, microsecond=0)
+        time_key = make_time_key(now)
+        entry = HistoryRecord.from_stats(now, float(data[0]), system_stats)
 
-        lock = context.bot_data['balance_lock']
-        with lock:
-            balance_history[time_key] = entry
-            save_balance_history(balance_history)
+        record_snapshot(context.bot_data, time_key, entry)
+        if context.bot_data.get('chart_cache') is not None:
+            context.bot_data['chart_cache'].notify()
 
         # Generate and send a validation chart (OK/NOK counts per cycle)
-        image_path = create_png_plot(data[2], data[4], data[3])
-        if image_path and os.path.exists(image_path):
+        # Rendered in memory, uploaded straight from the PNG bytes
+        image = await _plot(context, create_png_plot, data[2], data[4], data[3])
+        if image:
             try:
-                with open(image_path, 'rb') as image_file:
-                    await update.message.reply_photo(photo=image_file)
-            except (FileNotFoundError, OSError) as e:
+                await update.message.reply_photo(photo=image)
+            except Exception as e:
                 logging.error(f"Error while send image : {e}")
                 await update.message.reply_text("Error while send image.")
         else:
-            logging.error("Image file was not created successfully.")
+            logging.error("Validation chart was not created successfully.")
             await update.message.reply_text("Image file was not created successfully.")
     except Exception as e:
         logging.error(f"Error in /node : {e}")
         await update.message.reply_text("Arf !")
         await update.message.reply_photo(photo=f'media/{PAT_FILE_NAME}')
-    finally:
-        # Always clean up the temporary chart image
-        safe_delete_file(image_path)
 
 
 async def flush(update: Update, context: CallbackContext) -> int:
@@ -173,10 +351,18 @@ async def flush_confirm_yes(update: Update, context: CallbackContext) -> int:
             pass
         # Clear the in-memory balance history and persist the empty state
         balance_history = context.bot_data['balance_history']
+        persister = context.bot_data.get('history_persister')
         lock = context.bot_data['balance_lock']
         with lock:
             balance_history.clear()
-            save_balance_history(balance_history)
+            if context.bot_data.get('history_window') is not None:
+                context.bot_data['history_window'].clear()
+            if persister is None:
+                save_balance_history(balance_history)
+        if persister is not None:
+            persister.request_save()
+        if context.bot_data.get('history_archive') is not None:
+            clear_archive()
 
         message = "✓ Log file and balance history have been cleared."
         logging.info(message)
@@ -213,6 +399,49 @@ async def flush_confirm_no(update: Update, context: CallbackContext) -> int:
     return ConversationHandler.END
 
 
+async def _ask_hist_text(update: Update) -> int:
+    """Ask whether the history should also be sent as text, and enter the confirmation state."""
+    keyboard = [
+        [
+            InlineKeyboardButton("Yes", callback_data='hist_yes'),
+            InlineKeyboardButton("No", callback_data='hist_no')
+        ]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    await update.message.reply_text(
+        "Do you also want to receive the balance history as text?",
+        reply_markup=reply_markup
+    )
+    return HIST_CONFIRM_STATE
+
+
+async def _send_cached_charts(update: Update, chart_cache, name: str) -> int:
+    """Send a pre-rendered standard chart, rendering it first when the history changed since."""
+    try:
+        # A stale chart is rendered in a worker thread (through the plot pool when there is one)
+        chart = chart_cache.get(name) or await asyncio.to_thread(chart_cache.render, name)
+    except PlotPoolBusy:
+        await update.message.reply_text(_PLOT_POOL_BUSY)
+        return ConversationHandler.END
+    except Exception as e:
+        logging.error(f"Error creating balance history plot: {e}")
+        await update.message.reply_text("Error creating history graph.")
+        return ConversationHandler.END
+    if chart.balance_png is None:
+        await update.message.reply_text("No balance history in that range.")
+        return ConversationHandler.END
+    try:
+        await update.message.reply_photo(photo=chart.balance_png)
+        if chart.resources_png is not None:
+            await update.message.reply_photo(photo=chart.resources_png)
+        return await _ask_hist_text(update)
+    except Exception as e:
+        logging.error(f"Error while sending history image : {e}")
+        await update.message.reply_text("Error sending history image.")
+        return ConversationHandler.END
+
+
 async def hist(update: Update, context: CallbackContext) -> int:
     """Handle /hist command: send balance and resources history charts, then ask for text summary.
     This is a ConversationHandler entry point (cannot use @auth_required).
@@ -220,7 +449,6 @@ async def hist(update: Update, context: CallbackContext) -> int:
     user_id = str(update.effective_user.id)
     logging.info(f'User {user_id} used the /hist command.')
     allowed_user_ids = context.bot_data.get('allowed_user_ids', set())
-    balance_history = context.bot_data['balance_history']
 
     # Manual auth check (ConversationHandler requires returning a state)
     if user_id not in allowed_user_ids:
@@ -229,34 +457,66 @@ async def hist(update: Update, context: CallbackContext) -> int:
         await notify_admins_unauthorized(context, user_id)
         return ConversationHandler.END
 
-    if not balance_history:
+    selected = _select_address(context, list(context.args or []))
+    parsed = _parse_hist_args(selected[1]) if selected is not None else None
+    if parsed is None:
+        usage = _HIST_USAGE
+        if context.bot_data.get('history_partitions') is not None:
+            usage += "\n" + _addresses_text(context)
+        await update.message.reply_text(usage)
+        return ConversationHandler.END
+    window, step, agg = parsed
+    address = selected[0]
+    is_primary = address == context.bot_data.get('massa_node_address')
+    history, lock = await _address_history(context, address)
+    start = datetime.now() - window if window is not None else None
+    # Scheduled jobs rebuild the history from another thread: read a copy taken under its lock
+    with lock or contextlib.nullcontext():
+        empty = not history
+        balance_history = copy_window(history, start)
+    # Remembered for the text summary callback
+    context.user_data['hist_address'] = address
+
+    if empty:
         await update.message.reply_text("No balance history available.")
         return ConversationHandler.END
 
-    image_path = None
-    resources_path = None
+    # 24h, 7d and full-range charts of the first address are pre-rendered after each snapshot
+    chart_cache = context.bot_data.get('chart_cache')
+    if chart_cache is not None and is_primary and step is None and chart_name(window) is not None:
+        return await _send_cached_charts(update, chart_cache, chart_name(window))
+
     try:
-        # Generate a balance-over-time chart
+        # Chart only the requested range and resolution, including archived months when there
+        # are any
         try:
-            image_path = create_balance_history_plot(balance_history)
+            chart_history = balance_history
+            # Additional addresses have their own archive directory
+            archive_dir = None if is_primary else partition_archive_dir(address)
+            if context.bot_data.get('history_archive') is not None and read_manifest(archive_dir):
+                chart_history = history_with_archive(balance_history, start, directory=archive_dir)
+            if window is not None or step is not None:
+                chart_history = query_history(chart_history, start, None, step, agg)
+                if not chart_history:
+                    await update.message.reply_text("No balance history in that range.")
+                    return ConversationHandler.END
+            image = await _plot(context, create_balance_history_plot, chart_history)
+        except PlotPoolBusy:
+            await update.message.reply_text(_PLOT_POOL_BUSY)
+            return ConversationHandler.END
         except Exception as e:
             logging.error(f"Error creating balance history plot: {e}")
             await update.message.reply_text("Error creating history graph.")
             return ConversationHandler.END
 
-        if not image_path or not os.path.exists(image_path):
-            logging.error("History image file was not created successfully.")
+        if not image:
+            logging.error("History image was not created successfully.")
             await update.message.reply_text("Error creating history image.")
             return ConversationHandler.END
 
         # Send the balance chart image to the user
         try:
-            with open(image_path, 'rb') as image_file:
-                await update.message.reply_photo(photo=image_file)
-        except (FileNotFoundError, OSError) as e:
-            logging.error(f"Error while sending history image : {e}")
-            await update.message.reply_text("Error while sending history image.")
-            return ConversationHandler.END
+            await update.message.reply_photo(photo=image)
         except Exception as e:
             logging.error(f"Error while sending history image : {e}")
             await update.message.reply_text("Error sending history image.")
@@ -264,37 +524,19 @@ async def hist(update: Update, context: CallbackContext) -> int:
 
         # Generate and send the resources (temperature + RAM) chart when data is available
         try:
-            resources_path = create_resources_plot(balance_history)
-            if resources_path and os.path.exists(resources_path):
-                with open(resources_path, 'rb') as resources_file:
-                    await update.message.reply_photo(photo=resources_file)
+            resources = await _plot(context, create_resources_plot, chart_history)
+            if resources:
+                await update.message.reply_photo(photo=resources)
         except Exception as e:
             logging.error(f"Error creating or sending resources plot: {e}")
             # Non-fatal: continue without the resources chart
 
         # Ask if the user also wants the history as a text message
-        keyboard = [
-            [
-                InlineKeyboardButton("Yes", callback_data='hist_yes'),
-                InlineKeyboardButton("No", callback_data='hist_no')
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        await update.message.reply_text(
-            "Do you also want to receive the balance history as text?",
-            reply_markup=reply_markup
-        )
-
-        return HIST_CONFIRM_STATE
+        return await _ask_hist_text(update)
     except Exception as error:
         logging.error(f"Error in /hist command: {error}")
         await update.message.reply_text("Error retrieving balance history.")
         return ConversationHandler.END
-    finally:
-        # Always clean up the temporary chart images
-        for path in (image_path, resources_path):
-            safe_delete_file(path)
 
 
 @cb_auth_required
@@ -303,7 +545,9 @@ async def hist_confirm_yes(update: Update, context: CallbackContext) -> int:
     query = update.callback_query
     user_id = str(query.from_user.id)
     logging.info(f'User {user_id} confirmed hist with text summary.')
-    balance_history = context.bot_data['balance_history']
+    history, lock = await _address_history(context, context.user_data.get('hist_address'))
+    with lock or contextlib.nullcontext():
+        balance_history = copy_window(history)
 
     try:
         if not balance_history:
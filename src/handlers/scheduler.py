@@ -1,19 +1,28 @@
+import time
 import logging
 import functools
 import asyncio
-from datetime import datetime
+import contextlib
+from datetime import datetime, timedelta
 from telegram.ext import Application
 from apscheduler.schedulers.background import BackgroundScheduler
 from services.massa_rpc import get_addresses
 from services.system_monitor import get_system_stats
-from handlers.node import extract_address_data
+from handlers.node import extract_address_data, record_probe, record_snapshot
 from services.history import (
-    save_balance_history, filter_last_24h, filter_since_midnight,
+    compact_balance_history, copy_window, rebuild_aside, save_balance_history,
+    filter_last_24h, filter_since_midnight,
     get_entry_balance, get_entry_temperature,
-    make_time_key, build_balance_entry, format_history_entry,
+    make_time_key, format_history_entry, HistoryRecord,
 )
+from services.history_runs import compact_runs
+from services.history_archive import collect_archivable, write_archive, remove_archived
+from services.history_partitions import HistoryPartition, partition_archive_dir
 from config import (
-    JOB_SCHED_NAME, NODE_IS_DOWN, NODE_IS_UP,
+    JOB_SCHED_NAME, HISTORY_COMPACT_JOB_NAME, HISTORY_RETENTION_DEFAULT, HISTORY_RUNS_DEFAULT,
+    NODE_IS_DOWN, NODE_IS_UP,
+    HISTORY_ARCHIVE_JOB_NAME, HISTORY_ARCHIVE_DEFAULT,
+    PROBE_LOG_FLUSH_JOB_NAME, PROBE_LOG_FLUSH_SECONDS,
     TIMEOUT_NAME, TIMEOUT_FIRE_NAME,
 )
 
@@ -34,7 +43,10 @@ def _get_application_bot_data(application: Application) -> dict:
 def run_async_func(application: Application) -> None:
     """Set up the background scheduler for periodic node pinging.
     Creates or reuses an asyncio event loop, then registers a job
-    that runs periodic_node_ping every 60 minutes.
+    that runs periodic_node_ping every 60 minutes, plus daily
+    compact_history and archive_history jobs when a history retention
+    policy or archive is configured, and a job writing the buffered
+    health probes to the probe log file.
     """
     try:
         bot_data = _get_application_bot_data(application)
@@ -71,6 +83,42 @@ def run_async_func(application: Application) -> None:
             name=JOB_SCHED_NAME
         )
 
+        # Downsample old balance history once a day, starting right away
+        if bot_data.get('history_retention') is not None:
+            logging.info(f"Add daily job {HISTORY_COMPACT_JOB_NAME}.")
+            scheduler.add_job(
+                functools.partial(compact_history, application),
+                'interval',
+                hours=24,
+                next_run_time=datetime.now(),
+                id=HISTORY_COMPACT_JOB_NAME,
+                name=HISTORY_COMPACT_JOB_NAME
+            )
+
+        # Move closed months to compressed archive segments once a day
+        if bot_data.get('history_archive') is not None:
+            logging.info(f"Add daily job {HISTORY_ARCHIVE_JOB_NAME}.")
+            scheduler.add_job(
+                functools.partial(archive_history, application),
+                'interval',
+                hours=24,
+                next_run_time=datetime.now(),
+                id=HISTORY_ARCHIVE_JOB_NAME,
+                name=HISTORY_ARCHIVE_JOB_NAME
+            )
+
+        # Probes are recorded on the event loop; their file writes happen here
+        probe_log = bot_data.get('probe_log')
+        if probe_log is not None:
+            logging.info(f"Add periodic job {PROBE_LOG_FLUSH_JOB_NAME}.")
+            scheduler.add_job(
+                probe_log.flush,
+                'interval',
+                seconds=PROBE_LOG_FLUSH_SECONDS,
+                id=PROBE_LOG_FLUSH_JOB_NAME,
+                name=PROBE_LOG_FLUSH_JOB_NAME
+            )
+
         if not scheduler.running:
             scheduler.start()
             logging.info("Scheduler started.")
@@ -88,6 +136,7 @@ def stop_async_func(application: Application) -> None:
     scheduler = bot_data.get('scheduler')
     loop = bot_data.get('scheduler_loop')
     owns_loop = bot_data.get('scheduler_owns_loop', False)
+    persister = bot_data.get('history_persister')
 
     if scheduler is not None:
         try:
@@ -97,6 +146,29 @@ def stop_async_func(application: Application) -> None:
         except Exception as e:
             logging.error(f"Error stopping scheduler: {e}")
 
+    # Write out every queued history mutation before exiting
+    partitions = bot_data.get('history_partitions')
+    if partitions is not None:
+        partitions.stop()
+    chart_cache = bot_data.get('chart_cache')
+    if chart_cache is not None:
+        chart_cache.stop()
+    plot_pool = bot_data.get('plot_pool')
+    if plot_pool is not None:
+        try:
+            plot_pool.stop()
+        except Exception as e:
+            logging.error(f"Error stopping plot pool: {e}")
+    if persister is not None:
+        try:
+            persister.stop()
+            logging.info("History persister flushed and stopped.")
+        except Exception as e:
+            logging.error(f"Error stopping history persister: {e}")
+    probe_log = bot_data.get('probe_log')
+    if probe_log is not None:
+        probe_log.flush()
+
     if owns_loop and loop is not None:
         try:
             if not loop.is_running() and not loop.is_closed():
@@ -106,6 +178,131 @@ def stop_async_func(application: Application) -> None:
             logging.error(f"Error closing scheduler loop: {e}")
 
 
+def _job_partitions(bot_data: dict) -> list:
+    """Return the ``HistoryPartition`` of every address for the daily history jobs.
+
+    The first address comes first: its history, lock, window and persister come straight
+    from ``bot_data``; the other partitions are loaded if they are not yet
+    (see ``HistoryPartitions.others``), on the scheduler thread.
+    """
+    primary = HistoryPartition(
+        bot_data.get('massa_node_address'), bot_data['balance_history'],
+        bot_data.get('balance_lock'), bot_data.get('history_window'),
+        bot_data.get('history_persister'))
+    partitions = bot_data.get('history_partitions')
+    return [primary] + (partitions.others() if partitions is not None else [])
+
+
+def _persist_partition(partition) -> None:
+    """Save a partition after a bulk change, through its persister when it has one."""
+    if partition.persister is not None:
+        partition.persister.request_save()
+        return
+    with partition.lock:
+        save_balance_history(partition.history)
+
+
+def compact_history(application: Application) -> None:
+    """Scheduled job: apply the history retention policy and persist the result.
+
+    Entries older than ``raw_days`` become hourly aggregates and entries older
+    than ``hourly_days`` daily aggregates (see ``compact_balance_history``).
+    When ``history_retention`` has a ``runs`` dict, unchanged consecutive
+    snapshots are then stored as runs in the snapshot file (see ``compact_runs``).
+    Every monitored address is compacted.  Runs in the scheduler thread on a
+    copy of each history, which is swapped in under its lock (see
+    ``rebuild_aside``).
+    """
+    bot_data = _get_application_bot_data(application)
+    retention = bot_data.get('history_retention')
+    if retention is None or bot_data.get('balance_history') is None:
+        return
+
+    raw_days = retention.get('raw_days', HISTORY_RETENTION_DEFAULT['raw_days'])
+    hourly_days = retention.get('hourly_days', HISTORY_RETENTION_DEFAULT['hourly_days'])
+    runs = retention.get('runs')
+    settings = None
+    if isinstance(runs, dict):
+        settings = {name: runs.get(name, default) for name, default in HISTORY_RUNS_DEFAULT.items()}
+
+    def compact(history: dict) -> tuple:
+        removed = compact_balance_history(history, raw_days=raw_days, hourly_days=hourly_days)
+        saved = compact_runs(history, **settings) if settings is not None else 0
+        return removed, saved
+
+    try:
+        partitions = _job_partitions(bot_data)
+    except Exception as e:
+        logging.error(f"Error in compact_history: {e}")
+        return
+    for index, partition in enumerate(partitions):
+        try:
+            # Compact only once older entries have finished loading in the background
+            ready = getattr(partition.history, 'ready', None)
+            if ready is not None:
+                ready.wait()
+            # Compacted aside and swapped in, so /node and the ping job are not held up
+            removed, saved = rebuild_aside(partition.history, partition.lock, compact)
+            if removed and partition.window is not None:
+                with partition.lock:
+                    partition.window.rebuild(partition.history)
+            if not (removed or saved):
+                continue
+            _persist_partition(partition)
+            if index == 0 and bot_data.get('chart_cache') is not None:
+                bot_data['chart_cache'].notify()
+        except Exception as e:
+            logging.error(f"Error in compact_history ({partition.address}): {e}")
+
+
+def archive_history(application: Application) -> None:
+    """Scheduled job: move closed months out of the hot history into archive segments.
+
+    Entries are copied under the history's lock, compressed and written to
+    ``config/history/`` (``config/history/<address>/`` for additional
+    addresses) without holding it, and only then removed from the hot
+    history (on a copy swapped in under the lock), so a crash in between
+    leaves them in both places (the next run merges them again) rather than
+    in neither.
+    """
+    bot_data = _get_application_bot_data(application)
+    archive = bot_data.get('history_archive')
+    if archive is None or bot_data.get('balance_history') is None:
+        return
+
+    hot_days = archive.get('hot_days', HISTORY_ARCHIVE_DEFAULT['hot_days'])
+    compression = archive.get('compression', HISTORY_ARCHIVE_DEFAULT['compression'])
+    try:
+        partitions = _job_partitions(bot_data)
+    except Exception as e:
+        logging.error(f"Error in archive_history: {e}")
+        return
+    for index, partition in enumerate(partitions):
+        try:
+            history = partition.history
+            ready = getattr(history, 'ready', None)
+            if ready is not None:
+                ready.wait()
+            with partition.lock:
+                boundary, months = collect_archivable(history, hot_days=hot_days)
+            if not months:
+                continue
+            directory = None if index == 0 else partition_archive_dir(partition.address)
+            archived = write_archive(months, compression=compression, directory=directory)
+            # Removed from a copy swapped in under the lock, so readers never see a
+            # half-shifted history
+            rebuild_aside(history, partition.lock,
+                          lambda working: remove_archived(working, boundary, months))
+            _persist_partition(partition)
+            if index == 0 and bot_data.get('chart_cache') is not None:
+                bot_data['chart_cache'].notify()
+            logging.info(
+                f"Archived {archived} balance history entries of {partition.address} "
+                f"from {len(months)} closed month(s).")
+        except Exception as e:
+            logging.error(f"Error in archive_history ({partition.address}): {e}")
+
+
 def run_coroutine_in_loop(coroutine, application, loop) -> None:
     """Run an async coroutine from a synchronous scheduler thread.
     Uses run_coroutine_threadsafe when the loop is already running (thread-safe),
@@ -136,19 +333,171 @@ def run_coroutine_in_loop(coroutine, application, loop) -> None:
         logging.error(f"Error in run_coroutine_in_loop: {e}")
 
 
+def _build_report(balance_history: dict, window, now: datetime, current_time_key: str,
+                  last_balance: float, lock=None) -> str:
+    """Build the scheduled status report of one address from its history.
+
+    :param balance_history: History of the address, already holding the current snapshot.
+    :param window: Its ``RollingWindow``, or None to scan the history.
+    :param now: Time of the ping.
+    :param current_time_key: Key of the snapshot just recorded.
+    :param last_balance: Balance just recorded.
+    :param lock: Lock guarding *balance_history*, held while the last 24 hours are copied.
+    """
+    if not balance_history:
+        return NODE_IS_UP
+    if window is None:
+        # Scheduled jobs may rebuild the history meanwhile: scan a copy of the last 24 hours
+        with lock or contextlib.nullcontext():
+            balance_history = copy_window(balance_history, now - timedelta(hours=24))
+    if window is not None:
+        # Precomputed 24h aggregates, maintained on every insert
+        recent_history = window.recent(now)
+        first_since_midnight = window.first_since_midnight(now)
+        avg_temp = window.temperature_average(now)
+    else:
+        # Get entries from the last 24 hours (rolling window) and since today's midnight
+        recent_history = filter_last_24h(balance_history)
+        midnight_history = filter_since_midnight(balance_history)
+        first_since_midnight = None
+        if midnight_history:
+            first_since_midnight = (
+                next(iter(midnight_history)),
+                get_entry_balance(next(iter(midnight_history.values()))),
+            )
+        # Compute 24h average temperature from resource entries
+        temp_samples = [
+            get_entry_temperature(v)
+            for v in recent_history.values()
+            if get_entry_temperature(v) is not None
+        ]
+        avg_temp = sum(temp_samples) / len(temp_samples) if temp_samples else None
+
+    # Pre-compute oldest balance in the 24h rolling window
+    if recent_history:
+        oldest_24h_timestamp = next(iter(recent_history))
+        oldest_24h_balance = get_entry_balance(next(iter(recent_history.values())))
+    else:
+        oldest_24h_timestamp = None
+        oldest_24h_balance = None
+
+    # "First" is the first balance recorded after midnight today
+    if first_since_midnight is not None:
+        first_timestamp, first_balance = first_since_midnight
+    elif oldest_24h_balance is not None:
+        first_timestamp = oldest_24h_timestamp
+        first_balance = oldest_24h_balance
+    else:
+        first_timestamp = "N/A"
+        first_balance = 0
+
+    # "Current" is the most recently recorded balance
+    last_timestamp = current_time_key
+
+    # "Change" is the difference over the last 24 hours (rolling window)
+    if oldest_24h_balance is not None:
+        balance_change = last_balance - oldest_24h_balance
+        change_percent = (
+            (balance_change / oldest_24h_balance * 100) if oldest_24h_balance != 0 else 0)
+    else:
+        balance_change = 0
+        change_percent = 0
+
+    change_indicator = "📈" if balance_change >= 0 else "📉"
+
+    avg_temp_str = (
+        f"🌡️ Avg CPU Temp (24h): {avg_temp:.1f}°C\n"
+        if avg_temp is not None else ""
+    )
+
+    return (
+        f"{NODE_IS_UP}\n"
+        f"\n"
+        f"💰 Balance Comparison:\n"
+        f"First: {first_balance:.2f} ({first_timestamp})\n"
+        f"Current: {last_balance:.2f} ({last_timestamp})\n"
+        f"Change: {change_indicator} {balance_change:+.2f} ({change_percent:+.2f}%)\n"
+        f"\n"
+        f"{avg_temp_str}"
+        f"📊 Last 24h History:\n"
+        f"{'─' * 40}\n" +
+        ("\n".join(
+            format_history_entry(timestamp, v)
+            for timestamp, v in recent_history.items()
+        ) if recent_history else "No data in the last 24h.")
+    )
+
+
+async def _ping_other_addresses(application: Application, partitions, json_data: dict,
+                                now: datetime, system_stats: dict, report: bool) -> None:
+    """Record the snapshots of the additional addresses of a batched ping, then alert and report.
+
+    :param partitions: ``HistoryPartitions`` from ``bot_data``.
+    :param json_data: ``get_addresses`` response for every address, in
+        ``partitions.addresses`` order.
+    :param report: True at the scheduled report hours.
+    """
+    allowed_user_ids = application.bot_data.get('allowed_user_ids', set())
+    report_addresses = application.bot_data.get('report_addresses')
+    time_key = make_time_key(now)
+    snapshots = []
+    up_addresses = []
+    for index, address in enumerate(partitions.addresses[1:], start=1):
+        data = extract_address_data(json_data, index)
+        if data is None:
+            logging.error(f"Invalid data for {address}.")
+            continue
+        if any(data[4]) or data[1] == 0:
+            for user_id in allowed_user_ids:
+                await application.bot.send_message(
+                    chat_id=user_id, text=f"{address}\n{NODE_IS_DOWN}")
+            logging.info(f"Node {address} is down.")
+        else:
+            up_addresses.append((address, float(data[0])))
+        entry = HistoryRecord.from_stats(
+            now.replace(second=0, microsecond=0), float(data[0]), system_stats)
+        snapshots.append((address, time_key, entry))
+    # One journal write per address for the whole ping
+    partitions.record(snapshots)
+
+    if not report:
+        return
+    for address, balance in up_addresses:
+        if report_addresses is not None and address not in report_addresses:
+            continue
+        # Loading a partition parses its snapshot file: keep it off the event loop
+        partition = await asyncio.to_thread(partitions.get, address)
+        text = _build_report(partition.history, partition.window, now, time_key, balance,
+                             partition.lock)
+        for user_id in allowed_user_ids:
+            await application.bot.send_message(chat_id=user_id, text=f"📍 {address}\n{text}")
+
+
 async def periodic_node_ping(application: Application) -> None:
     """Periodic task (every 60 min) to check node status and notify users.
     Records balance snapshots and sends detailed reports at 7h, 12h and 21h.
+    With several addresses configured (``history_partitions`` in ``bot_data``),
+    every address is fetched in one batched request and reported separately.
     """
     logging.info('Node ping beginning...')
     allowed_user_ids = application.bot_data.get('allowed_user_ids', set())
     balance_history = application.bot_data.get('balance_history', {})
     massa_node_address = application.bot_data.get('massa_node_address', '')
+    partitions = application.bot_data.get('history_partitions')
+    report_addresses = application.bot_data.get('report_addresses')
+    several = partitions is not None and len(partitions.addresses) > 1
 
     try:
-        # Fetch node data via JSON-RPC
-        json_data = get_addresses(logging, massa_node_address)
+        # Fetch node data via JSON-RPC, one request for every address
+        started = time.perf_counter()
+        if several:
+            json_data = get_addresses(logging, partitions.addresses)
+        else:
+            json_data = get_addresses(logging, massa_node_address)
+        latency_ms = (time.perf_counter() - started) * 1000
         if "error" in json_data:
+            # A failed ping is a down probe, not a missing one
+            record_probe(application.bot_data, False)
             error_message = json_data["error"]
             # Pick the appropriate error image
             if "timed out" in error_message:
@@ -177,6 +526,7 @@ async def periodic_node_ping(application: Application) -> None:
 
         if data is None:
             logging.error("Invalid data.")
+            record_probe(application.bot_data, False, latency_ms)
             for user_id in allowed_user_ids:
                 await application.bot.send_message(chat_id=user_id, text="Ping failed, invalid data.")
             return
@@ -185,11 +535,13 @@ async def periodic_node_ping(application: Application) -> None:
 
         # Node is considered down if any NOK count is non-zero or roll count is 0
         node_is_up = not (any(data[4]) or data[1] == 0)
+        record_probe(application.bot_data, node_is_up, latency_ms)
 
         if not node_is_up:
             # Alert all users immediately when node is down
+            down_text = f"{massa_node_address}\n{NODE_IS_DOWN}" if several else NODE_IS_DOWN
             for user_id in allowed_user_ids:
-                await application.bot.send_message(chat_id=user_id, text=NODE_IS_DOWN)
+                await application.bot.send_message(chat_id=user_id, text=down_text)
             logging.info("Node is down.")
         else:
             logging.info("Node is up.")
@@ -201,89 +553,31 @@ async def periodic_node_ping(application: Application) -> None:
 
         # Collect CPU temperature and RAM usage
         system_stats = get_system_stats(logging)
-        entry = build_balance_entry(float(data[0]), system_stats)
+        entry = HistoryRecord.from_stats(
+            now.replace(second=0, microsecond=0), float(data[0]), system_stats)
 
+        window = application.bot_data.get('history_window')
         lock = application.bot_data.get('balance_lock')
-        if lock:
-            with lock:
-                balance_history[current_time_key] = entry
-                save_balance_history(balance_history)
-        else:
-            balance_history[current_time_key] = entry
-            save_balance_history(balance_history)
+        record_snapshot(application.bot_data, current_time_key, entry)
+        # Pre-render the /hist charts for the new history version
+        chart_cache = application.bot_data.get('chart_cache')
+        if chart_cache is not None:
+            chart_cache.notify()
 
         # Send a detailed status report at scheduled hours (7h, 12h, 21h)
-        if node_is_up and hour in (7, 12, 21):
-            if balance_history:
-                # Get entries from the last 24 hours (rolling window) and since today's midnight
-                recent_history = filter_last_24h(balance_history)
-                midnight_history = filter_since_midnight(balance_history)
-
-                # Pre-compute oldest balance in the 24h rolling window
-                if recent_history:
-                    oldest_24h_timestamp = next(iter(recent_history))
-                    oldest_24h_balance = get_entry_balance(next(iter(recent_history.values())))
-                else:
-                    oldest_24h_timestamp = None
-                    oldest_24h_balance = None
-
-                # "First" is the first balance recorded after midnight today
-                if midnight_history:
-                    first_timestamp = next(iter(midnight_history))
-                    first_balance = get_entry_balance(next(iter(midnight_history.values())))
-                elif oldest_24h_balance is not None:
-                    first_timestamp = oldest_24h_timestamp
-                    first_balance = oldest_24h_balance
-                else:
-                    first_timestamp = "N/A"
-                    first_balance = 0
-
-                # "Current" is the most recently recorded balance
-                last_timestamp = current_time_key
-                last_balance = float(data[0])
-
-                # "Change" is the difference over the last 24 hours (rolling window)
-                if oldest_24h_balance is not None:
-                    balance_change = last_balance - oldest_24h_balance
-                    change_percent = (balance_change / oldest_24h_balance * 100) if oldest_24h_balance != 0 else 0
-                else:
-                    balance_change = 0
-                    change_percent = 0
-
-                change_indicator = "📈" if balance_change >= 0 else "📉"
-
-                # Compute 24h average temperature from resource entries
-                temp_samples = [
-                    get_entry_temperature(v)
-                    for v in recent_history.values()
-                    if get_entry_temperature(v) is not None
-                ]
-                avg_temp_str = (
-                    f"🌡️ Avg CPU Temp (24h): {sum(temp_samples) / len(temp_samples):.1f}°C\n"
-                    if temp_samples else ""
-                )
-
-                tmp_string = (
-                    f"{NODE_IS_UP}\n"
-                    f"\n"
-                    f"💰 Balance Comparison:\n"
-                    f"First: {first_balance:.2f} ({first_timestamp})\n"
-                    f"Current: {last_balance:.2f} ({last_timestamp})\n"
-                    f"Change: {change_indicator} {balance_change:+.2f} ({change_percent:+.2f}%)\n"
-                    f"\n"
-                    f"{avg_temp_str}"
-                    f"📊 Last 24h History:\n"
-                    f"{'─' * 40}\n" +
-                    ("\n".join(
-                        format_history_entry(timestamp, v)
-                        for timestamp, v in recent_history.items()
-                    ) if recent_history else "No data in the last 24h.")
-                )
-            else:
-                tmp_string = NODE_IS_UP
-
+        report = hour in (7, 12, 21)
+        reported = report_addresses is None or massa_node_address in report_addresses
+        if node_is_up and report and reported:
+            tmp_string = _build_report(balance_history, window, now, current_time_key,
+                                       float(data[0]), lock)
+            if several:
+                tmp_string = f"📍 {massa_node_address}\n{tmp_string}"
             for user_id in allowed_user_ids:
                 await application.bot.send_message(chat_id=user_id, text=tmp_string)
 
+        if several:
+            await _ping_other_addresses(application, partitions, json_data, now, system_stats,
+                                        report)
+
     except Exception as e:
         logging.error(f"Error in periodic_node_ping: {e}")
@@ -1,10 +1,12 @@
 import logging
+import contextlib
 import subprocess
 from datetime import datetime, timedelta
 from telegram import Update
 from telegram.ext import CallbackContext
 from services.system_monitor import get_system_stats
 from services.massa_rpc import measure_rpc_latency
+from services.history import parse_time_key
 from handlers.common import auth_required
 from config import BUDDY_FILE_NAME
 
@@ -84,6 +86,7 @@ def _calculate_uptime(balance_history: dict) -> float:
     """
     Calculate node uptime percentage based on balance history entries.
     Assumes one entry per hour = 24 entries in 24h = 100% uptime.
+    Indexed histories answer the 24h count in O(log n); plain dicts are scanned.
     """
     if not balance_history:
         return 0.0
@@ -91,10 +94,14 @@ def _calculate_uptime(balance_history: dict) -> float:
     now = datetime.now()
     cutoff = now - timedelta(hours=24)
     
-    entries_in_24h = sum(
-        1 for key in balance_history.keys()
-        if _is_recent(key, cutoff, now)
-    )
+    count_between = getattr(balance_history, 'count_between', None)
+    if count_between is not None:
+        entries_in_24h = count_between(cutoff, None)
+    else:
+        entries_in_24h = sum(
+            1 for key in balance_history.keys()
+            if _is_recent(key, cutoff, now)
+        )
     
     # Max 24 entries in 24h = 100%
     uptime = (entries_in_24h / 24) * 100
@@ -103,19 +110,66 @@ def _calculate_uptime(balance_history: dict) -> float:
 
 def _is_recent(key: str, cutoff: datetime, now: datetime) -> bool:
     """
-    Check if a history key is within the last 24 hours.
-    Supports both new (YYYY/MM/DD-HH:MM) and legacy (DD/MM-HH:MM) formats.
+    Check if a history key (YYYY/MM/DD-HH:MM) is within the last 24 hours.
     """
-    try:
-        dt = datetime.strptime(key, "%Y/%m/%d-%H:%M")
-    except ValueError:
-        try:
-            dt = datetime.strptime(key, "%d/%m-%H:%M").replace(year=now.year)
-            if dt > now + timedelta(hours=1):
-                dt = dt.replace(year=now.year - 1)
-        except ValueError:
-            return False
-    return dt >= cutoff
+    dt = parse_time_key(key)
+    return dt is not None and dt >= cutoff
+
+
+def _format_probe_uptime(probe_log, fallback_24h: float) -> str:
+    """
+    Format the uptime lines of /perf from the probe log (24h, 7d, 30d windows).
+    The 24h line falls back to the history-based figure until probes have been recorded.
+    """
+    lines = []
+    for label, stats in probe_log.uptime_windows():
+        if stats['probes'] == 0:
+            value = f"{fallback_24h}%" if label == '24h' else "N/A"
+        else:
+            value = f"{stats['uptime_percent']}% ({stats['up']}/{stats['probes']} probes"
+            if stats['latency_ms'] is not None:
+                value += f", avg {stats['latency_ms']:.0f} ms"
+            value += ")"
+        lines.append(f"Uptime ({label}): {value}")
+    return "\n".join(lines)
+
+
+def _format_startup_metrics(metrics: dict, balance_history: dict) -> str:
+    """
+    Format the startup metrics (time to first response, history load) as extra /perf lines.
+    """
+    line = f"\nStartup: first response after {metrics['time_to_first_response']:.2f} s"
+    ready = getattr(balance_history, 'ready', None)
+    load_metrics = getattr(balance_history, 'load_metrics', {})
+    if ready is not None and not ready.is_set():
+        line += "\nHistory: older entries still loading"
+    elif load_metrics.get('full_load_seconds') is not None:
+        line += f"\nHistory: fully loaded in {load_metrics['full_load_seconds']:.2f} s"
+    return line
+
+
+def _format_persister_metrics(metrics: dict) -> str:
+    """
+    Format the history persister metrics as extra /perf lines.
+    """
+    duration = metrics.get('last_flush_duration')
+    last_flush = f"{duration * 1000:.1f} ms" if duration is not None else "N/A"
+    return (
+        f"\nHistory write queue: {metrics.get('queue_depth', 0)}"
+        f"\nLast history flush: {last_flush}"
+    )
+
+
+def _format_plot_cache_metrics(metrics: dict) -> str:
+    """
+    Format the chart cache metrics as an extra /perf line.
+    """
+    lookups = metrics['hits'] + metrics['misses']
+    hit_rate = f"{metrics['hits'] / lookups * 100:.0f}%" if lookups else "N/A"
+    return (
+        f"\nChart cache: {metrics['entries']} charts, {metrics['bytes'] / 1024:.0f} KiB, "
+        f"hit rate {hit_rate} ({metrics['hits']}/{lookups})"
+    )
 
 
 @auth_required
@@ -134,14 +188,35 @@ async def perf(update: Update, context: CallbackContext) -> None:
         
         # Calculate uptime from balance history
         balance_history = context.bot_data.get('balance_history', {})
-        uptime_percent = _calculate_uptime(balance_history)
+        window = context.bot_data.get('history_window')
+        if window is not None:
+            uptime_percent = window.uptime_percent()
+        else:
+            # The background loader may be merging older entries meanwhile
+            with context.bot_data.get('balance_lock') or contextlib.nullcontext():
+                uptime_percent = _calculate_uptime(balance_history)
         
+        probe_log = context.bot_data.get('probe_log')
+        if probe_log is not None:
+            uptime_lines = _format_probe_uptime(probe_log, uptime_percent)
+        else:
+            uptime_lines = f"Uptime (24h): {uptime_percent}%"
+
         formatted_string = (
             f"⚡ Node Performance\n"
             f"-----------\n"
             f"RPC Latency: {perf_data['latency_ms']} ms\n"
-            f"Uptime (24h): {uptime_percent}%"
+            f"{uptime_lines}"
         )
+        persister = context.bot_data.get('history_persister')
+        if persister is not None:
+            formatted_string += _format_persister_metrics(persister.metrics())
+        plot_cache = context.bot_data.get('plot_cache')
+        if plot_cache is not None:
+            formatted_string += _format_plot_cache_metrics(plot_cache.metrics())
+        startup_metrics = context.bot_data.get('startup_metrics')
+        if startup_metrics:
+            formatted_string += _format_startup_metrics(startup_metrics, balance_history)
         
         await update.message.reply_text(formatted_string)
     except Exception as e:
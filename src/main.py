@@ -1,6 +1,7 @@
 import os
 import sys
 import json
+import time
 import logging
 import threading
 from telegram import BotCommand
@@ -8,11 +9,20 @@ from telegram.ext import Application, CommandHandler, ContextTypes, Conversation
 from telegram.request import HTTPXRequest
 from services.massa_rpc import get_addresses
 from services.history import load_balance_history
+from services.history_persister import HistoryPersister
+from services.history_window import RollingWindow
+from services.probe_log import ProbeLog
+from services.chart_cache import ChartCache
+from services.plot_pool import PlotPool
+from services.plotting import PlotCache, sweep_orphan_plots, prewarm
+from services.history_partitions import HistoryPartition, HistoryPartitions, parse_addresses
 from config import (
     FLUSH_CONFIRM_STATE, HIST_CONFIRM_STATE, COMMANDS_LIST,
     DOCKER_MENU_STATE, DOCKER_START_CONFIRM_STATE, DOCKER_STOP_CONFIRM_STATE, DOCKER_RESTART_CONFIRM_STATE,
     DOCKER_MASSA_MENU_STATE, DOCKER_BUYROLLS_INPUT_STATE, DOCKER_BUYROLLS_CONFIRM_STATE,
     DOCKER_SELLROLLS_INPUT_STATE, DOCKER_SELLROLLS_CONFIRM_STATE, BUDDY_FILE_NAME,
+    HISTORY_RECENT_LOAD_HOURS,
+    PLOT_WORKERS_DEFAULT, PLOT_QUEUE_SIZE, PLOT_TIMEOUT_SECONDS, PLOT_CACHE_MB_DEFAULT,
 )
 from handlers.node import node, flush, flush_confirm_yes, flush_confirm_no, hist, hist_confirm_yes, hist_confirm_no, docker, docker_start, docker_stop, docker_restart, docker_start_confirm, docker_stop_confirm, docker_restart_confirm, docker_cancel, docker_massa, massa_wallet_info, massa_buy_rolls_ask, massa_buy_rolls_input, massa_buy_rolls_confirm, massa_sell_rolls_ask, massa_sell_rolls_input, massa_sell_rolls_confirm, massa_back
 from handlers.system import _get_git_commit_hash
@@ -39,12 +49,49 @@ def disable_prints() -> None:
     sys.stderr = devnull
 
 
+def record_startup_metrics(bot_data: dict) -> None:
+    """Store time-to-first-response (process start to bot ready) in bot_data['startup_metrics']."""
+    started = bot_data.get('startup_started')
+    if started is None:
+        return
+    balance_history = bot_data.get('balance_history')
+    load_metrics = getattr(balance_history, 'load_metrics', {})
+    metrics = {
+        'time_to_first_response': time.perf_counter() - started,
+        'history_recent_load': load_metrics.get('recent_load_seconds'),
+    }
+    bot_data['startup_metrics'] = metrics
+    logging.info(
+        f"Bot ready to respond {metrics['time_to_first_response']:.2f}s after start "
+        f"(recent history loaded in {metrics['history_recent_load'] or 0:.2f}s)."
+    )
+
+
+def start_chart_rendering(bot_data: dict) -> None:
+    """Start what loads matplotlib, once the bot answers: plot workers, chart pre-warm and cached charts.
+
+    :param bot_data: Application bot_data holding ``plot_pool``, ``plot_prewarm`` and ``chart_cache``.
+    """
+    plot_pool = bot_data.get('plot_pool')
+    if plot_pool is not None:
+        # Workers load matplotlib and the chart templates in their initializer
+        plot_pool.start()
+    elif bot_data.get('plot_prewarm'):
+        threading.Thread(target=prewarm, name='plot-prewarm', daemon=True).start()
+    chart_cache = bot_data.get('chart_cache')
+    if chart_cache is not None:
+        chart_cache.notify()
+
+
 async def post_init(application: Application) -> None:
     """Register bot commands with Telegram after startup."""
     commands = [BotCommand(command=cmd['cmd_txt'], description=cmd['cmd_desc']) for cmd in COMMANDS_LIST]
     await application.bot.set_my_commands(commands)
 
     bot_data = getattr(application, 'bot_data', {})
+    if isinstance(bot_data, dict):
+        record_startup_metrics(bot_data)
+        start_chart_rendering(bot_data)
     allowed_user_ids = bot_data.get('allowed_user_ids', set()) if isinstance(bot_data, dict) else set()
     if not allowed_user_ids:
         return
@@ -65,6 +112,7 @@ async def error_handler(update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 def main():
+    startup_started = time.perf_counter()
     # Load bot configuration from topology.json
     try:
         with open('topology.json', 'r', encoding='utf-8') as file:
@@ -80,16 +128,59 @@ def main():
         logging.error("Missing required config: 'telegram_bot_token' or 'user_white_list.admin'")
         return
     allowed_user_ids = {str(admin_id)}
-    massa_node_address = config.get('massa_node_address')
+    # A single address or a list of them; the first one keeps the historical files
+    node_addresses = parse_addresses(config.get('massa_node_address'))
+    massa_node_address = node_addresses[0] if node_addresses else None
     ninja_key = config.get('ninja_api_key')
     node_container_name = config.get('node_container_name', 'massa-container')
     robbi_container_name = config.get('robbi_container_name', 'robbi-container')
     massa_client_password = config.get('massa_client_password', '')
     massa_wallet_address = config.get('massa_wallet_address', '')
     massa_buy_rolls_fee = config.get('massa_buy_rolls_fee', 0.01)
+    history_backend = config.get('history_backend', 'json')
+    # Lossy downsampling of old entries, off unless "history_retention" is set ({} uses the defaults)
+    history_retention = config.get('history_retention')
+    # Closed months stay in the hot history file unless "history_archive" is set ({} uses the defaults)
+    history_archive = config.get('history_archive')
 
-    # Load persisted balance history from JSON file on disk
-    balance_history = load_balance_history()
+    # Load persisted balance history from disk (JSON files or SQLite database).
+    # Only the recent window is loaded before polling starts; older entries follow in the background.
+    balance_lock = threading.Lock()
+    balance_history = load_balance_history(history_backend, recent_hours=HISTORY_RECENT_LOAD_HOURS, lock=balance_lock)
+    # History writes happen on a background thread; stop_async_func flushes it
+    history_persister = HistoryPersister(balance_history, balance_lock)
+    history_persister.start()
+    # 24h aggregates for reports and /perf, kept up to date on every insert
+    history_window = RollingWindow.from_history(balance_history)
+    # Outcome and latency of every health probe, for multi-window uptime in /perf
+    probe_log = ProbeLog.load()
+    # Charts are rendered in memory; remove temporary chart files a crash may have left behind
+    sweep_orphan_plots()
+    # Charts are drawn in worker processes so matplotlib never blocks the event loop.
+    # Workers are spawned, and charts first rendered, once polling starts (see start_chart_rendering)
+    plot_workers = config.get('plot_workers', PLOT_WORKERS_DEFAULT)
+    plot_prewarm = config.get('plot_prewarm', True)
+    plot_pool = None
+    if plot_workers:
+        plot_pool = PlotPool(plot_workers, PLOT_QUEUE_SIZE, PLOT_TIMEOUT_SECONDS)
+    # /hist 24h, 7d and full-range charts, re-rendered in the background after each snapshot
+    # Charts of unchanged data are served from memory instead of being drawn again
+    plot_cache_mb = config.get('plot_cache_mb', PLOT_CACHE_MB_DEFAULT)
+    plot_cache = PlotCache(int(plot_cache_mb * 1024 * 1024)) if plot_cache_mb else None
+    chart_cache = ChartCache(balance_history, balance_lock, archive=history_archive is not None,
+                             plot_pool=plot_pool, plot_cache=plot_cache)
+    chart_cache.start()
+    # Other addresses get their own history files, loaded on first use
+    history_partitions = None
+    report_addresses = None
+    if len(node_addresses) > 1:
+        history_partitions = HistoryPartitions(node_addresses, HistoryPartition(
+            massa_node_address, balance_history, balance_lock, history_window, history_persister))
+        if config.get('report_addresses') is not None:
+            # Selectors as in /node and /hist: address, 1-based position, prefix or suffix
+            report_addresses = {
+                history_partitions.resolve(str(selector)) for selector in config['report_addresses']
+            } - {None}
 
     disable_prints()  # Comment this line to enable prints (DEBUG purpose only)
     logging.info("Starting bot...")
@@ -117,7 +208,19 @@ def main():
     application.bot_data['massa_node_address'] = massa_node_address
     application.bot_data['ninja_key'] = ninja_key
     application.bot_data['balance_history'] = balance_history
-    application.bot_data['balance_lock'] = threading.Lock()
+    application.bot_data['balance_lock'] = balance_lock
+    application.bot_data['history_persister'] = history_persister
+    application.bot_data['history_window'] = history_window
+    application.bot_data['probe_log'] = probe_log
+    application.bot_data['chart_cache'] = chart_cache
+    application.bot_data['plot_pool'] = plot_pool
+    application.bot_data['plot_prewarm'] = plot_prewarm
+    application.bot_data['plot_cache'] = plot_cache
+    application.bot_data['history_partitions'] = history_partitions
+    application.bot_data['report_addresses'] = report_addresses
+    application.bot_data['startup_started'] = startup_started
+    application.bot_data['history_retention'] = history_retention
+    application.bot_data['history_archive'] = history_archive
     application.bot_data['node_container_name'] = node_container_name
     application.bot_data['robbi_container_name'] = robbi_container_name
     application.bot_data['massa_client_password'] = massa_client_password
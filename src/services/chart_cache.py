@@ -0,0 +1,165 @@
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from services.history import copy_window
+from services.history_archive import history_with_archive, read_manifest
+from services.plotting import create_balance_history_plot, create_resources_plot
+
+
+# Charts kept pre-rendered: name -> window (None for the whole history)
+STANDARD_CHARTS = (('24h', timedelta(hours=24)), ('7d', timedelta(days=7)), ('all', None))
+
+
+def chart_name(window: Optional[timedelta]) -> Optional[str]:
+    """Return the name of the standard chart covering *window*, or None when it is not pre-rendered."""
+    for name, span in STANDARD_CHARTS:
+        if span == window:
+            return name
+    return None
+
+
+def _render_png(plot_function, history: dict, plot_pool=None, plot_cache=None) -> Optional[bytes]:
+    """Render one chart with *plot_function* and return the PNG bytes, or None when there is nothing to draw.
+
+    A chart of unchanged data (e.g. a window the last snapshot did not touch) comes from *plot_cache*.
+    """
+    key = plot_cache.key(plot_function, history) if plot_cache is not None else None
+    png = plot_cache.get(key) if key is not None else None
+    if png is None:
+        png = plot_pool.run_sync(plot_function, history) if plot_pool is not None else plot_function(history)
+        if key is not None:
+            plot_cache.put(key, png)
+    return png or None
+
+
+class CachedChart:
+    """PNG bytes of one standard chart and the history version they were rendered from."""
+
+    __slots__ = ('version', 'balance_png', 'resources_png', 'rendered_at')
+
+    def __init__(self, version: int, balance_png: Optional[bytes], resources_png: Optional[bytes]):
+        self.version = version
+        self.balance_png = balance_png
+        self.resources_png = resources_png
+        self.rendered_at = time.time()
+
+
+class ChartCache:
+    """Pre-rendered ``/hist`` charts of the primary balance history.
+
+    After each history insert the scheduler and ``/node`` call
+    :meth:`notify`; a background thread then re-renders every chart in
+    ``STANDARD_CHARTS`` (bursts of notifications coalesce into one pass) and
+    keeps the PNG bytes stamped with the history ``version`` they were built
+    from.  :meth:`get` only returns a chart whose stamp matches the current
+    version, so ``/hist`` can reply at once with cached bytes and falls back
+    to :meth:`render` only when the history changed since.
+
+    Window copies are taken under the balance lock; matplotlib runs outside
+    it, in *plot_pool* when one is given, unless *plot_cache* already holds
+    a chart of the same data.
+    """
+
+    def __init__(self, balance_history: dict, lock: Optional[threading.Lock] = None, archive: bool = False,
+                 plot_pool=None, plot_cache=None):
+        self._history = balance_history
+        self._lock = lock if lock is not None else threading.Lock()
+        self._archive = archive
+        self._plot_pool = plot_pool
+        self._plot_cache = plot_cache
+        self._charts: dict = {}
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.last_refresh_duration: Optional[float] = None
+
+    def start(self) -> None:
+        """Start the render thread (no-op if it is already running)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='chart-cache', daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def version(self) -> Optional[int]:
+        """Return the version of the history, or None when it does not track one (nothing is cached then)."""
+        return getattr(self._history, 'version', None)
+
+    def notify(self) -> None:
+        """Ask the render thread to refresh the charts (after a history insert)."""
+        self._wakeup.set()
+
+    def get(self, name: str) -> Optional[CachedChart]:
+        """Return the cached chart *name* when it matches the current history version, else None."""
+        chart = self._charts.get(name)
+        if chart is not None and chart.version == self.version():
+            self.hits += 1
+            return chart
+        self.misses += 1
+        return None
+
+    def render(self, name: str) -> CachedChart:
+        """Render the standard chart *name* now, store it and return it.
+
+        :raises KeyError: When *name* is not in ``STANDARD_CHARTS``.
+        """
+        window = dict(STANDARD_CHARTS)[name]
+        with self._lock:
+            version = self.version()
+            start = datetime.now() - window if window is not None else None
+            history = copy_window(self._history, start)
+        # The archive only holds months older than the hot history, so it only matters for long windows
+        if self._archive and read_manifest():
+            history = history_with_archive(history, start)
+        chart = CachedChart(
+            version,
+            _render_png(create_balance_history_plot, history, self._plot_pool, self._plot_cache),
+            _render_png(create_resources_plot, history, self._plot_pool, self._plot_cache),
+        )
+        if version is not None:
+            self._charts[name] = chart
+        return chart
+
+    def refresh(self) -> None:
+        """Re-render every standard chart that is missing or older than the current history version."""
+        if self.version() is None:
+            return
+        started = time.perf_counter()
+        for name, _ in STANDARD_CHARTS:
+            chart = self._charts.get(name)
+            if chart is not None and chart.version == self.version():
+                continue
+            try:
+                self.render(name)
+            except Exception as e:
+                logging.error(f"Error pre-rendering the {name} history chart: {e}")
+        self.last_refresh_duration = time.perf_counter() - started
+
+    def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """Stop the render thread once the current pass is done."""
+        if not self.running:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            # Wait for the background load, or the charts would miss the older entries
+            ready = getattr(self._history, 'ready', None)
+            if ready is not None:
+                ready.wait()
+            self.refresh()
@@ -1,11 +1,32 @@
 import os
 import json
+import math
+import time
+import bisect
+import shutil
 import logging
+import functools
+import itertools
+import threading
+import contextlib
+import dataclasses
+from array import array
 from typing import Optional
 from datetime import datetime, timedelta
+from collections.abc import MutableMapping, ItemsView, ValuesView
 
 
 BALANCE_HISTORY_FILE = 'config/balance_history.json'
+# On-disk snapshot schema: v1 was a bare dict, v2 wraps canonical entries with a header
+LEGACY_SCHEMA_VERSION = 1
+HISTORY_SCHEMA_VERSION = 2
+# Journal size above which it is folded back into the snapshot file
+JOURNAL_COMPACT_BYTES = 64 * 1024
+# Snapshot entry order written by write_history_snapshot (newest first)
+SNAPSHOT_ORDER = 'newest_first'
+# Streaming loader: characters read per chunk and entries inserted per batch
+SNAPSHOT_READ_CHARS = 64 * 1024
+SNAPSHOT_CHUNK_RECORDS = 5000
 
 
 def make_time_key(dt: datetime = None) -> str:
@@ -39,11 +60,11 @@ def build_balance_entry(balance: float, system_stats: dict) -> dict:
     return entry
 
 
-def format_history_entry(time_key: str, value) -> str:
+def format_history_entry(time_key: str, value: dict) -> str:
     """Format a single history entry as a human-readable string.
 
     :param time_key: Timestamp key (e.g. ``"2025/03/14-07:00"``).
-    :param value: History entry value (str or dict).
+    :param value: History entry dict.
     :return: Formatted string like ``"2025/03/14-07:00: Balance 1234.56, Temp 42.0°C, RAM 63.5%"``.
     """
     line = f"{time_key}: Balance {get_entry_balance(value):.2f}"
@@ -53,108 +74,1600 @@ def format_history_entry(time_key: str, value) -> str:
         line += f", Temp {temp:.1f}°C"
     if ram is not None:
         line += f", RAM {ram:.1f}%"
+    rollup = get_entry_rollup(value)
+    if rollup is not None:
+        line += f" (min {rollup[0]:.2f}, max {rollup[1]:.2f}, {rollup[2]} samples)"
     return line
 
 
-def get_entry_balance(value) -> float:
+def get_entry_balance(value: dict) -> float:
     """Extract the balance from a history entry.
 
-    Supports both the legacy string format ("Balance: X.XX") and the new
-    dict format ({"balance": X.XX, ...}).
+    Entries are always dicts (or :class:`HistoryRecord` objects) once loaded:
+    legacy ``"Balance: X"`` strings are rewritten by :func:`migrate_history`
+    at load time.
 
-    :param value: A history entry value (str or dict).
-    :return: The balance as a float, or 0.0 on parse failure.
+    :param value: A history entry dict or record.
+    :return: The balance as a float, or 0.0 when absent.
     """
-    if isinstance(value, dict):
-        return float(value.get("balance", 0.0))
-    try:
-        return float(str(value).split(": ")[1])
-    except (IndexError, ValueError):
-        return 0.0
+    return float(value.get("balance", 0.0))
 
 
-def get_entry_temperature(value) -> Optional[float]:
+def get_entry_temperature(value: dict) -> Optional[float]:
     """Extract the average CPU temperature from a history entry.
 
-    Only available in the new dict format.  Returns None for legacy string
-    entries or when the sensor was unavailable at recording time.
+    Returns None when the sensor was unavailable at recording time.
 
-    :param value: A history entry value (str or dict).
+    :param value: A history entry dict.
     :return: Temperature in °C as a float, or None.
     """
-    if isinstance(value, dict):
-        return value.get("temperature_avg")
-    return None
+    return value.get("temperature_avg")
 
 
-def get_entry_ram(value) -> Optional[float]:
+def get_entry_ram(value: dict) -> Optional[float]:
     """Extract the RAM usage percentage from a history entry.
 
-    Only available in the new dict format.  Returns None for legacy string
-    entries.
-
-    :param value: A history entry value (str or dict).
+    :param value: A history entry dict.
     :return: RAM usage as a float percentage, or None.
     """
+    return value.get("ram_percent")
+
+
+def get_entry_rollup(value: dict) -> Optional[tuple]:
+    """Extract the aggregate fields of a compacted history entry.
+
+    Entries written by :func:`compact_balance_history` hold the average
+    balance in ``balance`` plus ``balance_min``, ``balance_max`` and the
+    number of raw ``samples`` they replace.
+
+    :param value: A history entry dict.
+    :return: ``(balance_min, balance_max, samples)``, or None for raw entries.
+    """
+    samples = value.get("samples")
+    if samples is None:
+        return None
+    balance = get_entry_balance(value)
+    return (
+        float(value.get("balance_min", balance)),
+        float(value.get("balance_max", balance)),
+        int(samples),
+    )
+
+
+# Entry dict fields of a HistoryRecord, in JSON order
+_RECORD_ENTRY_FIELDS = (
+    'balance', 'temperature_avg', 'ram_percent', 'balance_min', 'balance_max', 'samples',
+)
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class HistoryRecord:
+    """Immutable balance history sample with typed fields and a parsed timestamp.
+
+    ``get()``, ``[]`` and ``in`` read the entry field names like a read-only
+    entry dict, so the ``get_entry_*`` helpers, :func:`format_history_entry`,
+    :func:`aggregate_entries` and every history store accept records and
+    entry dicts alike.  JSON files keep the entry dict format: records are
+    written through :meth:`to_entry` (see :func:`json_default`) and read back
+    with :meth:`from_entry`.
+    """
+
+    timestamp: datetime
+    balance: float
+    temperature_avg: Optional[float] = None
+    ram_percent: Optional[float] = None
+    balance_min: Optional[float] = None
+    balance_max: Optional[float] = None
+    samples: Optional[int] = None
+
+    @classmethod
+    def from_entry(cls, timestamp: datetime, value) -> 'HistoryRecord':
+        """Build a record from a (schema v2) entry dict or another record."""
+        if isinstance(value, cls):
+            if value.timestamp == timestamp:
+                return value
+            return dataclasses.replace(value, timestamp=timestamp)
+        rollup = get_entry_rollup(value)
+        return cls(timestamp, get_entry_balance(value), get_entry_temperature(value),
+                   get_entry_ram(value), *(rollup or ()))
+
+    @classmethod
+    def from_stats(cls, timestamp: datetime, balance: float, system_stats: dict) -> 'HistoryRecord':
+        """Record version of :func:`build_balance_entry`."""
+        return cls(timestamp, float(balance),
+                   system_stats.get("temperature_avg"), system_stats.get("ram_percent"))
+
+    @property
+    def key(self) -> str:
+        """Canonical ``YYYY/MM/DD-HH:MM`` history key of the record."""
+        return make_time_key(self.timestamp)
+
+    @property
+    def rollup(self) -> Optional[tuple]:
+        """``(balance_min, balance_max, samples)`` for compacted records, None for raw ones."""
+        if self.samples is None:
+            return None
+        return self.balance_min, self.balance_max, self.samples
+
+    def get(self, field: str, default=None):
+        """Return an entry field like ``dict.get`` (missing readings fall back to *default*)."""
+        if field not in _RECORD_ENTRY_FIELDS:
+            return default
+        value = getattr(self, field)
+        return default if value is None else value
+
+    def __getitem__(self, field: str):
+        value = self.get(field)
+        if value is None:
+            raise KeyError(field)
+        return value
+
+    def __contains__(self, field) -> bool:
+        return self.get(field) is not None
+
+    def to_entry(self) -> dict:
+        """Return the JSON entry dict, omitting missing fields."""
+        fields = ((field, getattr(self, field)) for field in _RECORD_ENTRY_FIELDS)
+        return {field: value for field, value in fields if value is not None}
+
+
+def json_default(value):
+    """``default`` hook for ``json.dump``: write :class:`HistoryRecord` values as entry dicts."""
+    if isinstance(value, HistoryRecord):
+        return value.to_entry()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _parse_legacy_time_key(key: str, now: datetime) -> Optional[datetime]:
+    """Parse a legacy ``DD/MM-HH:MM`` key.
+
+    The year is guessed: the current one, or the previous one when that would
+    place the key more than an hour in the future.
+    """
+    try:
+        dt = datetime.strptime(key, "%d/%m-%H:%M").replace(year=now.year)
+    except ValueError:
+        return None
+    if dt > now + timedelta(hours=1):
+        dt = dt.replace(year=now.year - 1)
+    return dt
+
+
+def migrate_entry(value) -> Optional[dict]:
+    """Rewrite a schema v1 history value into the canonical entry dict.
+
+    :param value: Legacy ``"Balance: X"`` string or entry dict.
+    :return: Canonical entry dict, or None when the value cannot be parsed.
+    """
     if isinstance(value, dict):
-        return value.get("ram_percent")
+        entry: dict = {"balance": float(value.get("balance", 0.0))}
+        for field in ("temperature_avg", "ram_percent"):
+            if value.get(field) is not None:
+                entry[field] = value[field]
+        return entry
+    try:
+        return {"balance": float(str(value).split(": ")[1])}
+    except (IndexError, ValueError):
+        return None
+
+
+def migrate_history(raw: dict, now: datetime = None) -> dict:
+    """Rewrite a schema v1 history into canonical keys and entries.
+
+    Legacy ``DD/MM-HH:MM`` keys become ``YYYY/MM/DD-HH:MM`` and legacy string
+    values become entry dicts.  Records that cannot be parsed are dropped
+    (they remain in the pre-migration backup).  When a legacy key and a
+    canonical key collide, the canonical record wins.
+
+    :param raw: History dict as read from a schema v1 file.
+    :param now: Reference time used to guess the year of legacy keys.
+    :return: Canonical history dict.
+    """
+    if now is None:
+        now = datetime.now()
+    migrated: dict = {}
+    dropped = 0
+    for key, value in raw.items():
+        dt = parse_time_key(key)
+        is_canonical = dt is not None
+        if dt is None:
+            dt = _parse_legacy_time_key(key, now)
+        entry = migrate_entry(value)
+        if dt is None or entry is None:
+            dropped += 1
+            continue
+        new_key = make_time_key(dt)
+        if is_canonical or new_key not in migrated:
+            migrated[new_key] = entry
+    if dropped:
+        logging.warning(f"Dropped {dropped} unparseable balance history records during migration.")
+    return migrated
+
+
+def _migrate_snapshot(raw: dict, path: str = None) -> dict:
+    """Back up a schema v1 snapshot file and return its migrated entries.
+
+    :param path: Snapshot file, ``BALANCE_HISTORY_FILE`` by default.
+    """
+    path = path or BALANCE_HISTORY_FILE
+    backup_path = f"{path}.v{LEGACY_SCHEMA_VERSION}.bak"
+    if not os.path.exists(backup_path):
+        shutil.copy2(path, backup_path)
+    migrated = migrate_history(raw)
+    logging.info(
+        f"Migrated balance history from schema v{LEGACY_SCHEMA_VERSION} "
+        f"to v{HISTORY_SCHEMA_VERSION} "
+        f"({len(migrated)}/{len(raw)} records kept, backup in {backup_path})."
+    )
+    return migrated
+
+
+def history_file(balance_history: dict = None) -> str:
+    """Return the snapshot file of *balance_history*.
+
+    Histories of additional addresses carry their own ``history_file`` (see
+    :mod:`services.history_partitions`); everything else uses ``BALANCE_HISTORY_FILE``.
+    """
+    return getattr(balance_history, 'history_file', None) or BALANCE_HISTORY_FILE
+
+
+def get_journal_path(path: str = None) -> str:
+    """Return the path of the append-only journal that sits next to the snapshot *path*."""
+    return os.path.splitext(path or BALANCE_HISTORY_FILE)[0] + '.journal'
+
+
+def get_backup_path(path: str = None) -> str:
+    """Return the path of the previous snapshot kept as a recovery fallback."""
+    return (path or BALANCE_HISTORY_FILE) + '.bak'
+
+
+def get_previous_journal_path(path: str = None) -> str:
+    """Return the path of the journal folded into the current snapshot."""
+    return get_journal_path(path) + '.prev'
+
+
+def _fsync_directory(path: str) -> None:
+    """Make renames inside *path* durable (no-op where directories cannot be opened)."""
+    try:
+        fd = os.open(path or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _replay_journal(balance_history: dict, journal_path: str = None) -> int:
+    """Apply every journal record on top of *balance_history* in place.
+
+    Malformed lines in the middle of the journal are skipped.  An unterminated
+    last line is a write torn by a crash: it is replayed if it still parses,
+    otherwise it is cut off so the next append starts on a clean line.
+
+    :param balance_history: History dict loaded from the snapshot.
+    :param journal_path: Journal to replay; defaults to :func:`get_journal_path`.
+    :return: Number of records replayed.
+    """
+    if journal_path is None:
+        journal_path = get_journal_path()
+    if not os.path.exists(journal_path):
+        return 0
+    with open(journal_path, 'rb') as f:
+        data = f.read()
+    replayed = 0
+    lines = data.split(b'\n')
+    # split() leaves the bytes after the last newline (normally b'') at the end
+    tail = lines.pop()
+    for line in lines:
+        if _replay_record(balance_history, line):
+            replayed += 1
+        elif line.strip():
+            logging.warning("Skipping malformed balance journal record.")
+    if tail.strip():
+        if _replay_record(balance_history, tail):
+            replayed += 1
+            # Terminate the record so the next append starts on its own line
+            with open(journal_path, 'ab') as f:
+                f.write(b'\n')
+        else:
+            logging.warning(f"Dropping torn balance journal tail ({len(tail)} bytes).")
+            with open(journal_path, 'r+b') as f:
+                f.truncate(len(data) - len(tail))
+    return replayed
+
+
+def _replay_record(balance_history: dict, line: bytes) -> bool:
+    """Apply one journal line; return False when it is blank or malformed."""
+    line = line.strip()
+    if not line:
+        return False
+    try:
+        record = json.loads(line)
+        balance_history[record["key"]] = record["entry"]
+        return True
+    except (ValueError, KeyError, TypeError):
+        return False
+
+
+class _SnapshotReader:
+    """Incremental parser for a snapshot file.
+
+    The file is read in fixed-size chunks and decoded one ``"key": entry``
+    pair at a time with :meth:`json.JSONDecoder.raw_decode`, so memory is
+    bounded by the chunk size instead of the file size.  Top-level fields
+    found before ``entries`` are collected in :attr:`header`; iterating the
+    reader yields the entries.  A schema v1 file has no ``entries`` field, so
+    its whole content ends up in :attr:`header`.
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+        self._has_entries = False
+        self.header: dict = {}
+        self._expect('{')
+        if self._peek() == '}':
+            return
+        while True:
+            key = self._key()
+            if key == 'entries':
+                self._expect('{')
+                self._has_entries = True
+                return
+            self.header[key] = self._value()
+            if not self._next_member():
+                return
+
+    def _fill(self) -> None:
+        chunk = self._f.read(SNAPSHOT_READ_CHARS)
+        if not chunk:
+            self._eof = True
+            return
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if self._eof:
+                raise ValueError("Unexpected end of balance history snapshot")
+            self._fill()
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise ValueError(
+                f"Expected {char!r} in balance history snapshot, got {self._buf[self._pos]!r}")
+        self._pos += 1
+
+    def _next_member(self) -> bool:
+        """Consume the separator after a member: True for ``,``, False for ``}``."""
+        char = self._peek()
+        self._pos += 1
+        if char not in ',}':
+            raise ValueError(f"Expected ',' or '}}' in balance history snapshot, got {char!r}")
+        return char == ','
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                self._fill()
+                continue
+            if end == len(self._buf) and not self._eof:
+                # A number may go on in the next chunk
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+    def _key(self) -> str:
+        key = self._value()
+        if not isinstance(key, str):
+            raise ValueError(f"Invalid key {key!r} in balance history snapshot")
+        self._expect(':')
+        return key
+
+    def __iter__(self):
+        if not self._has_entries or self._peek() == '}':
+            return
+        while True:
+            key = self._key()
+            yield key, self._value()
+            if not self._next_member():
+                return
+
+
+def _read_snapshot(path: str, live: bool = False) -> tuple:
+    """Read a whole snapshot file, migrating schema v1 content.
+
+    :param live: True for a live snapshot file (not a backup), which gets a
+        one-time ``.v1.bak`` copy.
+    :return: ``(entries, needs_migration)``.
+    :raises ValueError, OSError, KeyError, TypeError, AttributeError: When the file
+        is unreadable or corrupt.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = _SnapshotReader(f)
+        if "schema_version" not in reader.header:
+            # Only the live file gets a one-time .v1.bak copy
+            raw = reader.header
+            return (_migrate_snapshot(raw, path) if live else migrate_history(raw)), True
+        from services.history_runs import expand_runs
+        return dict(expand_runs(reader)), False
+
+
+def _load_records(balance_history: dict, records,
+                  stop_before: Optional[datetime] = None) -> Optional[tuple]:
+    """Feed ``(key, entry)`` records into *balance_history* in chunks.
+
+    :param stop_before: Stop at the first canonical record older than this
+        (the records must then be newest first).
+    :return: The record it stopped at, or None when *records* is exhausted.
+    """
+    chunk = []
+    for key, value in records:
+        if stop_before is not None:
+            dt = parse_time_key(key)
+            if dt is not None and dt < stop_before:
+                balance_history.update(chunk)
+                return key, value
+        chunk.append((key, value))
+        if len(chunk) >= SNAPSHOT_CHUNK_RECORDS:
+            balance_history.update(chunk)
+            chunk = []
+    balance_history.update(chunk)
     return None
 
 
-def load_balance_history() -> dict:
-    """Load balance history from the JSON file on disk.
-    Returns an empty dict if the file does not exist or is corrupted.
+def _quarantine(path: str) -> None:
+    """Move a corrupt snapshot aside so it is neither loaded nor overwritten."""
+    target = f"{path}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    try:
+        os.replace(path, target)
+        logging.error(f"Corrupt balance history moved to {target}.")
+    except OSError as e:
+        logging.error(f"Error quarantining corrupt balance history {path}: {e}")
+
+
+def _recover_from_backup(balance_history: dict, path: str = None) -> bool:
+    """Load the previous snapshot and the journal folded into the current one.
+
+    The previous journal only holds records newer than the backup when it was
+    rotated after the backup was written (a completed save); after a crash in
+    the middle of a save it is older and already part of the backup.
+
+    :param path: Live snapshot file; defaults to ``BALANCE_HISTORY_FILE``.
+    :return: True when a usable backup was found.
+    """
+    backup_path = get_backup_path(path)
+    if not os.path.exists(backup_path):
+        return False
+    try:
+        entries, _ = _read_snapshot(backup_path)
+    except (ValueError, IOError, KeyError, TypeError, AttributeError) as e:
+        logging.error(f"Error loading balance history backup: {e}")
+        return False
+    balance_history.update(entries)
+    previous_journal = get_previous_journal_path(path)
+    if (os.path.exists(previous_journal)
+            and os.path.getmtime(previous_journal) >= os.path.getmtime(backup_path)):
+        _replay_journal(balance_history, previous_journal)
+    logging.warning(f"Recovered {len(balance_history)} balance history entries from {backup_path}.")
+    return True
+
+
+def _load_older_records(balance_history: 'BalanceHistory', f, records, first: tuple,
+                        lock, started: float, path: str = None) -> None:
+    """Background part of :func:`load_balance_history`: load the rest of the snapshot.
+
+    The older records are collected in a separate container and merged in
+    one step under *lock*, then ``balance_history.ready`` is set.
+    """
+    generation = balance_history.generation
+    older = BalanceHistory()
+    try:
+        _load_records(older, itertools.chain([first], records))
+    except (ValueError, IOError, KeyError, TypeError, AttributeError) as e:
+        # Keep what was read; preserve the damaged file before it is rewritten
+        logging.error(f"Error loading older balance history: {e}")
+        path = path or BALANCE_HISTORY_FILE
+        try:
+            shutil.copy2(path, f"{path}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}")
+        except OSError as copy_error:
+            logging.error(f"Error copying corrupt balance history: {copy_error}")
+    finally:
+        f.close()
+    with lock if lock is not None else contextlib.nullcontext():
+        balance_history.merge_older(older, generation)
+    balance_history.load_metrics["full_load_seconds"] = time.perf_counter() - started
+    balance_history.ready.set()
+    logging.info(
+        f"Loaded {len(older)} older balance history entries in the background "
+        f"({balance_history.load_metrics['full_load_seconds']:.2f}s)."
+    )
+
+
+def load_balance_history(backend: str = 'json', recent_hours: Optional[float] = None, lock=None,
+                         path: str = None) -> dict:
+    """Load balance history from disk.
+
+    With the default ``json`` backend the snapshot file is streamed into a
+    :class:`BalanceHistory` in chunks (never parsed as a whole), then the
+    append-only journal is replayed on top of it so entries recorded since
+    the last save are restored.  If the snapshot is missing after an
+    interrupted save, or corrupt (it is then quarantined), the previous
+    snapshot (``.bak``) and journals are used instead, so a crash costs at
+    most the entries that were never written to disk.
+
+    With *recent_hours*, only entries from that window are loaded before
+    returning; older ones are loaded by a background thread and merged under
+    *lock*.  ``ready`` on the returned history is set once everything is
+    loaded, and ``load_metrics`` records ``recent_load_seconds`` and
+    ``full_load_seconds``.  Snapshots written before this format (oldest
+    first) are always loaded in full.
+
+    With the ``sqlite`` backend a :class:`~services.history_sqlite.SqliteBalanceHistory`
+    mapping is returned instead (importing the JSON files on first use), and
+    with the ``binary`` backend the fixed-record snapshot file is mapped and
+    queried in place (see :func:`services.history_binary.load_binary_history`).
+
+    :param backend: Storage backend name from ``topology.json`` (``json``, ``sqlite``
+        or ``binary``).
+    :param recent_hours: Size of the window to load before returning; None loads everything.
+    :param lock: Lock guarding the history (``balance_lock``), held while older entries are merged.
+    :param path: Snapshot file of the ``json`` backend; defaults to ``BALANCE_HISTORY_FILE``.
+        The returned history keeps it as ``history_file`` so saves and
+        journal appends go next to it.
     """
-    if os.path.exists(BALANCE_HISTORY_FILE):
+    if backend == 'sqlite':
+        from services.history_sqlite import open_sqlite_history
+        return open_sqlite_history()
+    if backend == 'binary':
+        from services.history_binary import load_binary_history
+        return load_binary_history()
+    if backend != 'json':
+        logging.error(f"Unknown history backend '{backend}', falling back to json.")
+
+    started = time.perf_counter()
+    balance_history = BalanceHistory()
+    balance_history.history_file = path
+    path = path or BALANCE_HISTORY_FILE
+    needs_migration = False
+    pending = None
+    if os.path.exists(path):
+        f = None
         try:
-            with open(BALANCE_HISTORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
+            f = open(path, 'r', encoding='utf-8')
+            reader = _SnapshotReader(f)
+            if "schema_version" not in reader.header:
+                balance_history.update(_migrate_snapshot(reader.header, path))
+                needs_migration = True
+            else:
+                stop_before = None
+                if recent_hours is not None and reader.header.get("order") == SNAPSHOT_ORDER:
+                    stop_before = datetime.now() - timedelta(hours=recent_hours)
+                # Runs of unchanged snapshots are stored as single entries
+                from services.history_runs import expand_runs
+                newest_first = reader.header.get("order") == SNAPSHOT_ORDER
+                records = expand_runs(reader, newest_first=newest_first)
+                first_older = _load_records(balance_history, records, stop_before)
+                if first_older is not None:
+                    pending = (f, records, first_older)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logging.error(f"Error loading balance history: {e}")
+            if f is not None:
+                f.close()
+                f = None
+            balance_history.clear()
+            _quarantine(path)
+            _recover_from_backup(balance_history, path)
+        except IOError as e:
+            # Unreadable but not known to be corrupt: leave the file alone
             logging.error(f"Error loading balance history: {e}")
-    return {}
+            if f is not None:
+                f.close()
+            balance_history.clear()
+            return balance_history
+        if f is not None and pending is None:
+            f.close()
+    else:
+        _recover_from_backup(balance_history, path)
+    try:
+        _replay_journal(balance_history, get_journal_path(path))
+    except IOError as e:
+        logging.error(f"Error replaying balance history journal: {e}")
+    if needs_migration:
+        # Persist the canonical form once so later loads take the fast path
+        save_balance_history(balance_history)
+
+    balance_history.load_metrics["recent_load_seconds"] = time.perf_counter() - started
+    if pending is None:
+        metrics = balance_history.load_metrics
+        metrics["full_load_seconds"] = metrics["recent_load_seconds"]
+    else:
+        balance_history.ready.clear()
+        threading.Thread(
+            target=_load_older_records,
+            args=(balance_history, *pending, lock, started, path),
+            name='history-loader',
+            daemon=True,
+        ).start()
+    return balance_history
+
+
+def write_history_snapshot(entries: dict, path: str = None, runs: Optional[dict] = None) -> None:
+    """Atomically replace the snapshot file with *entries* and reset the journal.
+
+    Entries are written one per line, newest first (``"order": "newest_first"``
+    in the header), which lets :func:`load_balance_history` stop after the
+    recent window.  The snapshot is written to a temporary file in the same directory,
+    fsync'ed and renamed over the live file, so readers (and a crash) only
+    ever see a complete snapshot.  The replaced snapshot is kept as ``.bak``
+    and the folded journal as ``.journal.prev`` for
+    :func:`load_balance_history` to fall back on.  Creates the parent
+    directory if it does not exist.
+
+    :param entries: Plain ``key -> entry`` dict to persist.
+    :param path: Snapshot file; defaults to ``BALANCE_HISTORY_FILE``.
+    :param runs: Run-length settings (see :func:`services.history_runs.compact_runs`):
+        unchanged consecutive snapshots are then written as single entries.
+    :raises OSError: When the snapshot cannot be written.
+    """
+    path = path or BALANCE_HISTORY_FILE
+    if runs is not None:
+        from services.history_runs import compress_runs
+        entries = dict(compress_runs(entries.items(), **runs))
+    directory = os.path.dirname(path)
+    # Ensure the config/ directory exists (first run or fresh container)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        # One entry per line, newest first, so the loader can stream the recent window first
+        f.write(f'{{"schema_version": {HISTORY_SCHEMA_VERSION}, '
+                f'"order": "{SNAPSHOT_ORDER}", "entries": {{')
+        encode = json.JSONEncoder(separators=(',', ':'), default=json_default).encode
+        f.write('\n')
+        f.write(',\n'.join(f'{encode(key)}: {encode(entries[key])}' for key in reversed(entries)))
+        f.write('\n}}\n')
+        f.flush()
+        os.fsync(f.fileno())
+    if os.path.exists(path):
+        os.replace(path, get_backup_path(path))
+    os.replace(tmp_path, path)
+    retire_journal(path)
+
+
+def retire_journal(path: str = None) -> None:
+    """Move the journal aside as ``.journal.prev``.
+
+    Called once a snapshot holding its entries is on disk.
+    """
+    journal_path = get_journal_path(path)
+    if os.path.exists(journal_path):
+        os.replace(journal_path, get_previous_journal_path(path))
+    _fsync_directory(os.path.dirname(journal_path))
+
+
+def get_snapshot_writer(balance_history: dict):
+    """Return the function that writes a full snapshot of *balance_history*.
+
+    Histories loaded from another on-disk format (binary backend) provide
+    their own ``write_snapshot``; everything else uses :func:`write_history_snapshot`
+    on its own :func:`history_file`, with its ``run_settings``.
+    """
+    writer = getattr(balance_history, 'write_snapshot', None)
+    if writer is not None:
+        return writer
+    path = getattr(balance_history, 'history_file', None)
+    runs = getattr(balance_history, 'run_settings', None)
+    if path is None and runs is None:
+        return write_history_snapshot
+    return functools.partial(write_history_snapshot, path=path, runs=runs)
+
+
+def append_journal_records(records: list, path: str = None) -> int:
+    """Append ``(key, entry)`` records to the journal in a single fsync'ed write.
+
+    :param records: Records to append, oldest first.
+    :param path: Snapshot file the journal belongs to; defaults to ``BALANCE_HISTORY_FILE``.
+    :return: Journal size in bytes after the write.
+    :raises OSError: When the journal cannot be written.
+    """
+    os.makedirs(os.path.dirname(path or BALANCE_HISTORY_FILE), exist_ok=True)
+    journal_path = get_journal_path(path)
+    lines = "".join(
+        json.dumps({"key": key, "entry": entry}, separators=(',', ':'), default=json_default) + '\n'
+        for key, entry in records
+    )
+    with open(journal_path, 'a', encoding='utf-8') as f:
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+    return os.path.getsize(journal_path)
 
 
 def save_balance_history(balance_history: dict) -> None:
-    """Persist the balance history dict to the JSON file.
-    Creates the parent directory if it does not exist.
+    """Persist the full balance history dict as a snapshot and reset the journal.
+
+    This is an O(n) rewrite: use :func:`append_balance_entry` to record a
+    single new entry.  Write-through stores (SQLite backend) are already
+    durable and are skipped.
     """
+    if getattr(balance_history, 'write_through', False):
+        return
+    ready = getattr(balance_history, 'ready', None)
+    if ready is not None and not ready.is_set():
+        # Writing now would drop the entries that are still loading
+        logging.warning("Balance history still loading, snapshot deferred (journal kept).")
+        return
     try:
-        # Ensure the config/ directory exists (first run or fresh container)
-        os.makedirs(os.path.dirname(BALANCE_HISTORY_FILE), exist_ok=True)
-        with open(BALANCE_HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(balance_history, f, indent=2)
+        get_snapshot_writer(balance_history)(dict(balance_history.items()))
     except IOError as e:
         logging.error(f"Error saving balance history: {e}")
 
 
-def filter_since_midnight(history: dict) -> dict:
-    """Filter balance history to keep only entries recorded today after midnight.
-    Returns entries from the current day (00:00:00 onwards) in chronological order.
-    Keys are in "YYYY/MM/DD-HH:MM" format (with year).
-    Legacy keys in "DD/MM-HH:MM" format are also supported.
+def append_balance_entry(balance_history: dict, time_key: str) -> None:
+    """Append the entry stored under *time_key* to the on-disk journal.
+
+    Each call writes a single JSON line, so recording a snapshot costs O(1)
+    I/O regardless of the history size.  Once the journal grows past
+    ``JOURNAL_COMPACT_BYTES`` it is compacted into a fresh snapshot.
+
+    :param balance_history: In-memory history already holding *time_key*.
+    :param time_key: Key of the entry to persist.
     """
-    now = datetime.now()
-    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    current_year = now.year
+    if getattr(balance_history, 'write_through', False):
+        return
+    try:
+        records = [(time_key, balance_history[time_key])]
+        if append_journal_records(records, history_file(balance_history)) > JOURNAL_COMPACT_BYTES:
+            save_balance_history(balance_history)
+    except IOError as e:
+        logging.error(f"Error appending to balance history journal: {e}")
+
+
+def parse_time_key(key: str) -> Optional[datetime]:
+    """Parse a canonical ``YYYY/MM/DD-HH:MM`` balance history key.
+
+    Legacy keys are rewritten at load time (see :func:`migrate_history`), so
+    only the canonical format is handled here, by slicing rather than
+    ``strptime``.
+
+    :param key: History time key.
+    :return: Parsed datetime, or None when the key is not canonical.
+    """
+    if len(key) != 16 or key[4] != '/' or key[7] != '/' or key[10] != '-' or key[13] != ':':
+        return None
+    try:
+        return datetime(int(key[0:4]), int(key[5:7]), int(key[8:10]),
+                        int(key[11:13]), int(key[14:16]))
+    except ValueError:
+        return None
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+
+
+def datetime_to_epoch(dt: datetime) -> int:
+    """Convert a naive wall-clock datetime to integer seconds (no timezone shift).
+
+    History keys carry local wall-clock time, so they are mapped to seconds as
+    if they were UTC; this keeps the mapping bijective across DST changes.
+    """
+    return (dt.toordinal() - _EPOCH_ORDINAL) * 86400 + dt.hour * 3600 + dt.minute * 60 + dt.second
+
+
+def epoch_to_datetime(ts: int) -> datetime:
+    """Inverse of :func:`datetime_to_epoch`."""
+    return _EPOCH + timedelta(seconds=ts)
+
+
+# Columns of a BalanceHistory, in storage order (missing values are NaN)
+HISTORY_COLUMNS = ("timestamp", "balance", "temperature_avg", "ram_percent")
+
+
+def _column_insert(column: array, index: int, value: float) -> array:
+    """Insert into *column*, copying it first if a zero-copy view is still exported.
+
+    Returns the column that now holds the data (the original or its copy).
+    """
+    try:
+        column.insert(index, value)
+    except BufferError:
+        column = array('d', column)
+        column.insert(index, value)
+    return column
+
+
+def _column_delete(column: array, index: int) -> array:
+    """Delete from *column*, copying it first if a zero-copy view is still exported."""
+    try:
+        del column[index]
+    except BufferError:
+        column = array('d', column)
+        del column[index]
+    return column
+
+
+def _column_extend(column: array, values: list) -> array:
+    """Extend *column*, copying it first if a zero-copy view is still exported."""
+    try:
+        column.extend(values)
+    except BufferError:
+        column = array('d', column)
+        column.extend(values)
+    return column
+
+
+def _nan_if_none(value: Optional[float]) -> float:
+    """Map a missing optional value to NaN for column storage."""
+    return math.nan if value is None else float(value)
+
+
+class _RowItemsView(ItemsView):
+    def __iter__(self):
+        yield from self._mapping._iter_rows()
+
+
+class _RowValuesView(ValuesView):
+    def __iter__(self):
+        for _, value in self._mapping._iter_rows():
+            yield value
+
+
+class BalanceHistory(MutableMapping):
+    """Columnar in-memory balance history with a sorted timestamp index.
+
+    Entries are stored as four parallel ``array('d')`` columns (timestamp in
+    epoch seconds, balance, temperature_avg, ram_percent) sorted by time, with
+    NaN for missing values: 32 bytes per entry instead of a key string plus a
+    dict.  Keys are parsed once on insert and rebuilt from the timestamp on
+    read, so the mapping view old callers rely on is unchanged.
+
+    Window queries (:meth:`items_between`, :meth:`count_between`) use
+    ``bisect`` on the timestamp column, and :meth:`columns` exposes zero-copy
+    ``memoryview`` slices for charts and reports.  Mutating the history while
+    such a view is alive transparently copies the affected column first.
+
+    Keys that are not canonical are kept in a side dict (so they survive a
+    save), are yielded last and never match a window query.  The few rows
+    written by :func:`compact_balance_history` keep their min/max/sample
+    count in another side dict keyed by timestamp.
+    """
+
+    # Snapshot file when not BALANCE_HISTORY_FILE (additional addresses)
+    history_file: Optional[str] = None
+    # Run-length settings applied when its snapshots are written (see services.history_runs)
+    run_settings: Optional[dict] = None
+
+    def __init__(self, entries=None):
+        self._ts = array('d')
+        self._balance = array('d')
+        self._temperature = array('d')
+        self._ram = array('d')
+        self._unindexed: dict = {}
+        self._rollups: dict = {}
+        # Cleared while older rows are still loading in the background
+        self.ready = threading.Event()
+        self.ready.set()
+        self._generation = 0
+        # Bumped by every change to the logical entries (see version)
+        self._version = 0
+        self.load_metrics: dict = {}
+        if entries:
+            self.update(entries)
+
+    def _find(self, epoch: float) -> int:
+        """Return the row holding *epoch*, or -1."""
+        index = bisect.bisect_left(self._ts, epoch)
+        if index < len(self._ts) and self._ts[index] == epoch:
+            return index
+        return -1
+
+    @staticmethod
+    def _make_entry(balance: float, temperature: float, ram: float,
+                    rollup: Optional[tuple]) -> dict:
+        entry: dict = {"balance": balance}
+        if not math.isnan(temperature):
+            entry["temperature_avg"] = temperature
+        if not math.isnan(ram):
+            entry["ram_percent"] = ram
+        if rollup is not None:
+            entry["balance_min"], entry["balance_max"], entry["samples"] = rollup
+        return entry
+
+    def _row_entry(self, index: int) -> dict:
+        return self._make_entry(self._balance[index], self._temperature[index], self._ram[index],
+                                self._rollups.get(self._ts[index]))
+
+    def _row_key(self, index: int) -> str:
+        return make_time_key(epoch_to_datetime(int(self._ts[index])))
+
+    def _iter_rows(self):
+        for index in range(len(self._ts)):
+            yield self._row_key(index), self._row_entry(index)
+        yield from self._unindexed.items()
+
+    def __getitem__(self, key: str) -> dict:
+        dt = parse_time_key(key)
+        if dt is None:
+            return self._unindexed[key]
+        index = self._find(datetime_to_epoch(dt))
+        if index < 0:
+            raise KeyError(key)
+        return self._row_entry(index)
+
+    @staticmethod
+    def _row_values(value: dict) -> tuple:
+        return (
+            get_entry_balance(value),
+            _nan_if_none(get_entry_temperature(value)),
+            _nan_if_none(get_entry_ram(value)),
+        )
+
+    def __setitem__(self, key: str, value: dict) -> None:
+        self._version += 1
+        dt = parse_time_key(key)
+        if dt is None:
+            self._unindexed[key] = value
+            return
+        epoch = float(datetime_to_epoch(dt))
+        self._set_row(epoch, self._row_values(value))
+        self._set_rollup(epoch, value)
+
+    def _set_rollup(self, epoch: float, value: dict) -> None:
+        rollup = get_entry_rollup(value)
+        if rollup is None:
+            self._rollups.pop(epoch, None)
+        else:
+            self._rollups[epoch] = rollup
+
+    def _set_row(self, epoch: float, row: tuple) -> None:
+        index = bisect.bisect_left(self._ts, epoch)
+        if index < len(self._ts) and self._ts[index] == epoch:
+            # Overwrite in place: no resize, so exported views stay valid
+            self._balance[index], self._temperature[index], self._ram[index] = row
+            return
+        # Entries almost always arrive in order, so this is usually an append
+        self._ts = _column_insert(self._ts, index, epoch)
+        self._balance = _column_insert(self._balance, index, row[0])
+        self._temperature = _column_insert(self._temperature, index, row[1])
+        self._ram = _column_insert(self._ram, index, row[2])
+
+    def update(self, other=(), **kwargs) -> None:
+        """Insert many entries at once.
+
+        When every new entry is more recent than the current last row (e.g.
+        when loading a snapshot), or older than the first one (streaming a
+        newest-first snapshot), the columns are built with a single sort and
+        extend or prepend instead of one bisect/insert per entry.
+        """
+        pairs = list(other.items() if hasattr(other, 'items') else other)
+        pairs.extend(kwargs.items())
+        self._version += 1
+        rows: dict = {}
+        for key, value in pairs:
+            dt = parse_time_key(key)
+            if dt is None:
+                self._unindexed[key] = value
+            else:
+                epoch = float(datetime_to_epoch(dt))
+                rows[epoch] = self._row_values(value)
+                self._set_rollup(epoch, value)
+        if not rows:
+            return
+        ordered = sorted(rows.items())
+        columns = (
+            [epoch for epoch, _ in ordered],
+            [row[0] for _, row in ordered],
+            [row[1] for _, row in ordered],
+            [row[2] for _, row in ordered],
+        )
+        if not self._ts or ordered[0][0] > self._ts[-1]:
+            self._ts, self._balance, self._temperature, self._ram = (
+                _column_extend(column, values)
+                for column, values in zip(
+                    (self._ts, self._balance, self._temperature, self._ram), columns)
+            )
+        elif ordered[-1][0] < self._ts[0]:
+            # Concatenation builds new arrays, so exported views stay valid
+            self._ts, self._balance, self._temperature, self._ram = (
+                array('d', values) + column
+                for column, values in zip(
+                    (self._ts, self._balance, self._temperature, self._ram), columns)
+            )
+        else:
+            for epoch, row in ordered:
+                self._set_row(epoch, row)
+
+    @classmethod
+    def from_columns(cls, timestamps, balances, temperatures, rams) -> 'BalanceHistory':
+        """Build a history straight from column buffers, without per-entry parsing.
+
+        Each argument is a bytes-like object of native doubles (e.g. a
+        contiguous float64 NumPy array); timestamps must be sorted epoch
+        seconds and missing temperature/RAM values NaN.
+        """
+        history = cls()
+        columns = (history._ts, history._balance, history._temperature, history._ram)
+        for column, buffer in zip(columns, (timestamps, balances, temperatures, rams)):
+            column.frombytes(memoryview(buffer).cast('B'))
+        return history
+
+    def merge_older(self, older: 'BalanceHistory', generation: int) -> None:
+        """Merge the rows of *older* that this history does not hold yet.
+
+        Used by the background loader once the older part of a snapshot has
+        been read: rows already present (e.g. replayed from the journal) win,
+        and rows older than the current first row are prepended in one step.
+        The merged columns are built aside and swapped in with
+        :meth:`replace_with`, so the live columns are never shown half
+        merged.  Nothing is merged if the history was cleared since
+        *generation* was read (see :attr:`generation`).
+        """
+        if generation != self._generation:
+            return
+        merged = self.copy()
+        first = self._ts[0] if self._ts else math.inf
+        split = bisect.bisect_left(older._ts, first)
+        if split:
+            merged._ts, merged._balance, merged._temperature, merged._ram = (
+                theirs[:split] + ours
+                for theirs, ours in zip(
+                    (older._ts, older._balance, older._temperature, older._ram),
+                    (merged._ts, merged._balance, merged._temperature, merged._ram),
+                )
+            )
+        for index in range(split, len(older._ts)):
+            epoch = older._ts[index]
+            if merged._find(epoch) < 0:
+                merged._set_row(epoch, (older._balance[index], older._temperature[index],
+                                        older._ram[index]))
+                if epoch in older._rollups:
+                    merged._rollups[epoch] = older._rollups[epoch]
+        for epoch, rollup in older._rollups.items():
+            if epoch < first:
+                merged._rollups[epoch] = rollup
+        for key, value in older._unindexed.items():
+            merged._unindexed.setdefault(key, value)
+        self.replace_with(merged)
+
+    def delete_before(self, end: datetime) -> int:
+        """Remove every row recorded before *end* in one slice.
+
+        :return: Number of rows removed.
+        """
+        _, high = self._bounds(None, end)
+        if not high:
+            return 0
+        self._version += 1
+        last = self._ts[high - 1]
+        for epoch in [epoch for epoch in self._rollups if epoch <= last]:
+            del self._rollups[epoch]
+        # Slicing builds new arrays, so exported views stay valid
+        self._ts, self._balance, self._temperature, self._ram = (
+            column[high:] for column in (self._ts, self._balance, self._temperature, self._ram)
+        )
+        return high
+
+    def copy(self, start: Optional[datetime] = None,
+             end: Optional[datetime] = None) -> 'BalanceHistory':
+        """Return an independent history holding the rows with ``start <= time < end``.
+
+        Columns are sliced in one step each, so this is cheap enough to run
+        under ``balance_lock``; keys that are not canonical are only copied
+        when both bounds are None.
+        """
+        low, high = self._bounds(start, end)
+        copy = type(self)()
+        copy._ts, copy._balance, copy._temperature, copy._ram = (
+            column[low:high] for column in (self._ts, self._balance, self._temperature, self._ram)
+        )
+        if low < high:
+            first, last = self._ts[low], self._ts[high - 1]
+            copy._rollups = {
+                epoch: rollup for epoch, rollup in self._rollups.items() if first <= epoch <= last
+            }
+        if start is None and end is None:
+            copy._unindexed = dict(self._unindexed)
+        copy.history_file = self.history_file
+        copy.run_settings = self.run_settings
+        return copy
+
+    def replace_with(self, other: 'BalanceHistory') -> None:
+        """Take over the rows and run settings of *other* (built aside with :meth:`copy`).
+
+        Only references are swapped, so the history changes in one step
+        while ``balance_lock`` is held; *other* must not be used afterwards.
+        """
+        self._version += 1
+        self._ts, self._balance, self._temperature, self._ram = (
+            other._ts, other._balance, other._temperature, other._ram)
+        self._unindexed = other._unindexed
+        self._rollups = other._rollups
+        self.run_settings = other.run_settings
+
+    @property
+    def generation(self) -> int:
+        """Counter bumped by :meth:`clear`, so a late background merge can tell it is stale."""
+        return self._generation
+
+    def __getstate__(self) -> dict:
+        # Pickled (e.g. for the plot pool) without the load event, which cannot cross processes
+        state = self.__dict__.copy()
+        state.pop('ready', None)
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.ready = threading.Event()
+        self.ready.set()
+
+    @property
+    def version(self) -> int:
+        """Counter bumped by every insert, overwrite or removal.
+
+        Caches derived from the history compare it to tell they are stale.
+        """
+        return self._version
+
+    def __delitem__(self, key: str) -> None:
+        self._version += 1
+        dt = parse_time_key(key)
+        if dt is None:
+            del self._unindexed[key]
+            return
+        index = self._find(datetime_to_epoch(dt))
+        if index < 0:
+            raise KeyError(key)
+        self._rollups.pop(self._ts[index], None)
+        self._ts = _column_delete(self._ts, index)
+        self._balance = _column_delete(self._balance, index)
+        self._temperature = _column_delete(self._temperature, index)
+        self._ram = _column_delete(self._ram, index)
+
+    def __iter__(self):
+        for index in range(len(self._ts)):
+            yield self._row_key(index)
+        yield from self._unindexed
+
+    def __len__(self) -> int:
+        return len(self._ts) + len(self._unindexed)
+
+    def __contains__(self, key) -> bool:
+        dt = parse_time_key(key) if isinstance(key, str) else None
+        if dt is None:
+            return key in self._unindexed
+        return self._find(datetime_to_epoch(dt)) >= 0
+
+    def items(self):
+        return _RowItemsView(self)
+
+    def values(self):
+        return _RowValuesView(self)
+
+    def clear(self) -> None:
+        # Fresh arrays: views exported from the old ones keep their data
+        self._ts, self._balance, self._temperature, self._ram = (array('d') for _ in range(4))
+        self._unindexed.clear()
+        self._rollups.clear()
+        self._generation += 1
+        self._version += 1
+
+    def _bounds(self, start: Optional[datetime], end: Optional[datetime]) -> tuple:
+        low = 0 if start is None else bisect.bisect_left(self._ts, datetime_to_epoch(start))
+        high = len(self._ts) if end is None else bisect.bisect_left(
+            self._ts, datetime_to_epoch(end))
+        return low, max(high, low)
+
+    def items_between(self, start: Optional[datetime], end: Optional[datetime]) -> list:
+        """Return ``(datetime, key, value)`` tuples with ``start <= time < end``, oldest first.
+
+        Either bound may be None.
+        """
+        low, high = self._bounds(start, end)
+        result = []
+        for index in range(low, high):
+            dt = epoch_to_datetime(int(self._ts[index]))
+            result.append((dt, make_time_key(dt), self._row_entry(index)))
+        return result
+
+    def count_between(self, start: Optional[datetime], end: Optional[datetime]) -> int:
+        """Return the number of entries with ``start <= time < end`` in O(log n)."""
+        low, high = self._bounds(start, end)
+        return high - low
+
+    def rows_between(self, start: Optional[datetime], end: Optional[datetime]):
+        """Yield ``(epoch, balance, temperature, ram, rollup)`` rows, oldest first.
+
+        Rows are those with ``start <= time < end``.
+
+        Readings are NaN when missing and *rollup* is ``(min, max, samples)``
+        or None; no entry dict or datetime is built per row.
+        """
+        low, high = self._bounds(start, end)
+        rollups = self._rollups
+        for epoch, balance, temperature, ram in zip(
+                self._ts[low:high], self._balance[low:high],
+                self._temperature[low:high], self._ram[low:high]):
+            yield epoch, balance, temperature, ram, rollups.get(epoch) if rollups else None
+
+    def records(self, start: Optional[datetime] = None, end: Optional[datetime] = None):
+        """Yield a :class:`HistoryRecord` per row with ``start <= time < end``, oldest first."""
+        for epoch, balance, temperature, ram, rollup in self.rows_between(start, end):
+            yield HistoryRecord(
+                epoch_to_datetime(int(epoch)), balance,
+                None if math.isnan(temperature) else temperature,
+                None if math.isnan(ram) else ram,
+                *(rollup or ()),
+            )
+
+    def columns(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> dict:
+        """Return zero-copy column slices for entries with ``start <= time < end``.
+
+        :return: Dict mapping each name in ``HISTORY_COLUMNS`` to a read-only
+            ``memoryview`` of doubles (timestamps are epoch seconds, missing
+            temperature/RAM values are NaN).
+        """
+        low, high = self._bounds(start, end)
+        arrays = (self._ts, self._balance, self._temperature, self._ram)
+        return {
+            name: memoryview(column).toreadonly()[low:high]
+            for name, column in zip(HISTORY_COLUMNS, arrays)
+        }
+
+
+def _entries_between(history: dict, start: Optional[datetime], end: Optional[datetime]) -> list:
+    """Return ``(datetime, key, value)`` tuples with ``start <= time < end``, oldest first.
+
+    Either bound may be None.  Indexed stores (:class:`BalanceHistory`, the
+    SQLite backend) answer with a range query on their timestamp index; plain
+    dicts are scanned and sorted.
+    """
+    items_between = getattr(history, 'items_between', None)
+    if items_between is not None:
+        return items_between(start, end)
 
     entries = []
     for key, value in history.items():
-        try:
-            dt = datetime.strptime(key, "%Y/%m/%d-%H:%M")
-        except ValueError:
-            try:
-                dt = datetime.strptime(key, "%d/%m-%H:%M").replace(year=current_year)
-                if dt > now + timedelta(hours=1):
-                    dt = dt.replace(year=current_year - 1)
-            except ValueError:
-                continue
-        if dt >= midnight:
+        dt = parse_time_key(key)
+        if dt is not None and (start is None or dt >= start) and (end is None or dt < end):
             entries.append((dt, key, value))
-
     entries.sort(key=lambda x: x[0])
+    return entries
+
+
+def iter_records(history: dict, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Yield a :class:`HistoryRecord` per entry with ``start <= time < end``, oldest first.
+
+    Columnar histories build records straight from their columns; other
+    stores and plain dicts go through their entries.  Keys that are not
+    canonical time keys are skipped.
+
+    :param history: Any history mapping.
+    :param start: Inclusive lower bound, or None.
+    :param end: Exclusive upper bound, or None.
+    """
+    records = getattr(history, 'records', None)
+    if records is not None:
+        yield from records(start, end)
+        return
+    for dt, _, value in _entries_between(history, start, end):
+        yield HistoryRecord.from_entry(dt, value)
+
+
+def _entries_since(history: dict, start: datetime) -> list:
+    """Return ``(datetime, key, value)`` tuples recorded at or after *start*, oldest first."""
+    return _entries_between(history, start, None)
+
+
+def aggregate_entries(values: list) -> dict:
+    """Merge history entries into one aggregate entry.
+
+    Averages are weighted by the number of raw samples each entry stands
+    for, so merging hourly aggregates into a daily one stays exact.
+    """
+    samples = 0
+    balance_sum = 0.0
+    balance_min = math.inf
+    balance_max = -math.inf
+    # field -> [weighted sum, weight]
+    resources = {"temperature_avg": [0.0, 0], "ram_percent": [0.0, 0]}
+    for value in values:
+        balance = get_entry_balance(value)
+        low, high, count = get_entry_rollup(value) or (balance, balance, 1)
+        samples += count
+        balance_sum += balance * count
+        balance_min = min(balance_min, low)
+        balance_max = max(balance_max, high)
+        for field, reading in (("temperature_avg", get_entry_temperature(value)),
+                               ("ram_percent", get_entry_ram(value))):
+            if reading is not None:
+                resources[field][0] += reading * count
+                resources[field][1] += count
+
+    entry: dict = {"balance": balance_sum / samples}
+    for field, (total, weight) in resources.items():
+        if weight:
+            entry[field] = total / weight
+    entry["balance_min"] = balance_min
+    entry["balance_max"] = balance_max
+    entry["samples"] = samples
+    return entry
+
+
+QUERY_AGGREGATES = ('avg', 'min', 'max', 'last')
+
+
+def _rows_between(history: dict, start: Optional[datetime], end: Optional[datetime]):
+    """Yield ``(epoch, balance, temperature, ram, rollup)`` rows, oldest first.
+
+    See ``BalanceHistory.rows_between``.
+    """
+    rows_between = getattr(history, 'rows_between', None)
+    if rows_between is not None:
+        yield from rows_between(start, end)
+        return
+    for dt, _, value in _entries_between(history, start, end):
+        yield (
+            datetime_to_epoch(dt), get_entry_balance(value),
+            _nan_if_none(get_entry_temperature(value)), _nan_if_none(get_entry_ram(value)),
+            get_entry_rollup(value),
+        )
+
+
+# Duration suffix -> seconds, for parse_duration
+_DURATION_UNITS = {'m': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+
+
+def parse_duration(text: str) -> Optional[timedelta]:
+    """Parse a duration such as ``30m``, ``1h``, ``7d`` or ``2w``.
+
+    :return: The duration, or None when *text* is not a positive ``<int><m|h|d|w>``.
+    """
+    text = text.strip().lower()
+    unit = _DURATION_UNITS.get(text[-1:])
+    if unit is None or not text[:-1].isdigit() or int(text[:-1]) == 0:
+        return None
+    return timedelta(seconds=int(text[:-1]) * unit)
+
+
+class _Bucket:
+    """Running min/max/sum/last of one field inside a query bucket."""
+
+    __slots__ = ('total', 'weight', 'low', 'high', 'last')
+
+    def __init__(self):
+        self.total = 0.0
+        self.weight = 0
+        self.low = math.inf
+        self.high = -math.inf
+        self.last = None
+
+    def add(self, value: float, low: float, high: float, count: int) -> None:
+        self.total += value * count
+        self.weight += count
+        self.low = min(self.low, low)
+        self.high = max(self.high, high)
+        self.last = value
+
+    def result(self, agg: str) -> float:
+        if agg == 'avg':
+            return self.total / self.weight
+        if agg == 'min':
+            return self.low
+        if agg == 'max':
+            return self.high
+        return self.last
+
+
+def _bucket_entry(fields: tuple, agg: str) -> dict:
+    balance, temperature, ram = fields
+    entry: dict = {"balance": balance.result(agg)}
+    if temperature.weight:
+        entry["temperature_avg"] = temperature.result(agg)
+    if ram.weight:
+        entry["ram_percent"] = ram.result(agg)
+    entry["balance_min"] = balance.low
+    entry["balance_max"] = balance.high
+    entry["samples"] = balance.weight
+    return entry
+
+
+def query_history(balance_history: dict, start: Optional[datetime] = None,
+                  end: Optional[datetime] = None, step: Optional[timedelta] = None,
+                  agg: str = 'avg') -> 'BalanceHistory':
+    """Return the entries recorded between *start* and *end*, bucketed by *step*.
+
+    Entries are grouped into buckets of *step* aligned on multiples of the
+    step since the epoch (so ``1h`` buckets start on the hour and ``1d``
+    buckets at midnight) in a single pass over the window.  Each bucket
+    becomes one entry keyed by its start time: ``balance``,
+    ``temperature_avg`` and ``ram_percent`` hold the *agg* of the bucket
+    (``avg`` weighted by samples, ``min``, ``max`` or ``last``), and
+    ``balance_min``, ``balance_max`` and ``samples`` are always filled in, as
+    for compacted entries.  Compacted entries count with their own min, max
+    and sample count.
+
+    :param balance_history: History to query (any mapping; indexed stores answer
+        the window with a range query).
+    :param start: First time included; None for the beginning.
+    :param end: First time excluded; None for no upper bound.
+    :param step: Bucket size (a whole number of minutes); None returns the raw entries.
+    :param agg: One of ``QUERY_AGGREGATES``.
+    :return: A new :class:`BalanceHistory` with one entry per non-empty bucket.
+    :raises ValueError: On an unknown *agg* or a *step* that is not a positive number of minutes.
+    """
+    if agg not in QUERY_AGGREGATES:
+        raise ValueError(
+            f"Unknown aggregate '{agg}', expected one of {', '.join(QUERY_AGGREGATES)}.")
+    if step is None:
+        entries = _entries_between(balance_history, start, end)
+        return BalanceHistory((key, value) for _, key, value in entries)
+    step_seconds = int(step.total_seconds())
+    if step_seconds <= 0 or step_seconds % 60:
+        raise ValueError(f"Query step must be a positive number of minutes, got {step}.")
+
+    result = []
+    bucket_start = None
+    fields = None
+    for epoch, balance, temperature, ram, rollup in _rows_between(balance_history, start, end):
+        bucket = int(epoch) - int(epoch) % step_seconds
+        if bucket != bucket_start:
+            if fields is not None:
+                bucket_key = make_time_key(epoch_to_datetime(bucket_start))
+                result.append((bucket_key, _bucket_entry(fields, agg)))
+            bucket_start = bucket
+            fields = (_Bucket(), _Bucket(), _Bucket())
+        low, high, count = rollup or (balance, balance, 1)
+        fields[0].add(balance, low, high, count)
+        if temperature == temperature:
+            fields[1].add(temperature, temperature, temperature, count)
+        if ram == ram:
+            fields[2].add(ram, ram, ram, count)
+    if fields is not None:
+        result.append((make_time_key(epoch_to_datetime(bucket_start)), _bucket_entry(fields, agg)))
+    return BalanceHistory(result)
+
+
+def copy_window(balance_history: dict, start: Optional[datetime] = None,
+                end: Optional[datetime] = None) -> dict:
+    """Return a copy of the entries with ``start <= time < end`` that later writes cannot touch.
+
+    Readers on the event loop call it under ``balance_lock`` and then work
+    on the copy, since scheduled jobs rebuild the history from another
+    thread.
+
+    :return: A :class:`BalanceHistory` (indexed stores answer with a range query).
+    """
+    if isinstance(balance_history, BalanceHistory):
+        return balance_history.copy(start, end)
+    if start is None and end is None:
+        return BalanceHistory(balance_history.items())
+    return BalanceHistory((key, value) for _, key, value in
+                          _entries_between(balance_history, start, end))
+
+
+def rebuild_aside(balance_history: dict, lock, rebuild, attempts: int = 3):
+    """Apply *rebuild* to a copy of *balance_history* and swap the result in.
+
+    *lock* (``balance_lock``) is only held to copy the columns and to swap
+    them back, so snapshots keep being recorded and readers are never shown
+    a half rebuilt history.  When the history changed in between, the copy
+    is discarded and the rebuild starts over; after *attempts* tries it runs
+    in place under the lock.  Histories that are not a :class:`BalanceHistory`
+    (e.g. the SQLite store, which writes through) are always changed in
+    place under the lock.
+
+    :param rebuild: Callable changing the history it is given in place.
+    :return: What *rebuild* returned.
+    """
+    if isinstance(balance_history, BalanceHistory):
+        for _ in range(attempts):
+            with lock:
+                version = balance_history.version
+                working = balance_history.copy()
+            copied = working.version
+            result = rebuild(working)
+            with lock:
+                if balance_history.version != version:
+                    continue
+                settings_changed = working.run_settings != balance_history.run_settings
+                if working.version != copied or settings_changed:
+                    balance_history.replace_with(working)
+                return result
+    with lock:
+        return rebuild(balance_history)
+
+
+def compact_balance_history(balance_history: dict, raw_days: int = 7, hourly_days: int = 90,
+                            now: datetime = None) -> int:
+    """Downsample old balance history entries into hourly and daily aggregates.
+
+    Entries older than *raw_days* are merged into one entry per hour, and
+    entries older than *hourly_days* into one entry per day.  Aggregates are
+    stored under the bucket's time key (``HH:00`` or ``00:00``) with the
+    average balance, temperature and RAM plus ``balance_min``,
+    ``balance_max`` and ``samples`` (see :func:`get_entry_rollup`).
+    Buckets that already hold a single entry at their own key are left
+    untouched, so running the compactor again is cheap.
+
+    The caller is responsible for holding ``balance_lock`` (or for compacting
+    a copy, see :func:`rebuild_aside`) and for saving the history afterwards.
+
+    :param balance_history: History to compact in place.
+    :param raw_days: Days of full-resolution entries to keep.
+    :param hourly_days: Days of hourly aggregates to keep before merging per day.
+    :param now: Reference time; defaults to now.
+    :return: Number of entries removed.
+    """
+    if now is None:
+        now = datetime.now()
+    raw_cutoff = (now - timedelta(days=raw_days)).replace(minute=0, second=0, microsecond=0)
+    hourly_cutoff = (now - timedelta(days=max(hourly_days, raw_days))).replace(
+        hour=0, minute=0, second=0, microsecond=0)
+
+    buckets: dict = {}
+    for dt, key, value in _entries_between(balance_history, None, raw_cutoff):
+        if dt < hourly_cutoff:
+            bucket = dt.replace(hour=0, minute=0)
+        else:
+            bucket = dt.replace(minute=0)
+        buckets.setdefault(make_time_key(bucket), []).append((key, value))
+
+    stale = set()
+    compacted = {}
+    for bucket_key, members in buckets.items():
+        if len(members) == 1 and members[0][0] == bucket_key:
+            continue
+        stale.update(key for key, _ in members)
+        compacted[bucket_key] = aggregate_entries([value for _, value in members])
+    if not compacted:
+        return 0
+
+    if getattr(balance_history, 'write_through', False):
+        for key in stale:
+            del balance_history[key]
+        balance_history.update(compacted)
+    else:
+        # Rebuild in one pass: deleting rows one by one would shift the columns every time
+        rebuilt = dict(compacted)
+        rebuilt.update((key, value) for key, value in balance_history.items() if key not in stale)
+        balance_history.clear()
+        balance_history.update(rebuilt)
+
+    removed = len(stale) - len(compacted)
+    logging.info(
+        f"Compacted balance history: {removed} entries merged into {len(compacted)} aggregates.")
+    return removed
+
+
+def filter_since_midnight(history: dict) -> dict:
+    """Filter balance history to keep only entries recorded today after midnight.
+    Returns entries from the current day (00:00:00 onwards) in chronological order.
+    Keys are in "YYYY/MM/DD-HH:MM" format (legacy keys are migrated at load time).
+    """
+    now = datetime.now()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
     filtered = {}
-    for _, key, value in entries:
+    for _, key, value in _entries_since(history, midnight):
         filtered[key] = value
     return filtered
 
@@ -163,36 +1676,14 @@ def filter_last_24h(history: dict) -> dict:
     """Filter balance history to keep only one entry per hour from the last 24 hours.
     For each hour, the latest recorded entry is kept.
     Returns at most 24 entries in chronological order.
-    Keys are in "YYYY/MM/DD-HH:MM" format (with year).
-    Legacy keys in "DD/MM-HH:MM" format are also supported.
+    Keys are in "YYYY/MM/DD-HH:MM" format (legacy keys are migrated at load time).
     """
     now = datetime.now()
     cutoff = now - timedelta(hours=24)
-    current_year = now.year
-
-    # Collect all entries within the last 24 hours with their parsed datetime
-    entries = []
-    for key, value in history.items():
-        try:
-            # Try new format first: YYYY/MM/DD-HH:MM
-            dt = datetime.strptime(key, "%Y/%m/%d-%H:%M")
-        except ValueError:
-            try:
-                # Fallback to legacy format: DD/MM-HH:MM
-                dt = datetime.strptime(key, "%d/%m-%H:%M").replace(year=current_year)
-                if dt > now + timedelta(hours=1):
-                    dt = dt.replace(year=current_year - 1)
-            except ValueError:
-                continue
-        if dt >= cutoff:
-            entries.append((dt, key, value))
-
-    # Sort chronologically
-    entries.sort(key=lambda x: x[0])
 
-    # Keep only the latest entry for each hour
+    # Keep only the latest entry for each hour (entries come sorted chronologically)
     hourly = {}
-    for dt, key, value in entries:
+    for dt, key, value in _entries_since(history, cutoff):
         hour_key = (dt.year, dt.month, dt.day, dt.hour)
         hourly[hour_key] = (dt, key, value)
 
@@ -0,0 +1,243 @@
+import os
+import gzip
+import json
+import lzma
+import logging
+from typing import Optional
+from datetime import datetime, timedelta
+
+from services.history import (
+    BalanceHistory, aggregate_entries, datetime_to_epoch, epoch_to_datetime, get_entry_balance,
+    json_default, parse_time_key,
+)
+
+
+HISTORY_ARCHIVE_DIR = 'config/history'
+MANIFEST_FILE_NAME = 'manifest.json'
+ARCHIVE_MANIFEST_VERSION = 1
+
+# Compression name -> (file extension, opener)
+_CODECS = {
+    'gzip': ('.jsonl.gz', gzip.open),
+    'lzma': ('.jsonl.xz', lzma.open),
+}
+
+
+def get_manifest_path(directory: str = None) -> str:
+    """Return the path of the archive manifest (in *directory*, by default ``HISTORY_ARCHIVE_DIR``)."""
+    return os.path.join(directory or HISTORY_ARCHIVE_DIR, MANIFEST_FILE_NAME)
+
+
+def read_manifest(directory: str = None) -> list:
+    """Return the archive segments described by the manifest, oldest first.
+
+    Each segment is a dict with ``month`` (``YYYY-MM``), ``file``,
+    ``compression``, ``start``/``end`` (epoch seconds of the first and last
+    entry), ``count`` and aggregate stats (``balance_min``, ``balance_max``,
+    ``balance_avg``, ``balance_first``, ``balance_last``, ``samples``).
+
+    :param directory: Archive of an additional address (see
+        :func:`services.history_partitions.partition_archive_dir`); defaults to
+        ``HISTORY_ARCHIVE_DIR``, the archive of the first address.
+    :return: List of segment dicts, empty when nothing is archived or the manifest is unreadable.
+    """
+    path = get_manifest_path(directory)
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return sorted(json.load(f)["segments"], key=lambda segment: segment["start"])
+    except (ValueError, IOError, KeyError, TypeError) as e:
+        logging.error(f"Error reading balance history archive manifest: {e}")
+        return []
+
+
+def _write_manifest(segments: list, directory: str = None) -> None:
+    path = get_manifest_path(directory)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"version": ARCHIVE_MANIFEST_VERSION, "segments": segments}, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _month_key(dt: datetime) -> str:
+    return f"{dt.year}-{dt.month:02d}"
+
+
+def _month_start(dt: datetime) -> datetime:
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def read_segment(segment: dict, directory: str = None) -> list:
+    """Return the ``(key, entry)`` records of an archive segment, oldest first."""
+    opener = _CODECS[segment.get("compression", 'gzip')][1]
+    path = os.path.join(directory or HISTORY_ARCHIVE_DIR, segment["file"])
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return [(record["key"], record["entry"]) for record in map(json.loads, f)]
+
+
+def _write_segment(month: str, records: list, compression: str, directory: str) -> dict:
+    """Write one month of records as a compressed segment and return its manifest entry."""
+    extension, opener = _CODECS[compression]
+    file_name = month + extension
+    path = os.path.join(directory, file_name)
+    tmp_path = path + '.tmp'
+    with opener(tmp_path, 'wt', encoding='utf-8') as f:
+        for key, entry in records:
+            f.write(json.dumps({"key": key, "entry": entry}, separators=(',', ':'), default=json_default) + '\n')
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    stats = aggregate_entries([entry for _, entry in records])
+    return {
+        "month": month,
+        "file": file_name,
+        "compression": compression,
+        "start": datetime_to_epoch(parse_time_key(records[0][0])),
+        "end": datetime_to_epoch(parse_time_key(records[-1][0])),
+        "count": len(records),
+        "samples": stats["samples"],
+        "balance_min": stats["balance_min"],
+        "balance_max": stats["balance_max"],
+        "balance_avg": stats["balance"],
+        "balance_first": get_entry_balance(records[0][1]),
+        "balance_last": get_entry_balance(records[-1][1]),
+        "bytes": os.path.getsize(path),
+    }
+
+
+def collect_archivable(balance_history: dict, hot_days: int = 90, now: datetime = None) -> tuple:
+    """Select the closed months that can leave the hot history.
+
+    A month is archivable once it ended more than *hot_days* ago.
+
+    :param balance_history: Hot history: a :class:`BalanceHistory` or another
+        store with an ``items_between`` range query.
+    :return: ``(boundary, months)``: entries recorded before *boundary* are
+        archivable, grouped in *months* as ``{"YYYY-MM": [(key, entry), ...]}``.
+    """
+    if now is None:
+        now = datetime.now()
+    boundary = _month_start(now - timedelta(days=hot_days))
+    months: dict = {}
+    for dt, key, value in balance_history.items_between(None, boundary):
+        months.setdefault(_month_key(dt), []).append((key, value))
+    return boundary, months
+
+
+def write_archive(months: dict, compression: str = 'gzip', directory: str = None) -> int:
+    """Write month segments and update the manifest.
+
+    Segments are immutable once written; the only exception is a month that
+    already has a segment (its entries reappear in the hot history when the
+    bot stopped between writing the archive and saving the trimmed history).
+    That segment is rewritten with both sets of records, hot entries winning
+    on duplicate keys.
+
+    :param months: ``{"YYYY-MM": [(key, entry), ...]}`` as returned by :func:`collect_archivable`.
+    :param compression: ``gzip`` or ``lzma``.
+    :param directory: Archive directory, as for :func:`read_manifest`.
+    :return: Number of records written.
+    :raises OSError: When a segment or the manifest cannot be written.
+    """
+    if compression not in _CODECS:
+        logging.error(f"Unknown archive compression '{compression}', using gzip.")
+        compression = 'gzip'
+    if not months:
+        return 0
+    directory = directory or HISTORY_ARCHIVE_DIR
+    os.makedirs(directory, exist_ok=True)
+    segments = {segment["month"]: segment for segment in read_manifest(directory)}
+    written = 0
+    for month, records in sorted(months.items()):
+        merged = dict(read_segment(segments[month], directory)) if month in segments else {}
+        merged.update(records)
+        ordered = sorted(merged.items(), key=lambda item: parse_time_key(item[0]))
+        previous = segments.get(month)
+        segments[month] = _write_segment(month, ordered, compression, directory)
+        if previous is not None and previous["file"] != segments[month]["file"]:
+            os.remove(os.path.join(directory, previous["file"]))
+        written += len(records)
+    _write_manifest(sorted(segments.values(), key=lambda segment: segment["start"]), directory)
+    return written
+
+
+def remove_archived(balance_history: dict, boundary: datetime, months: dict) -> int:
+    """Drop archived entries from the hot history.
+
+    :return: Number of entries removed.
+    """
+    delete_before = getattr(balance_history, 'delete_before', None)
+    if delete_before is not None:
+        return delete_before(boundary)
+    removed = 0
+    for records in months.values():
+        for key, _ in records:
+            if key in balance_history:
+                del balance_history[key]
+                removed += 1
+    return removed
+
+
+def archived_items_between(start: Optional[datetime], end: Optional[datetime],
+                           directory: str = None) -> list:
+    """Return archived ``(datetime, key, entry)`` tuples with ``start <= time < end``, oldest first.
+
+    Only segments whose ``[start, end]`` span overlaps the window are opened.
+    """
+    low = datetime_to_epoch(start) if start is not None else None
+    high = datetime_to_epoch(end) if end is not None else None
+    items = []
+    for segment in read_manifest(directory):
+        if (low is not None and segment["end"] < low) or (high is not None and segment["start"] >= high):
+            continue
+        try:
+            records = read_segment(segment, directory)
+        except (OSError, EOFError, ValueError, KeyError, lzma.LZMAError) as e:
+            logging.error(f"Error reading balance history archive segment {segment['file']}: {e}")
+            continue
+        for key, entry in records:
+            dt = parse_time_key(key)
+            if dt is None:
+                continue
+            epoch = datetime_to_epoch(dt)
+            if (low is None or epoch >= low) and (high is None or epoch < high):
+                items.append((dt, key, entry))
+    return items
+
+
+def history_with_archive(balance_history: dict, start: Optional[datetime] = None,
+                         end: Optional[datetime] = None, directory: str = None) -> BalanceHistory:
+    """Return a :class:`BalanceHistory` combining archived and hot entries in a window.
+
+    Hot entries win over archived ones with the same key.  Used for long-range
+    charts; the result is a copy and is not persisted.
+
+    :param balance_history: Hot history, as for :func:`collect_archivable`.
+    :param directory: Archive directory, as for :func:`read_manifest`.
+    """
+    archived = archived_items_between(start, end, directory)
+    combined = BalanceHistory((key, entry) for _, key, entry in archived)
+    combined.update((key, entry) for _, key, entry in balance_history.items_between(start, end))
+    return combined
+
+
+def archive_span() -> Optional[tuple]:
+    """Return ``(first, last)`` datetimes covered by the archive, or None when it is empty."""
+    segments = read_manifest()
+    if not segments:
+        return None
+    return epoch_to_datetime(segments[0]["start"]), epoch_to_datetime(segments[-1]["end"])
+
+
+def clear_archive() -> None:
+    """Delete every archive segment and the manifest."""
+    for segment in read_manifest():
+        path = os.path.join(HISTORY_ARCHIVE_DIR, segment["file"])
+        if os.path.exists(path):
+            os.remove(path)
+    if os.path.exists(get_manifest_path()):
+        os.remove(get_manifest_path())
@@ -0,0 +1,437 @@
+import os
+import mmap
+import struct
+import logging
+from array import array
+from typing import Optional
+from datetime import datetime
+from collections.abc import Mapping
+
+import numpy as np
+
+from services import history as json_history
+from services.history import (
+    BalanceHistory, HISTORY_COLUMNS, parse_time_key, make_time_key,
+    datetime_to_epoch, epoch_to_datetime, get_entry_balance, get_entry_temperature, get_entry_ram,
+)
+
+
+HISTORY_BINARY_FILE = 'config/balance_history.bin'
+BINARY_MAGIC = b'RBHF'
+BINARY_FORMAT_VERSION = 1
+
+# Magic, format version, record size, 8 reserved bytes
+_HEADER = struct.Struct('<4sHH8x')
+# Epoch seconds, balance, temperature_avg, ram_percent (NaN when missing)
+_RECORD = struct.Struct('<qdff')
+_RECORD_DTYPE = np.dtype([
+    ('timestamp', '<i8'), ('balance', '<f8'), ('temperature_avg', '<f4'), ('ram_percent', '<f4'),
+])
+# float32 readings are widened back to the precision they were recorded with
+_READING_DECIMALS = 2
+
+
+def _reading(value) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), _READING_DECIMALS)
+
+
+class BinarySnapshot(Mapping):
+    """Read-only view of a binary history snapshot file.
+
+    The file is a 16-byte header followed by fixed-size little-endian
+    records (int64 epoch, float64 balance, float32 temperature, float32 RAM)
+    sorted by time.  It is mapped read-only and the records are a NumPy
+    structured array over the mapping, so lookups, :meth:`columns` and window
+    queries (``searchsorted`` on the timestamp field) read straight from the
+    page cache without parsing.  :class:`BinaryBalanceHistory` keeps one open
+    as the base of the loaded history; close it once done otherwise.
+    """
+
+    def __init__(self, path: str = None):
+        self._file = open(path or HISTORY_BINARY_FILE, 'rb')
+        try:
+            header = self._file.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise ValueError("truncated header")
+            magic, version, record_size = _HEADER.unpack(header)
+            if magic != BINARY_MAGIC or version != BINARY_FORMAT_VERSION or record_size != _RECORD.size:
+                raise ValueError(f"unsupported binary history file (magic {magic!r}, version {version})")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        count = (len(self._map) - _HEADER.size) // _RECORD.size
+        self._records = np.frombuffer(self._map, dtype=_RECORD_DTYPE, count=count, offset=_HEADER.size)
+
+    def close(self) -> None:
+        # Drop the array first: the mapping cannot close while a buffer export is alive
+        self._records = self._records[:0].copy()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> 'BinarySnapshot':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _bounds(self, start: Optional[datetime], end: Optional[datetime]) -> tuple:
+        ts = self._records['timestamp']
+        low = 0 if start is None else int(np.searchsorted(ts, datetime_to_epoch(start)))
+        high = len(ts) if end is None else int(np.searchsorted(ts, datetime_to_epoch(end)))
+        return low, max(high, low)
+
+    def _entry(self, index: int) -> dict:
+        record = self._records[index]
+        entry: dict = {"balance": float(record['balance'])}
+        temperature = _reading(record['temperature_avg'])
+        ram = _reading(record['ram_percent'])
+        if temperature is not None:
+            entry["temperature_avg"] = temperature
+        if ram is not None:
+            entry["ram_percent"] = ram
+        return entry
+
+    def __getitem__(self, key: str) -> dict:
+        dt = parse_time_key(key)
+        if dt is None:
+            raise KeyError(key)
+        ts = self._records['timestamp']
+        epoch = datetime_to_epoch(dt)
+        index = int(np.searchsorted(ts, epoch))
+        if index == len(ts) or ts[index] != epoch:
+            raise KeyError(key)
+        return self._entry(index)
+
+    def __iter__(self):
+        for ts in self._records['timestamp']:
+            yield make_time_key(epoch_to_datetime(int(ts)))
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def items_between(self, start: Optional[datetime], end: Optional[datetime]) -> list:
+        """Return ``(datetime, key, entry)`` tuples with ``start <= time < end``, oldest first."""
+        low, high = self._bounds(start, end)
+        result = []
+        for index in range(low, high):
+            dt = epoch_to_datetime(int(self._records['timestamp'][index]))
+            result.append((dt, make_time_key(dt), self._entry(index)))
+        return result
+
+    def count_between(self, start: Optional[datetime], end: Optional[datetime]) -> int:
+        """Return the number of entries with ``start <= time < end`` in O(log n)."""
+        low, high = self._bounds(start, end)
+        return high - low
+
+    def columns(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> dict:
+        """Return zero-copy column views for entries with ``start <= time < end``.
+
+        :return: Dict mapping each name in ``HISTORY_COLUMNS`` to a read-only
+            NumPy view on the mapping (int64 timestamps, float64 balances,
+            float32 temperature/RAM with NaN for missing values).
+        """
+        low, high = self._bounds(start, end)
+        window = self._records[low:high]
+        return {name: window[name] for name in HISTORY_COLUMNS}
+
+
+def write_binary_history(entries: dict, path: str = None) -> int:
+    """Atomically write *entries* as a binary history file (temp file, fsync, rename).
+
+    Only the average of compacted entries is kept (the binary record has no
+    room for ``balance_min``/``balance_max``/``samples``), and keys that are
+    not ``YYYY/MM/DD-HH:MM`` time keys are skipped.
+
+    :param entries: ``key -> entry`` mapping to persist.
+    :param path: Destination file; defaults to ``HISTORY_BINARY_FILE``.
+    :return: Number of records written.
+    :raises OSError: When the file cannot be written.
+    """
+    path = path or HISTORY_BINARY_FILE
+    rows = []
+    for key, value in entries.items():
+        dt = parse_time_key(key)
+        if dt is None:
+            continue
+        temperature = get_entry_temperature(value)
+        ram = get_entry_ram(value)
+        rows.append((
+            datetime_to_epoch(dt), get_entry_balance(value),
+            np.nan if temperature is None else temperature,
+            np.nan if ram is None else ram,
+        ))
+    rows.sort()
+    records = np.array(rows, dtype=_RECORD_DTYPE)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(BINARY_MAGIC, BINARY_FORMAT_VERSION, _RECORD.size))
+        f.write(records.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+def _copy_columns(snapshot: BinarySnapshot, low: int = 0, high: Optional[int] = None) -> tuple:
+    """Copy records ``low:high`` out as contiguous float64 arrays (four vectorized conversions)."""
+    window = snapshot._records[low:high]
+    return (
+        window['timestamp'].astype(np.float64),
+        np.ascontiguousarray(window['balance']),
+        np.round(window['temperature_avg'].astype(np.float64), _READING_DECIMALS),
+        np.round(window['ram_percent'].astype(np.float64), _READING_DECIMALS),
+    )
+
+
+# Rows converted at a time when the mapped records are iterated
+_ITER_CHUNK_RECORDS = 4096
+
+
+class BinaryBalanceHistory(BalanceHistory):
+    """:class:`BalanceHistory` whose snapshotted rows are read from the mapped binary file.
+
+    The rows of the last snapshot stay in the file: a :class:`BinarySnapshot`
+    serves them as the read-only base of the history, so loading and window
+    queries cost no parsing and the page cache holds the data.  Rows recorded
+    since (the replayed journal, new snapshots) go to the in-memory columns,
+    which only ever hold rows newer than the base.
+
+    Copies (:meth:`copy`, ``copy_window``) convert just their window.  Any
+    change at or before the last mapped row (an overwrite, a removal,
+    ``clear`` or :meth:`replace_with` after compaction) first copies the base
+    into memory and unmaps it, until the next load.  New entries still go to
+    the JSON journal between snapshots.
+    """
+
+    def __init__(self, entries=None, snapshot: Optional[BinarySnapshot] = None):
+        self._base = snapshot
+        self._base_end = -np.inf
+        if snapshot is not None and len(snapshot):
+            self._base_end = float(snapshot._records['timestamp'][-1])
+        super().__init__(entries)
+
+    def write_snapshot(self, entries: dict) -> None:
+        write_binary_history(entries)
+        json_history.retire_journal()
+
+    def _materialize(self) -> None:
+        """Copy the mapped rows in front of the in-memory columns and unmap the file."""
+        if self._base is None:
+            return
+        base = self._base
+        self._ts, self._balance, self._temperature, self._ram = (
+            array('d', values.tobytes()) + column
+            for values, column in zip(
+                _copy_columns(base), (self._ts, self._balance, self._temperature, self._ram))
+        )
+        self._base = None
+        self._base_end = -np.inf
+        base.close()
+
+    def _in_base(self, epoch: float) -> bool:
+        return epoch <= self._base_end
+
+    def _base_rows(self, low: int, high: int):
+        """Yield ``(epoch, balance, temperature, ram)`` for mapped records ``low:high``."""
+        for chunk in range(low, high, _ITER_CHUNK_RECORDS):
+            columns = _copy_columns(self._base, chunk, min(chunk + _ITER_CHUNK_RECORDS, high))
+            yield from zip(*(column.tolist() for column in columns))
+
+    def _base_bounds(self, start: Optional[datetime], end: Optional[datetime]) -> tuple:
+        if self._base is None:
+            return 0, 0
+        return self._base._bounds(start, end)
+
+    def _iter_rows(self):
+        if self._base is not None:
+            for epoch, balance, temperature, ram in self._base_rows(0, len(self._base)):
+                key = make_time_key(epoch_to_datetime(int(epoch)))
+                yield key, self._make_entry(balance, temperature, ram, None)
+        yield from super()._iter_rows()
+
+    def __getitem__(self, key: str) -> dict:
+        dt = parse_time_key(key)
+        if dt is not None and self._in_base(datetime_to_epoch(dt)):
+            return self._base[key]
+        return super().__getitem__(key)
+
+    def __contains__(self, key) -> bool:
+        dt = parse_time_key(key) if isinstance(key, str) else None
+        if dt is not None and self._in_base(datetime_to_epoch(dt)):
+            return key in self._base
+        return super().__contains__(key)
+
+    def __iter__(self):
+        if self._base is not None:
+            yield from self._base
+        yield from super().__iter__()
+
+    def __len__(self) -> int:
+        return (len(self._base) if self._base is not None else 0) + super().__len__()
+
+    def _set_row(self, epoch: float, row: tuple) -> None:
+        if self._in_base(epoch):
+            self._materialize()
+        super()._set_row(epoch, row)
+
+    def update(self, other=(), **kwargs) -> None:
+        pairs = list(other.items() if hasattr(other, 'items') else other)
+        pairs.extend(kwargs.items())
+        if self._base is not None:
+            # The bulk append path only compares with the in-memory columns
+            for key, _ in pairs:
+                dt = parse_time_key(key)
+                if dt is not None and self._in_base(datetime_to_epoch(dt)):
+                    self._materialize()
+                    break
+        super().update(pairs)
+
+    def __delitem__(self, key: str) -> None:
+        dt = parse_time_key(key)
+        if dt is not None and self._in_base(datetime_to_epoch(dt)):
+            self._materialize()
+        super().__delitem__(key)
+
+    def delete_before(self, end: datetime) -> int:
+        if self._base_bounds(None, end)[1]:
+            self._materialize()
+        return super().delete_before(end)
+
+    def merge_older(self, older: BalanceHistory, generation: int) -> None:
+        self._materialize()
+        super().merge_older(older, generation)
+
+    def clear(self) -> None:
+        base, self._base, self._base_end = self._base, None, -np.inf
+        if base is not None:
+            base.close()
+        super().clear()
+
+    def copy(self, start: Optional[datetime] = None,
+             end: Optional[datetime] = None) -> 'BinaryBalanceHistory':
+        """Return an in-memory copy of the rows with ``start <= time < end``.
+
+        Only the mapped records in the window are converted, in one step per
+        column.
+        """
+        copy = super().copy(start, end)
+        low, high = self._base_bounds(start, end)
+        if low < high:
+            copy._ts, copy._balance, copy._temperature, copy._ram = (
+                array('d', values.tobytes()) + column
+                for values, column in zip(
+                    _copy_columns(self._base, low, high),
+                    (copy._ts, copy._balance, copy._temperature, copy._ram))
+            )
+        return copy
+
+    def replace_with(self, other: BalanceHistory) -> None:
+        base, self._base = self._base, getattr(other, '_base', None)
+        self._base_end = getattr(other, '_base_end', -np.inf)
+        if base is not None and base is not self._base:
+            base.close()
+        super().replace_with(other)
+
+    def __getstate__(self) -> dict:
+        # The mapping cannot be pickled: ship the rows themselves
+        state = super().__getstate__()
+        if self._base is not None:
+            whole = self.copy()
+            state.update(_ts=whole._ts, _balance=whole._balance,
+                         _temperature=whole._temperature, _ram=whole._ram)
+        state.update(_base=None, _base_end=-np.inf)
+        return state
+
+    def items_between(self, start: Optional[datetime], end: Optional[datetime]) -> list:
+        mapped = self._base.items_between(start, end) if self._base is not None else []
+        return mapped + super().items_between(start, end)
+
+    def count_between(self, start: Optional[datetime], end: Optional[datetime]) -> int:
+        low, high = self._base_bounds(start, end)
+        return high - low + super().count_between(start, end)
+
+    def rows_between(self, start: Optional[datetime], end: Optional[datetime]):
+        low, high = self._base_bounds(start, end)
+        for epoch, balance, temperature, ram in self._base_rows(low, high):
+            yield epoch, balance, temperature, ram, None
+        yield from super().rows_between(start, end)
+
+    def columns(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> dict:
+        """Return read-only float64 column slices for entries with ``start <= time < end``.
+
+        Slices that reach into the mapped rows are converted copies of the
+        window rather than views.
+        """
+        low, high = self._base_bounds(start, end)
+        columns = super().columns(start, end)
+        if low == high:
+            return columns
+        return {
+            name: memoryview(np.concatenate((mapped, np.asarray(columns[name])))).toreadonly()
+            for name, mapped in zip(HISTORY_COLUMNS, _copy_columns(self._base, low, high))
+        }
+
+
+def load_binary_history(path: str = None) -> BinaryBalanceHistory:
+    """Map the binary snapshot as the base of the history, then replay the JSON journal on top.
+
+    Records are read from the mapping on demand (see :class:`BinaryBalanceHistory`).
+    On first use (no binary file yet) the JSON snapshot is converted with
+    :func:`json_to_binary`.  A corrupt file is quarantined and the history
+    starts from the journal alone.
+
+    :param path: Binary file; defaults to ``HISTORY_BINARY_FILE``.
+    """
+    path = path or HISTORY_BINARY_FILE
+    if not os.path.exists(path) and os.path.exists(json_history.BALANCE_HISTORY_FILE):
+        json_to_binary(path)
+    history = BinaryBalanceHistory()
+    if os.path.exists(path):
+        try:
+            history = BinaryBalanceHistory(snapshot=BinarySnapshot(path))
+        except ValueError as e:
+            logging.error(f"Error loading binary balance history: {e}")
+            json_history._quarantine(path)
+        except OSError as e:
+            logging.error(f"Error loading binary balance history: {e}")
+            return history
+    try:
+        json_history._replay_journal(history)
+    except IOError as e:
+        logging.error(f"Error replaying balance history journal: {e}")
+    return history
+
+
+def json_to_binary(path: str = None) -> int:
+    """Convert ``config/balance_history.json`` (plus its journal) to the binary format.
+
+    The JSON snapshot is kept as ``.imported`` so the conversion runs once.
+
+    :param path: Destination file; defaults to ``HISTORY_BINARY_FILE``.
+    :return: Number of records written.
+    """
+    history = json_history.load_balance_history()
+    written = write_binary_history(history, path)
+    json_history.retire_journal()
+    if os.path.exists(json_history.BALANCE_HISTORY_FILE):
+        os.replace(json_history.BALANCE_HISTORY_FILE, json_history.BALANCE_HISTORY_FILE + '.imported')
+    logging.info(f"Converted {written} balance history entries to the binary format.")
+    return written
+
+
+def binary_to_json(path: str = None) -> int:
+    """Convert the binary history file (plus the journal) back to ``config/balance_history.json``.
+
+    :param path: Source file; defaults to ``HISTORY_BINARY_FILE``.
+    :return: Number of entries written.
+    """
+    history = load_binary_history(path)
+    entries = dict(history.items())
+    json_history.write_history_snapshot(entries)
+    logging.info(f"Converted {len(entries)} balance history entries back to JSON.")
+    return len(entries)
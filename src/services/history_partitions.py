@@ -0,0 +1,164 @@
+import os
+import logging
+import threading
+from typing import Optional
+
+from services import history as history_store
+from services import history_archive
+from services.history_persister import HistoryPersister
+from services.history_window import RollingWindow
+
+
+def parse_addresses(value) -> list:
+    """Normalize ``massa_node_address`` from ``topology.json`` into a list of addresses.
+
+    :param value: A single address, a list of addresses, or None.
+    :return: Addresses in configuration order, without blanks or duplicates.
+    """
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = [value]
+    addresses = []
+    for address in value:
+        address = str(address).strip()
+        if address and address not in addresses:
+            addresses.append(address)
+    return addresses
+
+
+def partition_file(address: str) -> str:
+    """Return the snapshot file of an additional address (``config/balance_history.<address>.json``)."""
+    root, ext = os.path.splitext(history_store.BALANCE_HISTORY_FILE)
+    safe = "".join(char for char in address if char.isalnum())
+    return f"{root}.{safe}{ext}"
+
+
+def partition_archive_dir(address: str) -> str:
+    """Return the archive directory of an additional address (``config/history/<address>/``)."""
+    safe = "".join(char for char in address if char.isalnum())
+    return os.path.join(history_archive.HISTORY_ARCHIVE_DIR, safe)
+
+
+class HistoryPartition:
+    """Balance history of one address with its lock, rolling window and persister."""
+
+    def __init__(self, address: str, history: dict, lock=None, window: Optional[RollingWindow] = None,
+                 persister: Optional[HistoryPersister] = None):
+        self.address = address
+        self.history = history
+        self.lock = lock if lock is not None else threading.Lock()
+        self.window = window
+        self.persister = persister
+
+
+class HistoryPartitions:
+    """Balance histories of every monitored address, one partition (set of files) each.
+
+    The first address keeps the historical files and objects stored directly
+    in ``bot_data`` (``balance_history``, ``balance_lock``, ...).  Each other
+    address is stored with the JSON backend in its own snapshot and journal
+    (see :func:`partition_file`) and is only loaded the first time it is
+    queried (``/node``, ``/hist``, scheduled report), so memory and startup
+    I/O grow with the addresses actually looked at.  Snapshots recorded for
+    an address that is not loaded yet are appended to its journal, which the
+    load replays.  Handlers load a partition with ``asyncio.to_thread``,
+    since :meth:`get` parses its snapshot; the daily retention and archive
+    jobs load them all (:meth:`others`), so every journal is folded back
+    into its snapshot and every address is compacted and archived.
+    """
+
+    def __init__(self, addresses: list, primary: HistoryPartition):
+        self.addresses = [primary.address] + [address for address in addresses if address != primary.address]
+        self._partitions = {primary.address: primary}
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self) -> HistoryPartition:
+        return self._partitions[self.addresses[0]]
+
+    def resolve(self, selector: str) -> Optional[str]:
+        """Return the address designated by *selector*, or None.
+
+        A selector is a full address, its 1-based position in the configured
+        list, or a prefix or suffix matching exactly one address.
+        """
+        selector = selector.strip()
+        if selector in self.addresses:
+            return selector
+        if selector.isdigit():
+            index = int(selector) - 1
+            return self.addresses[index] if 0 <= index < len(self.addresses) else None
+        if len(selector) < 3:
+            return None
+        matches = [
+            address for address in self.addresses
+            if address.startswith(selector) or address.endswith(selector)
+        ]
+        return matches[0] if len(matches) == 1 else None
+
+    def is_loaded(self, address: str) -> bool:
+        return address in self._partitions
+
+    def get(self, address: str) -> HistoryPartition:
+        """Return the partition of *address*, loading its history on first use.
+
+        :raises KeyError: When *address* is not monitored.
+        """
+        if address not in self.addresses:
+            raise KeyError(address)
+        with self._lock:
+            partition = self._partitions.get(address)
+            if partition is None:
+                history = history_store.load_balance_history('json', path=partition_file(address))
+                lock = threading.Lock()
+                persister = HistoryPersister(history, lock)
+                persister.start()
+                partition = HistoryPartition(address, history, lock, RollingWindow.from_history(history), persister)
+                self._partitions[address] = partition
+                logging.info(f"Loaded balance history of {address} ({len(history)} entries).")
+            return partition
+
+    def others(self) -> list:
+        """Return the partitions of the additional addresses, loading those not loaded yet.
+
+        Meant for the scheduler thread, never the event loop.
+        """
+        return [self.get(address) for address in self.addresses[1:]]
+
+    def record(self, snapshots: list) -> None:
+        """Store one ping's ``(address, time_key, entry)`` snapshots, batched per partition.
+
+        Loaded partitions are updated in memory and their persister writes
+        the new entry; for the others the entries go straight to the journal,
+        one write per address.
+        """
+        pending: dict = {}
+        for address, key, entry in snapshots:
+            partition = self._partitions.get(address)
+            if partition is None:
+                pending.setdefault(address, []).append((key, entry))
+                continue
+            with partition.lock:
+                partition.history[key] = entry
+                if partition.window is not None:
+                    partition.window.add(key, entry)
+                if partition.persister is None:
+                    history_store.append_balance_entry(partition.history, key)
+            if partition.persister is not None:
+                partition.persister.enqueue_append(key)
+        for address, records in pending.items():
+            try:
+                history_store.append_journal_records(records, partition_file(address))
+            except OSError as e:
+                logging.error(f"Error appending to balance history journal of {address}: {e}")
+
+    def stop(self) -> None:
+        """Flush and stop the persisters of the additional partitions."""
+        for address, partition in list(self._partitions.items()):
+            if address == self.addresses[0] or partition.persister is None:
+                continue
+            try:
+                partition.persister.stop()
+            except Exception as e:
+                logging.error(f"Error stopping history persister of {address}: {e}")
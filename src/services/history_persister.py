@@ -0,0 +1,160 @@
+import time
+import queue
+import logging
+import threading
+from typing import Optional
+
+from services import history as history_store
+
+
+# Queue markers (appends are queued as their time key)
+_SAVE = object()
+_STOP = object()
+
+
+class HistoryPersister:
+    """Write-behind persister for the balance history.
+
+    Handlers and the scheduler update the in-memory history under
+    ``balance_lock`` and then only enqueue what changed, so no file I/O
+    happens on the event loop or while the lock is held.  A dedicated thread
+    drains the queue and coalesces each burst into one write: a single
+    journal append for new entries, or one atomic snapshot rewrite (temp
+    file, fsync, rename) when a full save was requested or the journal grew
+    past ``JOURNAL_COMPACT_BYTES``.
+
+    Write-through stores (SQLite backend) are durable already and are
+    skipped, except for the entries handed over with :meth:`enqueue_store`:
+    storing one is a database commit, so the writer thread does it.
+    """
+
+    def __init__(self, balance_history: dict, lock: Optional[threading.Lock] = None):
+        self._history = balance_history
+        self._lock = lock if lock is not None else threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self.last_flush_duration: Optional[float] = None
+        self.flush_count = 0
+
+    def start(self) -> None:
+        """Start the writer thread (no-op if it is already running)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='history-persister', daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def enqueue_append(self, time_key: str) -> None:
+        """Queue the entry stored under *time_key* for the journal."""
+        self._submit(time_key)
+
+    def enqueue_store(self, time_key: str, entry) -> None:
+        """Queue *entry* to be stored under *time_key* by the writer thread.
+
+        Used for write-through stores, where the assignment itself commits
+        to the database and must not run on the event loop.
+        """
+        self._submit((time_key, entry))
+
+    def request_save(self) -> None:
+        """Queue a full snapshot rewrite (e.g. after ``clear`` or compaction)."""
+        self._submit(_SAVE)
+
+    def _submit(self, item) -> None:
+        if self.running:
+            self._queue.put(item)
+        else:
+            # No writer thread (not started yet or already stopped): write inline
+            self._write_batch([item])
+
+    def queue_depth(self) -> int:
+        """Return the number of mutations waiting to be written."""
+        return self._queue.qsize()
+
+    def metrics(self) -> dict:
+        """Return ``queue_depth``, ``last_flush_duration`` (seconds or None) and ``flush_count``."""
+        return {
+            "queue_depth": self.queue_depth(),
+            "last_flush_duration": self.last_flush_duration,
+            "flush_count": self.flush_count,
+        }
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every mutation queued so far has been written.
+
+        :param timeout: Maximum wait in seconds; None waits forever.
+        :return: True when the queue was drained in time.
+        """
+        if not self.running:
+            return self._queue.empty()
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """Write every pending mutation, then stop the writer thread."""
+        if not self.running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logging.error("History persister did not stop in time, pending writes may be lost.")
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            # Coalesce everything that piled up while the previous write ran
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+            if _STOP in batch:
+                return
+
+    def _write_batch(self, batch: list) -> None:
+        events = [item for item in batch if isinstance(item, threading.Event)]
+        keys = [item for item in batch if isinstance(item, str)]
+        stores = [item for item in batch if isinstance(item, tuple)]
+        full_save = _SAVE in batch
+        if stores:
+            try:
+                with self._lock:
+                    self._history.update(stores)
+            except Exception as e:
+                logging.error(f"Error storing balance history entries: {e}")
+        if (keys or full_save) and not getattr(self._history, 'write_through', False):
+            started = time.perf_counter()
+            try:
+                self._write(keys, full_save)
+            except Exception as e:
+                logging.error(f"Error persisting balance history: {e}")
+            self.last_flush_duration = time.perf_counter() - started
+            self.flush_count += 1
+        for event in events:
+            event.set()
+
+    def _write(self, keys: list, full_save: bool) -> None:
+        if not full_save:
+            with self._lock:
+                records = [
+                    (key, self._history[key])
+                    for key in dict.fromkeys(keys) if key in self._history
+                ]
+            if not records:
+                return
+            size = history_store.append_journal_records(records, history_store.history_file(self._history))
+            if size <= history_store.JOURNAL_COMPACT_BYTES:
+                return
+        # A snapshot taken before the background load finishes would drop entries
+        ready = getattr(self._history, 'ready', None)
+        if ready is not None:
+            ready.wait()
+        # Copy under the lock, write outside it
+        with self._lock:
+            entries = dict(self._history.items())
+        history_store.get_snapshot_writer(self._history)(entries)
@@ -0,0 +1,180 @@
+import logging
+from typing import Optional
+
+from services.history import (
+    BalanceHistory, datetime_to_epoch, epoch_to_datetime, get_entry_balance, get_entry_ram,
+    get_entry_rollup, get_entry_temperature, make_time_key, parse_time_key,
+)
+
+
+# Fields a run entry carries on top of the readings of its first snapshot
+RUN_FIELDS = ("run_end", "run_count")
+
+
+def get_entry_run(key: str, value: dict) -> Optional[tuple]:
+    """Extract the run fields of a run-length compacted snapshot entry.
+
+    Entries written with run settings (see :func:`compact_runs`) stand for
+    ``run_count`` identical snapshots taken every *step* seconds from their
+    own key to ``run_end``.
+
+    :param key: Time key of the entry (start of the run).
+    :param value: A history entry dict.
+    :return: ``(start epoch, step seconds, count)``, or None for ordinary
+        entries and malformed runs.
+    """
+    count = value.get("run_count")
+    if count is None:
+        return None
+    end = parse_time_key(value.get("run_end") or "")
+    start = parse_time_key(key)
+    if end is None or start is None or int(count) < 2:
+        return None
+    start_epoch = datetime_to_epoch(start)
+    span = datetime_to_epoch(end) - start_epoch
+    count = int(count)
+    if span <= 0 or span % (count - 1):
+        return None
+    return start_epoch, span // (count - 1), count
+
+
+def expand_runs(records, newest_first: bool = False):
+    """Yield ``(key, entry)`` pairs with every run expanded into its snapshots.
+
+    Used when a snapshot file is read, so the in-memory history always holds
+    the logical series.
+
+    :param records: A ``key -> entry`` mapping or an iterable of ``(key, entry)`` pairs.
+    :param newest_first: Yield the snapshots of a run newest first, to keep
+        the order of a newest-first snapshot file.
+    """
+    if hasattr(records, 'items'):
+        records = records.items()
+    for key, value in records:
+        run = get_entry_run(key, value) if isinstance(value, dict) else None
+        if run is None:
+            yield key, value
+            continue
+        start, step, count = run
+        entry = {field: reading for field, reading in value.items() if field not in RUN_FIELDS}
+        offsets = range(count - 1, -1, -1) if newest_first else range(count)
+        for offset in offsets:
+            yield make_time_key(epoch_to_datetime(start + step * offset)), entry
+
+
+def _within(value: Optional[float], reference: Optional[float], tolerance: float) -> bool:
+    """Return True when two readings match within *tolerance* (both missing counts as a match)."""
+    if value is None or reference is None:
+        return value is None and reference is None
+    return abs(value - reference) <= tolerance
+
+
+def _extends_run(pending: list, epoch: int, value, temperature_tolerance: float,
+                 ram_tolerance: float) -> bool:
+    """Return True when the snapshot at *epoch* continues the run in *pending*.
+
+    The balance must be unchanged, temperature and RAM within their
+    tolerances of the run's first snapshot, compacted aggregates never join
+    a run, and snapshots must be evenly spaced so the run expands back to
+    the exact same keys.
+    """
+    first = pending[0][2]
+    if get_entry_rollup(value) is not None or get_entry_rollup(first) is not None:
+        return False
+    if get_entry_balance(value) != get_entry_balance(first):
+        return False
+    if not _within(get_entry_temperature(value), get_entry_temperature(first),
+                   temperature_tolerance):
+        return False
+    if not _within(get_entry_ram(value), get_entry_ram(first), ram_tolerance):
+        return False
+    if len(pending) == 1:
+        return True
+    return epoch - pending[-1][0] == pending[1][0] - pending[0][0]
+
+
+def compress_runs(records, temperature_tolerance: float = 0.5, ram_tolerance: float = 1.0,
+                  min_length: int = 4) -> list:
+    """Return *records* with runs of unchanged consecutive snapshots merged into single entries.
+
+    At least *min_length* evenly spaced snapshots with the same balance, and
+    temperature / RAM within *temperature_tolerance* / *ram_tolerance* of the
+    run's first snapshot, become one entry holding the first snapshot's
+    readings plus ``run_end`` and ``run_count``.
+
+    :param records: ``(key, entry)`` pairs; keys that are not canonical are kept, last.
+    :return: ``(key, entry)`` pairs, oldest first.
+    """
+    rows = []
+    others = []
+    for key, value in records:
+        dt = parse_time_key(key)
+        if dt is None:
+            others.append((key, value))
+        else:
+            rows.append((datetime_to_epoch(dt), key, value))
+    rows.sort(key=lambda row: row[0])
+
+    result = []
+    pending: list = []
+
+    def flush() -> None:
+        if len(pending) >= max(min_length, 2):
+            _, key, value = pending[0]
+            entry: dict = {"balance": get_entry_balance(value)}
+            for field, reading in (("temperature_avg", get_entry_temperature(value)),
+                                   ("ram_percent", get_entry_ram(value))):
+                if reading is not None:
+                    entry[field] = reading
+            entry["run_end"] = pending[-1][1]
+            entry["run_count"] = len(pending)
+            result.append((key, entry))
+        else:
+            result.extend((key, value) for _, key, value in pending)
+        pending.clear()
+
+    for epoch, key, value in rows:
+        if pending and not _extends_run(pending, epoch, value, temperature_tolerance,
+                                        ram_tolerance):
+            flush()
+        pending.append((epoch, key, value))
+    flush()
+    result.extend(others)
+    return result
+
+
+def compact_runs(balance_history: dict, temperature_tolerance: float = 0.5,
+                 ram_tolerance: float = 1.0, min_length: int = 4) -> int:
+    """Store runs of unchanged consecutive snapshots as single entries on disk.
+
+    A node that is not earning keeps recording the same balance every hour.
+    The settings are kept as ``run_settings`` on the history, and every
+    snapshot written afterwards goes through :func:`compress_runs`.  The
+    in-memory history is not modified: loading a snapshot expands the runs
+    back (:func:`expand_runs`), with the first snapshot's readings, so
+    readers (``items()``, ``filter_last_24h``, plotting, uptime) see every
+    snapshot.
+
+    Only :class:`~services.history.BalanceHistory` objects written as JSON
+    snapshots get runs; other histories are left as is.
+
+    :param balance_history: History whose snapshots should store runs.
+    :param temperature_tolerance: Allowed temperature drift within a run (°C).
+    :param ram_tolerance: Allowed RAM usage drift within a run (percentage points).
+    :param min_length: Minimum number of snapshots worth a run.
+    :return: Number of entries the runs save in the next snapshot.
+    """
+    if not isinstance(balance_history, BalanceHistory):
+        return 0
+    if hasattr(balance_history, 'write_snapshot'):
+        return 0
+    settings = {
+        'temperature_tolerance': temperature_tolerance,
+        'ram_tolerance': ram_tolerance,
+        'min_length': min_length,
+    }
+    balance_history.run_settings = settings
+    saved = len(balance_history) - len(compress_runs(balance_history.items(), **settings))
+    if saved:
+        logging.info(f"Compacted balance history: {saved} unchanged snapshots stored as runs.")
+    return saved
@@ -0,0 +1,217 @@
+import os
+import sqlite3
+import logging
+import threading
+from typing import Optional
+from datetime import datetime
+from collections.abc import MutableMapping
+
+from services import history as json_history
+from services.history import (
+    parse_time_key, datetime_to_epoch, epoch_to_datetime,
+    get_entry_balance, get_entry_temperature, get_entry_ram, get_entry_rollup,
+)
+
+
+HISTORY_DB_FILE = 'config/balance_history.db'
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS balance_history ("
+    " time_key TEXT PRIMARY KEY,"
+    " ts INTEGER,"
+    " balance REAL NOT NULL,"
+    " temperature_avg REAL,"
+    " ram_percent REAL,"
+    " balance_min REAL,"
+    " balance_max REAL,"
+    " samples INTEGER)",
+    "CREATE INDEX IF NOT EXISTS idx_balance_history_ts ON balance_history (ts)",
+)
+# Columns added after the first release, created on databases that predate them
+_ROLLUP_COLUMNS = (("balance_min", "REAL"), ("balance_max", "REAL"), ("samples", "INTEGER"))
+_ENTRY_COLUMNS = "balance, temperature_avg, ram_percent, balance_min, balance_max, samples"
+_INSERT = "INSERT OR REPLACE INTO balance_history VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+def _row_to_entry(balance: float, temperature_avg: Optional[float], ram_percent: Optional[float],
+                  balance_min: Optional[float] = None, balance_max: Optional[float] = None,
+                  samples: Optional[int] = None) -> dict:
+    """Rebuild a history entry dict from a table row, omitting missing fields."""
+    entry: dict = {"balance": balance}
+    if temperature_avg is not None:
+        entry["temperature_avg"] = temperature_avg
+    if ram_percent is not None:
+        entry["ram_percent"] = ram_percent
+    if samples is not None:
+        entry["balance_min"] = balance_min
+        entry["balance_max"] = balance_max
+        entry["samples"] = samples
+    return entry
+
+
+class SqliteBalanceHistory(MutableMapping):
+    """Balance history stored in a SQLite table with an indexed timestamp column.
+
+    Behaves like the ``dict`` returned by the JSON backend, but every write goes
+    straight to the database (``write_through``), so ``save_balance_history`` and
+    ``append_balance_entry`` have nothing left to do.  Window queries used by
+    ``filter_last_24h`` / ``filter_since_midnight`` run through
+    :meth:`items_between` as indexed range scans.
+    """
+
+    write_through = True
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # The connection is shared between handlers and the scheduler thread
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._version = 0
+        with self._lock, self._conn:
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(balance_history)")}
+            for name, sql_type in _ROLLUP_COLUMNS:
+                if name not in existing:
+                    self._conn.execute(f"ALTER TABLE balance_history ADD COLUMN {name} {sql_type}")
+
+    @staticmethod
+    def _row_values(key: str, value) -> tuple:
+        dt = parse_time_key(key)
+        ts = datetime_to_epoch(dt) if dt is not None else None
+        rollup = get_entry_rollup(value) or (None, None, None)
+        return (key, ts, get_entry_balance(value), get_entry_temperature(value), get_entry_ram(value), *rollup)
+
+    def __getitem__(self, key: str) -> dict:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_ENTRY_COLUMNS} FROM balance_history WHERE time_key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return _row_to_entry(*row)
+
+    def __setitem__(self, key: str, value) -> None:
+        row = self._row_values(key, value)
+        with self._lock, self._conn:
+            self._conn.execute(_INSERT, row)
+            self._version += 1
+
+    def __delitem__(self, key: str) -> None:
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM balance_history WHERE time_key = ?", (key,))
+            self._version += 1
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __iter__(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT time_key FROM balance_history ORDER BY ts, time_key").fetchall()
+        return iter([row[0] for row in rows])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM balance_history").fetchone()[0]
+
+    def items(self):
+        """Return all ``(key, entry)`` pairs in chronological order with a single query."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT time_key, {_ENTRY_COLUMNS} FROM balance_history ORDER BY ts, time_key"
+            ).fetchall()
+        return [(row[0], _row_to_entry(*row[1:])) for row in rows]
+
+    def values(self):
+        return [entry for _, entry in self.items()]
+
+    def update(self, other=(), **kwargs) -> None:
+        """Insert many entries in a single transaction."""
+        pairs = other.items() if hasattr(other, 'items') else other
+        rows = [self._row_values(key, value) for key, value in pairs]
+        rows.extend(self._row_values(key, value) for key, value in kwargs.items())
+        with self._lock, self._conn:
+            self._conn.executemany(_INSERT, rows)
+            self._version += 1
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM balance_history")
+            self._version += 1
+
+    @property
+    def version(self) -> int:
+        """Counter bumped by every write, as ``BalanceHistory.version``."""
+        return self._version
+
+    @staticmethod
+    def _range_clause(start: Optional[datetime], end: Optional[datetime]) -> tuple:
+        clause = "ts IS NOT NULL"
+        params = []
+        if start is not None:
+            clause += " AND ts >= ?"
+            params.append(datetime_to_epoch(start))
+        if end is not None:
+            clause += " AND ts < ?"
+            params.append(datetime_to_epoch(end))
+        return clause, params
+
+    def items_between(self, start: Optional[datetime], end: Optional[datetime]) -> list:
+        """Return ``(datetime, key, entry)`` tuples with ``start <= time < end``, oldest first.
+
+        Either bound may be None.  Runs as an index range scan on ``ts``.
+        """
+        clause, params = self._range_clause(start, end)
+        query = f"SELECT ts, time_key, {_ENTRY_COLUMNS} FROM balance_history WHERE {clause} ORDER BY ts"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            (epoch_to_datetime(row[0]), row[1], _row_to_entry(*row[2:]))
+            for row in rows
+        ]
+
+    def count_between(self, start: Optional[datetime], end: Optional[datetime]) -> int:
+        """Return the number of entries with ``start <= time < end`` (index-only count)."""
+        clause, params = self._range_clause(start, end)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM balance_history WHERE {clause}", params).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def import_json_history(store: SqliteBalanceHistory) -> int:
+    """One-shot import of the JSON snapshot and journal into a SQLite store.
+
+    After the import the JSON files are renamed with an ``.imported`` suffix
+    so it never runs twice.
+
+    :param store: Destination store.
+    :return: Number of imported entries.
+    """
+    history = json_history.load_balance_history()
+    store.update(history)
+    for path in (json_history.BALANCE_HISTORY_FILE, json_history.get_journal_path()):
+        if os.path.exists(path):
+            os.replace(path, path + '.imported')
+    logging.info(f"Imported {len(history)} balance history entries into SQLite.")
+    return len(history)
+
+
+def open_sqlite_history(path: str = None) -> SqliteBalanceHistory:
+    """Open the SQLite history store, importing the JSON history on first use.
+
+    :param path: Database file; defaults to ``HISTORY_DB_FILE``.
+    """
+    if path is None:
+        path = HISTORY_DB_FILE
+    store = SqliteBalanceHistory(path)
+    has_json = any(
+        os.path.exists(p) for p in (json_history.BALANCE_HISTORY_FILE, json_history.get_journal_path())
+    )
+    if has_json and len(store) == 0:
+        import_json_history(store)
+    return store
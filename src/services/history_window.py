@@ -0,0 +1,157 @@
+import threading
+from typing import Optional
+from datetime import datetime, timedelta
+
+from services.history import (
+    _entries_since, datetime_to_epoch, get_entry_balance, get_entry_temperature, parse_time_key,
+)
+
+
+WINDOW_HOURS = 24
+
+
+class RollingWindow:
+    """Materialized view of the last 24 hours of balance history.
+
+    Reports and ``/perf`` used to rebuild ``filter_last_24h`` /
+    ``filter_since_midnight`` from the whole history on every call.  This
+    window is fed every new entry instead (:meth:`add`, under
+    ``balance_lock``) and expires hours lazily when read, so every accessor
+    costs O(1):
+
+    - one slot per hour holding its latest entry (the rows
+      ``filter_last_24h`` returns), in a ring indexed by epoch hour;
+    - a bitmap of occupied slots, for uptime;
+    - running temperature sum and count over the occupied slots;
+    - the first entry recorded since midnight.
+
+    The ring has one slot more than the window because a 24h window starting
+    mid-hour touches 25 distinct hours; like ``filter_last_24h``, readers
+    only report the 24 most recent ones.
+    """
+
+    def __init__(self, hours: int = WINDOW_HOURS):
+        self.hours = hours
+        self._size = hours + 1
+        self._lock = threading.Lock()
+        self.clear()
+
+    @classmethod
+    def from_history(cls, history: dict, now: datetime = None, hours: int = WINDOW_HOURS) -> 'RollingWindow':
+        """Build a window from the entries of *history* recorded in the last *hours*."""
+        window = cls(hours)
+        window.rebuild(history, now)
+        return window
+
+    def clear(self) -> None:
+        with self._lock:
+            # slot -> (epoch hour, epoch, key, balance, temperature or None, entry value)
+            self._slots: list = [None] * self._size
+            self._occupied = 0
+            self._temperature_sum = 0.0
+            self._temperature_count = 0
+            self._midnight: Optional[datetime] = None
+            self._first: Optional[tuple] = None
+
+    def rebuild(self, history: dict, now: datetime = None) -> None:
+        """Reset the window from *history* (after a bulk change such as compaction)."""
+        if now is None:
+            now = datetime.now()
+        self.clear()
+        for dt, key, value in _entries_since(history, now - timedelta(hours=self.hours)):
+            self._add(dt, key, value)
+
+    def add(self, key: str, value: dict) -> None:
+        """Account for the entry just stored under *key*."""
+        dt = parse_time_key(key)
+        if dt is not None:
+            self._add(dt, key, value)
+
+    def _add(self, dt: datetime, key: str, value: dict) -> None:
+        epoch = datetime_to_epoch(dt)
+        hour = epoch // 3600
+        record = (hour, epoch, key, get_entry_balance(value), get_entry_temperature(value), value)
+        with self._lock:
+            index = hour % self._size
+            current = self._slots[index]
+            if current is None or current[0] < hour or (current[0] == hour and current[1] <= epoch):
+                self._set_slot(index, record)
+            midnight = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+            if self._midnight is None or midnight > self._midnight:
+                self._midnight = midnight
+                self._first = (epoch, key, record[3])
+            elif midnight == self._midnight and epoch <= self._first[0]:
+                self._first = (epoch, key, record[3])
+
+    def _set_slot(self, index: int, record: Optional[tuple]) -> None:
+        current = self._slots[index]
+        if current is not None and current[4] is not None:
+            self._temperature_sum -= current[4]
+            self._temperature_count -= 1
+        self._slots[index] = record
+        if record is None:
+            self._occupied &= ~(1 << index)
+            return
+        self._occupied |= 1 << index
+        if record[4] is not None:
+            self._temperature_sum += record[4]
+            self._temperature_count += 1
+
+    def _expire(self, now: datetime) -> None:
+        cutoff = datetime_to_epoch(now - timedelta(hours=self.hours))
+        occupied = self._occupied
+        while occupied:
+            index = (occupied & -occupied).bit_length() - 1
+            occupied &= occupied - 1
+            if self._slots[index][1] < cutoff:
+                self._set_slot(index, None)
+
+    def _live_slots(self, now: Optional[datetime]) -> list:
+        """Expire stale hours and return the occupied slots, oldest first (at most ``hours``)."""
+        self._expire(now or datetime.now())
+        slots = sorted((slot for slot in self._slots if slot is not None), key=lambda slot: slot[1])
+        return slots[-self.hours:]
+
+    def recent(self, now: datetime = None) -> dict:
+        """Return the latest entry of each hour in the window, like ``filter_last_24h``.
+
+        :return: ``{key: entry}`` in chronological order, entries as stored in the history.
+        """
+        with self._lock:
+            slots = self._live_slots(now)
+        return {slot[2]: slot[5] for slot in slots}
+
+    def oldest(self, now: datetime = None) -> Optional[tuple]:
+        """Return ``(key, balance)`` of the oldest hour in the window, or None."""
+        with self._lock:
+            slots = self._live_slots(now)
+        return (slots[0][2], slots[0][3]) if slots else None
+
+    def first_since_midnight(self, now: datetime = None) -> Optional[tuple]:
+        """Return ``(key, balance)`` of the first entry recorded today, or None."""
+        if now is None:
+            now = datetime.now()
+        with self._lock:
+            if self._midnight != now.replace(hour=0, minute=0, second=0, microsecond=0):
+                return None
+            return self._first[1], self._first[2]
+
+    def temperature_average(self, now: datetime = None) -> Optional[float]:
+        """Return the average temperature over the hours in the window, or None without readings."""
+        with self._lock:
+            slots = self._live_slots(now)
+            total, count = self._temperature_sum, self._temperature_count
+            if len(slots) < bin(self._occupied).count('1'):
+                # 25 hours touched: leave the oldest one out, like recent()
+                dropped = min((slot for slot in self._slots if slot is not None), key=lambda slot: slot[1])[4]
+                if dropped is not None:
+                    total -= dropped
+                    count -= 1
+        return total / count if count else None
+
+    def uptime_percent(self, now: datetime = None) -> float:
+        """Return the share of the last 24 hours with at least one entry (0-100)."""
+        with self._lock:
+            self._expire(now or datetime.now())
+            hours = min(bin(self._occupied).count('1'), self.hours)
+        return round(hours / self.hours * 100, 1)
@@ -4,21 +4,23 @@ import logging
 from services.http_client import safe_request
 
 
-def get_addresses(logger, address: str) -> dict:
+def get_addresses(logger, address) -> dict:
     """
     Print the address info from a given address
 
     :param logger: The logger instance
-    :param address: The address to querry.
+    :param address: The address to querry, or a list of addresses queried in a single request
+        (``result`` then holds one item per address, in the same order).
     :return: json dict with all info
     """
+    addresses = [address] if isinstance(address, str) else list(address)
     url = 'https://mainnet.massa.net/api/v2'
     headers = {'Content-Type': 'application/json'}
     data = {
         "jsonrpc": "2.0",
         "id": 1,
         "method": "get_addresses",
-        "params": [[address]]
+        "params": [addresses]
     }
     return safe_request(logger, 'post', url, headers=headers, data=json.dumps(data))
 
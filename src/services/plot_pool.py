@@ -0,0 +1,185 @@
+import pickle
+import asyncio
+import logging
+import threading
+import multiprocessing
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from services.history import BalanceHistory
+
+
+class PlotPoolBusy(Exception):
+    """Raised when every render slot of the plot pool is taken."""
+
+
+def _warm_worker() -> None:
+    """Worker initializer: load matplotlib and the chart templates once, before the first render."""
+    from services.plotting import prewarm
+    prewarm()
+
+
+def _noop() -> None:
+    """Task submitted at startup so every worker process is spawned (and warmed) right away."""
+
+
+def _call(payload: bytes):
+    plot_function, args = pickle.loads(payload)
+    return plot_function(*args)
+
+
+def _detach(arg):
+    """Return *arg* in a form that can be sent to a worker (histories backed by a database are copied)."""
+    if isinstance(arg, Mapping) and not isinstance(arg, (dict, BalanceHistory)):
+        return BalanceHistory(arg.items())
+    return arg
+
+
+class PlotPool:
+    """Process pool rendering matplotlib charts off the Telegram event loop.
+
+    Workers are spawned at :meth:`start` with matplotlib already imported,
+    so the first chart does not pay for the import.  A plotting function and
+    its arguments are pickled (by :meth:`run` in a worker thread, so a large
+    history does not hold the event loop) and run in a worker.  Callers pass
+    histories they own, such as a window copied under ``balance_lock``.
+
+    At most ``max_pending`` renders are queued or running: :meth:`run` (for
+    handlers) raises :class:`PlotPoolBusy` at once when the pool is full
+    rather than holding the event loop, while :meth:`run_sync` (for
+    background threads) waits up to ``timeout`` for a slot.  Each render is
+    given ``timeout`` seconds; a render still running then gives its slot
+    back and its worker processes are terminated, the next render starting
+    a fresh pool, so hung renders cannot pile up.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 8, timeout: float = 30.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Futures holding a render slot -> executor running them
+        self._held: dict = {}
+        self.renders = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    def start(self) -> None:
+        """Spawn and warm the worker processes (no-op if the pool is running)."""
+        with self._lock:
+            if self._executor is not None:
+                return
+            # Spawned, not forked: the bot process already runs threads (scheduler, persister)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_warm_worker,
+            )
+            for _ in range(self.workers):
+                self._executor.submit(_noop)
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    @staticmethod
+    def _payload(plot_function, args: tuple) -> bytes:
+        return pickle.dumps((plot_function, tuple(_detach(arg) for arg in args)))
+
+    def _submit(self, payload: bytes):
+        self.start()
+        try:
+            executor = self._executor
+            future = executor.submit(_call, payload)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory): start a fresh pool
+            logging.error("Plot pool broken, restarting it.")
+            self.stop(wait=False)
+            self.start()
+            executor = self._executor
+            future = executor.submit(_call, payload)
+        self.renders += 1
+        with self._lock:
+            self._held[future] = executor
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future) -> None:
+        """Give the slot of *future* back, once, whether it finished or was abandoned."""
+        with self._lock:
+            held = self._held.pop(future, None) is not None
+        if held:
+            self._slots.release()
+
+    def _abandon(self, future, plot_function) -> None:
+        """Free the slot of a render that timed out and terminate the workers running it."""
+        self.timeouts += 1
+        logging.error(f"{plot_function.__name__} took more than {self.timeout}s, abandoned.")
+        with self._lock:
+            executor = self._held.get(future)
+            if executor is not None and executor is self._executor:
+                self._executor = None
+        self._release(future)
+        if executor is None:
+            return
+        # shutdown() alone would wait for the hung render: kill its processes
+        processes = list((getattr(executor, '_processes', None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    async def run(self, plot_function, *args):
+        """Render ``plot_function(*args)`` in a worker and return its result.
+
+        :raises PlotPoolBusy: When ``max_pending`` renders are already queued or running.
+        :raises asyncio.TimeoutError: When the render takes more than ``timeout`` seconds.
+        """
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PlotPoolBusy(f"{self.max_pending} charts already being rendered")
+        try:
+            payload = await asyncio.to_thread(self._payload, plot_function, args)
+            future = self._submit(payload)
+        except BaseException:
+            self._slots.release()
+            raise
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self._abandon(future, plot_function)
+            raise
+
+    def run_sync(self, plot_function, *args):
+        """Blocking :meth:`run` for background threads: waits up to ``timeout`` for a free slot.
+
+        :raises PlotPoolBusy: When no slot frees up in time.
+        :raises concurrent.futures.TimeoutError: When the render takes more than ``timeout`` seconds.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            self.rejected += 1
+            raise PlotPoolBusy(f"{self.max_pending} charts already being rendered")
+        try:
+            future = self._submit(self._payload(plot_function, args))
+        except BaseException:
+            self._slots.release()
+            raise
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            self._abandon(future, plot_function)
+            raise
+
+    def metrics(self) -> dict:
+        """Return ``renders``, ``timeouts`` and ``rejected`` counts."""
+        return {"renders": self.renders, "timeouts": self.timeouts, "rejected": self.rejected}
+
+    def stop(self, wait: bool = True) -> None:
+        """Shut the worker processes down, cancelling queued renders."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
@@ -1,31 +1,185 @@
+import io
 import math
+import time
+import pickle
+import hashlib
+import logging
+import functools
+import threading
 from pathlib import Path
-from uuid import uuid4
-import matplotlib.pyplot as plt
-from typing import List
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import List, Optional
 
-from services.history import get_entry_balance, get_entry_temperature, get_entry_ram
+from services.history import HISTORY_COLUMNS, iter_records, datetime_to_epoch, epoch_to_datetime
 
 
-PNG_FILE_NAME = 'plot.png'
-RESOURCES_PLOT_FILE_NAME = 'resources_history.png'
-BALANCE_HISTORY_PLOT_FILE_NAME = 'balance_history.png'
+# Temporary chart files written by earlier versions, removed by sweep_orphan_plots
+ORPHAN_PLOT_PATTERNS = ('*_plot.png', '*_history.png')
 
+# Most points drawn per series: about one per pixel column of the 12 in x 100 dpi charts
+MAX_PLOT_POINTS = 1000
+# Series longer than this are drawn as a plain line, without a marker per point
+MARKER_MAX_POINTS = 60
 
-def _unique_plot_name(base_name: str) -> str:
-    """Return a unique file name in the working directory for a plot image."""
-    return f"{uuid4().hex}_{base_name}"
+# pyplot keeps a global current figure, and charts are also rendered by the chart cache thread
+_PYPLOT_LOCK = threading.Lock()
 
+# Set by load_matplotlib(): importing NumPy and matplotlib takes about half of the bot's startup
+np = plt = mdates = Figure = FigureCanvasAgg = None
 
-def create_png_plot(cycles: List[int], nok_counts: List[int], ok_counts: List[int]) -> str:
+
+def load_matplotlib() -> None:
+    """Import NumPy and matplotlib on the Agg backend (no-op once done).
+
+    Importing this module stays cheap, so the bot can start polling without
+    paying for matplotlib; the first chart (or :func:`prewarm`) loads it.
+    The backend is pinned to Agg whatever ``MPLBACKEND`` says: charts are
+    only ever rendered to PNG bytes.
+    """
+    global np, plt, mdates, Figure, FigureCanvasAgg
+    if Figure is not None:
+        return
+    import numpy
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.dates
+    import matplotlib.pyplot
+    from matplotlib.figure import Figure as figure_class
+    from matplotlib.backends.backend_agg import FigureCanvasAgg as canvas_class
+    np, plt, mdates, FigureCanvasAgg = numpy, matplotlib.pyplot, matplotlib.dates, canvas_class
+    # Assigned last: it marks the libraries as loaded
+    Figure = figure_class
+
+
+def _pyplot_serialized(func):
+    """Run *func* with matplotlib loaded, while holding the pyplot lock."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        load_matplotlib()
+        with _PYPLOT_LOCK:
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _png_bytes(fig) -> bytes:
+    """Render *fig* as PNG into memory and return the bytes."""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+def sweep_orphan_plots(directory: str = '.') -> int:
+    """Delete chart images left in *directory* by versions that rendered to temporary files.
+
+    Charts used to be written as ``<uuid>_plot.png``, ``<uuid>_balance_history.png``
+    and ``<uuid>_resources_history.png`` and deleted after upload, so a crash
+    in between left them behind.  Called once at startup.
+
+    :return: Number of files removed.
+    """
+    removed = 0
+    for pattern in ORPHAN_PLOT_PATTERNS:
+        for path in Path(directory).glob(pattern):
+            try:
+                path.unlink()
+                removed += 1
+            except OSError as e:
+                logging.error(f"Error deleting orphan chart {path}: {e}")
+    if removed:
+        logging.info(f"Removed {removed} orphan chart file(s).")
+    return removed
+
+
+def _history_series(history: dict) -> tuple:
+    """Return ``(epochs, balances, temperatures, ram_percents)`` NumPy arrays for a history mapping.
+
+    Columnar histories (``BalanceHistory``) hand out zero-copy column views,
+    wrapped as NumPy arrays without copying; other mappings are walked as
+    ``HistoryRecord`` objects, oldest first.  Missing temperature/RAM values
+    are NaN.
+    """
+    columns = getattr(history, 'columns', None)
+    if columns is not None:
+        cols = columns()
+        return (
+            np.asarray(cols['timestamp']),
+            np.asarray(cols['balance']),
+            np.asarray(cols['temperature_avg']),
+            np.asarray(cols['ram_percent']),
+        )
+
+    records = list(iter_records(history))
+    return (
+        np.array([datetime_to_epoch(record.timestamp) for record in records], dtype=float),
+        np.array([record.balance for record in records], dtype=float),
+        np.array([math.nan if record.temperature_avg is None else record.temperature_avg for record in records]),
+        np.array([math.nan if record.ram_percent is None else record.ram_percent for record in records]),
+    )
+
+
+def _date_numbers(epochs) -> 'np.ndarray':
+    """Convert history epochs (wall-clock seconds) to matplotlib date numbers."""
+    return epochs / 86400.0 + mdates.date2num(epoch_to_datetime(0))
+
+
+def lttb_indices(x, y, max_points: int) -> 'np.ndarray':
+    """Pick the points of a series to draw with Largest-Triangle-Three-Buckets.
+
+    The first and last points are kept; the others are split into
+    ``max_points - 2`` buckets, and each bucket keeps the point forming the
+    largest triangle with the point kept in the previous bucket and the
+    average of the next bucket.  Peaks and dips survive, unlike with plain
+    decimation or bucket averages.
+
+    :param x: Increasing x values.
+    :param y: Y values, without NaN.
+    :param max_points: Most points to keep (below 3, nothing is dropped).
+    :return: Sorted indices of the points to keep.
+    """
+    size = len(x)
+    if max_points < 3 or size <= max_points:
+        return np.arange(size)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, size - 1, max_points - 1).astype(np.intp)
+    kept = np.empty(max_points, dtype=np.intp)
+    kept[0], kept[-1] = 0, size - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        following = edges[bucket + 2] if bucket + 2 < len(edges) else size
+        next_x, next_y = x[end:following].mean(), y[end:following].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def downsample(x, y, max_points: int = MAX_PLOT_POINTS) -> tuple:
+    """Return copies of ``(x, y)`` without NaN values, reduced to *max_points* with :func:`lttb_indices`."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    present = ~np.isnan(y)
+    # Boolean and fancy indexing copy: a chart never keeps a view on history columns
+    x, y = x[present], y[present]
+    kept = lttb_indices(x, y, max_points)
+    return x[kept], y[kept]
+
+
+@_pyplot_serialized
+def create_png_plot(cycles: List[int], nok_counts: List[int], ok_counts: List[int]) -> bytes:
     """
     Creates a line plot with markers for OK and NOK counts over multiple cycles,
-    and saves the plot as a PNG image.
+    rendered as a PNG image in memory.
 
     :param cycles: A list of integers representing the cycles.
     :param nok_counts: A list of integers representing the NOK counts for each cycle.
     :param ok_counts: A list of integers representing the OK counts for each cycle.
-    :return: The file path of the generated PNG image.
+    :return: The PNG image bytes.
     """
     fig = plt.figure(figsize=(10, 6))
     try:
@@ -36,125 +190,286 @@ def create_png_plot(cycles: List[int], nok_counts: List[int], ok_counts: List[in
         plt.ylabel('Count')
         plt.legend()
         plt.grid(True)
-        plot_name = _unique_plot_name(PNG_FILE_NAME)
-        plt.savefig(plot_name)
-        Path(plot_name).touch(exist_ok=True)
+        return _png_bytes(fig)
     finally:
         plt.close(fig)
-    return plot_name
 
 
-def create_resources_plot(resource_history: dict) -> str:
+class _ChartTemplate:
+    """Long-lived figure of one chart type, re-drawn with new data on every render.
+
+    Building a figure (axes, twin axis, titles, legend, grid) and fitting its
+    layout costs more than drawing the data, so each chart type keeps one
+    figure for the life of the process: a render replaces the ``Line2D`` data
+    with ``set_data``, rescales the axes and draws the canvas again on Agg.
+    ``tight_layout`` only runs again when the tick labels change shape (y
+    labels wider or narrower, date offset shown or not).
+
+    Series are reduced to ``max_points`` with :func:`downsample` and drawn
+    on a date x axis whose ticks are placed by ``AutoDateLocator``, so the
+    render time depends on the point budget, not on the history length.
+
+    The figure is not registered with pyplot, so it is never closed and
+    does not count against pyplot's open-figure limit.  Renders are
+    serialized by the pyplot lock.
+    """
+
+    def __init__(self, figsize: tuple):
+        self.figure = Figure(figsize=figsize)
+        FigureCanvasAgg(self.figure)
+        self._layout_key = None
+        self._markers: dict = {}
+
+    def _date_axis(self, axes) -> None:
+        locator = mdates.AutoDateLocator()
+        axes.xaxis.set_major_locator(locator)
+        axes.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+
+    def _add_line(self, axes, marker: str, **style):
+        line, = axes.plot([], [], marker=marker, linestyle='-', linewidth=2, **style)
+        self._markers[line] = marker
+        return line
+
+    def _set_series(self, line, x, y, max_points: int) -> None:
+        x, y = downsample(x, y, max_points)
+        line.set_data(x, y)
+        line.set_marker(self._markers[line] if len(x) <= MARKER_MAX_POINTS else 'None')
+
+    def _fit(self, *axes_list) -> None:
+        for axes in axes_list:
+            axes.relim()
+            axes.autoscale_view()
+
+    def _layout(self, key) -> None:
+        """Fit the layout again when *key* (what the margins depend on) changed since the last render."""
+        if key != self._layout_key:
+            self.figure.tight_layout()
+            self._layout_key = key
+
+
+def _tick_width(axes) -> int:
+    """Return the length of the widest y tick label *axes* will draw."""
+    formatter = axes.yaxis.get_major_formatter()
+    return max((len(label) for label in formatter.format_ticks(axes.get_yticks())), default=0)
+
+
+def _has_date_offset(axes) -> bool:
+    """Return whether the date axis of *axes* will draw an offset (year, month...) under its labels."""
+    formatter = axes.xaxis.get_major_formatter()
+    formatter.format_ticks(axes.xaxis.get_major_locator()())
+    return bool(formatter.get_offset())
+
+
+class _BalanceChart(_ChartTemplate):
+    def __init__(self):
+        super().__init__((12, 6))
+        self.axes = self.figure.add_subplot()
+        self.line = self._add_line(self.axes, 'o', color='green', markersize=8, label='Balance')
+        self._date_axis(self.axes)
+        self.axes.set_title('Balance History Over Time')
+        self.axes.set_xlabel('Time')
+        self.axes.set_ylabel('Balance')
+        self.axes.legend()
+        self.axes.grid(True, alpha=0.3)
+
+    def render(self, times, balances, max_points: int = MAX_PLOT_POINTS) -> bytes:
+        self._set_series(self.line, times, balances, max_points)
+        self._fit(self.axes)
+        self._layout((_tick_width(self.axes), _has_date_offset(self.axes)))
+        return _png_bytes(self.figure)
+
+
+class _ResourcesChart(_ChartTemplate):
+    def __init__(self):
+        super().__init__((12, 6))
+        self.temperature_axes = self.figure.add_subplot()
+        self.ram_axes = self.temperature_axes.twinx()
+        self.temperature_line = self._add_line(
+            self.temperature_axes, 'o', color='orange', markersize=6, label='Temperature (°C)')
+        self.ram_line = self._add_line(self.ram_axes, 's', color='purple', markersize=6, label='RAM Usage (%)')
+        self._date_axis(self.temperature_axes)
+        self.temperature_axes.set_xlabel('Time')
+        self.temperature_axes.set_ylabel('Temperature (°C)', color='orange')
+        self.temperature_axes.tick_params(axis='y', labelcolor='orange')
+        self.temperature_axes.grid(True, alpha=0.3)
+        self.ram_axes.set_ylabel('RAM Usage (%)', color='purple')
+        self.ram_axes.tick_params(axis='y', labelcolor='purple')
+        self.figure.suptitle('System Resources Over Time', fontsize=14, fontweight='bold')
+        self._shown = None
+
+    def _show(self, has_temperature: bool, has_ram: bool) -> None:
+        """Hide the series (and its y axis) without data; the legend lists the others."""
+        if self._shown == (has_temperature, has_ram):
+            return
+        self.temperature_line.set_visible(has_temperature)
+        self.temperature_axes.yaxis.set_visible(has_temperature)
+        self.ram_line.set_visible(has_ram)
+        self.ram_axes.yaxis.set_visible(has_ram)
+        lines = [line for line in (self.temperature_line, self.ram_line) if line.get_visible()]
+        self.temperature_axes.legend(lines, [line.get_label() for line in lines], loc='upper left')
+        self._shown = (has_temperature, has_ram)
+
+    def render(self, times, temperatures, rams, max_points: int = MAX_PLOT_POINTS) -> bytes:
+        # Each series is reduced on its own points: NaN samples of one do not thin out the other
+        self._set_series(self.temperature_line, times, temperatures, max_points)
+        self._set_series(self.ram_line, times, rams, max_points)
+        has_temperature = len(self.temperature_line.get_xdata()) > 0
+        has_ram = len(self.ram_line.get_xdata()) > 0
+        self._show(has_temperature, has_ram)
+        self._fit(self.temperature_axes, self.ram_axes)
+        self._layout((has_temperature, has_ram, _tick_width(self.temperature_axes), _tick_width(self.ram_axes),
+                      _has_date_offset(self.temperature_axes)))
+        return _png_bytes(self.figure)
+
+
+# One figure per chart type and process, built on first use
+_TEMPLATES: dict = {}
+
+
+def _template(chart_type: type) -> _ChartTemplate:
+    template = _TEMPLATES.get(chart_type)
+    if template is None:
+        template = _TEMPLATES[chart_type] = chart_type()
+    return template
+
+
+def prewarm() -> None:
+    """Load matplotlib and build the chart templates, so the first chart does not pay for them."""
+    started = time.perf_counter()
+    load_matplotlib()
+    with _PYPLOT_LOCK:
+        for chart_type in (_BalanceChart, _ResourcesChart):
+            _template(chart_type)
+    logging.info(f"Charts pre-warmed in {time.perf_counter() - started:.2f}s.")
+
+
+@_pyplot_serialized
+def create_resources_plot(resource_history: dict, max_points: int = MAX_PLOT_POINTS) -> bytes:
     """
     Creates a line plot showing CPU temperature (°C) and RAM usage (%)
-    over time on the same graph with dual Y-axes, and saves it as a PNG image.
+    over time on the same graph with dual Y-axes, rendered as a PNG image in memory.
 
     Only entries that carry resource data (new dict format) are plotted.
-    Returns an empty string when no resource data is available.
+    Returns empty bytes when no resource data is available.
 
-    :param resource_history: Dict with time keys and entry values (dict or str).
-    :return: The file path of the generated PNG image, or empty string if no data.
+    :param resource_history: History mapping (``BalanceHistory`` or dict of entry dicts).
+    :param max_points: Most points drawn per series; longer series are downsampled (LTTB).
+    :return: The PNG image bytes, or empty bytes if no data.
     """
     if not resource_history:
-        return ""
+        return b""
 
-    timestamps = list(resource_history.keys())
-    temperatures = [get_entry_temperature(v) for v in resource_history.values()]
-    ram_percents = [get_entry_ram(v) for v in resource_history.values()]
+    epochs, _, temp_values, ram_values = _history_series(resource_history)
+    if np.isnan(temp_values).all() and np.isnan(ram_values).all():
+        return b""
 
-    has_temperature = any(t is not None for t in temperatures)
-    has_ram = any(r is not None for r in ram_percents)
+    return _template(_ResourcesChart).render(_date_numbers(epochs), temp_values, ram_values, max_points)
 
-    if not has_temperature and not has_ram:
-        return ""
 
-    # Replace None with NaN so matplotlib skips missing data points
-    temp_values = [t if t is not None else math.nan for t in temperatures]
-    ram_values = [r if r is not None else math.nan for r in ram_percents]
+@_pyplot_serialized
+def create_balance_history_plot(balance_history: dict, max_points: int = MAX_PLOT_POINTS) -> bytes:
+    """
+    Creates a line plot of balance history over time, rendered as a PNG image in memory.
 
-    fig, ax1 = plt.subplots(figsize=(12, 6))
-    x = range(len(timestamps))
+    :param balance_history: History mapping (``BalanceHistory`` or dict of entry dicts).
+    :param max_points: Most points drawn; longer histories are downsampled (LTTB).
+    :return: The PNG image bytes, or empty bytes if no data.
+    """
+    if not balance_history:
+        return b""
 
-    try:
-        # Plot temperature on the left Y-axis (if available)
-        if has_temperature:
-            color_temp = 'orange'
-            ax1.set_xlabel('Time')
-            ax1.set_ylabel('Temperature (°C)', color=color_temp)
-            ax1.plot(
-                x, temp_values, marker='o', linestyle='-',
-                color=color_temp, linewidth=2, markersize=6, label='Temperature (°C)',
-            )
-            ax1.tick_params(axis='y', labelcolor=color_temp)
-            ax1.set_xticks(list(x))
-            ax1.set_xticklabels(timestamps, rotation=45, ha='right')
-            ax1.grid(True, alpha=0.3)
-
-        # Plot RAM on the right Y-axis (if available)
-        if has_ram:
-            ax2 = ax1.twinx()
-            color_ram = 'purple'
-            ax2.set_ylabel('RAM Usage (%)', color=color_ram)
-            ax2.plot(
-                x, ram_values, marker='s', linestyle='-',
-                color=color_ram, linewidth=2, markersize=6, label='RAM Usage (%)',
-            )
-            ax2.tick_params(axis='y', labelcolor=color_ram)
-
-        fig.suptitle('System Resources Over Time', fontsize=14, fontweight='bold')
-        fig.tight_layout()
-
-        # Add legend from both axes
-        if has_temperature:
-            lines1, labels1 = ax1.get_legend_handles_labels()
-            if has_ram:
-                ax2_obj = ax1.get_shared_x_axes().get_siblings(ax1)[0] if hasattr(ax1.get_shared_x_axes(), 'get_siblings') else None
-                if 'ax2' in locals():
-                    lines2, labels2 = ax2.get_legend_handles_labels()
-                    ax1.legend(lines1 + lines2, labels1 + labels2, loc='upper left')
-            else:
-                ax1.legend(lines1, labels1, loc='upper left')
-
-        resources_plot_name = _unique_plot_name(RESOURCES_PLOT_FILE_NAME)
-        plt.savefig(resources_plot_name)
-        Path(resources_plot_name).touch(exist_ok=True)
-    finally:
-        plt.close(fig)
+    epochs, balances, _, _ = _history_series(balance_history)
+    return _template(_BalanceChart).render(_date_numbers(epochs), balances, max_points)
 
-    return resources_plot_name
 
+def _hash_argument(digest, argument) -> None:
+    """Feed one plotting argument to *digest*: history columns as raw bytes, anything else pickled."""
+    columns = getattr(argument, 'columns', None)
+    if columns is not None:
+        cols = columns()
+        for name in HISTORY_COLUMNS:
+            digest.update(cols[name])
+    elif isinstance(argument, Mapping):
+        digest.update(pickle.dumps(list(argument.items()), protocol=pickle.HIGHEST_PROTOCOL))
+    else:
+        digest.update(pickle.dumps(argument, protocol=pickle.HIGHEST_PROTOCOL))
+    # Separates arguments, so (a, bc) and (ab, c) give different keys
+    digest.update(b'\0')
 
-def create_balance_history_plot(balance_history: dict) -> str:
-    """
-    Creates a line plot of balance history over time and saves it as a PNG image.
 
-    :param balance_history: Dict with time keys and balance string values.
-    :return: The file path of the generated PNG image, or empty string if no data.
+class PlotCache:
+    """Bounded LRU of rendered charts, keyed by a hash of what was plotted.
+
+    The key (:meth:`key`) covers the plotting function and every argument:
+    histories are hashed column by column straight from their buffers, other
+    arguments through ``pickle``.  Identical requests, e.g. ``/hist`` asked
+    again before the next snapshot or ``/node`` with unchanged cycle counts,
+    get the cached PNG bytes without running matplotlib or the plot pool.
+
+    Entries are evicted least recently used first once their PNG bytes
+    exceed ``max_bytes``.  Used from the event loop and the chart cache
+    thread, so every access takes a lock.
     """
-    if not balance_history:
-        return ""
 
-    # Extract timestamps and balance values
-    timestamps = list(balance_history.keys())
-    balances = [get_entry_balance(v) for v in balance_history.values()]
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
-    # Create plot
-    fig = plt.figure(figsize=(12, 6))
-    try:
-        plt.plot(range(len(timestamps)), balances, marker='o', linestyle='-',
-                 color='green', linewidth=2, markersize=8, label='Balance')
-        plt.title('Balance History Over Time')
-        plt.xlabel('Time')
-        plt.ylabel('Balance')
-        plt.xticks(range(len(timestamps)), timestamps, rotation=45, ha='right')
-        plt.legend()
-        plt.grid(True, alpha=0.3)
-        plt.tight_layout()
+    @staticmethod
+    def key(plot_function, *args, **kwargs) -> Optional[bytes]:
+        """Return the cache key of ``plot_function(*args, **kwargs)``, or None when an argument cannot be hashed."""
+        digest = hashlib.blake2b(digest_size=20)
+        # Callables without a qualified name (functools.partial...) are named by their repr
+        qualname = getattr(plot_function, '__qualname__', None)
+        name = f"{plot_function.__module__}.{qualname}" if qualname else repr(plot_function)
+        digest.update(f"{name}\0".encode())
+        try:
+            for argument in args:
+                _hash_argument(digest, argument)
+            for name in sorted(kwargs):
+                digest.update(f"{name}=".encode())
+                _hash_argument(digest, kwargs[name])
+        except (TypeError, ValueError, pickle.PicklingError, AttributeError) as e:
+            logging.error(f"Chart of {name} cannot be cached: {e}")
+            return None
+        return digest.digest()
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        """Return the PNG bytes stored under *key* (marking them recently used), or None."""
+        with self._lock:
+            png = self._entries.get(key)
+            if png is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return png
+
+    def put(self, key: bytes, png: bytes) -> None:
+        """Store *png* under *key*, evicting the least recently used charts to stay within ``max_bytes``."""
+        if not png or len(png) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            while self._entries and self._bytes + len(png) > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+            self._entries[key] = png
+            self._bytes += len(png)
+
+    def metrics(self) -> dict:
+        """Return ``entries``, ``bytes``, ``hits``, ``misses`` and ``evictions``."""
+        with self._lock:
+            return {
+                "entries": len(self._entries), "bytes": self._bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            }
 
-        # Save plot
-        history_plot_name = _unique_plot_name(BALANCE_HISTORY_PLOT_FILE_NAME)
-        plt.savefig(history_plot_name)
-        Path(history_plot_name).touch(exist_ok=True)
-    finally:
-        plt.close(fig)
-    return history_plot_name
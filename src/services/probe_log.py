@@ -0,0 +1,226 @@
+import os
+import bisect
+import struct
+import logging
+import threading
+from array import array
+from typing import Optional
+from datetime import datetime, timedelta
+
+from services.history import datetime_to_epoch
+
+
+PROBE_LOG_FILE = 'config/probe_log.bin'
+# Epoch seconds, outcome (1 = node up), latency in ms (NaN when the probe got no answer)
+_RECORD = struct.Struct('<qB3xf')
+# Windows reported by /perf
+UPTIME_WINDOWS = (('24h', timedelta(hours=24)), ('7d', timedelta(days=7)), ('30d', timedelta(days=30)))
+# Probes older than the largest window (before the newest probe) are dropped
+PROBE_LOG_RETENTION = max(span for _, span in UPTIME_WINDOWS)
+# Extra age tolerated before the file is rewritten, so that happens about once a day
+_TRIM_SLACK = timedelta(days=1)
+
+
+class ProbeLog:
+    """Append-only log of node health probes, with prefix sums for uptime queries.
+
+    Every probe (the hourly ping, ``/node``) is recorded with its outcome and
+    RPC latency, failed ones included, so uptime no longer depends on how
+    many balance snapshots happen to be in the history.  Records are 16-byte
+    little-endian structs appended to ``config/probe_log.bin``.
+
+    :meth:`record` only updates memory, as it runs on the event loop; new
+    records are buffered and appended to the file by :meth:`flush`, called
+    from the scheduler thread (``PROBE_LOG_FLUSH_JOB_NAME``) and at shutdown.
+    Only ``PROBE_LOG_RETENTION`` (the largest of ``UPTIME_WINDOWS``) is kept:
+    older probes are dropped at load time and, about once a day, by
+    :meth:`flush`, which then rewrites the file with the remaining ones.
+
+    In memory the probe times are a sorted ``array('d')`` next to prefix sums
+    of up probes and of latencies, so :meth:`stats` answers any window with
+    two bisects and a few subtractions, whatever its length.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or PROBE_LOG_FILE
+        self._lock = threading.Lock()
+        self._ts = array('d')
+        # Element i covers the first i probes
+        self._up = array('q', [0])
+        self._latency_sum = array('d', [0.0])
+        self._latency_count = array('q', [0])
+        # Packed records not written to the file yet
+        self._pending = bytearray()
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str = None) -> 'ProbeLog':
+        """Read the probe log file; a missing file gives an empty log and a torn last record is ignored.
+
+        Probes older than ``PROBE_LOG_RETENTION`` are dropped, and the file
+        is rewritten without them.
+        """
+        log = cls(path)
+        try:
+            with open(log.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return log
+        except OSError as e:
+            logging.error(f"Error reading probe log: {e}")
+            return log
+        usable = len(data) - len(data) % _RECORD.size
+        records = sorted(_RECORD.iter_unpack(memoryview(data)[:usable]))
+        if records:
+            cutoff = records[-1][0] - PROBE_LOG_RETENTION.total_seconds()
+            records = records[bisect.bisect_left(records, (cutoff,)):]
+        for epoch, up, latency in records:
+            log._append(float(epoch), bool(up), None if latency != latency else latency)
+        if len(records) * _RECORD.size != len(data):
+            try:
+                log._rewrite(b''.join(_RECORD.pack(*record) for record in records))
+            except OSError as e:
+                logging.error(f"Error trimming probe log: {e}")
+        return log
+
+    def _rewrite(self, data: bytes) -> None:
+        """Atomically replace the log file with *data* (temp file, fsync, rename)."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _trim(self) -> bool:
+        """Drop the probes older than ``PROBE_LOG_RETENTION``, once they are a day past it.
+
+        The prefix sums are sliced along with the times: queries only use
+        differences between them.  Call with ``_lock`` held.
+
+        :return: True when probes were dropped.
+        """
+        if not self._ts:
+            return False
+        newest = self._ts[-1]
+        if self._ts[0] >= newest - (PROBE_LOG_RETENTION + _TRIM_SLACK).total_seconds():
+            return False
+        drop = bisect.bisect_left(self._ts, newest - PROBE_LOG_RETENTION.total_seconds())
+        self._ts = self._ts[drop:]
+        self._up = self._up[drop:]
+        self._latency_sum = self._latency_sum[drop:]
+        self._latency_count = self._latency_count[drop:]
+        return True
+
+    def _packed(self) -> bytes:
+        """Return every probe in memory as file records. Call with ``_lock`` held."""
+        records = bytearray()
+        for index in range(len(self._ts)):
+            epoch, up, latency = self._probe(index)
+            records += _RECORD.pack(int(epoch), int(up), float('nan') if latency is None else latency)
+        return bytes(records)
+
+    def _append(self, epoch: float, up: bool, latency_ms: Optional[float]) -> None:
+        self._ts.append(epoch)
+        self._up.append(self._up[-1] + up)
+        if latency_ms is None:
+            self._latency_sum.append(self._latency_sum[-1])
+            self._latency_count.append(self._latency_count[-1])
+        else:
+            self._latency_sum.append(self._latency_sum[-1] + latency_ms)
+            self._latency_count.append(self._latency_count[-1] + 1)
+
+    def _insert(self, epoch: float, up: bool, latency_ms: Optional[float]) -> None:
+        """Insert an out-of-order probe (clock change): rebuild the prefix sums after it."""
+        index = bisect.bisect_right(self._ts, epoch)
+        tail = [self._probe(i) for i in range(index, len(self._ts))]
+        for column in (self._ts, self._up, self._latency_sum, self._latency_count):
+            del column[len(column) - len(tail):]
+        self._append(epoch, up, latency_ms)
+        for probe in tail:
+            self._append(*probe)
+
+    def _probe(self, index: int) -> tuple:
+        up = self._up[index + 1] - self._up[index]
+        measured = self._latency_count[index + 1] - self._latency_count[index]
+        latency = self._latency_sum[index + 1] - self._latency_sum[index] if measured else None
+        return self._ts[index], bool(up), latency
+
+    def record(self, up: bool, latency_ms: Optional[float] = None, when: datetime = None) -> None:
+        """Record one probe outcome; the file is written by the next :meth:`flush`.
+
+        :param up: True when the node answered and is healthy.
+        :param latency_ms: RPC round trip, or None when the probe got no answer.
+        :param when: Time of the probe; defaults to now.
+        """
+        epoch = datetime_to_epoch(when or datetime.now())
+        with self._lock:
+            if not self._ts or epoch >= self._ts[-1]:
+                self._append(float(epoch), up, latency_ms)
+            else:
+                self._insert(float(epoch), up, latency_ms)
+            self._pending += _RECORD.pack(epoch, int(up), float('nan') if latency_ms is None else latency_ms)
+
+    def flush(self) -> int:
+        """Append the buffered records to the log file.
+
+        When probes older than ``PROBE_LOG_RETENTION`` were dropped, the
+        whole file is rewritten with the remaining ones instead.  Records
+        that could not be written stay buffered for the next flush.
+
+        :return: Number of buffered records written.
+        """
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, bytearray()
+                # Every probe in memory, the buffered ones included, once the oldest were dropped
+                rewrite = self._packed() if self._trim() else None
+            if not pending and rewrite is None:
+                return 0
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                if rewrite is not None:
+                    self._rewrite(rewrite)
+                else:
+                    with open(self.path, 'ab') as f:
+                        f.write(pending)
+            except OSError as e:
+                logging.error(f"Error writing probe log: {e}")
+                with self._lock:
+                    self._pending[:0] = pending
+                return 0
+        return len(pending) // _RECORD.size
+
+    def __len__(self) -> int:
+        return len(self._ts)
+
+    def stats(self, start: Optional[datetime], end: Optional[datetime] = None) -> dict:
+        """Return the probe figures for ``start <= time < end`` in O(log n).
+
+        :return: Dict with ``probes``, ``up``, ``down``, ``uptime_percent``
+            (None without probes) and ``latency_ms`` (average of the answered
+            probes, or None).
+        """
+        with self._lock:
+            low = 0 if start is None else bisect.bisect_left(self._ts, datetime_to_epoch(start))
+            high = len(self._ts) if end is None else bisect.bisect_left(self._ts, datetime_to_epoch(end))
+            high = max(high, low)
+            up = self._up[high] - self._up[low]
+            measured = self._latency_count[high] - self._latency_count[low]
+            latency_sum = self._latency_sum[high] - self._latency_sum[low]
+        probes = high - low
+        return {
+            "probes": probes,
+            "up": up,
+            "down": probes - up,
+            "uptime_percent": round(up / probes * 100, 1) if probes else None,
+            "latency_ms": round(latency_sum / measured, 2) if measured else None,
+        }
+
+    def uptime_windows(self, now: datetime = None) -> list:
+        """Return ``(label, stats)`` for each of ``UPTIME_WINDOWS`` ending at *now*."""
+        if now is None:
+            now = datetime.now()
+        return [(label, self.stats(now - span, None)) for label, span in UPTIME_WINDOWS]
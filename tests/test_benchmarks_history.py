@@ -0,0 +1,67 @@
+"""Tests for benchmarks/history_benchmark.py (run at tiny sizes)."""
+from datetime import datetime
+from unittest.mock import patch
+
+from services import history as history_store
+from services.history import migrate_history, parse_time_key
+from benchmarks.history_benchmark import (
+    BENCHMARKS, find_regressions, generate_history, main, read_baseline, run_benchmarks,
+)
+
+
+class TestGenerateHistory:
+    def test_mixes_canonical_and_legacy_records(self):
+        now = datetime(2024, 6, 1, 12, 0)
+        raw = generate_history(5000, now)
+        legacy = [key for key in raw if parse_time_key(key) is None]
+        assert len(raw) == 5000
+        assert legacy and all(raw[key].startswith("Balance: ") for key in legacy)
+        assert "2024/06/01-12:00" in raw or "01/06-12:00" in raw
+        assert len(migrate_history(raw, now)) == 5000
+
+    def test_deterministic(self):
+        now = datetime(2024, 6, 1, 12, 0)
+        assert generate_history(100, now) == generate_history(100, now)
+
+
+class TestRunBenchmarks:
+    def test_times_every_benchmark(self):
+        original = history_store.BALANCE_HISTORY_FILE
+        results = run_benchmarks(200, repeat=1)
+        assert set(results) == set(BENCHMARKS)
+        assert all(seconds >= 0 for seconds in results.values())
+        assert history_store.BALANCE_HISTORY_FILE == original
+
+
+class TestFindRegressions:
+    BASELINE = {"results": {"1000": {"load": 1.0, "filter_last_24h": 0.0001}}}
+
+    def test_flags_slowdown_beyond_threshold(self):
+        results = {1000: {"load": 1.3, "filter_last_24h": 0.0001}}
+        assert find_regressions(results, self.BASELINE, threshold=0.25) == [(1000, "load", 1.0, 1.3)]
+        assert find_regressions(results, self.BASELINE, threshold=0.5) == []
+
+    def test_ignores_timer_noise_and_missing_baseline(self):
+        results = {1000: {"filter_last_24h": 0.0005}, 5000: {"load": 9.0}}
+        assert find_regressions(results, self.BASELINE) == []
+
+
+class TestMain:
+    def test_update_then_compare(self, tmp_path, capsys):
+        baseline = tmp_path / "baseline.json"
+        timings = {name: 0.5 for name in BENCHMARKS}
+        with patch('benchmarks.history_benchmark.run_benchmarks', return_value=timings):
+            assert main(["--sizes", "100", "--baseline", str(baseline), "--update"]) == 0
+        assert read_baseline(str(baseline))["results"] == {"100": timings}
+
+        with patch('benchmarks.history_benchmark.run_benchmarks', return_value={**timings, "load": 0.6}):
+            assert main(["--sizes", "100", "--baseline", str(baseline)]) == 0
+        with patch('benchmarks.history_benchmark.run_benchmarks', return_value={**timings, "load": 0.7}):
+            assert main(["--sizes", "100", "--baseline", str(baseline)]) == 1
+        assert "REGRESSION load at 100 entries" in capsys.readouterr().out
+
+    def test_repository_baseline_covers_every_size(self):
+        stored = read_baseline()
+        assert set(stored["results"]) == {"10000", "100000", "1000000"}
+        for timings in stored["results"].values():
+            assert set(timings) == set(BENCHMARKS)
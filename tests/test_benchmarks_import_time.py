@@ -0,0 +1,38 @@
+"""Tests for benchmarks/import_time.py."""
+from benchmarks.import_time import format_report, heavy_imports, main, measure_imports, parse_importtime
+
+
+TRACE = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:      3000 |      90000 |     matplotlib.pyplot
+import time:       500 |      95000 |   services.plotting
+import time:      2000 |     100000 | main
+"""
+
+
+class TestParseImporttime:
+    def test_parses_rows_and_depth(self):
+        records = parse_importtime(TRACE)
+        assert records[0] == ("_io", 120, 120, 1)
+        assert records[1] == ("matplotlib.pyplot", 3000, 90000, 2)
+        assert records[-1] == ("main", 2000, 100000, 0)
+
+    def test_heavy_modules_by_package(self):
+        assert heavy_imports(parse_importtime(TRACE)) == ['matplotlib']
+
+    def test_report(self):
+        report = format_report(parse_importtime(TRACE), top=2)
+        assert report.startswith("import main: 100.0 ms, 4 modules")
+        assert "services.plotting" in report and "_io" not in report.split("\n\n")[1]
+        assert report.endswith("Heavy libraries imported at startup: matplotlib")
+
+
+class TestBotStartup:
+    def test_heavy_libraries_not_imported_by_main(self):
+        records = measure_imports('main')
+        assert any(name == 'main' for name, _, _, _ in records)
+        assert heavy_imports(records) == []
+
+    def test_main_exit_status(self, capsys):
+        assert main(['--top', '3']) == 0
+        assert "Heavy libraries imported at startup: none" in capsys.readouterr().out
@@ -0,0 +1,29 @@
+"""Tests for benchmarks/plot_benchmark.py (run at tiny sizes)."""
+from datetime import datetime
+
+from benchmarks.plot_benchmark import CHARTS, format_report, generate_history, main, run_benchmarks
+
+
+class TestGenerateHistory:
+    def test_hourly_entries_with_resources(self):
+        history = generate_history(48, datetime(2024, 6, 1, 12, 0))
+        assert len(history) == 48
+        assert "2024/06/01-12:00" in history and "2024/05/30-13:00" in history
+        assert all(entry.get("temperature_avg") and entry.get("ram_percent") for entry in history.values())
+
+
+class TestRunBenchmarks:
+    def test_times_fresh_and_template_renders(self):
+        results = run_benchmarks(12, repeat=1)
+        assert set(results) == set(CHARTS)
+        assert all(timings["fresh"] > 0 and timings["template"] > 0 for timings in results.values())
+
+    def test_report_lists_speedup(self):
+        report = format_report({24: {chart: {"fresh": 0.2, "template": 0.1} for chart in CHARTS}})
+        assert "2.00x" in report and "resources" in report
+
+
+class TestMain:
+    def test_prints_report(self, capsys):
+        assert main(['--sizes', '6', '--repeat', '1']) == 0
+        assert "template" in capsys.readouterr().out
@@ -1,9 +1,8 @@
 """Additional targeted tests to cover remaining uncovered lines."""
-import os
 import threading
 import pytest
 from datetime import datetime, timedelta
-from unittest.mock import AsyncMock, MagicMock, patch, mock_open, call
+from unittest.mock import AsyncMock, MagicMock, patch, call
 from telegram.ext import ConversationHandler
 
 from handlers.node import node, flush_confirm_yes, flush_confirm_no, hist
@@ -53,64 +52,48 @@ class TestNodeHandlerImagePaths:
         update = _authorized_update()
         context = _authorized_context()
 
-        # Create the actual file so os.path.exists returns True
-        plot_file = tmp_path / "plot.png"
-        plot_file.write_bytes(b"PNG")
-
         with patch('handlers.node.get_addresses', return_value=_VALID_JSON), \
              patch('handlers.node.handle_api_error', new_callable=AsyncMock, return_value=False), \
              patch('handlers.node.get_system_stats', return_value={"ram_percent": 50.0}), \
-             patch('handlers.node.save_balance_history'), \
-             patch('handlers.node.create_png_plot', return_value=str(plot_file)):
+             patch('handlers.node.append_balance_entry'), \
+             patch('handlers.node.create_png_plot', return_value=b"PNG"):
             await node(update, context)
 
         update.message.reply_photo.assert_called()
 
-    async def test_image_open_raises_oserror(self, tmp_path, monkeypatch):
-        """Cover lines 96-98: FileNotFoundError/OSError when opening image."""
+    async def test_image_upload_raises_oserror(self, tmp_path, monkeypatch):
+        """OSError while uploading the in-memory chart is reported to the user."""
         monkeypatch.chdir(tmp_path)
         update = _authorized_update()
         context = _authorized_context()
-        plot_path = str(tmp_path / "plot.png")
-
-        real_open = open
-
-        def _mock_open(path, mode='r', **kwargs):
-            if 'plot.png' in str(path) and mode == 'rb':
-                raise OSError("permission denied")
-            return real_open(path, mode, **kwargs)
+        update.message.reply_photo.side_effect = OSError("connection reset")
 
         with patch('handlers.node.get_addresses', return_value=_VALID_JSON), \
              patch('handlers.node.handle_api_error', new_callable=AsyncMock, return_value=False), \
              patch('handlers.node.get_system_stats', return_value={}), \
-             patch('handlers.node.save_balance_history'), \
-             patch('handlers.node.create_png_plot', return_value=plot_path), \
-             patch('os.path.exists', return_value=True), \
-             patch('builtins.open', side_effect=_mock_open):
+             patch('handlers.node.append_balance_entry'), \
+             patch('handlers.node.create_png_plot', return_value=b"PNG"):
             await node(update, context)
 
         # Should have replied with error text
         texts = [c[0][0] for c in update.message.reply_text.call_args_list]
         assert any("Error" in t or "error" in t for t in texts)
 
-    async def test_cleanup_in_finally_when_remove_raises(self, tmp_path, monkeypatch):
-        """Cover lines 111-114: os.remove raises in finally block."""
+    async def test_chart_uploaded_from_memory(self, tmp_path, monkeypatch):
+        """The validation chart goes straight from bytes to reply_photo, with no file written."""
         monkeypatch.chdir(tmp_path)
         update = _authorized_update()
         context = _authorized_context()
-        plot_path = str(tmp_path / "plot.png")
-        (tmp_path / "plot.png").write_bytes(b"PNG")
 
         with patch('handlers.node.get_addresses', return_value=_VALID_JSON), \
              patch('handlers.node.handle_api_error', new_callable=AsyncMock, return_value=False), \
              patch('handlers.node.get_system_stats', return_value={}), \
-             patch('handlers.node.save_balance_history'), \
-             patch('handlers.node.create_png_plot', return_value=plot_path), \
-             patch('os.path.exists', return_value=True), \
-             patch('os.remove', side_effect=OSError("cannot delete")):
+             patch('handlers.node.append_balance_entry'), \
+             patch('handlers.node.create_png_plot', return_value=b"PNG"):
             await node(update, context)
 
-        # Should complete without raising
+        update.message.reply_photo.assert_called_once_with(photo=b"PNG")
+        assert list(tmp_path.iterdir()) == []
 
 
 # ---------------------------------------------------------------------------
@@ -173,23 +156,13 @@ class TestHistHandlerEdgeCases:
         return ctx
 
     async def test_image_send_raises_oserror(self, tmp_path, monkeypatch):
-        """Cover lines 254-257: OSError when opening history image."""
+        """OSError while uploading the history chart."""
         monkeypatch.chdir(tmp_path)
         update = _authorized_update()
         context = self._make_context()
+        update.message.reply_photo.side_effect = OSError("disk error")
 
-        fake_image = tmp_path / "balance_history.png"
-        fake_image.write_bytes(b"PNG")
-
-        real_open = open
-
-        def _mock_open(path, mode='r', **kwargs):
-            if 'balance_history.png' in str(path) and mode == 'rb':
-                raise OSError("disk error")
-            return real_open(path, mode, **kwargs)
-
-        with patch('handlers.node.create_balance_history_plot', return_value=str(fake_image)), \
-             patch('builtins.open', side_effect=_mock_open):
+        with patch('handlers.node.create_balance_history_plot', return_value=b"PNG"):
             result = await hist(update, context)
 
         assert result == ConversationHandler.END
@@ -197,23 +170,13 @@ class TestHistHandlerEdgeCases:
         assert any("Error" in t or "error" in t for t in texts)
 
     async def test_image_send_raises_generic_exception(self, tmp_path, monkeypatch):
-        """Cover lines 258-261: Generic exception when opening history image."""
+        """Generic exception while uploading the history chart."""
         monkeypatch.chdir(tmp_path)
         update = _authorized_update()
         context = self._make_context()
+        update.message.reply_photo.side_effect = RuntimeError("generic error")
 
-        fake_image = tmp_path / "balance_history.png"
-        fake_image.write_bytes(b"PNG")
-
-        real_open = open
-
-        def _mock_open(path, mode='r', **kwargs):
-            if 'balance_history.png' in str(path) and mode == 'rb':
-                raise RuntimeError("generic error")
-            return real_open(path, mode, **kwargs)
-
-        with patch('handlers.node.create_balance_history_plot', return_value=str(fake_image)), \
-             patch('builtins.open', side_effect=_mock_open):
+        with patch('handlers.node.create_balance_history_plot', return_value=b"PNG"):
             result = await hist(update, context)
 
         assert result == ConversationHandler.END
@@ -224,12 +187,8 @@ class TestHistHandlerEdgeCases:
         update = _authorized_update()
         context = self._make_context()
 
-        fake_image = tmp_path / "balance_history.png"
-        fake_image.write_bytes(b"PNG")
-
-        with patch('handlers.node.create_balance_history_plot', return_value=str(fake_image)), \
-             patch('handlers.node.create_resources_plot', side_effect=Exception("plot error")), \
-             patch('builtins.open', mock_open(read_data=b"PNG")):
+        with patch('handlers.node.create_balance_history_plot', return_value=b"PNG"), \
+             patch('handlers.node.create_resources_plot', side_effect=Exception("plot error")):
             result = await hist(update, context)
 
         # Should continue and return HIST_CONFIRM_STATE despite resources plot error
@@ -248,31 +207,20 @@ class TestHistHandlerEdgeCases:
         texts = [c[0][0] for c in update.message.reply_text.call_args_list]
         assert any("Error" in t or "error" in t for t in texts)
 
-    async def test_finally_cleanup_raises_for_resources_path(self, tmp_path, monkeypatch):
-        """Cover lines 300-301: Exception when deleting resources image in finally."""
+    async def test_both_charts_sent_from_memory(self, tmp_path, monkeypatch):
+        """Balance and resources charts are uploaded as bytes, without touching the disk."""
         monkeypatch.chdir(tmp_path)
         update = _authorized_update()
         context = self._make_context()
 
-        fake_image = tmp_path / "balance_history.png"
-        fake_image.write_bytes(b"PNG")
-        fake_resources = tmp_path / "resources_history.png"
-        fake_resources.write_bytes(b"PNG")
-
-        orig_exists = os.path.exists
-        orig_remove = os.remove
-
-        def mock_remove(path):
-            raise OSError("cannot delete")
-
-        with patch('handlers.node.create_balance_history_plot', return_value=str(fake_image)), \
-             patch('handlers.node.create_resources_plot', return_value=str(fake_resources)), \
-             patch('builtins.open', mock_open(read_data=b"PNG")), \
-             patch('os.remove', side_effect=mock_remove):
+        with patch('handlers.node.create_balance_history_plot', return_value=b"BALANCE"), \
+             patch('handlers.node.create_resources_plot', return_value=b"RESOURCES"):
             result = await hist(update, context)
 
-        # Should complete without raising
         assert result == HIST_CONFIRM_STATE
+        photos = [c.kwargs['photo'] for c in update.message.reply_photo.call_args_list]
+        assert photos == [b"BALANCE", b"RESOURCES"]
+        assert list(tmp_path.iterdir()) == []
 
 
 # ---------------------------------------------------------------------------
@@ -307,7 +255,7 @@ class TestSchedulerRemainingLines:
         app = self._make_app()
         with patch('handlers.scheduler.get_addresses', return_value=self._VALID_JSON), \
              patch('handlers.scheduler.get_system_stats', return_value={"temperature_avg": 55.0, "ram_percent": 60.0}), \
-             patch('handlers.scheduler.save_balance_history'):
+             patch('handlers.node.append_balance_entry'):
             await periodic_node_ping(app)
         # Check that the entry has temperature_avg
         history = app.bot_data['balance_history']
@@ -329,7 +277,7 @@ class TestSchedulerRemainingLines:
         report_time = datetime(now.year, now.month, now.day, 7, 0, 0)
         with patch('handlers.scheduler.get_addresses', return_value=self._VALID_JSON), \
              patch('handlers.scheduler.get_system_stats', return_value={}), \
-             patch('handlers.scheduler.save_balance_history'), \
+             patch('handlers.node.append_balance_entry'), \
              patch('handlers.scheduler.datetime') as mock_dt:
             mock_dt.now.return_value = report_time
             # Also need to patch filter functions to return our history
@@ -350,7 +298,7 @@ class TestSchedulerRemainingLines:
         report_time = datetime(now.year, now.month, now.day, 7, 0, 0)
         with patch('handlers.scheduler.get_addresses', return_value=self._VALID_JSON), \
              patch('handlers.scheduler.get_system_stats', return_value={}), \
-             patch('handlers.scheduler.save_balance_history'), \
+             patch('handlers.node.append_balance_entry'), \
              patch('handlers.scheduler.datetime') as mock_dt:
             mock_dt.now.return_value = report_time
             with patch('handlers.scheduler.filter_last_24h', return_value=recent_history), \
@@ -370,7 +318,7 @@ class TestSchedulerRemainingLines:
         report_time = datetime(now.year, now.month, now.day, 7, 0, 0)
         with patch('handlers.scheduler.get_addresses', return_value=self._VALID_JSON), \
              patch('handlers.scheduler.get_system_stats', return_value={}), \
-             patch('handlers.scheduler.save_balance_history'), \
+             patch('handlers.node.append_balance_entry'), \
              patch('handlers.scheduler.datetime') as mock_dt:
             mock_dt.now.return_value = report_time
             # midnight_history is empty, recent_history has data
@@ -387,7 +335,7 @@ class TestSchedulerRemainingLines:
         report_time = datetime.now().replace(hour=7, minute=0, second=0)
         with patch('handlers.scheduler.get_addresses', return_value=self._VALID_JSON), \
              patch('handlers.scheduler.get_system_stats', return_value={}), \
-             patch('handlers.scheduler.save_balance_history'), \
+             patch('handlers.node.append_balance_entry'), \
              patch('handlers.scheduler.datetime') as mock_dt:
             mock_dt.now.return_value = report_time
             await periodic_node_ping(app)
@@ -407,7 +355,7 @@ class TestSchedulerRemainingLines:
         report_time = datetime(now.year, now.month, now.day, 7, 0, 0)
         with patch('handlers.scheduler.get_addresses', return_value=self._VALID_JSON), \
              patch('handlers.scheduler.get_system_stats', return_value={}), \
-             patch('handlers.scheduler.save_balance_history'), \
+             patch('handlers.node.append_balance_entry'), \
              patch('handlers.scheduler.datetime') as mock_dt:
             mock_dt.now.return_value = report_time
             with patch('handlers.scheduler.filter_last_24h', return_value=recent_history), \
@@ -1,96 +1,61 @@
 """Final targeted tests to cover the last remaining uncovered lines."""
 import pytest
-from datetime import datetime, timedelta
-from unittest.mock import AsyncMock, MagicMock, patch, mock_open
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
 from telegram.ext import ConversationHandler
 
-from services.history import filter_since_midnight, filter_last_24h
-from handlers.system import _is_recent
+from services.history import filter_since_midnight, filter_last_24h, migrate_history
 from handlers.node import hist
 
 
 # ---------------------------------------------------------------------------
-# history.py lines 100 and 136 – legacy year rollback branch
+# history.py – legacy year rollback branch (now applied once by migrate_history)
 # (when parsed date with current year > now + 1h → rollback to previous year)
 # ---------------------------------------------------------------------------
 
 class TestHistoryLegacyYearRollback:
-    """Cover the `dt = dt.replace(year=current_year - 1)` branches."""
+    """Cover the `dt = dt.replace(year=now.year - 1)` branch of the migrator."""
 
-    def test_filter_since_midnight_legacy_year_rollback(self):
+    def test_migrate_legacy_year_rollback(self):
         """
-        Provide a legacy DD/MM-HH:MM key that, when assigned the current year,
-        would be more than 1 hour in the future (e.g. New Year's Eve entry run
-        on January 1). The function should roll it back to the previous year.
+        A legacy DD/MM-HH:MM key that, when assigned the current year, would
+        be more than 1 hour in the future (e.g. New Year's Eve entry migrated
+        on January 1) is rolled back to the previous year.
         """
-        # Fake "now" = January 1 of year 2025 at 00:30
         fake_now = datetime(2025, 1, 1, 0, 30, 0)
-        # A legacy key for Dec 31 at 23:00 – with year 2025 that's in the future
-        legacy_key = "31/12-23:00"
+        result = migrate_history({"31/12-23:00": {"balance": 1.0}}, fake_now)
+        assert result == {"2024/12/31-23:00": {"balance": 1.0}}
 
-        with patch('services.history.datetime') as mock_dt:
-            mock_dt.now.return_value = fake_now
-            mock_dt.strptime.side_effect = lambda s, fmt: datetime.strptime(s, fmt)
-            result = filter_since_midnight({legacy_key: {"balance": 1.0}})
-
-        # The date Dec 31, 2024 is before midnight of Jan 1, 2025, so it's filtered out
-        assert result == {}
+    def test_migrate_legacy_key_in_past_keeps_current_year(self):
+        fake_now = datetime(2025, 1, 1, 1, 0, 0)
+        result = migrate_history({"01/01-00:30": {"balance": 2.0}}, fake_now)
+        assert result == {"2025/01/01-00:30": {"balance": 2.0}}
 
-    def test_filter_last_24h_legacy_year_rollback(self):
-        """
-        Same scenario for filter_last_24h: legacy key from Dec 31 when
-        now is Jan 1 should be rolled back to previous year and included
-        if within 24h.
-        """
-        # Fake "now" = January 1, 2025 at 01:00
+    def test_migrated_legacy_key_lands_in_24h_window(self):
+        """Dec 31 at 12:00 migrated on Jan 1 at 01:00 is 13 hours old → kept by filter_last_24h."""
         fake_now = datetime(2025, 1, 1, 1, 0, 0)
-        # Dec 31 at 12:00 is 13 hours before now → within 24h
-        legacy_key = "31/12-12:00"
+        migrated = migrate_history({"31/12-12:00": {"balance": 2.0}}, fake_now)
 
         with patch('services.history.datetime') as mock_dt:
             mock_dt.now.return_value = fake_now
-            mock_dt.strptime.side_effect = lambda s, fmt: datetime.strptime(s, fmt)
-            result = filter_last_24h({legacy_key: {"balance": 2.0}})
+            mock_dt.side_effect = lambda *args: datetime(*args)
+            result = filter_last_24h(migrated)
 
-        assert legacy_key in result
+        assert "2024/12/31-12:00" in result
 
-    def test_filter_since_midnight_legacy_year_rollback_recent(self):
-        """
-        Dec 31 at 23:30 when now is Jan 1 at 00:30 – date is within today window? No,
-        because midnight is Jan 1 00:00. But the year-rollback is still exercised.
-        """
+    def test_migrated_legacy_key_before_midnight_filtered_out(self):
         fake_now = datetime(2025, 1, 1, 2, 0, 0)
-        # Dec 31 at 23:00 would with year=2025 be Dec 31, 2025 (future) → roll to 2024
-        legacy_key = "31/12-23:00"
+        migrated = migrate_history({"31/12-23:00": {"balance": 3.0}}, fake_now)
 
         with patch('services.history.datetime') as mock_dt:
             mock_dt.now.return_value = fake_now
-            mock_dt.strptime.side_effect = lambda s, fmt: datetime.strptime(s, fmt)
-            result = filter_since_midnight({legacy_key: {"balance": 3.0}})
+            mock_dt.side_effect = lambda *args: datetime(*args)
+            result = filter_since_midnight(migrated)
 
         # Dec 31, 2024 23:00 is before midnight Jan 1, 2025 → filtered out
         assert result == {}
 
 
-# ---------------------------------------------------------------------------
-# handlers/system.py line 115 – _is_recent legacy year rollback
-# ---------------------------------------------------------------------------
-
-class TestIsRecentLegacyYearRollback:
-    def test_legacy_key_in_future_gets_rolled_back(self):
-        """
-        A legacy key that with current year appears > 1h in the future
-        should be rolled back to previous year (line 115).
-        """
-        now = datetime(2025, 1, 1, 0, 30, 0)
-        cutoff = now - timedelta(hours=24)
-        # "31/12-23:00" with year=2025 is Dec 31, 2025 → future → roll back to 2024
-        # Dec 31, 2024 23:00 is < 2 hours before now → within cutoff
-        legacy_key = "31/12-23:00"
-        result = _is_recent(legacy_key, cutoff, now)
-        assert result is True  # within 24h after rollback
-
-
 # ---------------------------------------------------------------------------
 # handlers/node.py lines 288-291 – outer exception handler in hist
 # ---------------------------------------------------------------------------
@@ -124,18 +89,14 @@ class TestHistOuterException:
         update = self._make_update()
         context = self._make_context()
 
-        fake_image = tmp_path / "balance_history.png"
-        fake_image.write_bytes(b"PNG")
-
         # First call raises, second call (from outer except) succeeds
         update.message.reply_text.side_effect = [
             RuntimeError("network send failed"),  # "Do you also want..." → raises
             None,                                 # "Error retrieving..." → succeeds
         ]
 
-        with patch('handlers.node.create_balance_history_plot', return_value=str(fake_image)), \
-             patch('handlers.node.create_resources_plot', return_value=""), \
-             patch('builtins.open', mock_open(read_data=b"PNG")):
+        with patch('handlers.node.create_balance_history_plot', return_value=b"PNG"), \
+             patch('handlers.node.create_resources_plot', return_value=b""):
             result = await hist(update, context)
 
         assert result == ConversationHandler.END
@@ -148,13 +109,9 @@ class TestHistOuterException:
         update = self._make_update()
         context = self._make_context()
 
-        fake_image = tmp_path / "balance_history.png"
-        fake_image.write_bytes(b"PNG")
-
-        with patch('handlers.node.create_balance_history_plot', return_value=str(fake_image)), \
-             patch('handlers.node.create_resources_plot', return_value=""), \
-             patch('handlers.node.InlineKeyboardMarkup', side_effect=RuntimeError("markup error")), \
-             patch('builtins.open', mock_open(read_data=b"PNG")):
+        with patch('handlers.node.create_balance_history_plot', return_value=b"PNG"), \
+             patch('handlers.node.create_resources_plot', return_value=b""), \
+             patch('handlers.node.InlineKeyboardMarkup', side_effect=RuntimeError("markup error")):
             result = await hist(update, context)
 
         assert result == ConversationHandler.END
@@ -2,6 +2,7 @@
 import os
 import threading
 import pytest
+from datetime import datetime, timedelta
 from unittest.mock import AsyncMock, MagicMock, patch, mock_open, call
 from telegram.ext import ConversationHandler
 
@@ -12,8 +13,13 @@ from handlers.node import (
     flush_confirm_yes,
     flush_confirm_no,
     hist,
+    record_snapshot,
 )
 from config import FLUSH_CONFIRM_STATE, HIST_CONFIRM_STATE
+from services.history import BalanceHistory, HistoryRecord, make_time_key
+from services.history_partitions import HistoryPartition, HistoryPartitions
+from services.plot_pool import PlotPoolBusy
+from services.plotting import PlotCache, create_balance_history_plot
 
 
 # ---------------------------------------------------------------------------
@@ -53,6 +59,11 @@ class TestExtractAddressData:
     def test_error_dict_returns_none(self):
         assert extract_address_data({"error": "timeout"}) is None
 
+    def test_index_of_batched_request(self):
+        batched = {"result": [_VALID_JSON["result"][0], dict(_VALID_JSON["result"][0], final_balance="5.00")]}
+        assert extract_address_data(batched, 1)[0] == "5.00"
+        assert extract_address_data(batched, 2) is None
+
 
 # ---------------------------------------------------------------------------
 # node handler
@@ -70,13 +81,68 @@ class TestNodeHandler:
         with patch('handlers.node.get_addresses', return_value=_VALID_JSON), \
              patch('handlers.node.handle_api_error', new_callable=AsyncMock, return_value=False), \
              patch('handlers.node.get_system_stats', return_value=_make_stats()), \
-             patch('handlers.node.save_balance_history'), \
-             patch('handlers.node.create_png_plot', return_value='plot.png'), \
-             patch('os.path.exists', return_value=False):
+             patch('handlers.node.append_balance_entry'), \
+             patch('handlers.node.create_png_plot', return_value=b"PNG"):
             await node(update, context)
 
         update.message.reply_text.assert_called()
 
+    async def test_entry_queued_on_persister(self, authorized_update_context):
+        update, context = authorized_update_context
+        persister = MagicMock()
+        context.bot_data['history_persister'] = persister
+
+        with patch('handlers.node.get_addresses', return_value=_VALID_JSON), \
+             patch('handlers.node.handle_api_error', new_callable=AsyncMock, return_value=False), \
+             patch('handlers.node.get_system_stats', return_value=_make_stats()), \
+             patch('handlers.node.append_balance_entry') as mock_append, \
+             patch('handlers.node.create_png_plot', return_value=None):
+            await node(update, context)
+
+        mock_append.assert_not_called()
+        key = next(iter(context.bot_data['balance_history']))
+        persister.enqueue_append.assert_called_once_with(key)
+
+    async def test_entry_added_to_rolling_window(self, authorized_update_context):
+        update, context = authorized_update_context
+        window = MagicMock()
+        context.bot_data['history_window'] = window
+
+        with patch('handlers.node.get_addresses', return_value=_VALID_JSON), \
+             patch('handlers.node.handle_api_error', new_callable=AsyncMock, return_value=False), \
+             patch('handlers.node.get_system_stats', return_value=_make_stats()), \
+             patch('handlers.node.append_balance_entry'), \
+             patch('handlers.node.create_png_plot', return_value=None):
+            await node(update, context)
+
+        key, entry = next(iter(context.bot_data['balance_history'].items()))
+        window.add.assert_called_once_with(key, entry)
+        # Same value type as the periodic ping writes
+        assert isinstance(entry, HistoryRecord)
+        assert entry.key == key
+
+    async def test_probe_recorded(self, authorized_update_context):
+        update, context = authorized_update_context
+        probe_log = MagicMock()
+        context.bot_data['probe_log'] = probe_log
+
+        with patch('handlers.node.get_addresses', return_value=_VALID_JSON), \
+             patch('handlers.node.handle_api_error', new_callable=AsyncMock, return_value=False), \
+             patch('handlers.node.get_system_stats', return_value=_make_stats()), \
+             patch('handlers.node.append_balance_entry'), \
+             patch('handlers.node.create_png_plot', return_value=None):
+            await node(update, context)
+        # Same rule as the hourly ping: a NOK in any cycle counts as down
+        up, latency_ms = probe_log.record.call_args[0]
+        assert up is False
+        assert latency_ms >= 0
+
+        probe_log.reset_mock()
+        with patch('handlers.node.get_addresses', return_value={"error": "timed out"}), \
+             patch('handlers.node.handle_api_error', new_callable=AsyncMock, return_value=True):
+            await node(update, context)
+        probe_log.record.assert_called_once_with(False, None)
+
     async def test_api_error_triggers_handle_api_error(self, authorized_update_context):
         update, context = authorized_update_context
 
@@ -118,6 +184,32 @@ class TestNodeHandler:
 # flush handler
 # ---------------------------------------------------------------------------
 
+class TestRecordSnapshot:
+    def test_stores_under_the_lock_and_enqueues_the_append(self):
+        lock = threading.Lock()
+        persister = MagicMock()
+        history = BalanceHistory()
+        bot_data = {'balance_history': history, 'balance_lock': lock, 'history_persister': persister}
+        record_snapshot(bot_data, "2024/01/01-10:00", {"balance": 1.0})
+        assert dict(history) == {"2024/01/01-10:00": {"balance": 1.0}}
+        persister.enqueue_append.assert_called_once_with("2024/01/01-10:00")
+        assert not lock.locked()
+
+    def test_write_through_store_is_left_to_the_persister(self):
+        class Store(dict):
+            write_through = True
+
+        history = Store()
+        persister = MagicMock()
+        window = MagicMock()
+        bot_data = {'balance_history': history, 'balance_lock': threading.Lock(),
+                    'history_persister': persister, 'history_window': window}
+        record_snapshot(bot_data, "2024/01/01-10:00", {"balance": 1.0})
+        assert history == {}
+        persister.enqueue_store.assert_called_once_with("2024/01/01-10:00", {"balance": 1.0})
+        window.add.assert_called_once_with("2024/01/01-10:00", {"balance": 1.0})
+
+
 class TestFlushHandler:
     async def test_unauthorized_user_returns_end(self, unauthorized_update_context):
         update, context = unauthorized_update_context
@@ -164,6 +256,44 @@ class TestFlushConfirmYes:
         assert mock_context.bot_data['balance_history'] == {}
         update.callback_query.edit_message_text.assert_called_once()
 
+    async def test_save_requested_on_persister(self, mock_context):
+        update = self._make_query_update("123")
+        mock_context.bot_data['balance_history'] = {"key": "val"}
+        persister = MagicMock()
+        mock_context.bot_data['history_persister'] = persister
+
+        with patch('builtins.open', mock_open()), \
+             patch('handlers.node.save_balance_history') as mock_save:
+            await flush_confirm_yes(update, mock_context)
+
+        mock_save.assert_not_called()
+        persister.request_save.assert_called_once()
+        assert mock_context.bot_data['balance_history'] == {}
+
+    async def test_rolling_window_cleared(self, mock_context):
+        update = self._make_query_update("123")
+        mock_context.bot_data['balance_history'] = {"key": "val"}
+        window = MagicMock()
+        mock_context.bot_data['history_window'] = window
+
+        with patch('builtins.open', mock_open()), \
+             patch('handlers.node.save_balance_history'):
+            await flush_confirm_yes(update, mock_context)
+
+        window.clear.assert_called_once()
+
+    async def test_archive_cleared_when_enabled(self, mock_context):
+        update = self._make_query_update("123")
+        mock_context.bot_data['balance_history'] = {"key": "val"}
+        mock_context.bot_data['history_archive'] = {'hot_days': 90}
+
+        with patch('builtins.open', mock_open()), \
+             patch('handlers.node.save_balance_history'), \
+             patch('handlers.node.clear_archive') as mock_clear:
+            await flush_confirm_yes(update, mock_context)
+
+        mock_clear.assert_called_once()
+
     async def test_unauthorized_returns_end(self, mock_context):
         update = self._make_query_update("999")
         result = await flush_confirm_yes(update, mock_context)
@@ -230,18 +360,173 @@ class TestHistHandler:
             "2024/01/01-10:00": {"balance": 100.0}
         }
 
-        # Create a fake image file
-        fake_image = tmp_path / "balance_history.png"
-        fake_image.write_bytes(b"PNG")
-        fake_resources = tmp_path / "resources_history.png"
-        fake_resources.write_bytes(b"PNG")
+        with patch('handlers.node.create_balance_history_plot', return_value=b"balance"), \
+             patch('handlers.node.create_resources_plot', return_value=b"resources"):
+            result = await hist(update, context)
+
+        assert result == HIST_CONFIRM_STATE
+        photos = [c[1]['photo'] for c in update.message.reply_photo.call_args_list]
+        assert photos == [b"balance", b"resources"]
+
+    async def test_charts_a_copy_taken_under_the_lock(self, authorized_update_context):
+        update, context = authorized_update_context
+        history = BalanceHistory({"2024/01/01-10:00": {"balance": 100.0}})
+        context.bot_data['balance_history'] = history
+        charted = []
+
+        def plot(chart_history):
+            # A compaction swapping rows in meanwhile must not change what is drawn
+            history.clear()
+            charted.append(dict(chart_history.items()))
+            return b"balance"
+
+        with patch('handlers.node.create_balance_history_plot', side_effect=plot), \
+             patch('handlers.node.create_resources_plot', return_value=b""):
+            await hist(update, context)
+
+        assert charted == [{"2024/01/01-10:00": {"balance": 100.0}}]
+
+    async def test_balance_chart_includes_archive(self, authorized_update_context, tmp_path):
+        update, context = authorized_update_context
+        context.bot_data['balance_history'] = {"2024/01/01-10:00": {"balance": 100.0}}
+        context.bot_data['history_archive'] = {'hot_days': 90}
+        combined = {"2023/01/01-10:00": {"balance": 90.0}, "2024/01/01-10:00": {"balance": 100.0}}
+
+        with patch('handlers.node.read_manifest', return_value=[{"month": "2023-01"}]), \
+             patch('handlers.node.history_with_archive', return_value=combined), \
+             patch('handlers.node.create_balance_history_plot', return_value="") as mock_plot, \
+             patch('os.path.exists', return_value=False):
+            await hist(update, context)
+
+        mock_plot.assert_called_once_with(combined)
+
+    async def test_range_and_step_arguments(self, authorized_update_context):
+        update, context = authorized_update_context
+        now = datetime.now()
+        context.bot_data['balance_history'] = BalanceHistory({
+            make_time_key(now - timedelta(days=10)): {"balance": 1.0},
+            make_time_key(now - timedelta(hours=2)): {"balance": 2.0},
+            make_time_key(now - timedelta(hours=1)): {"balance": 4.0},
+        })
+        context.args = ["1d", "1d"]
+
+        with patch('handlers.node.create_balance_history_plot', return_value="") as mock_plot, \
+             patch('os.path.exists', return_value=False):
+            await hist(update, context)
+
+        charted = mock_plot.call_args[0][0]
+        assert len(charted) in (1, 2)  # the two recent entries, split when they straddle midnight
+        assert sum(entry["samples"] for entry in charted.values()) == 2
+
+    async def test_standard_range_sent_from_chart_cache(self, authorized_update_context):
+        update, context = authorized_update_context
+        context.bot_data['balance_history'] = BalanceHistory({make_time_key(): {"balance": 1.0}})
+        chart_cache = MagicMock()
+        chart_cache.get.return_value = MagicMock(balance_png=b"balance", resources_png=b"resources")
+        context.bot_data['chart_cache'] = chart_cache
+        context.args = ["7d"]
 
-        with patch('handlers.node.create_balance_history_plot', return_value=str(fake_image)), \
-             patch('handlers.node.create_resources_plot', return_value=str(fake_resources)), \
-             patch('builtins.open', mock_open(read_data=b"PNG")):
+        with patch('handlers.node.create_balance_history_plot') as mock_plot:
             result = await hist(update, context)
 
         assert result == HIST_CONFIRM_STATE
+        mock_plot.assert_not_called()
+        chart_cache.get.assert_called_once_with('7d')
+        chart_cache.render.assert_not_called()
+        photos = [c[1]['photo'] for c in update.message.reply_photo.call_args_list]
+        assert photos == [b"balance", b"resources"]
+
+    async def test_stale_chart_cache_renders_again(self, authorized_update_context):
+        update, context = authorized_update_context
+        context.bot_data['balance_history'] = BalanceHistory({make_time_key(): {"balance": 1.0}})
+        chart_cache = MagicMock()
+        chart_cache.get.return_value = None
+        chart_cache.render.return_value = MagicMock(balance_png=b"balance", resources_png=None)
+        context.bot_data['chart_cache'] = chart_cache
+
+        result = await hist(update, context)
+
+        assert result == HIST_CONFIRM_STATE
+        chart_cache.render.assert_called_once_with('all')
+        update.message.reply_photo.assert_called_once_with(photo=b"balance")
+
+    async def test_bucketed_range_bypasses_chart_cache(self, authorized_update_context):
+        update, context = authorized_update_context
+        context.bot_data['balance_history'] = BalanceHistory({make_time_key(): {"balance": 1.0}})
+        context.bot_data['chart_cache'] = MagicMock()
+        context.args = ["7d", "1h"]
+
+        with patch('handlers.node.create_balance_history_plot', return_value="") as mock_plot, \
+             patch('os.path.exists', return_value=False):
+            await hist(update, context)
+
+        mock_plot.assert_called_once()
+        context.bot_data['chart_cache'].get.assert_not_called()
+
+    async def test_charts_rendered_in_plot_pool(self, authorized_update_context):
+        update, context = authorized_update_context
+        context.bot_data['balance_history'] = {"2024/01/01-10:00": {"balance": 100.0}}
+        plot_pool = MagicMock()
+        plot_pool.run = AsyncMock(return_value="")
+        context.bot_data['plot_pool'] = plot_pool
+
+        with patch('os.path.exists', return_value=False):
+            await hist(update, context)
+
+        plot_pool.run.assert_awaited_once()
+        assert plot_pool.run.call_args[0][0] is create_balance_history_plot
+
+    async def test_repeated_hist_served_from_plot_cache(self, authorized_update_context):
+        update, context = authorized_update_context
+        context.bot_data['balance_history'] = {"2024/01/01-10:00": {"balance": 100.0}}
+        context.bot_data['plot_cache'] = PlotCache(1024 * 1024)
+
+        with patch('handlers.node.create_balance_history_plot', side_effect=create_balance_history_plot) as mock_plot:
+            await hist(update, context)
+            await hist(update, context)
+            assert mock_plot.call_count == 1
+            context.bot_data['balance_history']["2024/01/01-11:00"] = {"balance": 101.0}
+            await hist(update, context)
+            assert mock_plot.call_count == 2
+
+        photos = [c.kwargs['photo'] for c in update.message.reply_photo.call_args_list]
+        assert photos[0] == photos[1] != photos[2]
+        assert context.bot_data['plot_cache'].metrics()['hits'] == 1
+
+    async def test_busy_plot_pool(self, authorized_update_context):
+        update, context = authorized_update_context
+        context.bot_data['balance_history'] = {"2024/01/01-10:00": {"balance": 100.0}}
+        plot_pool = MagicMock()
+        plot_pool.run = AsyncMock(side_effect=PlotPoolBusy("full"))
+        context.bot_data['plot_pool'] = plot_pool
+
+        result = await hist(update, context)
+
+        assert result == ConversationHandler.END
+        assert "try again" in update.message.reply_text.call_args[0][0]
+
+    async def test_range_without_data(self, authorized_update_context):
+        update, context = authorized_update_context
+        context.bot_data['balance_history'] = {"2020/01/01-10:00": {"balance": 100.0}}
+        context.args = ["7d"]
+
+        with patch('handlers.node.create_balance_history_plot') as mock_plot:
+            result = await hist(update, context)
+
+        assert result == ConversationHandler.END
+        mock_plot.assert_not_called()
+        assert "no balance history in that range" in update.message.reply_text.call_args[0][0].lower()
+
+    @pytest.mark.parametrize("args", [["soon"], ["7d", "1x"], ["7d", "1h", "median"], ["1d", "1h", "avg", "x"]])
+    async def test_invalid_arguments_reply_usage(self, authorized_update_context, args):
+        update, context = authorized_update_context
+        context.bot_data['balance_history'] = {"2024/01/01-10:00": {"balance": 100.0}}
+        context.args = args
+
+        result = await hist(update, context)
+
+        assert result == ConversationHandler.END
+        assert update.message.reply_text.call_args[0][0].startswith("Usage: /hist")
 
     async def test_plot_creation_error_returns_end(self, authorized_update_context):
         update, context = authorized_update_context
@@ -261,3 +546,88 @@ class TestHistHandler:
             result = await hist(update, context)
 
         assert result == ConversationHandler.END
+
+
+# ---------------------------------------------------------------------------
+# address selection (several monitored addresses)
+# ---------------------------------------------------------------------------
+
+def _with_partitions(context, tmp_path, other_history=None):
+    primary = context.bot_data['massa_node_address']
+    partitions = HistoryPartitions(
+        [primary, "AU1other_address"],
+        HistoryPartition(primary, context.bot_data['balance_history'], context.bot_data['balance_lock']),
+    )
+    other = HistoryPartition("AU1other_address", BalanceHistory(other_history or {}))
+    partitions._partitions["AU1other_address"] = other
+    context.bot_data['history_partitions'] = partitions
+    return other
+
+
+class TestAddressSelection:
+    async def test_node_invalid_selector_lists_addresses(self, authorized_update_context):
+        update, context = authorized_update_context
+        context.args = ["AU9unknown"]
+        with patch('handlers.node.get_addresses') as mock_get:
+            await node(update, context)
+        mock_get.assert_not_called()
+        text = update.message.reply_text.call_args[0][0]
+        assert text.startswith("Usage: /node")
+        assert "1. AU1some_address" in text
+
+    async def test_node_other_address_records_in_its_partition(self, authorized_update_context, tmp_path):
+        update, context = authorized_update_context
+        other = _with_partitions(context, tmp_path)
+        context.args = ["2"]
+
+        with patch('handlers.node.get_addresses', return_value=_VALID_JSON) as mock_get, \
+             patch('handlers.node.handle_api_error', new_callable=AsyncMock, return_value=False), \
+             patch('handlers.node.get_system_stats', return_value=_make_stats()), \
+             patch('services.history.append_balance_entry') as mock_append:
+            await node(update, context)
+
+        mock_get.assert_called_once()
+        assert mock_get.call_args[0][1] == "AU1other_address"
+        assert "AU1other_address" in update.message.reply_text.call_args[0][0]
+        assert len(other.history) == 1
+        assert context.bot_data['balance_history'] == {}
+        mock_append.assert_called_once()
+
+    async def test_hist_other_address_by_suffix(self, authorized_update_context, tmp_path):
+        update, context = authorized_update_context
+        _with_partitions(context, tmp_path, {"2024/01/01-10:00": {"balance": 7.0}})
+        context.bot_data['balance_history'] = {"2024/01/01-10:00": {"balance": 100.0}}
+        context.args = ["other_address"]
+        context.user_data = {}
+
+        with patch('handlers.node.create_balance_history_plot', return_value="") as mock_plot, \
+             patch('os.path.exists', return_value=False):
+            await hist(update, context)
+
+        assert mock_plot.call_args[0][0] == {"2024/01/01-10:00": {"balance": 7.0}}
+        assert context.user_data['hist_address'] == "AU1other_address"
+
+    async def test_hist_loads_the_partition_off_the_event_loop(self, authorized_update_context, tmp_path):
+        update, context = authorized_update_context
+        _with_partitions(context, tmp_path, {"2024/01/01-10:00": {"balance": 7.0}})
+        partitions = context.bot_data['history_partitions']
+        get = partitions.get
+        threads = []
+
+        def load(address):
+            threads.append(threading.current_thread() is threading.main_thread())
+            return get(address)
+
+        context.args = ["2"]
+        context.user_data = {}
+        with patch.object(partitions, 'get', side_effect=load), \
+             patch('handlers.node.create_balance_history_plot', return_value=""):
+            await hist(update, context)
+        assert threads == [False]
+
+    async def test_hist_duration_is_not_a_selector(self, authorized_update_context):
+        update, context = authorized_update_context
+        context.bot_data['balance_history'] = {"2020/01/01-10:00": {"balance": 100.0}}
+        context.args = ["7d"]
+        await hist(update, context)
+        assert "Usage" not in update.message.reply_text.call_args[0][0]
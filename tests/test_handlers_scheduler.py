@@ -1,11 +1,15 @@
 """Tests for src/handlers/scheduler.py."""
+import json
 import asyncio
 import threading
 import pytest
 from datetime import datetime
 from unittest.mock import AsyncMock, MagicMock, patch, mock_open
 
-from handlers.scheduler import periodic_node_ping, run_coroutine_in_loop
+from handlers.scheduler import periodic_node_ping, run_coroutine_in_loop, stop_async_func
+from services.history import HistoryRecord
+from services.history_window import RollingWindow
+from services.history_partitions import HistoryPartition, HistoryPartitions
 
 
 # ---------------------------------------------------------------------------
@@ -54,17 +58,38 @@ class TestPeriodicNodePing:
         app = _make_application()
         with patch('handlers.scheduler.get_addresses', return_value=_VALID_JSON), \
              patch('handlers.scheduler.get_system_stats', return_value={}), \
-             patch('handlers.scheduler.save_balance_history'):
+             patch('handlers.node.append_balance_entry'):
             await periodic_node_ping(app)
         # Node is up → should NOT call send_message with NODE_IS_DOWN
         for send_call in app.bot.send_message.call_args_list:
             assert "down" not in send_call[1].get('text', '').lower()
 
+    async def test_entry_queued_on_persister(self):
+        app = _make_application()
+        persister = MagicMock()
+        app.bot_data['history_persister'] = persister
+        with patch('handlers.scheduler.get_addresses', return_value=_VALID_JSON), \
+             patch('handlers.scheduler.get_system_stats', return_value={}), \
+             patch('handlers.node.append_balance_entry') as mock_append:
+            await periodic_node_ping(app)
+        mock_append.assert_not_called()
+        key = next(iter(app.bot_data['balance_history']))
+        persister.enqueue_append.assert_called_once_with(key)
+
+    async def test_chart_cache_notified_after_insert(self):
+        app = _make_application()
+        app.bot_data['chart_cache'] = MagicMock()
+        with patch('handlers.scheduler.get_addresses', return_value=_VALID_JSON), \
+             patch('handlers.scheduler.get_system_stats', return_value={}), \
+             patch('handlers.node.append_balance_entry'):
+            await periodic_node_ping(app)
+        app.bot_data['chart_cache'].notify.assert_called_once()
+
     async def test_node_down_sends_node_is_down(self):
         app = _make_application()
         with patch('handlers.scheduler.get_addresses', return_value=_DOWN_JSON), \
              patch('handlers.scheduler.get_system_stats', return_value={}), \
-             patch('handlers.scheduler.save_balance_history'):
+             patch('handlers.node.append_balance_entry'):
             await periodic_node_ping(app)
         # Should send NODE_IS_DOWN message
         app.bot.send_message.assert_called()
@@ -85,6 +110,24 @@ class TestPeriodicNodePing:
             await periodic_node_ping(app)
         app.bot.send_photo.assert_called()
 
+    async def test_probes_recorded_with_outcome(self):
+        app = _make_application()
+        probe_log = MagicMock()
+        app.bot_data['probe_log'] = probe_log
+        with patch('handlers.scheduler.get_addresses', return_value=_DOWN_JSON), \
+             patch('handlers.scheduler.get_system_stats', return_value={}), \
+             patch('handlers.node.append_balance_entry'):
+            await periodic_node_ping(app)
+        up, latency_ms = probe_log.record.call_args[0]
+        assert up is False
+        assert latency_ms >= 0
+
+        probe_log.reset_mock()
+        with patch('handlers.scheduler.get_addresses', return_value={"error": "Connection error."}), \
+             patch('builtins.open', mock_open(read_data=b"PNG")):
+            await periodic_node_ping(app)
+        probe_log.record.assert_called_once_with(False, None)
+
     async def test_extract_address_data_returns_none_sends_ping_failed(self):
         app = _make_application()
         with patch('handlers.scheduler.get_addresses', return_value={"result": []}), \
@@ -94,6 +137,22 @@ class TestPeriodicNodePing:
         texts = [c[1]['text'] for c in app.bot.send_message.call_args_list]
         assert any("invalid" in t.lower() or "failed" in t.lower() for t in texts)
 
+    async def test_snapshot_recorded_as_history_record(self, tmp_path):
+        app = _make_application()
+        now = datetime(2024, 1, 1, 10, 0, 42)
+        with patch('handlers.scheduler.get_addresses', return_value=_VALID_JSON), \
+             patch('handlers.scheduler.get_system_stats', return_value={"temperature_avg": 50.0}), \
+             patch('services.history.BALANCE_HISTORY_FILE', str(tmp_path / "balance_history.json")), \
+             patch('handlers.scheduler.datetime') as mock_dt:
+            mock_dt.now.return_value = now
+            await periodic_node_ping(app)
+        record = app.bot_data['balance_history']["2024/01/01-10:00"]
+        assert isinstance(record, HistoryRecord)
+        assert record.timestamp == datetime(2024, 1, 1, 10, 0)
+        assert (record.balance, record.temperature_avg, record.ram_percent) == (1000.0, 50.0, None)
+        journal = json.loads((tmp_path / "balance_history.journal").read_text())
+        assert journal == {"key": "2024/01/01-10:00", "entry": {"balance": 1000.0, "temperature_avg": 50.0}}
+
     async def test_at_report_hour_sends_detailed_report(self):
         """At hour 7, 12, or 21 with node up, a detailed text report is sent."""
         app = _make_application(
@@ -102,13 +161,40 @@ class TestPeriodicNodePing:
         report_time = datetime(2024, 1, 1, 7, 0, 0)
         with patch('handlers.scheduler.get_addresses', return_value=_VALID_JSON), \
              patch('handlers.scheduler.get_system_stats', return_value={}), \
-             patch('handlers.scheduler.save_balance_history'), \
+             patch('handlers.node.append_balance_entry'), \
              patch('handlers.scheduler.datetime') as mock_dt:
             mock_dt.now.return_value = report_time
             await periodic_node_ping(app)
         # The detailed report message should have been sent
         app.bot.send_message.assert_called()
 
+    async def test_report_reads_rolling_window(self):
+        """With a rolling window the report uses its aggregates instead of rescanning."""
+        history = {
+            "2024/01/01-01:00": {"balance": 900.0, "temperature_avg": 40.0},
+            "2024/01/01-06:00": {"balance": 950.0, "temperature_avg": 50.0, "ram_percent": 55.0},
+        }
+        app = _make_application(balance_history=history)
+        window = RollingWindow()
+        for key, value in history.items():
+            window.add(key, value)
+        app.bot_data['history_window'] = window
+        report_time = datetime(2024, 1, 1, 7, 0, 0)
+        with patch('handlers.scheduler.get_addresses', return_value=_VALID_JSON), \
+             patch('handlers.scheduler.get_system_stats', return_value={}), \
+             patch('handlers.node.append_balance_entry'), \
+             patch('handlers.scheduler.filter_last_24h', side_effect=AssertionError("scanned")), \
+             patch('handlers.scheduler.filter_since_midnight', side_effect=AssertionError("scanned")), \
+             patch('handlers.scheduler.datetime') as mock_dt:
+            mock_dt.now.return_value = report_time
+            await periodic_node_ping(app)
+        text = app.bot.send_message.call_args[1]['text']
+        assert "First: 900.00 (2024/01/01-01:00)" in text
+        assert "Current: 1000.00 (2024/01/01-07:00)" in text
+        assert "Avg CPU Temp (24h): 45.0°C" in text
+        assert "RAM 55.0%" in text
+        assert "2024/01/01-07:00" in window.recent(report_time)
+
     async def test_exception_is_handled_gracefully(self):
         app = _make_application()
         with patch('handlers.scheduler.get_addresses', side_effect=Exception("unexpected crash")):
@@ -121,7 +207,7 @@ class TestPeriodicNodePing:
         del app.bot_data['balance_lock']
         with patch('handlers.scheduler.get_addresses', return_value=_VALID_JSON), \
              patch('handlers.scheduler.get_system_stats', return_value={}), \
-             patch('handlers.scheduler.save_balance_history'):
+             patch('handlers.node.append_balance_entry'):
             await periodic_node_ping(app)
         # Should have added an entry to balance_history
         assert len(app.bot_data['balance_history']) > 0
@@ -134,6 +220,32 @@ class TestPeriodicNodePing:
             # Must not raise
             await periodic_node_ping(app)
 
+    async def test_several_addresses_batched_in_one_request(self, tmp_path):
+        app = _make_application(balance_history={"2024/01/01-06:00": {"balance": 900.0}})
+        primary = HistoryPartition('AU1test', app.bot_data['balance_history'], app.bot_data['balance_lock'])
+        app.bot_data['history_partitions'] = HistoryPartitions(['AU1test', 'AU1second', 'AU1third'], primary)
+        app.bot_data['report_addresses'] = {'AU1second'}
+        batched = {"result": [_VALID_JSON["result"][0], _VALID_JSON["result"][0], _DOWN_JSON["result"][0]]}
+        report_time = datetime(2024, 1, 1, 7, 0, 0)
+        with patch('services.history.BALANCE_HISTORY_FILE', str(tmp_path / "balance_history.json")), \
+             patch('handlers.scheduler.get_addresses', return_value=batched) as mock_get, \
+             patch('handlers.scheduler.get_system_stats', return_value={}), \
+             patch('handlers.node.append_balance_entry'), \
+             patch('handlers.scheduler.datetime') as mock_dt:
+            mock_dt.now.return_value = report_time
+            await periodic_node_ping(app)
+            app.bot_data['history_partitions'].stop()
+
+        mock_get.assert_called_once()
+        assert mock_get.call_args[0][1] == ['AU1test', 'AU1second', 'AU1third']
+        texts = [c[1]['text'] for c in app.bot.send_message.call_args_list]
+        assert any(text.startswith("AU1third") for text in texts)
+        # Only AU1second is in report_addresses: no report for the primary address
+        reports = [text for text in texts if "Current: 1000.00" in text]
+        assert len(reports) == 1 and reports[0].startswith("📍 AU1second")
+        assert (tmp_path / "balance_history.AU1third.journal").exists()
+        assert "2024/01/01-07:00" in app.bot_data['balance_history']
+
 
 # ---------------------------------------------------------------------------
 # run_coroutine_in_loop
@@ -218,3 +330,26 @@ class TestRunCoroutineInLoop:
 
         assert len(captured_callback) == 1
         captured_callback[0](mock_future)  # Must not raise
+
+
+class TestStopAsyncFunc:
+    def test_flushes_history_persister(self):
+        app = _make_application()
+        persister = MagicMock()
+        app.bot_data['history_persister'] = persister
+        stop_async_func(app)
+        persister.stop.assert_called_once()
+
+    def test_flushes_probe_log(self):
+        app = _make_application()
+        probe_log = MagicMock()
+        app.bot_data['probe_log'] = probe_log
+        stop_async_func(app)
+        probe_log.flush.assert_called_once()
+
+    def test_persister_error_is_logged(self):
+        app = _make_application()
+        app.bot_data['history_persister'] = MagicMock(**{'stop.side_effect': OSError("disk full")})
+        with patch('handlers.scheduler.logging') as mock_logging:
+            stop_async_func(app)
+        mock_logging.error.assert_called_once()
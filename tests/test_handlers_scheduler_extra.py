@@ -5,7 +5,10 @@ import threading
 import pytest
 from unittest.mock import MagicMock, patch, AsyncMock
 
-from handlers.scheduler import run_async_func, periodic_node_ping
+from handlers.scheduler import run_async_func, periodic_node_ping, compact_history, archive_history
+from services.history import BalanceHistory, compact_balance_history, load_balance_history
+from services.history_archive import read_manifest
+from services.history_partitions import HistoryPartition, HistoryPartitions, partition_file
 
 
 class TestRunAsyncFunc:
@@ -56,6 +59,67 @@ class TestRunAsyncFunc:
         # Scheduler is already running, so start() is NOT called again
         mock_scheduler.start.assert_not_called()
 
+    def test_run_async_func_adds_compaction_job_with_retention(self):
+        """A configured retention policy schedules the daily compaction job too."""
+        mock_app = MagicMock()
+        mock_app.bot_data = {'history_retention': {'raw_days': 7, 'hourly_days': 90}}
+        mock_scheduler = MagicMock()
+        mock_scheduler.running = False
+        mock_scheduler.get_job.return_value = None
+
+        with patch('handlers.scheduler.asyncio.get_running_loop', return_value=MagicMock()), \
+             patch('handlers.scheduler.BackgroundScheduler', return_value=mock_scheduler):
+            run_async_func(mock_app)
+
+        assert mock_scheduler.add_job.call_count == 2
+        assert mock_scheduler.add_job.call_args.kwargs['hours'] == 24
+
+    def test_run_async_func_no_compaction_job_by_default(self):
+        """Without a retention policy only the periodic ping is scheduled."""
+        mock_app = MagicMock()
+        mock_app.bot_data = {'history_retention': None}
+        mock_scheduler = MagicMock()
+        mock_scheduler.running = False
+        mock_scheduler.get_job.return_value = None
+
+        with patch('handlers.scheduler.asyncio.get_running_loop', return_value=MagicMock()), \
+             patch('handlers.scheduler.BackgroundScheduler', return_value=mock_scheduler):
+            run_async_func(mock_app)
+
+        assert mock_scheduler.add_job.call_count == 1
+
+    def test_run_async_func_adds_probe_log_flush_job(self):
+        """Buffered probes are written to their file by a scheduler job, off the event loop."""
+        mock_app = MagicMock()
+        probe_log = MagicMock()
+        mock_app.bot_data = {'probe_log': probe_log}
+        mock_scheduler = MagicMock()
+        mock_scheduler.running = False
+        mock_scheduler.get_job.return_value = None
+
+        with patch('handlers.scheduler.asyncio.get_running_loop', return_value=MagicMock()), \
+             patch('handlers.scheduler.BackgroundScheduler', return_value=mock_scheduler):
+            run_async_func(mock_app)
+
+        assert mock_scheduler.add_job.call_count == 2
+        assert mock_scheduler.add_job.call_args.args[0] is probe_log.flush
+        assert mock_scheduler.add_job.call_args.kwargs['id'] == 'probe_log_flush'
+
+    def test_run_async_func_adds_archive_job(self):
+        """A configured archive schedules the daily archive job."""
+        mock_app = MagicMock()
+        mock_app.bot_data = {'history_archive': {'hot_days': 90, 'compression': 'gzip'}}
+        mock_scheduler = MagicMock()
+        mock_scheduler.running = False
+        mock_scheduler.get_job.return_value = None
+
+        with patch('handlers.scheduler.asyncio.get_running_loop', return_value=MagicMock()), \
+             patch('handlers.scheduler.BackgroundScheduler', return_value=mock_scheduler):
+            run_async_func(mock_app)
+
+        assert mock_scheduler.add_job.call_count == 2
+        assert mock_scheduler.add_job.call_args.kwargs['id'] == 'balance_history_archive'
+
     def test_run_async_func_handles_exception(self):
         """An exception inside run_async_func should be caught and logged."""
         mock_app = MagicMock()
@@ -98,7 +162,7 @@ class TestPeriodicNodePingReportHours:
         report_time = datetime(2024, 1, 1, 12, 0, 0)
         with patch('handlers.scheduler.get_addresses', return_value=self._VALID_JSON), \
              patch('handlers.scheduler.get_system_stats', return_value={}), \
-             patch('handlers.scheduler.save_balance_history'), \
+             patch('handlers.node.append_balance_entry'), \
              patch('handlers.scheduler.datetime') as mock_dt:
             mock_dt.now.return_value = report_time
             await periodic_node_ping(app)
@@ -115,13 +179,35 @@ class TestPeriodicNodePingReportHours:
 
         with patch('handlers.scheduler.get_addresses', return_value=self._VALID_JSON), \
              patch('handlers.scheduler.get_system_stats', return_value={"ram_percent": 60.0}), \
-             patch('handlers.scheduler.save_balance_history'), \
+             patch('handlers.node.append_balance_entry'), \
              patch('handlers.scheduler.datetime') as mock_dt:
             mock_dt.now.return_value = now
             await periodic_node_ping(app)
 
         app.bot.send_message.assert_called()
 
+    async def test_report_scans_a_copy_taken_under_the_lock(self):
+        from datetime import datetime
+        now = datetime(2024, 6, 15, 21, 0, 0)
+        app = self._make_app(balance_history=BalanceHistory({"2024/06/15-18:00": {"balance": 900.0}}))
+        lock = app.bot_data['balance_lock']
+        held = []
+
+        def copy(history, start=None, end=None):
+            held.append(lock.locked())
+            return BalanceHistory(history.items())
+
+        with patch('handlers.scheduler.get_addresses', return_value=self._VALID_JSON), \
+             patch('handlers.scheduler.get_system_stats', return_value={}), \
+             patch('handlers.node.append_balance_entry'), \
+             patch('handlers.scheduler.copy_window', side_effect=copy), \
+             patch('handlers.scheduler.datetime') as mock_dt:
+            mock_dt.now.return_value = now
+            await periodic_node_ping(app)
+
+        assert held == [True]
+        app.bot.send_message.assert_called_once()
+
     async def test_non_report_hour_sends_no_message_when_node_up(self):
         """At a non-report hour (e.g. hour 3), no message should be sent if node is up."""
         from datetime import datetime
@@ -130,9 +216,223 @@ class TestPeriodicNodePingReportHours:
 
         with patch('handlers.scheduler.get_addresses', return_value=self._VALID_JSON), \
              patch('handlers.scheduler.get_system_stats', return_value={}), \
-             patch('handlers.scheduler.save_balance_history'), \
+             patch('handlers.node.append_balance_entry'), \
              patch('handlers.scheduler.datetime') as mock_dt:
             mock_dt.now.return_value = report_time
             await periodic_node_ping(app)
 
         app.bot.send_message.assert_not_called()
+
+
+class TestCompactHistory:
+    def _make_app(self, retention):
+        app = MagicMock()
+        app.bot_data = {
+            'balance_history': BalanceHistory({
+                "2020/01/01-08:00": {"balance": 1.0},
+                "2020/01/01-09:00": {"balance": 3.0},
+            }),
+            'balance_lock': threading.Lock(),
+            'history_retention': retention,
+        }
+        return app
+
+    def test_compacts_and_saves(self):
+        app = self._make_app({'raw_days': 7, 'hourly_days': 90})
+        with patch('handlers.scheduler.save_balance_history') as mock_save:
+            compact_history(app)
+        assert list(app.bot_data['balance_history']) == ["2020/01/01-00:00"]
+        mock_save.assert_called_once_with(app.bot_data['balance_history'])
+
+    def test_rolling_window_rebuilt(self):
+        app = self._make_app({'raw_days': 7, 'hourly_days': 90})
+        window = MagicMock()
+        app.bot_data['history_window'] = window
+        with patch('handlers.scheduler.save_balance_history'):
+            compact_history(app)
+        window.rebuild.assert_called_once_with(app.bot_data['balance_history'])
+
+    def test_save_goes_through_persister(self):
+        app = self._make_app({'raw_days': 7, 'hourly_days': 90})
+        persister = MagicMock()
+        app.bot_data['history_persister'] = persister
+        with patch('handlers.scheduler.save_balance_history') as mock_save:
+            compact_history(app)
+        mock_save.assert_not_called()
+        persister.request_save.assert_called_once()
+
+    def test_lock_not_held_while_compacting(self):
+        app = self._make_app({'raw_days': 7, 'hourly_days': 90})
+        history = app.bot_data['balance_history']
+        lock = app.bot_data['balance_lock']
+        held = []
+
+        def compact(working, **kwargs):
+            held.append((working is history, lock.locked()))
+            return compact_balance_history(working, **kwargs)
+
+        with patch('handlers.scheduler.compact_balance_history', side_effect=compact), \
+             patch('handlers.scheduler.save_balance_history'):
+            compact_history(app)
+        assert held == [(False, False)]
+        assert list(history) == ["2020/01/01-00:00"]
+
+    def test_additional_addresses_compacted(self, tmp_path):
+        app = self._make_app({'raw_days': 7, 'hourly_days': 90})
+        with patch('services.history.BALANCE_HISTORY_FILE', str(tmp_path / "balance_history.json")), \
+             patch('handlers.scheduler.save_balance_history'):
+            primary = HistoryPartition('AU1test', app.bot_data['balance_history'], app.bot_data['balance_lock'])
+            partitions = HistoryPartitions(['AU1test', 'AU1second'], primary)
+            app.bot_data['history_partitions'] = partitions
+            # Recorded while the partition was never loaded: only in its journal
+            partitions.record([('AU1second', "2020/01/01-08:00", {"balance": 1.0}),
+                               ('AU1second', "2020/01/01-09:00", {"balance": 3.0})])
+            compact_history(app)
+            partitions.stop()
+            reloaded = load_balance_history('json', path=partition_file('AU1second'))
+        assert list(reloaded) == ["2020/01/01-00:00"]
+        assert list(app.bot_data['balance_history']) == ["2020/01/01-00:00"]
+
+    def test_disabled_without_retention(self):
+        app = self._make_app(None)
+        with patch('handlers.scheduler.save_balance_history') as mock_save:
+            compact_history(app)
+        assert len(app.bot_data['balance_history']) == 2
+        mock_save.assert_not_called()
+
+    def test_empty_retention_uses_defaults(self):
+        app = self._make_app({})
+        with patch('handlers.scheduler.save_balance_history'):
+            compact_history(app)
+        assert list(app.bot_data['balance_history']) == ["2020/01/01-00:00"]
+
+    def test_nothing_to_compact_skips_save(self):
+        app = self._make_app({})
+        app.bot_data['history_retention'] = {'raw_days': 100000}
+        with patch('handlers.scheduler.save_balance_history') as mock_save:
+            compact_history(app)
+        mock_save.assert_not_called()
+
+    def test_errors_are_logged(self):
+        app = self._make_app({'raw_days': 7})
+        with patch('handlers.scheduler.compact_balance_history', side_effect=ValueError("boom")), \
+             patch('handlers.scheduler.logging') as mock_logging:
+            compact_history(app)
+        mock_logging.error.assert_called_once()
+
+    def test_runs_compacted_after_retention(self):
+        app = self._make_app({'raw_days': 100000, 'runs': {'min_length': 3}})
+        history = app.bot_data['balance_history']
+        history.update({f"2020/01/02-0{hour}:00": {"balance": 5.0} for hour in range(5)})
+        with patch('handlers.scheduler.save_balance_history') as mock_save:
+            compact_history(app)
+        assert len(history) == 7
+        assert history.run_settings['min_length'] == 3
+        mock_save.assert_called_once_with(history)
+
+    def test_runs_disabled_by_default(self):
+        app = self._make_app({'raw_days': 100000})
+        history = app.bot_data['balance_history']
+        history.update({f"2020/01/02-0{hour}:00": {"balance": 5.0} for hour in range(5)})
+        with patch('handlers.scheduler.save_balance_history') as mock_save:
+            compact_history(app)
+        assert history.run_settings is None
+        mock_save.assert_not_called()
+
+
+class TestArchiveHistory:
+    def _make_app(self, archive):
+        app = MagicMock()
+        app.bot_data = {
+            'balance_history': BalanceHistory({
+                "2020/01/01-08:00": {"balance": 1.0},
+                "2099/01/01-09:00": {"balance": 3.0},
+            }),
+            'balance_lock': threading.Lock(),
+            'history_archive': archive,
+        }
+        return app
+
+    def test_archives_closed_months_and_saves(self, tmp_path):
+        app = self._make_app({'hot_days': 90, 'compression': 'lzma'})
+        with patch('services.history_archive.HISTORY_ARCHIVE_DIR', str(tmp_path)), \
+             patch('handlers.scheduler.save_balance_history') as mock_save:
+            archive_history(app)
+        assert list(app.bot_data['balance_history']) == ["2099/01/01-09:00"]
+        assert (tmp_path / "2020-01.jsonl.xz").exists()
+        mock_save.assert_called_once_with(app.bot_data['balance_history'])
+
+    def test_empty_archive_uses_defaults(self, tmp_path):
+        app = self._make_app({})
+        with patch('services.history_archive.HISTORY_ARCHIVE_DIR', str(tmp_path)), \
+             patch('handlers.scheduler.save_balance_history'):
+            archive_history(app)
+        assert list(app.bot_data['balance_history']) == ["2099/01/01-09:00"]
+        assert (tmp_path / "2020-01.jsonl.gz").exists()
+
+    def test_save_goes_through_persister(self, tmp_path):
+        app = self._make_app({'hot_days': 90})
+        persister = MagicMock()
+        app.bot_data['history_persister'] = persister
+        with patch('services.history_archive.HISTORY_ARCHIVE_DIR', str(tmp_path)), \
+             patch('handlers.scheduler.save_balance_history') as mock_save:
+            archive_history(app)
+        mock_save.assert_not_called()
+        persister.request_save.assert_called_once()
+
+    def test_rows_removed_on_a_copy(self, tmp_path):
+        app = self._make_app({'hot_days': 90})
+        history = app.bot_data['balance_history']
+        lock = app.bot_data['balance_lock']
+        held = []
+
+        def remove(working, boundary, months):
+            held.append((working is history, lock.locked()))
+            return working.delete_before(boundary)
+
+        with patch('services.history_archive.HISTORY_ARCHIVE_DIR', str(tmp_path)), \
+             patch('handlers.scheduler.remove_archived', side_effect=remove), \
+             patch('handlers.scheduler.save_balance_history'):
+            archive_history(app)
+        assert held == [(False, False)]
+        assert list(history) == ["2099/01/01-09:00"]
+
+    def test_additional_addresses_archived_in_their_directory(self, tmp_path):
+        app = self._make_app({'hot_days': 90})
+        archive_dir = tmp_path / "history"
+        with patch('services.history.BALANCE_HISTORY_FILE', str(tmp_path / "balance_history.json")), \
+             patch('services.history_archive.HISTORY_ARCHIVE_DIR', str(archive_dir)), \
+             patch('handlers.scheduler.save_balance_history'):
+            primary = HistoryPartition('AU1test', app.bot_data['balance_history'], app.bot_data['balance_lock'])
+            partitions = HistoryPartitions(['AU1test', 'AU1second'], primary)
+            app.bot_data['history_partitions'] = partitions
+            partitions.record([('AU1second', "2020/02/01-08:00", {"balance": 2.0})])
+            archive_history(app)
+            history = partitions.get('AU1second').history
+            partitions.stop()
+            assert [segment["month"] for segment in read_manifest()] == ["2020-01"]
+            assert [segment["month"] for segment in read_manifest(str(archive_dir / "AU1second"))] == ["2020-02"]
+        assert len(history) == 0
+
+    def test_disabled_without_archive(self):
+        app = self._make_app(None)
+        with patch('handlers.scheduler.write_archive') as mock_write:
+            archive_history(app)
+        mock_write.assert_not_called()
+        assert len(app.bot_data['balance_history']) == 2
+
+    def test_nothing_to_archive(self):
+        app = self._make_app({'hot_days': 1000000})
+        with patch('handlers.scheduler.write_archive') as mock_write, \
+             patch('handlers.scheduler.save_balance_history') as mock_save:
+            archive_history(app)
+        mock_write.assert_not_called()
+        mock_save.assert_not_called()
+
+    def test_write_failure_keeps_entries(self):
+        app = self._make_app({'hot_days': 90})
+        with patch('handlers.scheduler.write_archive', side_effect=OSError("disk full")), \
+             patch('handlers.scheduler.logging') as mock_logging:
+            archive_history(app)
+        mock_logging.error.assert_called_once()
+        assert len(app.bot_data['balance_history']) == 2
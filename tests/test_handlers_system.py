@@ -1,4 +1,5 @@
 """Tests for src/handlers/system.py."""
+import os
 import threading
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
@@ -12,6 +13,8 @@ from handlers.system import (
     temperature,
     perf,
 )
+from services.history import BalanceHistory
+from services.probe_log import ProbeLog
 
 
 # ---------------------------------------------------------------------------
@@ -154,6 +157,13 @@ class TestCalculateUptime:
         result = _calculate_uptime(history)
         assert result <= 100.0
 
+    def test_indexed_history_counts_without_scanning(self):
+        now = datetime.now()
+        history = BalanceHistory({self._key(now - timedelta(hours=i)): {"balance": 1.0} for i in range(6)})
+        with patch('handlers.system._is_recent', side_effect=AssertionError("scanned")):
+            result = _calculate_uptime(history)
+        assert result == pytest.approx(25.0, abs=0.1)
+
     def test_old_entries_ignored(self):
         now = datetime.now()
         old = now - timedelta(hours=48)
@@ -182,12 +192,13 @@ class TestIsRecent:
         old = now - timedelta(hours=25)
         assert _is_recent(self._key(old), cutoff, now) is False
 
-    def test_legacy_format_in_range(self):
+    def test_legacy_format_not_parsed(self):
+        # Legacy keys are rewritten by the loader's migration, never seen here
         now = datetime.now()
         cutoff = now - timedelta(hours=24)
         recent = now - timedelta(hours=2)
         legacy_key = f"{recent.day:02d}/{recent.month:02d}-{recent.hour:02d}:{recent.minute:02d}"
-        assert _is_recent(legacy_key, cutoff, now) is True
+        assert _is_recent(legacy_key, cutoff, now) is False
 
     def test_invalid_format_returns_false(self):
         now = datetime.now()
@@ -210,6 +221,79 @@ class TestPerfHandler:
         assert "123.4" in text
         assert "Uptime" in text
 
+    async def test_uptime_read_from_rolling_window(self, authorized_update_context):
+        update, context = authorized_update_context
+        context.bot_data['balance_history'] = {}
+        context.bot_data['history_window'] = MagicMock(**{'uptime_percent.return_value': 87.5})
+        with patch('handlers.system.measure_rpc_latency', return_value={"latency_ms": 1.0, "status": "ok"}), \
+             patch('handlers.system._calculate_uptime', side_effect=AssertionError("scanned")):
+            await perf(update, context)
+        assert "Uptime (24h): 87.5%" in update.message.reply_text.call_args[0][0]
+
+    async def test_uptime_windows_from_probe_log(self, authorized_update_context):
+        update, context = authorized_update_context
+        context.bot_data['balance_history'] = {}
+        context.bot_data['history_window'] = MagicMock(**{'uptime_percent.return_value': 87.5})
+        probe_log = ProbeLog(os.devnull)
+        probe_log.record(False, None, datetime.now() - timedelta(days=3))
+        probe_log.record(True, 120.0, datetime.now() - timedelta(days=2))
+        context.bot_data['probe_log'] = probe_log
+        with patch('handlers.system.measure_rpc_latency', return_value={"latency_ms": 1.0, "status": "ok"}):
+            await perf(update, context)
+        text = update.message.reply_text.call_args[0][0]
+        # No probe in the last 24h yet: history-based figure
+        assert "Uptime (24h): 87.5%" in text
+        assert "Uptime (7d): 50.0% (1/2 probes, avg 120 ms)" in text
+        assert "Uptime (30d): 50.0%" in text
+
+    async def test_persister_metrics_reported(self, authorized_update_context):
+        update, context = authorized_update_context
+        context.bot_data['balance_history'] = {}
+        context.bot_data['history_persister'] = MagicMock(**{'metrics.return_value': {
+            "queue_depth": 2, "last_flush_duration": 0.0125, "flush_count": 3,
+        }})
+        with patch('handlers.system.measure_rpc_latency', return_value={"latency_ms": 1.0, "status": "ok"}):
+            await perf(update, context)
+        text = update.message.reply_text.call_args[0][0]
+        assert "History write queue: 2" in text
+        assert "Last history flush: 12.5 ms" in text
+
+    async def test_plot_cache_metrics_reported(self, authorized_update_context):
+        update, context = authorized_update_context
+        context.bot_data['balance_history'] = {}
+        context.bot_data['plot_cache'] = MagicMock(**{'metrics.return_value': {
+            "entries": 3, "bytes": 3 * 1024 * 1024 // 8, "hits": 6, "misses": 2, "evictions": 0,
+        }})
+        with patch('handlers.system.measure_rpc_latency', return_value={"latency_ms": 1.0, "status": "ok"}):
+            await perf(update, context)
+        assert "Chart cache: 3 charts, 384 KiB, hit rate 75% (6/8)" in update.message.reply_text.call_args[0][0]
+
+    async def test_startup_metrics_reported(self, authorized_update_context):
+        update, context = authorized_update_context
+        history = BalanceHistory()
+        history.load_metrics = {"recent_load_seconds": 0.1, "full_load_seconds": 2.5}
+        context.bot_data['balance_history'] = history
+        context.bot_data['startup_metrics'] = {"time_to_first_response": 1.25, "history_recent_load": 0.1}
+        with patch('handlers.system.measure_rpc_latency', return_value={"latency_ms": 1.0, "status": "ok"}):
+            await perf(update, context)
+        text = update.message.reply_text.call_args[0][0]
+        assert "Startup: first response after 1.25 s" in text
+        assert "History: fully loaded in 2.50 s" in text
+        history.ready.clear()
+        with patch('handlers.system.measure_rpc_latency', return_value={"latency_ms": 1.0, "status": "ok"}):
+            await perf(update, context)
+        assert "older entries still loading" in update.message.reply_text.call_args[0][0]
+
+    async def test_persister_without_flush_yet(self, authorized_update_context):
+        update, context = authorized_update_context
+        context.bot_data['balance_history'] = {}
+        context.bot_data['history_persister'] = MagicMock(**{'metrics.return_value': {
+            "queue_depth": 0, "last_flush_duration": None, "flush_count": 0,
+        }})
+        with patch('handlers.system.measure_rpc_latency', return_value={"latency_ms": 1.0, "status": "ok"}):
+            await perf(update, context)
+        assert "Last history flush: N/A" in update.message.reply_text.call_args[0][0]
+
     async def test_rpc_error_sends_error_message(self, authorized_update_context):
         update, context = authorized_update_context
         with patch('handlers.system.measure_rpc_latency', return_value={"error": "connection failed"}):
@@ -13,7 +13,7 @@ from datetime import datetime
 # Ensure src/ is on the path so imports work without installation
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from services.history import make_time_key, build_balance_entry, format_history_entry
+from services.history import make_time_key, build_balance_entry, format_history_entry, migrate_entry
 
 
 # ---------------------------------------------------------------------------
@@ -118,10 +118,10 @@ class TestFormatHistoryEntry:
         result = format_history_entry("2025/03/14-10:00", value)
         assert result == "2025/03/14-10:00: Balance 300.00, RAM 75.3%"
 
-    def test_legacy_string_entry(self):
-        # Legacy format: "Balance: 1234.56"
-        result = format_history_entry("14/03-07:05", "Balance: 1234.56")
-        assert result == "14/03-07:05: Balance 1234.56"
+    def test_migrated_legacy_string_entry(self):
+        # Legacy "Balance: 1234.56" strings are migrated to dicts at load time
+        result = format_history_entry("2025/03/14-07:05", migrate_entry("Balance: 1234.56"))
+        assert result == "2025/03/14-07:05: Balance 1234.56"
 
     def test_zero_balance(self):
         value = {"balance": 0.0}
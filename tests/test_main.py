@@ -8,6 +8,7 @@ from unittest.mock import AsyncMock, MagicMock, patch, mock_open
 
 # We import specific functions, not the whole module (which would trigger top-level config.py side effects)
 import main as main_module
+from services.probe_log import ProbeLog
 
 
 class TestDisablePrints:
@@ -23,6 +24,27 @@ class TestDisablePrints:
             sys.stderr = original_stderr
 
 
+class TestRecordStartupMetrics:
+    def test_records_time_to_first_response(self):
+        history = MagicMock(load_metrics={'recent_load_seconds': 0.25})
+        bot_data = {'startup_started': 0.0, 'balance_history': history}
+        with patch('main.time.perf_counter', return_value=1.5):
+            main_module.record_startup_metrics(bot_data)
+        assert bot_data['startup_metrics'] == {'time_to_first_response': 1.5, 'history_recent_load': 0.25}
+
+    def test_noop_without_start_time(self):
+        bot_data = {}
+        main_module.record_startup_metrics(bot_data)
+        assert 'startup_metrics' not in bot_data
+
+    async def test_post_init_records_metrics(self):
+        mock_app = MagicMock()
+        mock_app.bot = AsyncMock()
+        mock_app.bot_data = {'startup_started': 0.0, 'balance_history': {}}
+        await main_module.post_init(mock_app)
+        assert mock_app.bot_data['startup_metrics']['history_recent_load'] is None
+
+
 class TestPostInit:
     async def test_registers_commands_with_telegram(self):
         mock_app = MagicMock()
@@ -82,6 +104,36 @@ class TestPostInit:
         await main_module.post_init(mock_app)
 
 
+class TestStartChartRendering:
+    def test_starts_pool_and_refreshes_cache(self):
+        bot_data = {'plot_pool': MagicMock(), 'plot_prewarm': True, 'chart_cache': MagicMock()}
+        with patch('main.threading.Thread') as mock_thread:
+            main_module.start_chart_rendering(bot_data)
+        bot_data['plot_pool'].start.assert_called_once()
+        bot_data['chart_cache'].notify.assert_called_once()
+        # Workers warm themselves: nothing to pre-warm in the bot process
+        mock_thread.assert_not_called()
+
+    def test_prewarms_in_process_without_pool(self):
+        bot_data = {'plot_pool': None, 'plot_prewarm': True}
+        with patch('main.threading.Thread') as mock_thread:
+            main_module.start_chart_rendering(bot_data)
+        assert mock_thread.call_args.kwargs['target'] is main_module.prewarm
+        mock_thread.return_value.start.assert_called_once()
+
+    def test_prewarm_disabled(self):
+        with patch('main.threading.Thread') as mock_thread:
+            main_module.start_chart_rendering({'plot_pool': None, 'plot_prewarm': False})
+        mock_thread.assert_not_called()
+
+    async def test_called_from_post_init(self):
+        mock_app = MagicMock()
+        mock_app.bot = AsyncMock()
+        mock_app.bot_data = {'chart_cache': MagicMock()}
+        await main_module.post_init(mock_app)
+        mock_app.bot_data['chart_cache'].notify.assert_called_once()
+
+
 class TestErrorHandler:
     async def test_logs_error(self):
         update = MagicMock()
@@ -140,10 +192,20 @@ class TestMainFunction:
         with patch('builtins.open', mock_open(read_data=json.dumps(config))), \
              patch('main.get_addresses', return_value=addresses_result), \
              patch('main.load_balance_history', return_value={}), \
+             patch('main.ProbeLog.load', return_value=ProbeLog()), \
+             patch('main.PlotPool') as mock_pool, \
              patch('main.Application.builder', return_value=mock_app_builder), \
              patch('main.run_async_func'):
             main_module.main()
 
+        # Workers are only spawned once polling starts (post_init)
+        mock_pool.return_value.start.assert_not_called()
+        assert mock_app.bot_data['plot_pool'] is mock_pool.return_value
+        assert mock_app.bot_data['plot_prewarm'] is True
+        assert mock_app.bot_data['plot_cache'].max_bytes == 32 * 1024 * 1024
+        # Lossy retention is opt-in
+        assert mock_app.bot_data['history_retention'] is None
+        assert mock_app.bot_data['history_archive'] is None
         return mock_app
 
     def test_full_main_with_mocked_application(self):
@@ -0,0 +1,111 @@
+"""Tests for src/services/chart_cache.py."""
+import threading
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from services.chart_cache import ChartCache, STANDARD_CHARTS, chart_name
+from services.history import BalanceHistory, make_time_key
+from services.plotting import PlotCache
+
+
+def _history(hours: int = 200) -> BalanceHistory:
+    # Half past: keys are truncated to the minute, so on-the-hour samples can land on a window edge
+    now = datetime.now() - timedelta(minutes=30)
+    return BalanceHistory({
+        make_time_key(now - timedelta(hours=hour)): {"balance": 1000.0 + hour, "temperature_avg": 40.0}
+        for hour in range(hours)
+    })
+
+
+@pytest.fixture
+def fake_plots():
+    """Replace the matplotlib renderers with ones returning the number of charted entries."""
+    calls = []
+
+    def plot(prefix):
+        def render(history):
+            calls.append((prefix, len(history)))
+            return f"{prefix}:{len(history)}".encode()
+        return render
+
+    with patch('services.chart_cache.create_balance_history_plot', side_effect=plot('balance')), \
+         patch('services.chart_cache.create_resources_plot', side_effect=plot('resources')):
+        yield calls
+
+
+class TestChartName:
+    def test_standard_windows(self):
+        assert chart_name(timedelta(days=1)) == '24h'
+        assert chart_name(timedelta(hours=168)) == '7d'
+        assert chart_name(None) == 'all'
+        assert chart_name(timedelta(days=30)) is None
+
+
+class TestChartCache:
+    def test_render_then_hit_until_history_changes(self, fake_plots):
+        history = _history()
+        cache = ChartCache(history, threading.Lock())
+        assert cache.get('24h') is None
+
+        chart = cache.render('24h')
+        assert chart.balance_png == b"balance:24"
+        assert chart.resources_png == b"resources:24"
+        assert cache.get('24h') is chart
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        history[make_time_key()] = {"balance": 1.0}
+        assert cache.get('24h') is None
+
+    def test_refresh_renders_only_stale_charts(self, fake_plots):
+        history = _history()
+        cache = ChartCache(history)
+        cache.refresh()
+        assert [prefix for prefix, _ in fake_plots].count('balance') == len(STANDARD_CHARTS)
+        assert cache.get('all').balance_png == b"balance:200"
+
+        cache.refresh()
+        assert len(fake_plots) == 2 * len(STANDARD_CHARTS)
+        del history[next(iter(history))]
+        cache.refresh()
+        assert len(fake_plots) == 4 * len(STANDARD_CHARTS)
+
+    def test_background_thread_renders_on_notify(self, fake_plots):
+        cache = ChartCache(_history())
+        cache.start()
+        try:
+            cache.notify()
+            for _ in range(200):
+                if all(cache._charts.get(name) for name, _ in STANDARD_CHARTS):
+                    break
+                threading.Event().wait(0.01)
+        finally:
+            cache.stop()
+        assert not cache.running
+        assert cache.get('7d').balance_png == b"balance:168"
+
+    def test_history_without_version_is_not_cached(self, fake_plots):
+        cache = ChartCache({"2024/01/01-10:00": {"balance": 1.0}})
+        cache.refresh()
+        assert fake_plots == []
+        chart = cache.render('all')
+        assert chart.balance_png == b"balance:1"
+        assert cache.get('all') is None
+
+    def test_empty_window(self, fake_plots):
+        with patch('services.chart_cache.create_balance_history_plot', return_value=b""), \
+             patch('services.chart_cache.create_resources_plot', return_value=b""):
+            chart = ChartCache(BalanceHistory()).render('24h')
+        assert chart.balance_png is None and chart.resources_png is None
+
+    def test_unchanged_window_reused_from_plot_cache(self, fake_plots):
+        history = _history()
+        plot_cache = PlotCache(1024 * 1024)
+        cache = ChartCache(history, plot_cache=plot_cache)
+        cache.render('7d')
+        # A new version with the same 7-day window: the version changed, the charted data did not
+        history[make_time_key(datetime.now() - timedelta(days=30))] = {"balance": 1.0}
+        chart = cache.render('7d')
+        assert chart.balance_png == b"balance:168"
+        assert len(fake_plots) == 2
+        assert plot_cache.metrics()['hits'] == 2
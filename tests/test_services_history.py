@@ -1,7 +1,15 @@
 """Exhaustive tests for src/services/history.py."""
+import dataclasses
+import gc
 import json
+import math
 import os
+import pickle
+import sys
+import threading
+import tracemalloc
 import pytest
+from array import array
 from datetime import datetime, timedelta
 from unittest.mock import patch
 
@@ -11,8 +19,26 @@ from services.history import (
     get_entry_ram,
     load_balance_history,
     save_balance_history,
+    append_balance_entry,
     filter_since_midnight,
     filter_last_24h,
+    parse_time_key,
+    BalanceHistory,
+    migrate_entry,
+    migrate_history,
+    HISTORY_SCHEMA_VERSION,
+    HISTORY_COLUMNS,
+    datetime_to_epoch,
+    compact_balance_history,
+    get_entry_rollup,
+    format_history_entry,
+    parse_duration,
+    query_history,
+    HistoryRecord,
+    iter_records,
+    make_time_key,
+    copy_window,
+    rebuild_aside,
 )
 
 
@@ -30,18 +56,6 @@ class TestGetEntryBalance:
     def test_dict_format_zero_balance(self):
         assert get_entry_balance({"balance": 0.0}) == 0.0
 
-    def test_legacy_string_format(self):
-        assert get_entry_balance("Balance: 99.75") == 99.75
-
-    def test_legacy_string_bad_format_returns_zero(self):
-        assert get_entry_balance("no colon here") == 0.0
-
-    def test_legacy_string_non_numeric_returns_zero(self):
-        assert get_entry_balance("Balance: abc") == 0.0
-
-    def test_empty_string_returns_zero(self):
-        assert get_entry_balance("") == 0.0
-
     def test_integer_value_via_dict(self):
         assert get_entry_balance({"balance": 10}) == 10.0
 
@@ -57,9 +71,6 @@ class TestGetEntryTemperature:
     def test_dict_without_temperature_avg(self):
         assert get_entry_temperature({"balance": 1.0}) is None
 
-    def test_string_input_returns_none(self):
-        assert get_entry_temperature("Balance: 10") is None
-
     def test_dict_with_none_temperature(self):
         assert get_entry_temperature({"temperature_avg": None}) is None
 
@@ -75,9 +86,6 @@ class TestGetEntryRam:
     def test_dict_without_ram_percent(self):
         assert get_entry_ram({"balance": 1.0}) is None
 
-    def test_string_input_returns_none(self):
-        assert get_entry_ram("Balance: 10") is None
-
     def test_dict_with_none_ram(self):
         assert get_entry_ram({"ram_percent": None}) is None
 
@@ -130,7 +138,7 @@ class TestSaveBalanceHistory:
         with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
             save_balance_history(data)
         assert target.exists()
-        assert json.loads(target.read_text()) == data
+        assert json.loads(target.read_text())["entries"] == data
 
     def test_writes_correct_json(self, tmp_path):
         target = tmp_path / "balance_history.json"
@@ -138,7 +146,7 @@ class TestSaveBalanceHistory:
         with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
             save_balance_history(data)
         loaded = json.loads(target.read_text())
-        assert loaded == data
+        assert loaded == {"schema_version": HISTORY_SCHEMA_VERSION, "order": "newest_first", "entries": data}
 
     def test_handles_ioerror_gracefully(self, tmp_path):
         target = tmp_path / "balance_history.json"
@@ -151,7 +159,69 @@ class TestSaveBalanceHistory:
         target = tmp_path / "balance_history.json"
         with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
             save_balance_history({})
-        assert json.loads(target.read_text()) == {}
+        assert json.loads(target.read_text())["entries"] == {}
+
+
+# ---------------------------------------------------------------------------
+# append_balance_entry (journal)
+# ---------------------------------------------------------------------------
+
+class TestAppendBalanceEntry:
+    def test_appends_one_line_per_entry(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        history = {"2024/01/01-10:00": {"balance": 1.0}, "2024/01/01-11:00": {"balance": 2.0}}
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            append_balance_entry(history, "2024/01/01-10:00")
+            append_balance_entry(history, "2024/01/01-11:00")
+        lines = (tmp_path / "balance_history.journal").read_text().splitlines()
+        assert [json.loads(line)["key"] for line in lines] == ["2024/01/01-10:00", "2024/01/01-11:00"]
+        # The snapshot is not rewritten on append
+        assert not target.exists()
+
+    def test_load_replays_journal_over_snapshot(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            save_balance_history({"2024/01/01-10:00": {"balance": 1.0}})
+            history = {"2024/01/01-10:00": {"balance": 1.0}, "2024/01/01-11:00": {"balance": 2.0}}
+            append_balance_entry(history, "2024/01/01-11:00")
+            result = load_balance_history()
+        assert result == history
+
+    def test_malformed_journal_line_skipped(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        journal = tmp_path / "balance_history.journal"
+        journal.write_text(
+            '{"key":"2024/01/01-10:00","entry":{"balance":1.0}}\n{"key":"2024/01/01-11', encoding='utf-8'
+        )
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            result = load_balance_history()
+        assert result == {"2024/01/01-10:00": {"balance": 1.0}}
+
+    def test_compacts_when_journal_exceeds_threshold(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        history = {"2024/01/01-10:00": {"balance": 1.0}}
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)), \
+             patch('services.history.JOURNAL_COMPACT_BYTES', 0):
+            append_balance_entry(history, "2024/01/01-10:00")
+        assert json.loads(target.read_text())["entries"] == history
+        assert not (tmp_path / "balance_history.journal").exists()
+
+    def test_save_resets_journal(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        history = {"2024/01/01-10:00": {"balance": 1.0}}
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            append_balance_entry(history, "2024/01/01-10:00")
+            history.clear()
+            save_balance_history(history)
+            assert load_balance_history() == {}
+        assert not (tmp_path / "balance_history.journal").exists()
+
+    def test_handles_ioerror_gracefully(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            with patch('builtins.open', side_effect=IOError("read-only")):
+                # Must not raise
+                append_balance_entry({"key": {"balance": 1.0}}, "key")
 
 
 # ---------------------------------------------------------------------------
@@ -181,13 +251,12 @@ class TestFilterSinceMidnight:
         result = filter_since_midnight({key: {"balance": 5.0}})
         assert key in result
 
-    def test_legacy_format_kept_if_today(self):
+    def test_legacy_format_ignored(self):
         now = datetime.now()
-        # Build a legacy key for today
+        # Legacy keys are migrated at load time; the filter only parses canonical keys
         legacy_key = f"{now.day:02d}/{now.month:02d}-{now.hour:02d}:{now.minute:02d}"
-        result = filter_since_midnight({legacy_key: "Balance: 10"})
-        # Should be included (today's entry)
-        assert len(result) <= 1  # might or might not be included depending on exact hour
+        result = filter_since_midnight({legacy_key: {"balance": 10.0}})
+        assert result == {}
 
     def test_invalid_format_skipped(self):
         result = filter_since_midnight({"not-a-date": {"balance": 1.0}})
@@ -256,13 +325,13 @@ class TestFilterLast24h:
         result = filter_last_24h(history)
         assert len(result) <= 24
 
-    def test_legacy_format_parsed(self):
+    def test_migrated_legacy_format_kept(self):
         now = datetime.now()
-        # Build a legacy key for 2 hours ago
+        # Build a legacy key for 2 hours ago, migrated the way the loader does it
         two_hours_ago = now - timedelta(hours=2)
         legacy_key = f"{two_hours_ago.day:02d}/{two_hours_ago.month:02d}-{two_hours_ago.hour:02d}:{two_hours_ago.minute:02d}"
-        result = filter_last_24h({legacy_key: "Balance: 7"})
-        assert len(result) == 1
+        result = filter_last_24h(migrate_history({legacy_key: "Balance: 7"}, now))
+        assert list(result.values()) == [{"balance": 7.0}]
 
     def test_invalid_format_skipped(self):
         result = filter_last_24h({"not-a-date": {"balance": 1.0}})
@@ -280,3 +349,904 @@ class TestFilterLast24h:
         for k in result.keys():
             dts.append(datetime.strptime(k, "%Y/%m/%d-%H:%M"))
         assert dts == sorted(dts)
+
+
+# ---------------------------------------------------------------------------
+# parse_time_key
+# ---------------------------------------------------------------------------
+
+class TestParseTimeKey:
+    def test_new_format(self):
+        assert parse_time_key("2024/03/15-14:30") == datetime(2024, 3, 15, 14, 30)
+
+    def test_legacy_format_not_parsed(self):
+        assert parse_time_key("15/03-14:30") is None
+
+    def test_invalid_key_returns_none(self):
+        assert parse_time_key("not-a-date") is None
+
+    def test_out_of_range_fields_return_none(self):
+        assert parse_time_key("2024/13/01-10:00") is None
+        assert parse_time_key("2024/01/01-1x:00") is None
+
+
+# ---------------------------------------------------------------------------
+# BalanceHistory (sorted timestamp index)
+# ---------------------------------------------------------------------------
+
+class TestBalanceHistory:
+    def test_behaves_like_a_dict(self):
+        history = BalanceHistory({"2024/01/01-10:00": {"balance": 1.0}})
+        history["2024/01/01-11:00"] = {"balance": 2.0}
+        assert history == {"2024/01/01-10:00": {"balance": 1.0}, "2024/01/01-11:00": {"balance": 2.0}}
+        assert "2024/01/01-11:00" in history
+        assert len(history) == 2
+
+    def test_iteration_is_chronological(self):
+        history = BalanceHistory()
+        history["2024/01/02-10:00"] = {"balance": 2.0}
+        history["2024/01/01-10:00"] = {"balance": 1.0}
+        assert list(history) == ["2024/01/01-10:00", "2024/01/02-10:00"]
+
+    def test_overwrite_keeps_single_index_entry(self):
+        history = BalanceHistory()
+        history["2024/01/01-10:00"] = {"balance": 1.0}
+        history["2024/01/01-10:00"] = {"balance": 3.0}
+        assert history.count_between(None, None) == 1
+        assert history["2024/01/01-10:00"] == {"balance": 3.0}
+
+    def test_delete_removes_from_index(self):
+        history = BalanceHistory({"2024/01/01-10:00": {"balance": 1.0}, "2024/01/01-11:00": {"balance": 2.0}})
+        del history["2024/01/01-10:00"]
+        assert list(history) == ["2024/01/01-11:00"]
+        assert history.count_between(None, None) == 1
+
+    def test_invalid_keys_kept_but_not_indexed(self):
+        history = BalanceHistory({"not-a-date": {"balance": 1.0}, "2024/01/01-10:00": {"balance": 2.0}})
+        assert list(history) == ["2024/01/01-10:00", "not-a-date"]
+        assert history.count_between(None, None) == 1
+        del history["not-a-date"]
+        assert len(history) == 1
+
+    def test_items_between_uses_half_open_window(self):
+        history = BalanceHistory({f"2024/01/01-{h:02d}:00": {"balance": float(h)} for h in range(6)})
+        result = history.items_between(datetime(2024, 1, 1, 2), datetime(2024, 1, 1, 4))
+        assert [(dt.hour, key) for dt, key, _ in result] == [(2, "2024/01/01-02:00"), (3, "2024/01/01-03:00")]
+        assert history.count_between(datetime(2024, 1, 1, 2), datetime(2024, 1, 1, 4)) == 2
+        assert history.count_between(datetime(2024, 1, 1, 5), datetime(2024, 1, 1, 1)) == 0
+
+    def test_clear(self):
+        history = BalanceHistory({"2024/01/01-10:00": {"balance": 1.0}})
+        history.clear()
+        assert history == {}
+        assert history.items_between(None, None) == []
+
+    def test_pickle_roundtrip(self):
+        history = BalanceHistory({"2024/01/01-10:00": {"balance": 1.0, "temperature_avg": 40.0}})
+        history.ready.clear()
+        copy = pickle.loads(pickle.dumps(history))
+        assert copy == history
+        assert copy.ready.is_set()
+
+    def test_version_bumped_by_every_change(self):
+        history = BalanceHistory()
+        versions = [history.version]
+        history["2024/01/01-10:00"] = {"balance": 1.0}
+        versions.append(history.version)
+        history.update({"2024/01/01-11:00": {"balance": 2.0}})
+        versions.append(history.version)
+        del history["2024/01/01-10:00"]
+        versions.append(history.version)
+        history.delete_before(datetime(2024, 1, 2))
+        versions.append(history.version)
+        history.clear()
+        versions.append(history.version)
+        assert versions == sorted(set(versions))
+        # Reads leave it alone
+        list(history.items())
+        history.columns()
+        assert history.version == versions[-1]
+
+    def test_filters_use_index(self):
+        now = datetime.now()
+        recent = now - timedelta(minutes=5)
+        key = f"{recent.year}/{recent.month:02d}/{recent.day:02d}-{recent.hour:02d}:{recent.minute:02d}"
+        history = BalanceHistory({key: {"balance": 1.0}, "2000/01/01-00:00": {"balance": 0.0}})
+        with patch('services.history.parse_time_key', side_effect=AssertionError("re-parsed")):
+            assert list(filter_last_24h(history)) == [key]
+            assert list(filter_since_midnight(history)) == [key]
+
+    def test_load_returns_balance_history(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        target.write_text(json.dumps({"2024/01/01-10:00": {"balance": 1.0}}), encoding='utf-8')
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            result = load_balance_history()
+        assert isinstance(result, BalanceHistory)
+        assert result.count_between(None, None) == 1
+
+    def test_save_serializes_balance_history(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        history = BalanceHistory({"2024/01/01-10:00": {"balance": 1.0}})
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            save_balance_history(history)
+        assert json.loads(target.read_text())["entries"] == {"2024/01/01-10:00": {"balance": 1.0}}
+
+
+# ---------------------------------------------------------------------------
+# Schema v1 → v2 migration
+# ---------------------------------------------------------------------------
+
+class TestMigrateEntry:
+    def test_legacy_string_format(self):
+        assert migrate_entry("Balance: 99.75") == {"balance": 99.75}
+
+    def test_legacy_string_bad_format_returns_none(self):
+        assert migrate_entry("no colon here") is None
+
+    def test_legacy_string_non_numeric_returns_none(self):
+        assert migrate_entry("Balance: abc") is None
+
+    def test_empty_string_returns_none(self):
+        assert migrate_entry("") is None
+
+    def test_dict_drops_null_fields_and_coerces_balance(self):
+        assert migrate_entry({"balance": 10, "temperature_avg": None, "ram_percent": 50.0}) == {
+            "balance": 10.0, "ram_percent": 50.0,
+        }
+
+
+class TestMigrateHistory:
+    def test_rewrites_legacy_keys(self):
+        now = datetime(2025, 6, 1, 12, 0)
+        assert migrate_history({"15/03-14:30": "Balance: 1"}, now) == {"2025/03/15-14:30": {"balance": 1.0}}
+
+    def test_canonical_record_wins_collision(self):
+        now = datetime(2025, 6, 1, 12, 0)
+        for raw in (
+            {"15/03-14:30": "Balance: 1", "2025/03/15-14:30": {"balance": 2.0}},
+            {"2025/03/15-14:30": {"balance": 2.0}, "15/03-14:30": "Balance: 1"},
+        ):
+            assert migrate_history(raw, now) == {"2025/03/15-14:30": {"balance": 2.0}}
+
+    def test_unparseable_records_dropped(self):
+        result = migrate_history({"not-a-date": {"balance": 1.0}, "2025/03/15-14:30": "garbage"})
+        assert result == {}
+
+
+class TestLoadMigratesSchemaV1:
+    def test_v1_file_is_migrated_backed_up_and_rewritten(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        legacy = {"15/03-14:30": "Balance: 1", "2024/01/01-10:00": {"balance": 2.0}}
+        target.write_text(json.dumps(legacy), encoding='utf-8')
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            result = load_balance_history()
+
+        assert len(result) == 2
+        assert all(parse_time_key(key) is not None for key in result)
+        assert all(isinstance(value, dict) for value in result.values())
+        backup = tmp_path / "balance_history.json.v1.bak"
+        assert json.loads(backup.read_text()) == legacy
+        on_disk = json.loads(target.read_text())
+        assert on_disk["schema_version"] == HISTORY_SCHEMA_VERSION
+        assert on_disk["entries"] == dict(result)
+
+    def test_v2_file_is_not_migrated_again(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        target.write_text(json.dumps({
+            "schema_version": HISTORY_SCHEMA_VERSION,
+            "entries": {"2024/01/01-10:00": {"balance": 2.0}},
+        }), encoding='utf-8')
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)), \
+             patch('services.history.migrate_history') as mock_migrate:
+            result = load_balance_history()
+        mock_migrate.assert_not_called()
+        assert result == {"2024/01/01-10:00": {"balance": 2.0}}
+        assert not (tmp_path / "balance_history.json.v1.bak").exists()
+
+    def test_existing_backup_not_overwritten(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        backup = tmp_path / "balance_history.json.v1.bak"
+        backup.write_text("original", encoding='utf-8')
+        target.write_text(json.dumps({"2024/01/01-10:00": {"balance": 2.0}}), encoding='utf-8')
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            load_balance_history()
+        assert backup.read_text() == "original"
+
+
+# ---------------------------------------------------------------------------
+# BalanceHistory columnar storage
+# ---------------------------------------------------------------------------
+
+class TestBalanceHistoryColumns:
+    def _history(self):
+        return BalanceHistory({
+            "2024/01/01-10:00": {"balance": 1.0, "temperature_avg": 40.0},
+            "2024/01/01-11:00": {"balance": 2.0, "ram_percent": 60.0},
+            "2024/01/01-12:00": {"balance": 3.0, "temperature_avg": 42.0, "ram_percent": 61.0},
+        })
+
+    def test_mapping_view_rebuilds_entries(self):
+        history = self._history()
+        assert history["2024/01/01-10:00"] == {"balance": 1.0, "temperature_avg": 40.0}
+        assert history["2024/01/01-11:00"] == {"balance": 2.0, "ram_percent": 60.0}
+        assert list(history.values())[2] == {"balance": 3.0, "temperature_avg": 42.0, "ram_percent": 61.0}
+
+    def test_missing_key_raises(self):
+        with pytest.raises(KeyError):
+            self._history()["2024/01/01-13:00"]
+        with pytest.raises(KeyError):
+            del self._history()["2024/01/01-13:00"]
+
+    def test_columns_are_zero_copy_views_with_nan(self):
+        history = self._history()
+        cols = history.columns()
+        assert tuple(cols) == HISTORY_COLUMNS
+        assert all(isinstance(view, memoryview) and view.readonly for view in cols.values())
+        assert list(cols["balance"]) == [1.0, 2.0, 3.0]
+        assert math.isnan(cols["temperature_avg"][1])
+        assert math.isnan(cols["ram_percent"][0])
+
+    def test_columns_window(self):
+        history = self._history()
+        cols = history.columns(datetime(2024, 1, 1, 11), datetime(2024, 1, 1, 12))
+        assert list(cols["balance"]) == [2.0]
+        assert cols["timestamp"][0] == datetime_to_epoch(datetime(2024, 1, 1, 11))
+
+    def test_mutation_while_view_exported_copies_column(self):
+        history = self._history()
+        view = history.columns()["balance"]
+        history["2024/01/01-13:00"] = {"balance": 4.0}
+        del history["2024/01/01-10:00"]
+        # The old view still sees the data it was taken from
+        assert list(view) == [1.0, 2.0, 3.0]
+        assert list(history.columns()["balance"]) == [2.0, 3.0, 4.0]
+
+    def test_out_of_order_insert_keeps_columns_sorted(self):
+        history = self._history()
+        history["2024/01/01-09:00"] = {"balance": 0.5}
+        assert list(history.columns()["balance"]) == [0.5, 1.0, 2.0, 3.0]
+
+    def test_bulk_update_merges_older_and_duplicate_entries(self):
+        history = self._history()
+        history.update({"2024/01/01-09:00": {"balance": 0.5}, "2024/01/01-12:00": {"balance": 9.0}})
+        assert list(history.columns()["balance"]) == [0.5, 1.0, 2.0, 9.0]
+
+    def test_bulk_update_appends_newer_entries(self):
+        history = self._history()
+        history.update([("2024/01/01-14:00", {"balance": 5.0}), ("2024/01/01-13:00", {"balance": 4.0})])
+        assert list(history)[-2:] == ["2024/01/01-13:00", "2024/01/01-14:00"]
+
+    def test_overwrite_updates_row_in_place(self):
+        history = self._history()
+        history["2024/01/01-11:00"] = {"balance": 9.0}
+        assert len(history) == 3
+        assert history["2024/01/01-11:00"] == {"balance": 9.0}
+
+    def test_items_view_supports_len_and_contains(self):
+        history = self._history()
+        assert len(history.items()) == 3
+        assert ("2024/01/01-10:00", {"balance": 1.0, "temperature_avg": 40.0}) in history.items()
+
+
+# ---------------------------------------------------------------------------
+# compact_balance_history (retention tiers)
+# ---------------------------------------------------------------------------
+
+class TestCompactBalanceHistory:
+    NOW = datetime(2024, 6, 1, 12, 30)
+
+    def _key(self, dt: datetime) -> str:
+        return f"{dt.year}/{dt.month:02d}/{dt.day:02d}-{dt.hour:02d}:{dt.minute:02d}"
+
+    def test_recent_entries_untouched(self):
+        history = BalanceHistory({
+            self._key(self.NOW - timedelta(days=1, minutes=m)): {"balance": float(m)} for m in range(3)
+        })
+        before = dict(history.items())
+        assert compact_balance_history(history, now=self.NOW) == 0
+        assert dict(history.items()) == before
+
+    def test_old_entries_merged_per_hour(self):
+        base = datetime(2024, 5, 20, 8, 0)
+        history = BalanceHistory({
+            self._key(base): {"balance": 10.0, "temperature_avg": 40.0},
+            self._key(base + timedelta(minutes=20)): {"balance": 20.0, "temperature_avg": 50.0},
+            self._key(base + timedelta(minutes=40)): {"balance": 30.0, "ram_percent": 60.0},
+        })
+        assert compact_balance_history(history, now=self.NOW) == 2
+        assert history["2024/05/20-08:00"] == {
+            "balance": 20.0,
+            "temperature_avg": 45.0,
+            "ram_percent": 60.0,
+            "balance_min": 10.0,
+            "balance_max": 30.0,
+            "samples": 3,
+        }
+
+    def test_very_old_entries_merged_per_day_weighted_by_samples(self):
+        history = BalanceHistory({
+            "2024/01/10-08:00": {"balance": 10.0, "balance_min": 5.0, "balance_max": 15.0, "samples": 3},
+            "2024/01/10-20:15": {"balance": 30.0},
+        })
+        assert compact_balance_history(history, now=self.NOW) == 1
+        assert list(history) == ["2024/01/10-00:00"]
+        entry = history["2024/01/10-00:00"]
+        assert entry["balance"] == pytest.approx(15.0)
+        assert get_entry_rollup(entry) == (5.0, 30.0, 4)
+
+    def test_second_run_is_a_noop(self):
+        history = BalanceHistory({
+            "2024/05/20-08:00": {"balance": 1.0},
+            "2024/05/20-08:30": {"balance": 2.0},
+            "2024/01/10-08:00": {"balance": 3.0},
+        })
+        compact_balance_history(history, now=self.NOW)
+        snapshot = dict(history.items())
+        assert compact_balance_history(history, now=self.NOW) == 0
+        assert dict(history.items()) == snapshot
+
+    def test_plain_dict_supported(self):
+        history = {
+            "2024/05/20-08:10": {"balance": 1.0},
+            "2024/05/20-08:50": {"balance": 3.0},
+            "2024/05/31-12:00": {"balance": 5.0},
+        }
+        compact_balance_history(history, now=self.NOW)
+        assert set(history) == {"2024/05/20-08:00", "2024/05/31-12:00"}
+        assert history["2024/05/20-08:00"]["balance"] == 2.0
+
+    def test_custom_tiers(self):
+        history = BalanceHistory({
+            "2024/05/31-09:10": {"balance": 1.0},
+            "2024/05/31-09:50": {"balance": 3.0},
+        })
+        compact_balance_history(history, raw_days=0, hourly_days=0, now=self.NOW)
+        assert list(history) == ["2024/05/31-00:00"]
+
+    def test_rollup_survives_save_and_load(self, tmp_path):
+        history_file = tmp_path / "history.json"
+        history = BalanceHistory({
+            "2024/05/20-08:00": {"balance": 1.0},
+            "2024/05/20-08:30": {"balance": 3.0},
+        })
+        compact_balance_history(history, now=self.NOW)
+        with patch('services.history.BALANCE_HISTORY_FILE', str(history_file)):
+            save_balance_history(history)
+            loaded = load_balance_history()
+        assert get_entry_rollup(loaded["2024/05/20-08:00"]) == (1.0, 3.0, 2)
+
+    def test_delete_and_overwrite_drop_rollup(self):
+        history = BalanceHistory({"2024/05/20-08:00": {"balance": 2.0, "balance_min": 1.0,
+                                                       "balance_max": 3.0, "samples": 2}})
+        history["2024/05/20-08:00"] = {"balance": 4.0}
+        assert history["2024/05/20-08:00"] == {"balance": 4.0}
+        history["2024/05/20-08:00"] = {"balance": 2.0, "balance_min": 1.0, "balance_max": 3.0, "samples": 2}
+        del history["2024/05/20-08:00"]
+        history["2024/05/20-08:00"] = {"balance": 5.0}
+        assert get_entry_rollup(history["2024/05/20-08:00"]) is None
+
+
+class TestGetEntryRollup:
+    def test_raw_entry(self):
+        assert get_entry_rollup({"balance": 1.0}) is None
+
+    def test_format_includes_rollup_stats(self):
+        line = format_history_entry("2024/05/20-08:00", {
+            "balance": 2.0, "balance_min": 1.0, "balance_max": 3.0, "samples": 4,
+        })
+        assert line == "2024/05/20-08:00: Balance 2.00 (min 1.00, max 3.00, 4 samples)"
+
+
+# ---------------------------------------------------------------------------
+# Crash safety: atomic snapshots, torn journal tails, backup recovery
+# ---------------------------------------------------------------------------
+
+class TestCrashRecovery:
+    def _paths(self, tmp_path):
+        return tmp_path / "balance_history.json", tmp_path / "balance_history.journal"
+
+    def test_torn_tail_is_truncated_and_next_append_is_clean(self, tmp_path):
+        target, journal = self._paths(tmp_path)
+        journal.write_text('{"key":"2024/01/01-10:00","entry":{"balance":1.0}}\n{"key":"2024/01/01-11', encoding='utf-8')
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            history = load_balance_history()
+            history["2024/01/01-12:00"] = {"balance": 3.0}
+            append_balance_entry(history, "2024/01/01-12:00")
+            reloaded = load_balance_history()
+        assert journal.read_text().count("\n") == 2
+        assert dict(reloaded) == {"2024/01/01-10:00": {"balance": 1.0}, "2024/01/01-12:00": {"balance": 3.0}}
+
+    def test_complete_but_unterminated_tail_is_kept(self, tmp_path):
+        target, journal = self._paths(tmp_path)
+        journal.write_text('{"key":"2024/01/01-10:00","entry":{"balance":1.0}}', encoding='utf-8')
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            assert dict(load_balance_history()) == {"2024/01/01-10:00": {"balance": 1.0}}
+        assert journal.read_text().endswith("}\n")
+
+    def test_save_keeps_previous_snapshot_and_journal(self, tmp_path):
+        target, journal = self._paths(tmp_path)
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            save_balance_history({"2024/01/01-10:00": {"balance": 1.0}})
+            history = {"2024/01/01-10:00": {"balance": 1.0}, "2024/01/01-11:00": {"balance": 2.0}}
+            append_balance_entry(history, "2024/01/01-11:00")
+            save_balance_history(history)
+        assert json.loads((tmp_path / "balance_history.json.bak").read_text())["entries"] == {
+            "2024/01/01-10:00": {"balance": 1.0},
+        }
+        assert (tmp_path / "balance_history.journal.prev").exists()
+        assert not journal.exists()
+        assert not (tmp_path / "balance_history.json.tmp").exists()
+
+    def test_corrupt_snapshot_quarantined_and_recovered_from_backup(self, tmp_path):
+        target, journal = self._paths(tmp_path)
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            save_balance_history({"2024/01/01-10:00": {"balance": 1.0}})
+            history = {"2024/01/01-10:00": {"balance": 1.0}, "2024/01/01-11:00": {"balance": 2.0}}
+            append_balance_entry(history, "2024/01/01-11:00")
+            save_balance_history(history)
+            history["2024/01/01-12:00"] = {"balance": 3.0}
+            append_balance_entry(history, "2024/01/01-12:00")
+            target.write_text("{truncated", encoding='utf-8')
+            recovered = load_balance_history()
+        assert dict(recovered) == history
+        assert len(list(tmp_path.glob("balance_history.json.corrupt-*"))) == 1
+
+    def test_interrupted_save_recovers_from_backup_and_journal(self, tmp_path):
+        target, journal = self._paths(tmp_path)
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            history = {"2024/01/01-10:00": {"balance": 1.0}}
+            append_balance_entry(history, "2024/01/01-10:00")
+            save_balance_history(history)
+            save_balance_history(history)
+            history["2024/01/01-11:00"] = {"balance": 2.0}
+            append_balance_entry(history, "2024/01/01-11:00")
+            # Crash after the live snapshot was moved to .bak, before the new one landed
+            os.replace(target, str(target) + ".bak")
+            prev = tmp_path / "balance_history.journal.prev"
+            os.utime(prev, (0, 0))
+            recovered = load_balance_history()
+        assert dict(recovered) == history
+
+    def test_no_backup_gives_empty_history_plus_journal(self, tmp_path):
+        target, journal = self._paths(tmp_path)
+        target.write_text("{oops", encoding='utf-8')
+        journal.write_text('{"key":"2024/01/01-10:00","entry":{"balance":1.0}}\n', encoding='utf-8')
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            assert dict(load_balance_history()) == {"2024/01/01-10:00": {"balance": 1.0}}
+
+    def test_journal_and_snapshot_writes_are_fsynced(self, tmp_path):
+        target, _ = self._paths(tmp_path)
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)), \
+             patch('services.history.os.fsync') as mock_fsync:
+            append_balance_entry({"2024/01/01-10:00": {"balance": 1.0}}, "2024/01/01-10:00")
+            assert mock_fsync.call_count == 1
+            save_balance_history({"2024/01/01-10:00": {"balance": 1.0}})
+        # Snapshot file plus its directory
+        assert mock_fsync.call_count == 3
+
+
+# ---------------------------------------------------------------------------
+# Streaming loader (newest-first snapshot, recent window, background load)
+# ---------------------------------------------------------------------------
+
+def _hours_ago(hours: int) -> str:
+    dt = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours)
+    return f"{dt.year}/{dt.month:02d}/{dt.day:02d}-{dt.hour:02d}:{dt.minute:02d}"
+
+
+class TestStreamingLoader:
+    def _save(self, target, entries):
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            save_balance_history(BalanceHistory(entries))
+
+    def test_snapshot_is_newest_first_one_entry_per_line(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        self._save(target, {"2024/01/01-10:00": {"balance": 1.0}, "2024/01/01-11:00": {"balance": 2.0}})
+        lines = target.read_text().splitlines()
+        assert lines[1].startswith('"2024/01/01-11:00"')
+        assert lines[2].startswith('"2024/01/01-10:00"')
+
+    def test_small_read_chunks_roundtrip(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        entries = {f"2024/01/01-{h:02d}:00": {"balance": 1000.125 + h, "ram_percent": 12.5} for h in range(24)}
+        self._save(target, entries)
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)), \
+             patch('services.history.SNAPSHOT_READ_CHARS', 7), \
+             patch('services.history.SNAPSHOT_CHUNK_RECORDS', 5):
+            loaded = load_balance_history()
+        assert dict(loaded.items()) == entries
+        assert list(loaded) == sorted(entries)
+
+    def test_indented_oldest_first_snapshot_still_loads(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        entries = {"2024/01/01-10:00": {"balance": 1.0}, "2024/01/01-11:00": {"balance": 2.0}}
+        target.write_text(json.dumps({"schema_version": HISTORY_SCHEMA_VERSION, "entries": entries}, indent=2))
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            loaded = load_balance_history(recent_hours=48)
+        assert loaded.ready.is_set()
+        assert dict(loaded.items()) == entries
+
+    def test_recent_window_first_then_background(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        entries = {_hours_ago(h): {"balance": float(h)} for h in (1, 2, 100, 200)}
+        self._save(target, entries)
+        gate = threading.Event()
+        real_load_records = __import__('services.history', fromlist=['_load_records'])._load_records
+
+        def gated_load_records(history, records, stop_before=None):
+            if stop_before is None:
+                gate.wait(5)
+            return real_load_records(history, records, stop_before)
+
+        lock = threading.Lock()
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)), \
+             patch('services.history._load_records', side_effect=gated_load_records):
+            loaded = load_balance_history(recent_hours=48, lock=lock)
+            assert set(loaded) == {_hours_ago(1), _hours_ago(2)}
+            assert not loaded.ready.is_set()
+            gate.set()
+            assert loaded.ready.wait(5)
+        assert dict(loaded.items()) == {key: entries[key] for key in sorted(entries)}
+        assert loaded.load_metrics["full_load_seconds"] >= loaded.load_metrics["recent_load_seconds"]
+
+    def test_journal_wins_over_older_snapshot_rows(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        old_key = _hours_ago(100)
+        self._save(target, {old_key: {"balance": 1.0}, _hours_ago(1): {"balance": 2.0}})
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            append_balance_entry({old_key: {"balance": 9.0}}, old_key)
+            loaded = load_balance_history(recent_hours=48)
+            assert loaded.ready.wait(5)
+        assert loaded[old_key] == {"balance": 9.0}
+
+    def test_save_deferred_while_loading(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        history = BalanceHistory({"2024/01/01-10:00": {"balance": 1.0}})
+        history.ready.clear()
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            save_balance_history(history)
+        assert not target.exists()
+
+    def test_full_load_metrics_without_background(self, tmp_path):
+        with patch('services.history.BALANCE_HISTORY_FILE', str(tmp_path / "missing.json")):
+            loaded = load_balance_history(recent_hours=48)
+        assert loaded.ready.is_set()
+        assert loaded.load_metrics["full_load_seconds"] == loaded.load_metrics["recent_load_seconds"]
+
+
+class TestBalanceHistoryFromColumns:
+    def test_builds_rows_from_buffers(self):
+        ts = array('d', [datetime_to_epoch(datetime(2024, 1, 1, 10)), datetime_to_epoch(datetime(2024, 1, 1, 11))])
+        history = BalanceHistory.from_columns(
+            ts, array('d', [1.0, 2.0]), array('d', [40.0, float('nan')]), array('d', [float('nan'), 50.0]),
+        )
+        assert dict(history) == {
+            "2024/01/01-10:00": {"balance": 1.0, "temperature_avg": 40.0},
+            "2024/01/01-11:00": {"balance": 2.0, "ram_percent": 50.0},
+        }
+
+
+class TestBalanceHistoryDeleteBefore:
+    def test_removes_rows_and_rollups(self):
+        history = BalanceHistory({
+            "2024/01/01-00:00": {"balance": 1.0, "balance_min": 0.5, "balance_max": 1.5, "samples": 2},
+            "2024/01/02-10:00": {"balance": 2.0},
+            "2024/02/01-10:00": {"balance": 3.0},
+        })
+        view = history.columns()["balance"]
+        assert history.delete_before(datetime(2024, 2, 1)) == 2
+        assert dict(history) == {"2024/02/01-10:00": {"balance": 3.0}}
+        assert list(view) == [1.0, 2.0, 3.0]
+
+    def test_nothing_before(self):
+        history = BalanceHistory({"2024/02/01-10:00": {"balance": 3.0}})
+        assert history.delete_before(datetime(2024, 1, 1)) == 0
+        assert len(history) == 1
+
+
+class TestBalanceHistoryMergeOlder:
+    def test_update_prepends_older_rows(self):
+        history = BalanceHistory({"2024/01/02-10:00": {"balance": 2.0}})
+        view = history.columns()["balance"]
+        history.update({"2024/01/01-10:00": {"balance": 1.0}, "2024/01/01-11:00": {"balance": 1.5}})
+        assert list(history.columns()["balance"]) == [1.0, 1.5, 2.0]
+        assert list(view) == [2.0]
+
+    def test_existing_rows_win(self):
+        history = BalanceHistory({"2024/01/01-12:00": {"balance": 9.0}, "2024/01/02-10:00": {"balance": 2.0}})
+        older = BalanceHistory({
+            "2024/01/01-10:00": {"balance": 1.0, "balance_min": 0.5, "balance_max": 1.5, "samples": 2},
+            "2024/01/01-12:00": {"balance": 3.0},
+            "2024/01/01-13:00": {"balance": 4.0},
+        })
+        history.merge_older(older, history.generation)
+        assert dict(history.items()) == {
+            "2024/01/01-10:00": {"balance": 1.0, "balance_min": 0.5, "balance_max": 1.5, "samples": 2},
+            "2024/01/01-12:00": {"balance": 9.0},
+            "2024/01/01-13:00": {"balance": 4.0},
+            "2024/01/02-10:00": {"balance": 2.0},
+        }
+
+    def test_live_columns_are_not_changed_in_place(self):
+        history = BalanceHistory({"2024/01/01-12:00": {"balance": 9.0}, "2024/01/02-10:00": {"balance": 2.0}})
+        balances = history._balance
+        history.merge_older(BalanceHistory({"2024/01/01-13:00": {"balance": 4.0}}), history.generation)
+        assert list(balances) == [9.0, 2.0]
+        assert list(history.columns()["balance"]) == [9.0, 4.0, 2.0]
+
+    def test_stale_generation_is_dropped(self):
+        history = BalanceHistory({"2024/01/02-10:00": {"balance": 2.0}})
+        generation = history.generation
+        history.clear()
+        history.merge_older(BalanceHistory({"2024/01/01-10:00": {"balance": 1.0}}), generation)
+        assert len(history) == 0
+
+
+class TestBalanceHistoryCopy:
+    ENTRIES = {
+        "2024/01/01-00:00": {"balance": 1.0, "balance_min": 0.5, "balance_max": 1.5, "samples": 2},
+        "2024/01/02-10:00": {"balance": 2.0, "temperature_avg": 40.0},
+        "legacy": {"balance": 0.0},
+    }
+
+    def test_copy_is_independent(self):
+        history = BalanceHistory(self.ENTRIES)
+        copy = history.copy()
+        history["2024/01/03-10:00"] = {"balance": 3.0}
+        del history["legacy"]
+        assert dict(copy.items()) == self.ENTRIES
+
+    def test_window_drops_rollups_and_unindexed_outside(self):
+        copy = BalanceHistory(self.ENTRIES).copy(datetime(2024, 1, 2))
+        assert dict(copy.items()) == {"2024/01/02-10:00": {"balance": 2.0, "temperature_avg": 40.0}}
+
+    def test_replace_with_swaps_rows(self):
+        history = BalanceHistory(self.ENTRIES)
+        version = history.version
+        working = history.copy()
+        working.delete_before(datetime(2024, 1, 2))
+        working.run_settings = {'min_length': 4}
+        history.replace_with(working)
+        assert list(history) == ["2024/01/02-10:00", "legacy"]
+        assert history.run_settings == {'min_length': 4}
+        assert history.version > version
+
+    def test_copy_window_of_plain_dict(self):
+        copy = copy_window(dict(self.ENTRIES), datetime(2024, 1, 2))
+        assert isinstance(copy, BalanceHistory)
+        assert list(copy) == ["2024/01/02-10:00"]
+        assert list(copy_window(dict(self.ENTRIES))) == list(self.ENTRIES)
+
+
+class TestRebuildAside:
+    def test_rebuilds_a_copy_and_swaps_it_in(self):
+        history = BalanceHistory(TestBalanceHistoryCopy.ENTRIES)
+        lock = threading.Lock()
+        seen = []
+
+        def rebuild(working):
+            assert working is not history
+            assert not lock.locked()
+            seen.append(len(history))
+            return working.delete_before(datetime(2024, 1, 2))
+
+        assert rebuild_aside(history, lock, rebuild) == 1
+        assert seen == [3]
+        assert list(history) == ["2024/01/02-10:00", "legacy"]
+
+    def test_unchanged_copy_is_not_swapped_in(self):
+        history = BalanceHistory(TestBalanceHistoryCopy.ENTRIES)
+        version = history.version
+        assert rebuild_aside(history, threading.Lock(), lambda working: 0) == 0
+        assert history.version == version
+
+    def test_concurrent_write_restarts_then_runs_in_place(self):
+        history = BalanceHistory(TestBalanceHistoryCopy.ENTRIES)
+        calls = []
+
+        def rebuild(working):
+            calls.append(working is history)
+            if working is not history:
+                # A snapshot recorded meanwhile makes the copy stale
+                history[make_time_key(datetime(2024, 1, 3, len(calls)))] = {"balance": 9.0}
+            return working.delete_before(datetime(2024, 1, 2))
+
+        assert rebuild_aside(history, threading.Lock(), rebuild, attempts=2) == 1
+        assert calls == [False, False, True]
+        assert list(history)[:3] == ["2024/01/02-10:00", "2024/01/03-01:00", "2024/01/03-02:00"]
+
+    def test_other_stores_change_in_place(self):
+        history = dict(TestBalanceHistoryCopy.ENTRIES)
+        assert rebuild_aside(history, threading.Lock(), lambda working: working is history)
+
+
+# ---------------------------------------------------------------------------
+# query_history / parse_duration
+# ---------------------------------------------------------------------------
+
+class TestParseDuration:
+    @pytest.mark.parametrize("text, expected", [
+        ("30m", timedelta(minutes=30)),
+        ("1h", timedelta(hours=1)),
+        ("7D", timedelta(days=7)),
+        ("2w", timedelta(weeks=2)),
+    ])
+    def test_valid(self, text, expected):
+        assert parse_duration(text) == expected
+
+    @pytest.mark.parametrize("text", ["", "h", "0h", "1y", "1.5h", "-1h", "abc"])
+    def test_invalid(self, text):
+        assert parse_duration(text) is None
+
+
+class TestQueryHistory:
+    def _history(self):
+        return BalanceHistory({
+            "2024/01/01-10:00": {"balance": 1.0, "temperature_avg": 40.0},
+            "2024/01/01-10:30": {"balance": 3.0, "temperature_avg": 50.0, "ram_percent": 20.0},
+            "2024/01/01-11:15": {"balance": 2.0},
+            # Hourly aggregate of four samples
+            "2024/01/01-12:00": {"balance": 5.0, "balance_min": 4.0, "balance_max": 7.0, "samples": 4},
+        })
+
+    def test_hourly_average(self):
+        result = query_history(self._history(), step=timedelta(hours=1))
+        assert dict(result) == {
+            "2024/01/01-10:00": {"balance": 2.0, "temperature_avg": 45.0, "ram_percent": 20.0,
+                                 "balance_min": 1.0, "balance_max": 3.0, "samples": 2},
+            "2024/01/01-11:00": {"balance": 2.0, "balance_min": 2.0, "balance_max": 2.0, "samples": 1},
+            "2024/01/01-12:00": {"balance": 5.0, "balance_min": 4.0, "balance_max": 7.0, "samples": 4},
+        }
+
+    def test_daily_buckets_weight_aggregates(self):
+        result = query_history(self._history(), step=timedelta(days=1))
+        entry = result["2024/01/01-00:00"]
+        assert entry["balance"] == pytest.approx((1.0 + 3.0 + 2.0 + 5.0 * 4) / 7)
+        assert (entry["balance_min"], entry["balance_max"], entry["samples"]) == (1.0, 7.0, 7)
+
+    @pytest.mark.parametrize("agg, balance, temperature", [
+        ("min", 1.0, 40.0), ("max", 3.0, 50.0), ("last", 3.0, 50.0),
+    ])
+    def test_aggregates(self, agg, balance, temperature):
+        entry = query_history(self._history(), step=timedelta(hours=1), agg=agg)["2024/01/01-10:00"]
+        assert entry["balance"] == balance
+        assert entry["temperature_avg"] == temperature
+
+    def test_window(self):
+        result = query_history(self._history(), datetime(2024, 1, 1, 10, 30), datetime(2024, 1, 1, 12),
+                               step=timedelta(minutes=30))
+        assert list(result) == ["2024/01/01-10:30", "2024/01/01-11:00"]
+
+    def test_plain_dict_matches_columnar(self):
+        history = self._history()
+        step = timedelta(hours=2)
+        assert dict(query_history(dict(history.items()), step=step)) == dict(query_history(history, step=step))
+
+    def test_without_step_returns_raw_window(self):
+        result = query_history(self._history(), datetime(2024, 1, 1, 11))
+        assert isinstance(result, BalanceHistory)
+        assert list(result) == ["2024/01/01-11:15", "2024/01/01-12:00"]
+
+    def test_empty(self):
+        assert len(query_history(BalanceHistory(), step=timedelta(hours=1))) == 0
+
+    def test_invalid_arguments(self):
+        with pytest.raises(ValueError):
+            query_history(self._history(), agg="median")
+        with pytest.raises(ValueError):
+            query_history(self._history(), step=timedelta(seconds=90))
+
+
+# ---------------------------------------------------------------------------
+# HistoryRecord / iter_records
+# ---------------------------------------------------------------------------
+
+class TestHistoryRecord:
+    def test_entry_round_trip(self):
+        entry = {"balance": 5.0, "temperature_avg": 40.0, "balance_min": 4.0, "balance_max": 7.0, "samples": 4}
+        record = HistoryRecord.from_entry(datetime(2024, 1, 1, 10), entry)
+        assert record.key == "2024/01/01-10:00"
+        assert record.rollup == (4.0, 7.0, 4)
+        assert record.ram_percent is None
+        assert record.to_entry() == entry
+
+    def test_reads_like_an_entry(self):
+        record = HistoryRecord(datetime(2024, 1, 1, 10), 100.0, temperature_avg=45.0)
+        assert record["balance"] == 100.0
+        assert "temperature_avg" in record and "ram_percent" not in record
+        assert record.get("ram_percent", 0.0) == 0.0
+        assert get_entry_temperature(record) == 45.0
+        assert get_entry_rollup(record) is None
+        assert format_history_entry(record.key, record) == "2024/01/01-10:00: Balance 100.00, Temp 45.0°C"
+        with pytest.raises(KeyError):
+            record["ram_percent"]
+
+    def test_immutable_and_hashable(self):
+        record = HistoryRecord(datetime(2024, 1, 1, 10), 1.0)
+        with pytest.raises(AttributeError):
+            record.balance = 2.0
+        assert not hasattr(record, '__dict__')
+        assert dataclasses.replace(record, balance=2.0).balance == 2.0
+        assert {record, HistoryRecord(datetime(2024, 1, 1, 10), 1.0)} == {record}
+        assert pickle.loads(pickle.dumps(record)) == record
+
+    def test_from_record(self):
+        record = HistoryRecord(datetime(2024, 1, 1, 10), 1.0, ram_percent=50.0)
+        assert HistoryRecord.from_entry(datetime(2024, 1, 1, 10), record) is record
+        moved = HistoryRecord.from_entry(datetime(2024, 1, 1, 11), record)
+        assert (moved.key, moved.to_entry()) == ("2024/01/01-11:00", {"balance": 1.0, "ram_percent": 50.0})
+
+    def test_json_round_trip_through_snapshot_and_journal(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        history = {
+            "2024/01/01-10:00": HistoryRecord(datetime(2024, 1, 1, 10), 1.0, ram_percent=50.0),
+            "2024/01/01-11:00": HistoryRecord(datetime(2024, 1, 1, 11), 2.0),
+        }
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            save_balance_history({"2024/01/01-10:00": history["2024/01/01-10:00"]})
+            append_balance_entry(history, "2024/01/01-11:00")
+            loaded = load_balance_history()
+        assert dict(loaded) == {key: record.to_entry() for key, record in history.items()}
+
+    def test_balance_history_stores_records_as_columns(self):
+        history = BalanceHistory()
+        history["2024/01/01-10:00"] = HistoryRecord(datetime(2024, 1, 1, 10), 3.0, 40.0, samples=2,
+                                                    balance_min=1.0, balance_max=5.0)
+        assert history["2024/01/01-10:00"] == {"balance": 3.0, "temperature_avg": 40.0,
+                                               "balance_min": 1.0, "balance_max": 5.0, "samples": 2}
+
+
+class TestIterRecords:
+    ENTRIES = {
+        "2024/01/01-11:00": {"balance": 2.0, "ram_percent": 60.0},
+        "2024/01/01-10:00": {"balance": 1.0, "temperature_avg": 40.0},
+        "2024/01/01-12:00": {"balance": 3.0, "balance_min": 2.0, "balance_max": 4.0, "samples": 3},
+    }
+
+    def test_columnar_and_plain_dict_agree(self):
+        columnar = list(iter_records(BalanceHistory(self.ENTRIES)))
+        assert list(iter_records(self.ENTRIES)) == columnar
+        assert [record.key for record in columnar] == ["2024/01/01-10:00", "2024/01/01-11:00", "2024/01/01-12:00"]
+        assert columnar[0] == HistoryRecord(datetime(2024, 1, 1, 10), 1.0, temperature_avg=40.0)
+        assert columnar[2].rollup == (2.0, 4.0, 3)
+
+    def test_window(self):
+        records = iter_records(BalanceHistory(self.ENTRIES), datetime(2024, 1, 1, 11), datetime(2024, 1, 1, 12))
+        assert [record.balance for record in records] == [2.0]
+
+    def test_skips_non_canonical_keys(self):
+        history = {"junk": {"balance": 9.0}, "2024/01/01-11:00": {"balance": 5.0}}
+        assert [record.to_entry() for record in iter_records(history)] == [{"balance": 5.0}]
+
+
+class TestHistoryRecordMemory:
+    """Memory benchmark: 100k snapshots as records versus key strings plus entry dicts."""
+
+    COUNT = 100_000
+
+    @staticmethod
+    def _allocated(build) -> int:
+        """Return the bytes still allocated by the objects *build* returns."""
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            objects = build()
+            allocated = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+        del objects
+        return allocated
+
+    def test_records_smaller_than_dicts_at_100k(self):
+        times = [datetime(2020, 1, 1) + timedelta(minutes=i) for i in range(self.COUNT)]
+        dict_bytes = self._allocated(lambda: [
+            (make_time_key(dt), {"balance": 1000.0 + i, "temperature_avg": 40.0 + i % 7, "ram_percent": 50.0 + i % 5})
+            for i, dt in enumerate(times)
+        ]) - self.COUNT * sys.getsizeof((None, None))
+        # The timestamps are shared with the dict side: count a datetime per record on top
+        record_bytes = self._allocated(lambda: [
+            HistoryRecord(dt, 1000.0 + i, 40.0 + i % 7, 50.0 + i % 5) for i, dt in enumerate(times)
+        ]) + self.COUNT * sys.getsizeof(times[0])
+        # CPython 3.11 allocates ~215 bytes per record against ~330 per key string and entry dict
+        assert record_bytes < dict_bytes * 0.75
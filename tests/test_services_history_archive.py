@@ -0,0 +1,190 @@
+"""Tests for src/services/history_archive.py."""
+import gzip
+import json
+import lzma
+import pytest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+from services.history import BalanceHistory, datetime_to_epoch
+from services.history_archive import (
+    archive_span, archived_items_between, clear_archive, collect_archivable, get_manifest_path,
+    history_with_archive, read_manifest, read_segment, remove_archived, write_archive,
+)
+
+
+NOW = datetime(2024, 6, 15, 12, 0)
+
+
+@pytest.fixture
+def archive_dir(tmp_path):
+    path = tmp_path / "config" / "history"
+    with patch('services.history_archive.HISTORY_ARCHIVE_DIR', str(path)):
+        yield path
+
+
+def _history():
+    # Two entries per month from January to June 2024
+    return BalanceHistory({
+        f"2024/{month:02d}/{day:02d}-10:00": {"balance": float(month * 10 + day)}
+        for month in range(1, 7) for day in (1, 20)
+    })
+
+
+def _archive(history, compression='gzip'):
+    boundary, months = collect_archivable(history, hot_days=90, now=NOW)
+    write_archive(months, compression=compression)
+    remove_archived(history, boundary, months)
+    return boundary, months
+
+
+class TestCollectArchivable:
+    def test_only_closed_months_older_than_hot_days(self):
+        boundary, months = collect_archivable(_history(), hot_days=90, now=NOW)
+        # 90 days before June 15 is March 17: January and February are closed
+        assert boundary == datetime(2024, 3, 1)
+        assert sorted(months) == ["2024-01", "2024-02"]
+        assert [key for key, _ in months["2024-01"]] == ["2024/01/01-10:00", "2024/01/20-10:00"]
+
+    def test_nothing_to_archive(self):
+        _, months = collect_archivable(_history(), hot_days=365, now=NOW)
+        assert months == {}
+
+    def test_reads_through_the_range_query(self):
+        history = MagicMock()
+        history.items_between.return_value = [
+            (datetime(2024, 1, 1, 10), "2024/01/01-10:00", {"balance": 1.0}),
+        ]
+        boundary, months = collect_archivable(history, hot_days=90, now=NOW)
+        history.items_between.assert_called_once_with(None, boundary)
+        assert months == {"2024-01": [("2024/01/01-10:00", {"balance": 1.0})]}
+
+
+class TestWriteArchive:
+    def test_segments_and_manifest(self, archive_dir):
+        history = _history()
+        _archive(history)
+        assert sorted(p.name for p in archive_dir.iterdir()) == [
+            "2024-01.jsonl.gz", "2024-02.jsonl.gz", "manifest.json",
+        ]
+        segments = read_manifest()
+        assert [s["month"] for s in segments] == ["2024-01", "2024-02"]
+        first = segments[0]
+        assert first["count"] == 2
+        assert first["start"] == datetime_to_epoch(datetime(2024, 1, 1, 10))
+        assert first["end"] == datetime_to_epoch(datetime(2024, 1, 20, 10))
+        assert first["balance_min"] == 11.0
+        assert first["balance_max"] == 30.0
+        assert first["balance_avg"] == pytest.approx(20.5)
+        assert first["balance_first"] == 11.0
+        assert first["balance_last"] == 30.0
+        assert first["samples"] == 2
+        with gzip.open(archive_dir / "2024-01.jsonl.gz", 'rt') as f:
+            assert json.loads(f.readline()) == {"key": "2024/01/01-10:00", "entry": {"balance": 11.0}}
+
+    def test_archived_entries_leave_hot_history(self, archive_dir):
+        history = _history()
+        _archive(history)
+        assert len(history) == 8
+        assert min(history) == "2024/03/01-10:00"
+
+    def test_lzma(self, archive_dir):
+        _archive(_history(), compression='lzma')
+        segment = read_manifest()[0]
+        assert segment["file"] == "2024-01.jsonl.xz"
+        with lzma.open(archive_dir / segment["file"], 'rt') as f:
+            assert len(f.readlines()) == 2
+
+    def test_unknown_compression_falls_back_to_gzip(self, archive_dir):
+        with patch('services.history_archive.logging') as mock_logging:
+            _archive(_history(), compression='zip')
+        mock_logging.error.assert_called_once()
+        assert read_manifest()[0]["file"] == "2024-01.jsonl.gz"
+
+    def test_existing_segment_is_merged(self, archive_dir):
+        _archive(_history())
+        # The same month shows up again (e.g. crash before the trimmed history was saved)
+        write_archive({"2024-01": [("2024/01/01-10:00", {"balance": 99.0}),
+                                   ("2024/01/25-10:00", {"balance": 5.0})]})
+        segment = read_manifest()[0]
+        assert segment["count"] == 3
+        assert read_segment(segment) == [
+            ("2024/01/01-10:00", {"balance": 99.0}),
+            ("2024/01/20-10:00", {"balance": 30.0}),
+            ("2024/01/25-10:00", {"balance": 5.0}),
+        ]
+
+    def test_separate_directory(self, archive_dir):
+        other = archive_dir / "AU1second"
+        history = _history()
+        boundary, months = collect_archivable(history, hot_days=90, now=NOW)
+        assert write_archive(months, directory=str(other)) == 4
+        assert read_manifest() == []
+        assert [segment["month"] for segment in read_manifest(str(other))] == ["2024-01", "2024-02"]
+        assert len(history_with_archive(history, directory=str(other))) == 12
+
+    def test_empty_months(self, archive_dir):
+        assert write_archive({}) == 0
+        assert not archive_dir.exists()
+
+
+class TestArchiveQueries:
+    def test_only_overlapping_segments_are_opened(self, archive_dir):
+        _archive(_history())
+        with patch('services.history_archive.read_segment', wraps=read_segment) as mock_read:
+            items = archived_items_between(datetime(2024, 2, 1), datetime(2024, 2, 10))
+        assert [key for _, key, _ in items] == ["2024/02/01-10:00"]
+        assert [call.args[0]["month"] for call in mock_read.call_args_list] == ["2024-02"]
+
+    def test_unbounded_window(self, archive_dir):
+        _archive(_history())
+        assert len(archived_items_between(None, None)) == 4
+
+    def test_history_with_archive(self, archive_dir):
+        history = _history()
+        _archive(history)
+        combined = history_with_archive(history)
+        assert len(combined) == 12
+        window = history_with_archive(history, datetime(2024, 2, 15), datetime(2024, 3, 15))
+        assert list(window) == ["2024/02/20-10:00", "2024/03/01-10:00"]
+
+    def test_archive_span(self, archive_dir):
+        assert archive_span() is None
+        _archive(_history())
+        assert archive_span() == (datetime(2024, 1, 1, 10), datetime(2024, 2, 20, 10))
+
+    def test_unreadable_segment_is_skipped(self, archive_dir):
+        _archive(_history())
+        (archive_dir / "2024-01.jsonl.gz").write_bytes(b"not gzip")
+        with patch('services.history_archive.logging') as mock_logging:
+            items = archived_items_between(None, None)
+        mock_logging.error.assert_called_once()
+        assert [key for _, key, _ in items] == ["2024/02/01-10:00", "2024/02/20-10:00"]
+
+    def test_corrupt_manifest(self, archive_dir):
+        archive_dir.mkdir(parents=True)
+        (archive_dir / "manifest.json").write_text("{")
+        with patch('services.history_archive.logging') as mock_logging:
+            assert read_manifest() == []
+        mock_logging.error.assert_called_once()
+
+
+class TestRemoveArchived:
+    def test_plain_dict(self):
+        history = {"2024/01/01-10:00": {"balance": 1.0}, "2024/05/01-10:00": {"balance": 2.0}}
+        months = {"2024-01": [("2024/01/01-10:00", {"balance": 1.0})]}
+        assert remove_archived(history, datetime(2024, 3, 1), months) == 1
+        assert list(history) == ["2024/05/01-10:00"]
+
+
+class TestClearArchive:
+    def test_removes_segments_and_manifest(self, archive_dir):
+        _archive(_history())
+        clear_archive()
+        assert list(archive_dir.iterdir()) == []
+        assert read_manifest() == []
+
+    def test_no_archive(self, archive_dir):
+        clear_archive()
+        assert not (archive_dir / "manifest.json").exists()
+        assert get_manifest_path().endswith("manifest.json")
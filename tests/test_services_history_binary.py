@@ -0,0 +1,204 @@
+"""Tests for src/services/history_binary.py."""
+import json
+import pickle
+import struct
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from services.history import append_balance_entry, load_balance_history, save_balance_history
+from services.history_binary import (
+    BinaryBalanceHistory, BinarySnapshot, binary_to_json, json_to_binary,
+    load_binary_history, write_binary_history,
+)
+
+
+ENTRIES = {
+    "2024/01/01-10:00": {"balance": 100.5, "temperature_avg": 45.3, "ram_percent": 62.1},
+    "2024/01/01-11:00": {"balance": 101.25},
+    "2024/01/02-10:00": {"balance": 102.0, "temperature_avg": 50.0},
+}
+
+
+@pytest.fixture
+def paths(tmp_path):
+    json_path = tmp_path / "config" / "balance_history.json"
+    bin_path = tmp_path / "config" / "balance_history.bin"
+    with patch('services.history.BALANCE_HISTORY_FILE', str(json_path)), \
+         patch('services.history_binary.HISTORY_BINARY_FILE', str(bin_path)):
+        yield json_path, bin_path
+
+
+class TestWriteBinaryHistory:
+    def test_layout(self, paths):
+        _, bin_path = paths
+        assert write_binary_history(ENTRIES) == 3
+        data = bin_path.read_bytes()
+        assert data[:4] == b'RBHF'
+        assert struct.unpack_from('<HH', data, 4) == (1, 24)
+        assert len(data) == 16 + 3 * 24
+        ts, balance, temperature, ram = struct.unpack_from('<qdff', data, 16)
+        assert datetime(1970, 1, 1) + timedelta(seconds=ts) == datetime(2024, 1, 1, 10)
+        assert balance == 100.5
+        assert temperature == pytest.approx(45.3, abs=1e-5)
+        assert ram == pytest.approx(62.1, abs=1e-5)
+        assert not bin_path.with_suffix('.bin.tmp').exists()
+
+    def test_records_sorted_and_invalid_keys_skipped(self, paths):
+        write_binary_history({"2024/01/02-10:00": {"balance": 2.0}, "junk": {"balance": 0.0},
+                              "2024/01/01-10:00": {"balance": 1.0}})
+        with BinarySnapshot() as snapshot:
+            assert list(snapshot) == ["2024/01/01-10:00", "2024/01/02-10:00"]
+
+    def test_rollups_keep_their_average(self, paths):
+        write_binary_history({"2024/01/01-00:00": {"balance": 5.0, "balance_min": 1.0,
+                                                   "balance_max": 9.0, "samples": 3}})
+        with BinarySnapshot() as snapshot:
+            assert snapshot["2024/01/01-00:00"] == {"balance": 5.0}
+
+class TestBinarySnapshot:
+    def test_mapping(self, paths):
+        write_binary_history(ENTRIES)
+        with BinarySnapshot() as snapshot:
+            assert len(snapshot) == 3
+            assert dict(snapshot) == ENTRIES
+            assert "2024/01/01-12:00" not in snapshot
+            assert "junk" not in snapshot
+
+    def test_window_queries(self, paths):
+        write_binary_history(ENTRIES)
+        with BinarySnapshot() as snapshot:
+            assert snapshot.count_between(datetime(2024, 1, 1, 11), None) == 2
+            items = snapshot.items_between(datetime(2024, 1, 1, 11), datetime(2024, 1, 2))
+            assert items == [(datetime(2024, 1, 1, 11), "2024/01/01-11:00", {"balance": 101.25})]
+
+    def test_columns_are_views(self, paths):
+        write_binary_history(ENTRIES)
+        with BinarySnapshot() as snapshot:
+            cols = snapshot.columns(datetime(2024, 1, 1, 11))
+            assert list(cols['balance']) == [101.25, 102.0]
+            assert cols['balance'].base is not None
+            assert not cols['balance'].flags.writeable
+            del cols
+
+    def test_bad_header(self, paths):
+        _, bin_path = paths
+        bin_path.parent.mkdir(parents=True)
+        bin_path.write_bytes(b'NOPE' + bytes(12))
+        with pytest.raises(ValueError):
+            BinarySnapshot()
+
+
+class TestLoadBinaryHistory:
+    def test_loads_columns_and_replays_journal(self, paths):
+        write_binary_history(ENTRIES)
+        history = load_binary_history()
+        history["2024/01/03-10:00"] = {"balance": 103.0}
+        append_balance_entry(history, "2024/01/03-10:00")
+
+        reloaded = load_balance_history('binary')
+        assert isinstance(reloaded, BinaryBalanceHistory)
+        assert dict(reloaded) == {**ENTRIES, "2024/01/03-10:00": {"balance": 103.0}}
+
+    def test_snapshot_written_as_binary(self, paths):
+        json_path, bin_path = paths
+        history = load_binary_history()
+        history.update(ENTRIES)
+        save_balance_history(history)
+        assert not json_path.exists()
+        with BinarySnapshot() as snapshot:
+            assert len(snapshot) == 3
+
+    def test_first_use_converts_json(self, paths):
+        json_path, _ = paths
+        json_path.parent.mkdir(parents=True)
+        json_path.write_text(json.dumps({"schema_version": 2, "entries": ENTRIES}))
+        history = load_binary_history()
+        assert dict(history) == ENTRIES
+        assert not json_path.exists()
+        assert json_path.with_suffix('.json.imported').exists()
+
+    def test_corrupt_file_is_quarantined(self, paths):
+        _, bin_path = paths
+        bin_path.parent.mkdir(parents=True)
+        bin_path.write_bytes(b'garbage')
+        with patch('services.history_binary.logging') as mock_logging:
+            history = load_binary_history()
+        mock_logging.error.assert_called_once()
+        assert len(history) == 0
+        assert not bin_path.exists()
+        assert list(bin_path.parent.glob("balance_history.bin.corrupt-*"))
+
+    def test_empty(self, paths):
+        assert len(load_binary_history()) == 0
+
+
+class TestMappedQueries:
+    @pytest.fixture
+    def history(self, paths):
+        write_binary_history(ENTRIES)
+        history = load_binary_history()
+        history["2024/01/03-10:00"] = {"balance": 103.0}
+        yield history
+        history.clear()
+
+    def test_snapshot_rows_stay_mapped(self, history):
+        assert history._base is not None
+        assert len(history._ts) == 1
+        assert len(history) == 4
+        assert history["2024/01/01-10:00"] == ENTRIES["2024/01/01-10:00"]
+        assert "2024/01/01-11:00" in history
+        assert "2024/01/01-12:00" not in history
+        assert list(history)[-2:] == ["2024/01/02-10:00", "2024/01/03-10:00"]
+
+    def test_window_queries_span_the_mapping(self, history):
+        start = datetime(2024, 1, 1, 11)
+        assert history.count_between(start, None) == 3
+        assert [key for _, key, _ in history.items_between(start, None)] == [
+            "2024/01/01-11:00", "2024/01/02-10:00", "2024/01/03-10:00"]
+        assert [row[1] for row in history.rows_between(start, None)] == [101.25, 102.0, 103.0]
+        assert list(history.columns(start)['balance']) == [101.25, 102.0, 103.0]
+
+    def test_copy_converts_only_its_window(self, history):
+        copy = history.copy(datetime(2024, 1, 2))
+        assert copy._base is None
+        assert dict(copy) == {"2024/01/02-10:00": ENTRIES["2024/01/02-10:00"],
+                              "2024/01/03-10:00": {"balance": 103.0}}
+
+    def test_overwriting_a_mapped_row_copies_the_base(self, history):
+        history["2024/01/01-11:00"] = {"balance": 1.0}
+        assert history._base is None
+        assert len(history._ts) == 4
+        assert history["2024/01/01-11:00"] == {"balance": 1.0}
+        assert history["2024/01/02-10:00"] == ENTRIES["2024/01/02-10:00"]
+
+    def test_removal_copies_the_base(self, history):
+        assert history.delete_before(datetime(2024, 1, 2)) == 2
+        assert list(history) == ["2024/01/02-10:00", "2024/01/03-10:00"]
+
+    def test_pickles_the_mapped_rows(self, history):
+        restored = pickle.loads(pickle.dumps(history))
+        assert restored._base is None
+        assert dict(restored) == dict(history)
+
+
+class TestConverters:
+    def test_round_trip(self, paths):
+        json_path, _ = paths
+        json_path.parent.mkdir(parents=True)
+        json_path.write_text(json.dumps({"schema_version": 2, "entries": ENTRIES}))
+        assert json_to_binary() == 3
+        assert binary_to_json() == 3
+        assert dict(load_balance_history()) == ENTRIES
+
+    def test_runs_are_expanded(self, paths):
+        json_path, _ = paths
+        json_path.parent.mkdir(parents=True)
+        run = {"balance": 5.0, "run_end": "2024/01/01-03:00", "run_count": 4}
+        json_path.write_text(json.dumps({"schema_version": 2,
+                                         "entries": {"2024/01/01-00:00": run}}))
+        assert json_to_binary() == 4
+        with BinarySnapshot() as snapshot:
+            assert list(snapshot) == ["2024/01/01-00:00", "2024/01/01-01:00", "2024/01/01-02:00",
+                                      "2024/01/01-03:00"]
+            assert snapshot["2024/01/01-02:00"] == {"balance": 5.0}
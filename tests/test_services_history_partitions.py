@@ -0,0 +1,85 @@
+"""Tests for src/services/history_partitions.py."""
+import threading
+import pytest
+from unittest.mock import patch
+
+from services.history import BalanceHistory, load_balance_history, save_balance_history
+from services.history_partitions import (
+    HistoryPartition, HistoryPartitions, parse_addresses, partition_archive_dir, partition_file,
+)
+
+
+ADDRESSES = ["AU1primary", "AU1second", "AU2third"]
+
+
+@pytest.fixture
+def partitions(tmp_path):
+    with patch('services.history.BALANCE_HISTORY_FILE', str(tmp_path / "config" / "balance_history.json")):
+        primary = HistoryPartition(ADDRESSES[0], BalanceHistory(), threading.Lock())
+        partitions = HistoryPartitions(ADDRESSES, primary)
+        yield partitions
+        partitions.stop()
+
+
+class TestParseAddresses:
+    def test_single_and_list(self):
+        assert parse_addresses("AU1a") == ["AU1a"]
+        assert parse_addresses([" AU1a", "AU1b", "AU1a", ""]) == ["AU1a", "AU1b"]
+        assert parse_addresses(None) == []
+
+
+class TestResolve:
+    def test_selectors(self, partitions):
+        assert partitions.resolve("AU1second") == "AU1second"
+        assert partitions.resolve("3") == "AU2third"
+        assert partitions.resolve("4") is None
+        assert partitions.resolve("AU2") == "AU2third"
+        assert partitions.resolve("cond") == "AU1second"
+        # Ambiguous or too short
+        assert partitions.resolve("AU1") is None
+        assert partitions.resolve("d") is None
+
+
+class TestPartitions:
+    def test_separate_files(self, partitions, tmp_path):
+        assert partition_file("AU1second") == str(tmp_path / "config" / "balance_history.AU1second.json")
+
+    def test_lazy_load_and_journal_ingestion(self, partitions, tmp_path):
+        partitions.record([
+            ("AU1second", "2024/01/01-10:00", {"balance": 1.0}),
+            ("AU2third", "2024/01/01-10:00", {"balance": 2.0}),
+        ])
+        assert not partitions.is_loaded("AU1second")
+        assert (tmp_path / "config" / "balance_history.AU1second.journal").exists()
+        # Nothing written for the primary address
+        assert not (tmp_path / "config" / "balance_history.journal").exists()
+
+        partition = partitions.get("AU1second")
+        assert dict(partition.history) == {"2024/01/01-10:00": {"balance": 1.0}}
+        assert not partitions.is_loaded("AU2third")
+
+        partitions.record([("AU1second", "2024/01/01-11:00", {"balance": 1.5})])
+        assert partition.window.recent is not None
+        partition.persister.flush(5)
+        reloaded = load_balance_history('json', path=partition_file("AU1second"))
+        assert len(reloaded) == 2
+
+    def test_snapshot_written_to_partition_file(self, partitions, tmp_path):
+        history = partitions.get("AU2third").history
+        history["2024/01/01-10:00"] = {"balance": 3.0}
+        save_balance_history(history)
+        assert (tmp_path / "config" / "balance_history.AU2third.json").exists()
+        assert not (tmp_path / "config" / "balance_history.json").exists()
+
+    def test_others_loads_every_additional_partition(self, partitions):
+        others = partitions.others()
+        assert [partition.address for partition in others] == ["AU1second", "AU2third"]
+        assert partitions.is_loaded("AU1second") and partitions.is_loaded("AU2third")
+
+    def test_separate_archive_directories(self, tmp_path):
+        with patch('services.history_archive.HISTORY_ARCHIVE_DIR', str(tmp_path / "history")):
+            assert partition_archive_dir("AU1second") == str(tmp_path / "history" / "AU1second")
+
+    def test_unknown_address(self, partitions):
+        with pytest.raises(KeyError):
+            partitions.get("AU9unknown")
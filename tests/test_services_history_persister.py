@@ -0,0 +1,162 @@
+"""Tests for src/services/history_persister.py."""
+import json
+import threading
+import pytest
+from unittest.mock import patch
+
+from services.history import BalanceHistory, load_balance_history
+from services.history_persister import HistoryPersister
+
+
+@pytest.fixture
+def history_file(tmp_path):
+    path = tmp_path / "config" / "history.json"
+    with patch('services.history.BALANCE_HISTORY_FILE', str(path)):
+        yield path
+
+
+def _journal_lines(history_file):
+    journal = history_file.with_suffix('.journal')
+    if not journal.exists():
+        return []
+    return [json.loads(line) for line in journal.read_text().splitlines()]
+
+
+class TestHistoryPersister:
+    def test_appends_written_by_thread_and_flushed(self, history_file):
+        history = BalanceHistory()
+        persister = HistoryPersister(history)
+        persister.start()
+        history["2024/01/01-10:00"] = {"balance": 1.0}
+        persister.enqueue_append("2024/01/01-10:00")
+        assert persister.flush(timeout=5)
+        persister.stop()
+        assert _journal_lines(history_file) == [{"key": "2024/01/01-10:00", "entry": {"balance": 1.0}}]
+        assert not persister.running
+
+    def test_burst_coalesced_into_one_write(self, history_file):
+        history = BalanceHistory({f"2024/01/01-{h:02d}:00": {"balance": float(h)} for h in range(5)})
+        persister = HistoryPersister(history)
+        lock = threading.Lock()
+        persister._lock = lock
+        persister.start()
+        # Hold the lock so the writer blocks on the first item while the rest pile up
+        with lock:
+            for h in range(5):
+                persister.enqueue_append(f"2024/01/01-{h:02d}:00")
+            persister.enqueue_append("2024/01/01-04:00")
+        persister.stop()
+        assert [r["key"] for r in _journal_lines(history_file)] == [
+            f"2024/01/01-{h:02d}:00" for h in range(5)
+        ]
+        assert persister.flush_count <= 2
+
+    def test_request_save_writes_snapshot_and_resets_journal(self, history_file):
+        history = BalanceHistory({"2024/01/01-10:00": {"balance": 1.0}})
+        persister = HistoryPersister(history)
+        persister.start()
+        persister.enqueue_append("2024/01/01-10:00")
+        persister.request_save()
+        persister.stop()
+        data = json.loads(history_file.read_text())
+        assert data["entries"] == {"2024/01/01-10:00": {"balance": 1.0}}
+        assert not history_file.with_suffix('.journal').exists()
+        assert not (history_file.parent / "history.json.tmp").exists()
+
+    def test_journal_over_threshold_is_compacted(self, history_file):
+        history = BalanceHistory({"2024/01/01-10:00": {"balance": 1.0}})
+        persister = HistoryPersister(history)
+        with patch('services.history.JOURNAL_COMPACT_BYTES', 1):
+            persister.enqueue_append("2024/01/01-10:00")
+        assert history_file.exists()
+        assert not history_file.with_suffix('.journal').exists()
+
+    def test_inline_write_when_not_started(self, history_file):
+        history = BalanceHistory({"2024/01/01-10:00": {"balance": 1.0}})
+        persister = HistoryPersister(history)
+        persister.enqueue_append("2024/01/01-10:00")
+        assert dict(load_balance_history()) == {"2024/01/01-10:00": {"balance": 1.0}}
+
+    def test_deleted_keys_are_skipped(self, history_file):
+        persister = HistoryPersister(BalanceHistory())
+        persister.enqueue_append("2024/01/01-10:00")
+        assert _journal_lines(history_file) == []
+        assert persister.flush_count == 1
+
+    def test_write_through_history_is_skipped(self, history_file):
+        class Store(dict):
+            write_through = True
+        persister = HistoryPersister(Store({"2024/01/01-10:00": {"balance": 1.0}}))
+        persister.request_save()
+        assert not history_file.exists()
+        assert persister.flush_count == 0
+
+    def test_store_runs_on_the_writer_thread(self, history_file):
+        stored = []
+
+        class Store(dict):
+            write_through = True
+
+            def update(self, pairs):
+                stored.append(threading.current_thread().name)
+                super().update(pairs)
+
+        history = Store()
+        persister = HistoryPersister(history)
+        persister.start()
+        persister.enqueue_store("2024/01/01-10:00", {"balance": 1.0})
+        assert persister.flush(timeout=5)
+        persister.stop()
+        assert history == {"2024/01/01-10:00": {"balance": 1.0}}
+        assert stored == ['history-persister']
+        assert not history_file.exists()
+
+    def test_errors_are_logged_and_thread_survives(self, history_file):
+        history = BalanceHistory({"2024/01/01-10:00": {"balance": 1.0}})
+        persister = HistoryPersister(history)
+        persister.start()
+        with patch('services.history_persister.history_store.append_journal_records',
+                   side_effect=OSError("disk full")), \
+             patch('services.history_persister.logging') as mock_logging:
+            persister.enqueue_append("2024/01/01-10:00")
+            assert persister.flush(timeout=5)
+        mock_logging.error.assert_called_once()
+        assert persister.running
+        persister.stop()
+
+    def test_snapshot_waits_for_background_load(self, history_file):
+        history = BalanceHistory({"2024/01/01-10:00": {"balance": 1.0}})
+        history.ready.clear()
+        persister = HistoryPersister(history)
+        persister.start()
+        persister.request_save()
+        assert not persister.flush(timeout=0.2)
+        assert not history_file.exists()
+        history.ready.set()
+        assert persister.flush(timeout=5)
+        persister.stop()
+        assert history_file.exists()
+
+    def test_metrics(self, history_file):
+        persister = HistoryPersister(BalanceHistory({"2024/01/01-10:00": {"balance": 1.0}}))
+        assert persister.metrics() == {"queue_depth": 0, "last_flush_duration": None, "flush_count": 0}
+        persister.request_save()
+        metrics = persister.metrics()
+        assert metrics["flush_count"] == 1
+        assert metrics["last_flush_duration"] >= 0
+
+    def test_stop_and_flush_without_thread(self, history_file):
+        persister = HistoryPersister(BalanceHistory())
+        persister.stop()
+        assert persister.flush() is True
+
+    def test_snapshot_uses_history_writer(self, history_file):
+        class Store(BalanceHistory):
+            written = None
+
+            def write_snapshot(self, entries):
+                Store.written = entries
+        persister = HistoryPersister(Store({"2024/01/01-10:00": {"balance": 1.0}}))
+        persister.request_save()
+        assert Store.written == {"2024/01/01-10:00": {"balance": 1.0}}
+        assert not history_file.exists()
@@ -0,0 +1,169 @@
+"""Tests for src/services/history_runs.py."""
+import json
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+
+from services.history import (
+    BalanceHistory, datetime_to_epoch, filter_last_24h, load_balance_history,
+    make_time_key, save_balance_history,
+)
+from services.history_runs import compact_runs, compress_runs, expand_runs, get_entry_run
+
+
+END = datetime(2024, 3, 10, 12, 0)
+
+
+def _history(end: datetime = END) -> BalanceHistory:
+    """48 hourly snapshots: a 30 hour plateau, then a rising balance."""
+    entries = {}
+    for hour in range(48):
+        dt = end - timedelta(hours=47 - hour)
+        if hour < 30:
+            temperature = 40.0 + (hour % 2) * 0.2
+            entry = {"balance": 100.0, "temperature_avg": temperature, "ram_percent": 50.0}
+        else:
+            entry = {"balance": 100.0 + hour, "temperature_avg": 45.0, "ram_percent": 55.0}
+        entries[make_time_key(dt)] = entry
+    return BalanceHistory(entries)
+
+
+def _expected(history: BalanceHistory) -> dict:
+    """The logical series once the plateau repeats its first snapshot's readings."""
+    expected = dict(history.items())
+    first = next(iter(expected.values()))
+    for key, value in expected.items():
+        if value["balance"] == 100.0:
+            expected[key] = dict(first)
+    return expected
+
+
+@pytest.fixture
+def history_file(tmp_path):
+    path = str(tmp_path / "balance_history.json")
+    with patch('services.history.BALANCE_HISTORY_FILE', path):
+        yield path
+
+
+class TestCompressRuns:
+    def test_plateau_becomes_one_entry(self):
+        compressed = compress_runs(_history().items())
+        assert len(compressed) == 19
+        key, entry = compressed[0]
+        assert key == make_time_key(END - timedelta(hours=47))
+        assert entry == {"balance": 100.0, "temperature_avg": 40.0, "ram_percent": 50.0,
+                         "run_end": make_time_key(END - timedelta(hours=18)), "run_count": 30}
+
+    def test_expands_back_to_the_logical_series(self):
+        history = _history()
+        assert dict(expand_runs(compress_runs(history.items()))) == _expected(history)
+
+    def test_tolerances_and_min_length(self):
+        items = list(_history().items())
+        assert len(compress_runs(items, temperature_tolerance=0.1)) == 48
+        assert len(compress_runs(items, min_length=31)) == 48
+        assert len(compress_runs(items, min_length=30)) == 19
+
+    def test_rollups_never_join_runs(self):
+        items = [
+            (f"2024/03/10-0{hour}:00",
+             {"balance": 1.0, "balance_min": 1.0, "balance_max": 1.0, "samples": 2})
+            for hour in range(6)
+        ]
+        assert compress_runs(items) == items
+
+    def test_uneven_spacing_breaks_runs(self):
+        items = [
+            (key, {"balance": 1.0})
+            for key in ("2024/03/10-00:00", "2024/03/10-01:00", "2024/03/10-02:00",
+                        "2024/03/10-03:00", "2024/03/10-03:30", "2024/03/10-04:00")
+        ]
+        compressed = compress_runs(items)
+        assert len(compressed) == 3
+        assert get_entry_run(*compressed[0]) == (datetime_to_epoch(datetime(2024, 3, 10)), 3600, 4)
+
+    def test_non_canonical_keys_are_kept(self):
+        items = [("junk", {"balance": 1.0})] + [
+            (f"2024/03/10-0{hour}:00", {"balance": 1.0}) for hour in range(4)
+        ]
+        assert compress_runs(items)[-1] == ("junk", {"balance": 1.0})
+
+
+class TestExpandRuns:
+    RUN = {"balance": 5.0, "run_end": "2024/01/01-03:00", "run_count": 4}
+
+    def test_oldest_first_by_default(self):
+        assert list(expand_runs({"2024/01/01-00:00": self.RUN})) == [
+            (f"2024/01/01-0{hour}:00", {"balance": 5.0}) for hour in range(4)
+        ]
+
+    def test_newest_first(self):
+        pairs = expand_runs([("2024/01/01-00:00", self.RUN)], newest_first=True)
+        assert [key for key, _ in pairs] == [f"2024/01/01-0{hour}:00" for hour in (3, 2, 1, 0)]
+
+    def test_malformed_runs_are_left_as_is(self):
+        entry = {"balance": 5.0, "run_end": "2023/12/31-23:00", "run_count": 4}
+        assert list(expand_runs({"2024/01/01-00:00": entry})) == [("2024/01/01-00:00", entry)]
+
+
+class TestCompactRuns:
+    def test_history_is_not_modified(self):
+        history = _history()
+        before = dict(history.items())
+        assert compact_runs(history) == 29
+        assert dict(history.items()) == before
+        assert history.run_settings == {'temperature_tolerance': 0.5, 'ram_tolerance': 1.0,
+                                        'min_length': 4}
+
+    def test_snapshot_stores_runs(self, history_file):
+        history = _history()
+        compact_runs(history)
+        save_balance_history(history)
+        with open(history_file, encoding='utf-8') as f:
+            entries = json.load(f)["entries"]
+        assert len(entries) == 19
+        assert sum(1 for value in entries.values() if "run_count" in value) == 1
+
+    def test_load_expands_runs(self, history_file):
+        history = _history()
+        expected = _expected(history)
+        compact_runs(history)
+        save_balance_history(history)
+        loaded = load_balance_history()
+        assert len(loaded) == 48
+        assert dict(loaded.items()) == expected
+        assert filter_last_24h(loaded) == filter_last_24h(BalanceHistory(expected))
+
+    def test_recent_load_splits_runs_reaching_the_window(self, history_file):
+        history = _history(datetime.now().replace(minute=0, second=0, microsecond=0))
+        expected = _expected(history)
+        compact_runs(history)
+        save_balance_history(history)
+        loaded = load_balance_history(recent_hours=20)
+        assert loaded.ready.wait(5)
+        assert dict(loaded.items()) == expected
+
+    def test_backup_recovery_expands_runs(self, history_file):
+        history = _history()
+        expected = _expected(history)
+        compact_runs(history)
+        save_balance_history(history)
+        save_balance_history(history)
+        with open(history_file, 'w', encoding='utf-8') as f:
+            f.write('{"schema_version": 2, "entries": {"broken')
+        assert dict(load_balance_history().items()) == expected
+
+    def test_plain_dict_left_alone(self):
+        history = {"2024/03/10-0{}:00".format(hour): {"balance": 1.0} for hour in range(6)}
+        assert compact_runs(history) == 0
+        assert len(history) == 6
+
+    def test_histories_with_their_own_format_left_alone(self):
+        class Snapshotted(BalanceHistory):
+            def write_snapshot(self, entries):
+                pass
+
+        history = Snapshotted(_history().items())
+        assert compact_runs(history) == 0
+        assert history.run_settings is None
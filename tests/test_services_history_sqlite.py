@@ -0,0 +1,215 @@
+"""Tests for src/services/history_sqlite.py."""
+import json
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from services.history import (
+    load_balance_history,
+    save_balance_history,
+    append_balance_entry,
+    filter_last_24h,
+    filter_since_midnight,
+    compact_balance_history,
+)
+from services.history_sqlite import (
+    SqliteBalanceHistory,
+    import_json_history,
+    open_sqlite_history,
+)
+
+
+def _key(dt: datetime) -> str:
+    return f"{dt.year}/{dt.month:02d}/{dt.day:02d}-{dt.hour:02d}:{dt.minute:02d}"
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = SqliteBalanceHistory(str(tmp_path / "history.db"))
+    yield s
+    s.close()
+
+
+# ---------------------------------------------------------------------------
+# SqliteBalanceHistory mapping behaviour
+# ---------------------------------------------------------------------------
+
+class TestSqliteBalanceHistory:
+    def test_set_and_get_roundtrip(self, store):
+        store["2024/01/01-10:00"] = {"balance": 1.5, "temperature_avg": 40.0, "ram_percent": 55.0}
+        assert store["2024/01/01-10:00"] == {"balance": 1.5, "temperature_avg": 40.0, "ram_percent": 55.0}
+
+    def test_missing_optional_fields_omitted(self, store):
+        store["2024/01/01-10:00"] = {"balance": 2.0}
+        assert store["2024/01/01-10:00"] == {"balance": 2.0}
+
+    def test_legacy_records_migrated_on_import(self, tmp_path, store):
+        target = tmp_path / "balance_history.json"
+        target.write_text(json.dumps({"01/01-10:00": "Balance: 7.5"}), encoding='utf-8')
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            import_json_history(store)
+        assert len(store) == 1
+        assert store.values() == [{"balance": 7.5}]
+
+    def test_missing_key_raises(self, store):
+        with pytest.raises(KeyError):
+            store["nope"]
+
+    def test_delete(self, store):
+        store["2024/01/01-10:00"] = {"balance": 1.0}
+        del store["2024/01/01-10:00"]
+        assert len(store) == 0
+        with pytest.raises(KeyError):
+            del store["2024/01/01-10:00"]
+
+    def test_iteration_is_chronological(self, store):
+        store["2024/01/02-10:00"] = {"balance": 2.0}
+        store["2024/01/01-10:00"] = {"balance": 1.0}
+        assert list(store) == ["2024/01/01-10:00", "2024/01/02-10:00"]
+        assert [v["balance"] for v in store.values()] == [1.0, 2.0]
+
+    def test_version_bumped_by_writes(self, store):
+        store["2024/01/01-10:00"] = {"balance": 1.0}
+        store.update({"2024/01/01-11:00": {"balance": 2.0}})
+        del store["2024/01/01-10:00"]
+        store.clear()
+        assert store.version == 4
+
+    def test_update_and_clear(self, store):
+        store.update({"2024/01/01-10:00": {"balance": 1.0}, "2024/01/01-11:00": {"balance": 2.0}})
+        assert len(store) == 2
+        store.clear()
+        assert len(store) == 0
+        assert store == {}
+
+    def test_persists_across_connections(self, tmp_path):
+        path = str(tmp_path / "history.db")
+        first = SqliteBalanceHistory(path)
+        first["2024/01/01-10:00"] = {"balance": 3.0}
+        first.close()
+        second = SqliteBalanceHistory(path)
+        assert dict(second) == {"2024/01/01-10:00": {"balance": 3.0}}
+        second.close()
+
+    def test_items_between_bounds(self, store):
+        for hour in range(5):
+            store[f"2024/01/01-{hour:02d}:00"] = {"balance": float(hour)}
+        result = store.items_between(datetime(2024, 1, 1, 1), datetime(2024, 1, 1, 3))
+        assert [key for _, key, _ in result] == ["2024/01/01-01:00", "2024/01/01-02:00"]
+        assert result[0][0] == datetime(2024, 1, 1, 1)
+
+    def test_count_between(self, store):
+        for hour in range(5):
+            store[f"2024/01/01-{hour:02d}:00"] = {"balance": float(hour)}
+        assert store.count_between(datetime(2024, 1, 1, 3), None) == 2
+
+    def test_rollup_fields_roundtrip(self, store):
+        entry = {"balance": 2.0, "balance_min": 1.0, "balance_max": 3.0, "samples": 2}
+        store["2024/01/01-10:00"] = entry
+        assert store["2024/01/01-10:00"] == entry
+        assert store.items_between(None, None)[0][2] == entry
+
+    def test_rollup_columns_added_to_existing_database(self, tmp_path):
+        import sqlite3
+        path = str(tmp_path / "old.db")
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE balance_history (time_key TEXT PRIMARY KEY, ts INTEGER,"
+            " balance REAL NOT NULL, temperature_avg REAL, ram_percent REAL)"
+        )
+        conn.execute("INSERT INTO balance_history VALUES ('2024/01/01-10:00', 1704103200, 1.0, NULL, NULL)")
+        conn.commit()
+        conn.close()
+        upgraded = SqliteBalanceHistory(path)
+        upgraded["2024/01/01-11:00"] = {"balance": 2.0, "balance_min": 2.0, "balance_max": 2.0, "samples": 1}
+        assert upgraded["2024/01/01-10:00"] == {"balance": 1.0}
+        assert upgraded["2024/01/01-11:00"]["samples"] == 1
+        upgraded.close()
+
+    def test_items_between_skips_invalid_keys(self, store):
+        store["not-a-date"] = {"balance": 1.0}
+        assert store.items_between(None, None) == []
+        assert "not-a-date" in store
+
+
+# ---------------------------------------------------------------------------
+# Integration with services.history
+# ---------------------------------------------------------------------------
+
+class TestHistoryApiWithSqlite:
+    def test_filters_use_indexed_range(self, store):
+        now = datetime.now()
+        old = now - timedelta(hours=30)
+        recent = now - timedelta(minutes=5)
+        store[_key(old)] = {"balance": 1.0}
+        store[_key(recent)] = {"balance": 2.0}
+        assert list(filter_last_24h(store)) == [_key(recent)]
+        assert list(filter_since_midnight(store)) == [_key(recent)]
+
+    def test_compaction_writes_through(self, store):
+        store.update({"2024/01/01-10:05": {"balance": 1.0}, "2024/01/01-10:35": {"balance": 3.0}})
+        assert compact_balance_history(store, now=datetime(2024, 2, 1)) == 1
+        assert dict(store) == {
+            "2024/01/01-10:00": {"balance": 2.0, "balance_min": 1.0, "balance_max": 3.0, "samples": 2},
+        }
+
+    def test_save_and_append_are_noops(self, store, tmp_path):
+        target = tmp_path / "balance_history.json"
+        store["2024/01/01-10:00"] = {"balance": 1.0}
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            save_balance_history(store)
+            append_balance_entry(store, "2024/01/01-10:00")
+        assert not target.exists()
+        assert not (tmp_path / "balance_history.journal").exists()
+
+    def test_load_with_sqlite_backend(self, tmp_path):
+        with patch('services.history.BALANCE_HISTORY_FILE', str(tmp_path / "balance_history.json")), \
+             patch('services.history_sqlite.HISTORY_DB_FILE', str(tmp_path / "history.db")):
+            result = load_balance_history('sqlite')
+        assert isinstance(result, SqliteBalanceHistory)
+        result.close()
+
+    def test_unknown_backend_falls_back_to_json(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        target.write_text(json.dumps({"2024/01/01-10:00": {"balance": 1.0}}), encoding='utf-8')
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            assert load_balance_history('bogus') == {"2024/01/01-10:00": {"balance": 1.0}}
+
+
+# ---------------------------------------------------------------------------
+# JSON importer
+# ---------------------------------------------------------------------------
+
+class TestImportJsonHistory:
+    def test_imports_snapshot_and_journal_once(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        target.write_text(json.dumps({"2024/01/01-10:00": {"balance": 1.0}}), encoding='utf-8')
+        (tmp_path / "balance_history.journal").write_text(
+            '{"key":"2024/01/01-11:00","entry":{"balance":2.0}}\n', encoding='utf-8'
+        )
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            store = open_sqlite_history(str(tmp_path / "history.db"))
+        assert dict(store) == {"2024/01/01-10:00": {"balance": 1.0}, "2024/01/01-11:00": {"balance": 2.0}}
+        assert not target.exists()
+        assert (tmp_path / "balance_history.json.imported").exists()
+        assert not (tmp_path / "balance_history.journal").exists()
+        store.close()
+
+    def test_no_import_when_store_not_empty(self, tmp_path):
+        target = tmp_path / "balance_history.json"
+        target.write_text(json.dumps({"2024/01/01-10:00": {"balance": 1.0}}), encoding='utf-8')
+        db_path = str(tmp_path / "history.db")
+        existing = SqliteBalanceHistory(db_path)
+        existing["2023/01/01-10:00"] = {"balance": 9.0}
+        existing.close()
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            store = open_sqlite_history(db_path)
+        assert list(store) == ["2023/01/01-10:00"]
+        assert target.exists()
+        store.close()
+
+    def test_import_returns_count(self, tmp_path, store):
+        target = tmp_path / "balance_history.json"
+        target.write_text(json.dumps({"2024/01/01-10:00": {"balance": 1.0}}), encoding='utf-8')
+        with patch('services.history.BALANCE_HISTORY_FILE', str(target)):
+            assert import_json_history(store) == 1
@@ -0,0 +1,118 @@
+"""Tests for src/services/history_window.py."""
+import random
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from services.history import BalanceHistory, filter_last_24h, filter_since_midnight, make_time_key
+from services.history_window import RollingWindow
+
+
+NOW = datetime(2024, 3, 10, 12, 30)
+
+
+class _FixedDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return NOW
+
+
+def _random_history(seed: int) -> BalanceHistory:
+    rng = random.Random(seed)
+    history = BalanceHistory()
+    dt = NOW - timedelta(hours=60)
+    while dt <= NOW:
+        entry = {"balance": rng.uniform(900, 1100)}
+        if rng.random() < 0.8:
+            entry["temperature_avg"] = round(rng.uniform(30, 60), 1)
+        if rng.random() < 0.8:
+            entry["ram_percent"] = round(rng.uniform(20, 90), 1)
+        history[make_time_key(dt)] = entry
+        dt += timedelta(minutes=rng.choice([10, 20, 45, 70, 130]))
+    return history
+
+
+class TestRollingWindow:
+    @pytest.mark.parametrize("seed", range(5))
+    def test_matches_full_scans(self, seed):
+        history = _random_history(seed)
+        window = RollingWindow()
+        for key, value in history.items():
+            window.add(key, value)
+        with patch('services.history.datetime', _FixedDatetime):
+            recent = filter_last_24h(history)
+            midnight = filter_since_midnight(history)
+
+        assert window.recent(NOW) == recent
+        assert window.oldest(NOW) == (next(iter(recent)), next(iter(recent.values()))["balance"])
+        first_key = next(iter(midnight))
+        assert window.first_since_midnight(NOW) == (first_key, midnight[first_key]["balance"])
+        temperatures = [v["temperature_avg"] for v in recent.values() if "temperature_avg" in v]
+        assert window.temperature_average(NOW) == pytest.approx(sum(temperatures) / len(temperatures))
+        assert window.uptime_percent(NOW) == round(len(recent) / 24 * 100, 1)
+
+    def test_recent_keeps_whole_entries(self):
+        history = _random_history(11)
+        window = RollingWindow.from_history(history, NOW)
+        with patch('services.history.datetime', _FixedDatetime):
+            recent = filter_last_24h(history)
+        assert window.recent(NOW) == recent
+        assert any("ram_percent" in value for value in window.recent(NOW).values())
+
+    def test_from_history(self):
+        history = _random_history(7)
+        window = RollingWindow.from_history(history, NOW)
+        with patch('services.history.datetime', _FixedDatetime):
+            assert window.recent(NOW) == filter_last_24h(history)
+
+    def test_expiry_as_time_passes(self):
+        window = RollingWindow()
+        window.add("2024/03/10-10:00", {"balance": 1.0, "temperature_avg": 40.0})
+        window.add("2024/03/10-11:00", {"balance": 2.0, "temperature_avg": 50.0})
+        assert window.uptime_percent(NOW) == pytest.approx(8.3)
+        assert window.temperature_average(NOW) == 45.0
+
+        later = datetime(2024, 3, 11, 10, 30)
+        assert list(window.recent(later)) == ["2024/03/10-11:00"]
+        assert window.temperature_average(later) == 50.0
+        assert window.oldest(later) == ("2024/03/10-11:00", 2.0)
+        # A new day has started without any entry yet
+        assert window.first_since_midnight(later) is None
+
+        assert window.recent(datetime(2024, 3, 12)) == {}
+        assert window.temperature_average(datetime(2024, 3, 12)) is None
+        assert window.uptime_percent(datetime(2024, 3, 12)) == 0.0
+
+    def test_latest_entry_of_the_hour_wins(self):
+        window = RollingWindow()
+        window.add("2024/03/10-10:40", {"balance": 2.0, "temperature_avg": 50.0})
+        window.add("2024/03/10-10:05", {"balance": 1.0, "temperature_avg": 10.0})
+        assert window.recent(NOW) == {"2024/03/10-10:40": {"balance": 2.0, "temperature_avg": 50.0}}
+        assert window.temperature_average(NOW) == 50.0
+        assert window.first_since_midnight(NOW) == ("2024/03/10-10:05", 1.0)
+
+    def test_overwritten_entry_updates_first_balance(self):
+        window = RollingWindow()
+        window.add("2024/03/10-01:00", {"balance": 1.0})
+        window.add("2024/03/10-01:00", {"balance": 3.0})
+        assert window.first_since_midnight(NOW) == ("2024/03/10-01:00", 3.0)
+
+    def test_25_hours_touched_reports_24(self):
+        window = RollingWindow()
+        # Yesterday 12:45, then every hour from yesterday 13:00 to today 12:00
+        times = [NOW - timedelta(hours=23, minutes=45)]
+        times += [NOW - timedelta(hours=23, minutes=30) + timedelta(hours=hour) for hour in range(24)]
+        for hour, dt in enumerate(times):
+            window.add(make_time_key(dt), {"balance": 1.0, "temperature_avg": float(hour)})
+        recent = window.recent(NOW)
+        assert len(recent) == 24
+        assert window.uptime_percent(NOW) == 100.0
+        assert window.temperature_average(NOW) == pytest.approx(sum(range(1, 25)) / 24)
+
+    def test_clear_and_invalid_keys(self):
+        window = RollingWindow()
+        window.add("not-a-date", {"balance": 1.0})
+        window.add("2024/03/10-10:00", {"balance": 1.0})
+        window.clear()
+        assert window.recent(NOW) == {}
+        assert window.first_since_midnight(NOW) is None
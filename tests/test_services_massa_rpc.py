@@ -32,6 +32,13 @@ class TestGetAddresses:
             result = get_addresses(logger, 'AU1test')
         assert "error" in result
 
+    def test_several_addresses_in_one_request(self):
+        logger = MagicMock(spec=logging.Logger)
+        with patch('services.massa_rpc.safe_request', return_value={"result": []}) as mock_req:
+            get_addresses(logger, ['AU1a', 'AU1b'])
+        data = json.loads(mock_req.call_args[1]['data'])
+        assert data['params'] == [['AU1a', 'AU1b']]
+
 
 class TestMeasureRpcLatency:
     def test_happy_path_returns_latency_and_ok_status(self):
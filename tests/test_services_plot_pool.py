@@ -0,0 +1,80 @@
+"""Tests for src/services/plot_pool.py."""
+import os
+import time
+import asyncio
+import pytest
+
+from services.history import BalanceHistory
+from services.history_sqlite import SqliteBalanceHistory
+from services.plot_pool import PlotPool, PlotPoolBusy, _detach
+from services.plotting import create_balance_history_plot
+
+
+@pytest.fixture
+def pool():
+    pool = PlotPool(workers=1, max_pending=2, timeout=60)
+    yield pool
+    pool.stop(wait=False)
+
+
+class TestPlotPool:
+    async def test_renders_in_worker_process(self, pool):
+        history = BalanceHistory({"2024/01/01-10:00": {"balance": 1.0}, "2024/01/01-11:00": {"balance": 2.0}})
+        pool.start()
+        png = await pool.run(create_balance_history_plot, history)
+        assert png.startswith(b"\x89PNG\r\n\x1a\n")
+        assert await pool.run(os.getpid) != os.getpid()
+        assert pool.metrics() == {"renders": 2, "timeouts": 0, "rejected": 0}
+
+    async def test_full_queue_is_rejected(self, pool):
+        pool._slots.acquire()
+        pool._slots.acquire()
+        with pytest.raises(PlotPoolBusy):
+            await pool.run(os.getpid)
+        assert pool.metrics()["rejected"] == 1
+        assert not pool.running
+
+    async def test_render_timeout(self, pool):
+        pool.timeout = 0.3
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run(time.sleep, 1.5)
+        assert pool.metrics()["timeouts"] == 1
+
+    async def test_timed_out_render_frees_its_slot_and_worker(self, pool):
+        pool.timeout = 0.3
+        for _ in range(pool.max_pending + 1):
+            # Never PlotPoolBusy: each hung render gave its slot back
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.run(time.sleep, 60)
+            assert not pool.running
+        pool.timeout = 60
+        assert await pool.run(abs, -3) == 3
+
+    def test_run_sync_timeout_frees_its_slot(self, pool):
+        pool.timeout = 0.3
+        with pytest.raises(TimeoutError):
+            pool.run_sync(time.sleep, 60)
+        assert not pool.running
+        assert pool._slots.acquire(blocking=False) and pool._slots.acquire(blocking=False)
+
+    def test_run_sync_and_slot_release(self, pool):
+        for _ in range(3):
+            assert pool.run_sync(abs, -3) == 3
+        # Every slot was given back once its render completed
+        assert pool._slots.acquire(blocking=False) and pool._slots.acquire(blocking=False)
+
+
+class TestDetach:
+    def test_database_history_copied(self, tmp_path):
+        store = SqliteBalanceHistory(str(tmp_path / "history.db"))
+        store["2024/01/01-10:00"] = {"balance": 1.0}
+        detached = _detach(store)
+        store.close()
+        assert isinstance(detached, BalanceHistory)
+        assert dict(detached) == {"2024/01/01-10:00": {"balance": 1.0}}
+
+    def test_other_arguments_unchanged(self):
+        history = BalanceHistory()
+        cycles = [1, 2]
+        assert _detach(history) is history
+        assert _detach(cycles) is cycles
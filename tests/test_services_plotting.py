@@ -1,19 +1,39 @@
 """Tests for src/services/plotting.py using mocked matplotlib and tmp_path."""
+import os
+import sys
 import math
+import subprocess
 import pytest
+from datetime import datetime, timedelta
 from unittest.mock import patch, MagicMock
 
 import matplotlib
 matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+import numpy as np
 
 from services.plotting import (
     create_png_plot,
     create_resources_plot,
     create_balance_history_plot,
-    PNG_FILE_NAME,
-    RESOURCES_PLOT_FILE_NAME,
-    BALANCE_HISTORY_PLOT_FILE_NAME,
+    sweep_orphan_plots,
+    _BalanceChart,
+    _ResourcesChart,
+    _TEMPLATES,
+    MARKER_MAX_POINTS,
+    downsample,
+    lttb_indices,
+    load_matplotlib,
+    prewarm,
+    PlotCache,
 )
+from services.history import migrate_history, BalanceHistory, make_time_key
+
+# Tests below patch services.plotting.plt and build chart templates directly
+load_matplotlib()
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
 
 
 # ---------------------------------------------------------------------------
@@ -39,14 +59,14 @@ def _make_plt_mock():
 # ---------------------------------------------------------------------------
 
 class TestCreatePngPlot:
-    def test_creates_and_returns_filename(self, tmp_path, monkeypatch):
+    def test_returns_png_bytes_without_files(self, tmp_path, monkeypatch):
         monkeypatch.chdir(tmp_path)
         cycles = [1, 2, 3]
         nok = [0, 1, 0]
         ok = [5, 4, 6]
         result = create_png_plot(cycles, nok, ok)
-        assert result.endswith(PNG_FILE_NAME)
-        assert (tmp_path / result).exists()
+        assert result.startswith(PNG_SIGNATURE)
+        assert os.listdir(tmp_path) == []
 
     def test_closes_figure_on_success(self, tmp_path, monkeypatch):
         monkeypatch.chdir(tmp_path)
@@ -70,51 +90,52 @@ class TestCreatePngPlot:
 # ---------------------------------------------------------------------------
 
 class TestCreateResourcesPlot:
-    def test_empty_dict_returns_empty_string(self):
-        assert create_resources_plot({}) == ""
+    def test_empty_dict_returns_empty_bytes(self):
+        assert create_resources_plot({}) == b""
 
-    def test_no_temp_or_ram_data_returns_empty_string(self):
-        # legacy string entries have no temp/ram
-        history = {"01/01-10:00": "Balance: 5.0"}
-        assert create_resources_plot(history) == ""
+    def test_no_temp_or_ram_data_returns_empty_bytes(self):
+        # balance-only entries have no temp/ram
+        history = {"2024/01/01-10:00": {"balance": 5.0}}
+        assert create_resources_plot(history) == b""
 
-    def test_temperature_only_returns_filename(self, tmp_path, monkeypatch):
+    def test_temperature_only_returns_png(self, tmp_path, monkeypatch):
         monkeypatch.chdir(tmp_path)
         history = {
             "2024/01/01-10:00": {"balance": 1.0, "temperature_avg": 55.0},
             "2024/01/01-11:00": {"balance": 1.5, "temperature_avg": 57.0},
         }
         result = create_resources_plot(history)
-        assert result.endswith(RESOURCES_PLOT_FILE_NAME)
-        assert (tmp_path / result).exists()
+        assert result.startswith(PNG_SIGNATURE)
+        assert os.listdir(tmp_path) == []
 
-    def test_ram_only_returns_filename(self, tmp_path, monkeypatch):
+    def test_ram_only_returns_png(self, tmp_path, monkeypatch):
         monkeypatch.chdir(tmp_path)
         history = {
             "2024/01/01-10:00": {"balance": 1.0, "ram_percent": 60.0},
             "2024/01/01-11:00": {"balance": 1.5, "ram_percent": 65.0},
         }
         result = create_resources_plot(history)
-        assert result.endswith(RESOURCES_PLOT_FILE_NAME)
-        assert (tmp_path / result).exists()
+        assert result.startswith(PNG_SIGNATURE)
+        assert os.listdir(tmp_path) == []
 
-    def test_both_temperature_and_ram_returns_filename(self, tmp_path, monkeypatch):
+    def test_both_temperature_and_ram_returns_png(self, tmp_path, monkeypatch):
         monkeypatch.chdir(tmp_path)
         history = {
             "2024/01/01-10:00": {"balance": 1.0, "temperature_avg": 50.0, "ram_percent": 70.0},
             "2024/01/01-11:00": {"balance": 2.0, "temperature_avg": 52.0, "ram_percent": 72.0},
         }
         result = create_resources_plot(history)
-        assert result.endswith(RESOURCES_PLOT_FILE_NAME)
-        assert (tmp_path / result).exists()
+        assert result.startswith(PNG_SIGNATURE)
+        assert os.listdir(tmp_path) == []
 
-    def test_closes_figure_on_success(self, tmp_path, monkeypatch):
-        monkeypatch.chdir(tmp_path)
-        mock_plt, fig, ax1, _ = _make_plt_mock()
-        history = {"2024/01/01-10:00": {"temperature_avg": 50.0}}
-        with patch('services.plotting.plt', mock_plt):
-            create_resources_plot(history)
-        mock_plt.close.assert_called_with(fig)
+    def test_template_reused_and_series_toggled(self):
+        create_resources_plot({"2024/01/01-10:00": {"temperature_avg": 50.0, "ram_percent": 70.0}})
+        chart = _TEMPLATES[_ResourcesChart]
+        create_resources_plot({"2024/01/01-10:00": {"ram_percent": 70.0}, "2024/01/01-11:00": {"ram_percent": 71.0}})
+        assert _TEMPLATES[_ResourcesChart] is chart
+        assert not chart.temperature_line.get_visible() and chart.ram_line.get_visible()
+        assert list(chart.ram_line.get_ydata()) == [70.0, 71.0]
+        assert [text.get_text() for text in chart.temperature_axes.get_legend().get_texts()] == ['RAM Usage (%)']
 
 
 # ---------------------------------------------------------------------------
@@ -122,33 +143,236 @@ class TestCreateResourcesPlot:
 # ---------------------------------------------------------------------------
 
 class TestCreateBalanceHistoryPlot:
-    def test_empty_dict_returns_empty_string(self):
-        assert create_balance_history_plot({}) == ""
+    def test_empty_dict_returns_empty_bytes(self):
+        assert create_balance_history_plot({}) == b""
 
-    def test_with_data_returns_filename(self, tmp_path, monkeypatch):
+    def test_with_data_returns_png(self, tmp_path, monkeypatch):
         monkeypatch.chdir(tmp_path)
         history = {
             "2024/01/01-10:00": {"balance": 100.0},
             "2024/01/01-11:00": {"balance": 105.0},
         }
         result = create_balance_history_plot(history)
-        assert result.endswith(BALANCE_HISTORY_PLOT_FILE_NAME)
-        assert (tmp_path / result).exists()
+        assert result.startswith(PNG_SIGNATURE)
+        assert os.listdir(tmp_path) == []
 
-    def test_closes_figure_on_success(self, tmp_path, monkeypatch):
-        monkeypatch.chdir(tmp_path)
-        mock_plt, fig, _, _ = _make_plt_mock()
-        history = {"2024/01/01-10:00": {"balance": 50.0}}
-        with patch('services.plotting.plt', mock_plt):
-            create_balance_history_plot(history)
-        mock_plt.close.assert_called_with(fig)
+    def test_template_reused_between_renders(self):
+        first = create_balance_history_plot({"2024/01/01-10:00": {"balance": 50.0}})
+        chart = _TEMPLATES[_BalanceChart]
+        second = create_balance_history_plot({"2024/01/01-10:00": {"balance": 50.0}, "2024/01/01-11:00": {"balance": 60.0}})
+        assert _TEMPLATES[_BalanceChart] is chart
+        assert list(chart.line.get_ydata()) == [50.0, 60.0]
+        assert first != second
+        # Templates are not pyplot figures: nothing is left open
+        assert plt.get_fignums() == []
 
-    def test_with_legacy_string_values(self, tmp_path, monkeypatch):
+    def test_layout_refitted_only_when_tick_labels_change(self):
+        chart = _BalanceChart()
+        times = [19723.4, 19723.5]
+        with patch.object(chart.figure, 'tight_layout', wraps=chart.figure.tight_layout) as tight_layout:
+            chart.render(times, [1.0, 2.0])
+            chart.render(times, [1.5, 2.5])
+            assert tight_layout.call_count == 1
+            chart.render(times, [10.0, 100000.0])
+            assert tight_layout.call_count == 2
+
+    def test_with_migrated_legacy_values(self, tmp_path, monkeypatch):
         monkeypatch.chdir(tmp_path)
-        history = {
+        history = migrate_history({
             "01/01-10:00": "Balance: 200.0",
             "01/01-11:00": "Balance: 210.0",
-        }
+        })
         result = create_balance_history_plot(history)
-        assert result.endswith(BALANCE_HISTORY_PLOT_FILE_NAME)
-        assert (tmp_path / result).exists()
+        assert result.startswith(PNG_SIGNATURE)
+        assert os.listdir(tmp_path) == []
+
+
+# ---------------------------------------------------------------------------
+# Columnar BalanceHistory input
+# ---------------------------------------------------------------------------
+
+class TestPlotsFromBalanceHistory:
+    def _history(self):
+        return BalanceHistory({
+            "2024/01/01-10:00": {"balance": 1.0, "temperature_avg": 50.0, "ram_percent": 70.0},
+            "2024/01/01-11:00": {"balance": 2.0, "ram_percent": 72.0},
+        })
+
+    def test_balance_plot_from_columns(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        history = self._history()
+        result = create_balance_history_plot(history)
+        assert result.startswith(PNG_SIGNATURE)
+        # The history stays writable after the chart consumed its column views
+        history["2024/01/01-12:00"] = {"balance": 3.0}
+        assert len(history) == 3
+
+    def test_resources_plot_from_columns(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        result = create_resources_plot(self._history())
+        assert result.startswith(PNG_SIGNATURE)
+
+    def test_dates_rebuilt_from_timestamps(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        create_balance_history_plot(self._history())
+        dates = mdates.num2date(_TEMPLATES[_BalanceChart].line.get_xdata())
+        assert [date.strftime("%Y/%m/%d-%H:%M") for date in dates] == ["2024/01/01-10:00", "2024/01/01-11:00"]
+
+    def test_same_dates_from_plain_dict(self):
+        create_balance_history_plot(dict(self._history().items()))
+        columnar = _TEMPLATES[_BalanceChart].line.get_xdata().copy()
+        create_balance_history_plot(self._history())
+        assert list(_TEMPLATES[_BalanceChart].line.get_xdata()) == list(columnar)
+
+    def test_resources_plot_no_resource_columns_returns_empty(self):
+        assert create_resources_plot(BalanceHistory({"2024/01/01-10:00": {"balance": 1.0}})) == b""
+
+
+# ---------------------------------------------------------------------------
+# Downsampling
+# ---------------------------------------------------------------------------
+
+class TestLttb:
+    def test_short_series_kept_whole(self):
+        assert list(lttb_indices([0, 1, 2], [5, 6, 7], 10)) == [0, 1, 2]
+
+    def test_keeps_ends_and_peaks(self):
+        x = np.arange(1000, dtype=float)
+        y = np.zeros(1000)
+        y[437], y[812] = 50.0, -30.0
+        kept = lttb_indices(x, y, 20)
+        assert len(kept) == 20
+        assert kept[0] == 0 and kept[-1] == 999
+        assert 437 in kept and 812 in kept
+        assert list(kept) == sorted(set(kept))
+
+    def test_downsample_drops_nan_and_copies(self):
+        x = np.arange(6, dtype=float)
+        y = np.array([1.0, np.nan, 3.0, np.nan, 5.0, 6.0])
+        dx, dy = downsample(x, y, 10)
+        assert list(dx) == [0.0, 2.0, 4.0, 5.0] and list(dy) == [1.0, 3.0, 5.0, 6.0]
+        assert not np.shares_memory(dy, y)
+
+
+class TestLongHistories:
+    def _history(self, size):
+        start = datetime(2020, 1, 1)
+        return BalanceHistory({
+            make_time_key(start + timedelta(hours=hour)): {"balance": float(hour % 97), "ram_percent": 50.0}
+            for hour in range(size)
+        })
+
+    def test_points_capped_at_budget(self):
+        assert create_balance_history_plot(self._history(5000), max_points=300).startswith(PNG_SIGNATURE)
+        line = _TEMPLATES[_BalanceChart].line
+        assert len(line.get_xdata()) == 300
+        assert line.get_marker() == 'None'
+        create_resources_plot(self._history(5000), max_points=300)
+        assert len(_TEMPLATES[_ResourcesChart].ram_line.get_xdata()) == 300
+
+    def test_markers_on_short_series(self):
+        create_balance_history_plot(self._history(MARKER_MAX_POINTS))
+        assert _TEMPLATES[_BalanceChart].line.get_marker() == 'o'
+
+    def test_date_axis_uses_locator(self):
+        create_balance_history_plot(self._history(5000))
+        axes = _TEMPLATES[_BalanceChart].axes
+        assert isinstance(axes.xaxis.get_major_locator(), mdates.AutoDateLocator)
+        assert len(axes.get_xticks()) < 20
+
+
+# ---------------------------------------------------------------------------
+# Lazy matplotlib
+# ---------------------------------------------------------------------------
+
+class TestLazyMatplotlib:
+    def test_import_does_not_load_matplotlib(self, tmp_path):
+        code = ("import sys; import services.plotting, services.chart_cache, handlers.node; "
+                "print(sorted(m for m in ('matplotlib', 'numpy') if m in sys.modules))")
+        src = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+        output = subprocess.run([sys.executable, '-c', code], cwd=tmp_path, capture_output=True, text=True,
+                                env=dict(os.environ, PYTHONPATH=src)).stdout
+        assert output.strip() == "[]"
+
+    def test_backend_pinned_to_agg(self):
+        load_matplotlib()
+        assert matplotlib.get_backend().lower() == 'agg'
+
+    def test_prewarm_builds_templates(self):
+        with patch.dict(_TEMPLATES, clear=True):
+            prewarm()
+            assert set(_TEMPLATES) == {_BalanceChart, _ResourcesChart}
+
+
+# ---------------------------------------------------------------------------
+# PlotCache
+# ---------------------------------------------------------------------------
+
+class TestPlotCache:
+    HISTORY = {"2024/01/01-10:00": {"balance": 1.0}, "2024/01/01-11:00": {"balance": 2.0}}
+
+    def test_key_follows_data_function_and_parameters(self):
+        key = PlotCache.key(create_balance_history_plot, BalanceHistory(self.HISTORY))
+        assert key == PlotCache.key(create_balance_history_plot, BalanceHistory(self.HISTORY))
+        changed = BalanceHistory(self.HISTORY)
+        changed["2024/01/01-11:00"] = {"balance": 2.5}
+        assert key != PlotCache.key(create_balance_history_plot, changed)
+        assert key != PlotCache.key(create_resources_plot, BalanceHistory(self.HISTORY))
+        assert key != PlotCache.key(create_balance_history_plot, BalanceHistory(self.HISTORY), max_points=10)
+        assert PlotCache.key(create_balance_history_plot, dict(self.HISTORY)) == \
+            PlotCache.key(create_balance_history_plot, dict(self.HISTORY))
+
+    def test_argument_boundaries_in_key(self):
+        assert PlotCache.key(create_png_plot, [1], [2, 3], []) != PlotCache.key(create_png_plot, [1, 2], [3], [])
+
+    def test_unpicklable_argument_not_cached(self):
+        assert PlotCache.key(create_png_plot, lambda: None) is None
+
+    def test_hits_and_misses(self):
+        cache = PlotCache(1024)
+        assert cache.get(b"k") is None
+        cache.put(b"k", b"png")
+        assert cache.get(b"k") == b"png"
+        assert cache.metrics() == {"entries": 1, "bytes": 3, "hits": 1, "misses": 1, "evictions": 0}
+
+    def test_evicts_least_recently_used_by_bytes(self):
+        cache = PlotCache(10)
+        cache.put(b"a", b"1234")
+        cache.put(b"b", b"1234")
+        cache.get(b"a")
+        cache.put(b"c", b"1234")
+        assert cache.get(b"b") is None
+        assert cache.get(b"a") == b"1234" and cache.get(b"c") == b"1234"
+        assert cache.metrics()["bytes"] == 8 and cache.metrics()["evictions"] == 1
+
+    def test_replacing_and_oversized_entries(self):
+        cache = PlotCache(10)
+        cache.put(b"a", b"1234")
+        cache.put(b"a", b"123456")
+        assert cache.metrics()["bytes"] == 6
+        cache.put(b"big", b"x" * 11)
+        cache.put(b"empty", b"")
+        assert cache.get(b"big") is None and cache.get(b"empty") is None
+        assert cache.get(b"a") == b"123456"
+
+    def test_columnar_history_hashed_without_blocking_writes(self):
+        history = BalanceHistory(self.HISTORY)
+        PlotCache.key(create_balance_history_plot, history)
+        history["2024/01/01-12:00"] = {"balance": 3.0}
+        assert len(history) == 3
+
+
+# ---------------------------------------------------------------------------
+# sweep_orphan_plots
+# ---------------------------------------------------------------------------
+
+class TestSweepOrphanPlots:
+    def test_removes_leftover_chart_files_only(self, tmp_path):
+        for name in ("0123abcd_plot.png", "0123abcd_balance_history.png", "0123abcd_resources_history.png",
+                     "timeout.png", "balance_history.json"):
+            (tmp_path / name).write_bytes(b"x")
+        assert sweep_orphan_plots(str(tmp_path)) == 3
+        assert sorted(os.listdir(tmp_path)) == ["balance_history.json", "timeout.png"]
+
+    def test_nothing_to_remove(self, tmp_path):
+        assert sweep_orphan_plots(str(tmp_path)) == 0
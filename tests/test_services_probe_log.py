@@ -0,0 +1,130 @@
+"""Tests for src/services/probe_log.py."""
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from services.probe_log import PROBE_LOG_RETENTION, ProbeLog, UPTIME_WINDOWS
+
+
+NOW = datetime(2024, 3, 10, 12, 0)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "config" / "probe_log.bin")
+
+
+def _hourly(log: ProbeLog, hours: int, down_every: int = 0) -> None:
+    """Record one probe per hour over the last *hours*, every *down_every*-th one down."""
+    for hour in range(hours, 0, -1):
+        up = not (down_every and hour % down_every == 0)
+        log.record(up, 100.0 if up else None, NOW - timedelta(hours=hour) + timedelta(minutes=1))
+
+
+class TestProbeLogStats:
+    def test_counts_failed_probes(self, path):
+        log = ProbeLog(path)
+        _hourly(log, 24, down_every=4)
+        stats = log.stats(NOW - timedelta(hours=24))
+        assert stats == {"probes": 24, "up": 18, "down": 6, "uptime_percent": 75.0, "latency_ms": 100.0}
+
+    def test_extra_probes_do_not_inflate_uptime(self, path):
+        log = ProbeLog(path)
+        _hourly(log, 24)
+        for minute in range(5):
+            log.record(True, 50.0, NOW - timedelta(minutes=30 - minute))
+        stats = log.stats(NOW - timedelta(hours=24))
+        assert stats["probes"] == 29
+        assert stats["uptime_percent"] == 100.0
+
+    def test_windows(self, path):
+        log = ProbeLog(path)
+        _hourly(log, 24 * 30, down_every=24)
+        windows = dict(log.uptime_windows(NOW))
+        assert [label for label, _ in UPTIME_WINDOWS] == list(windows)
+        assert windows["24h"]["probes"] == 24
+        assert windows["7d"]["down"] == 7
+        assert windows["30d"]["uptime_percent"] == round(690 / 720 * 100, 1)
+
+    def test_empty_window(self, path):
+        stats = ProbeLog(path).stats(NOW - timedelta(days=7))
+        assert stats == {"probes": 0, "up": 0, "down": 0, "uptime_percent": None, "latency_ms": None}
+
+    def test_out_of_order_probe(self, path):
+        log = ProbeLog(path)
+        log.record(True, 10.0, NOW - timedelta(hours=1))
+        log.record(True, 30.0, NOW)
+        log.record(False, None, NOW - timedelta(minutes=30))
+        assert log.stats(NOW - timedelta(minutes=45), NOW)["down"] == 1
+        assert log.stats(None)["latency_ms"] == 20.0
+        assert len(log) == 3
+
+
+class TestProbeLogFile:
+    def test_round_trip(self, path):
+        log = ProbeLog(path)
+        _hourly(log, 48, down_every=3)
+        assert log.flush() == 48
+        loaded = ProbeLog.load(path)
+        assert len(loaded) == 48
+        assert loaded.stats(None) == log.stats(None)
+
+    def test_torn_record_ignored(self, path):
+        log = ProbeLog(path)
+        _hourly(log, 3)
+        log.flush()
+        with open(path, 'ab') as f:
+            f.write(b'\x01\x02\x03')
+        assert len(ProbeLog.load(path)) == 3
+
+    def test_missing_file(self, path):
+        assert len(ProbeLog.load(path)) == 0
+
+    def test_record_does_not_touch_the_file(self, path):
+        log = ProbeLog(path)
+        with patch('builtins.open', side_effect=AssertionError("file I/O")):
+            log.record(True, 1.0, NOW)
+        assert len(log) == 1
+        assert log.flush() == 1
+        assert log.flush() == 0
+        assert len(ProbeLog.load(path)) == 1
+
+    def test_write_error_keeps_records_for_next_flush(self, path):
+        log = ProbeLog(path)
+        log.record(True, 1.0, NOW)
+        with patch('builtins.open', side_effect=OSError("disk full")), \
+             patch('services.probe_log.logging') as mock_logging:
+            assert log.flush() == 0
+        mock_logging.error.assert_called_once()
+        log.record(False, None, NOW + timedelta(hours=1))
+        assert log.flush() == 2
+        assert ProbeLog.load(path).stats(None) == log.stats(None)
+
+
+class TestProbeLogRetention:
+    def test_load_drops_probes_older_than_the_largest_window(self, path):
+        log = ProbeLog(path)
+        _hourly(log, 24 * 40, down_every=24)
+        log.flush()
+        loaded = ProbeLog.load(path)
+        assert len(loaded) == 24 * 30 + 1
+        assert dict(loaded.uptime_windows(NOW)) == dict(log.uptime_windows(NOW))
+        # The file was rewritten without them
+        assert len(ProbeLog.load(path)) == len(loaded)
+
+    def test_flush_trims_once_a_day_past_retention(self, path):
+        log = ProbeLog(path)
+        start = NOW - PROBE_LOG_RETENTION
+        for hour in range(24):
+            log.record(True, 1.0, start + timedelta(hours=hour))
+        log.flush()
+        log.record(True, 1.0, NOW + timedelta(hours=12))
+        log.flush()
+        # Less than a day past retention: appended only
+        assert len(log) == 25
+        log.record(False, None, NOW + timedelta(days=1, hours=1))
+        before = log.uptime_windows(NOW + timedelta(days=1, hours=1))
+        assert log.flush() == 1
+        assert len(log) == 2
+        assert log.uptime_windows(NOW + timedelta(days=1, hours=1)) == before
+        assert ProbeLog.load(path).stats(None) == log.stats(None)